@@ -4,27 +4,75 @@ It includes endpoints for scraping a website using different methods, user authe
 
 Endpoints:
 - /auth (GET): Verifies the JWT token.
-- /scrape (POST): Scrapes a website using the specified method (requests, bs4, or selenium) and saves the output.
+- /scrape (POST): Scrapes a website using the specified method (requests, bs4, selenium,
+  extract or auto) and saves the output.
+- /scrape/batch (POST): Scrapes a list of websites concurrently and saves the successful outputs.
+- /crawl (POST): Queues a crawl following the links of a seed URL as a job.
+- /jobs/<job_id> (GET): Returns the status and result of an asynchronous scrape or crawl job.
+- /jobs/<job_id> (DELETE): Cancels an asynchronous scrape or crawl job.
+- /extract/rule-sets (GET): Lists the structured extraction rule sets.
+- /metrics (GET): Returns the metrics of the scrape pipeline in the Prometheus text format.
+- /metrics/hosts (GET): Returns per-host rate limiting, queueing and connection statistics.
 - /login (POST): Authenticates a user and returns a JWT token.
 - /logout (GET): Logs out the current user.
 - /sign-up (POST): Registers a new user.
-- /history (GET): Retrieves the scraping history of the logged-in user.
+- /history (GET): Retrieves one page of the scraping history of the logged-in user.
+- /history/search (GET): Searches the scraping history of the logged-in user.
+- /history/<id> (GET): Retrieves a history record of the logged-in user with its content.
+- /history/export (GET): Streams the whole history of the logged-in user as NDJSON.
 """
 
+import argparse
+import json
 import os
 from os import path
 from datetime import datetime, timedelta
 from functools import wraps
 
 import jwt
-from flask import request, jsonify
+from flask import Response, g, request, jsonify, stream_with_context
 from flask_login import LoginManager, login_user, logout_user
 from werkzeug.security import generate_password_hash, check_password_hash
 
 from config import app, db
-from core.models import User, History
-from core.repository import store_user_history
-from core.scraper import scrape_with_bs4, scrape_with_requests, scrape_with_selenium
+from core.models import User
+from core.batch import scrape_batch
+from core.blobs import load_content
+from core.changes import detect_change
+from core.compression import compress_response, stream_json
+from core.crawl import validate_crawl_request
+from core.deadlines import DeadlineExceeded, validate_timeout
+from core.engines import get_engine, is_loaded, preload_engines
+from core.extraction import RuleSetError, get_rule_set, list_rule_sets
+from core.history_writer import save_user_history, save_user_history_bulk
+from core.jobs import (
+    JobWorkerPool,
+    cancel_job,
+    enqueue_crawl_job,
+    enqueue_scrape_job,
+    get_job,
+    job_to_dict,
+)
+from core.metrics import begin_request, end_request, render_metrics, stage
+from core.migrations import run_migrations
+from core.politeness import get_stats as get_politeness_stats
+from core.repository import (
+    get_history_page,
+    get_history_record,
+    history_to_dict,
+    iter_history_records,
+    search_user_history,
+)
+from core.scraper import SCRAPING_METHODS, is_cleaned, is_scrape_error, run_scraper
+from core.search import SearchUnavailable
+
+# Response formats of /scrape
+RESPONSE_FORMATS = ("json", "stream", "raw")
+
+# Under `gunicorn --preload` this module is imported once in the master, so the engines loaded
+# here are shared copy-on-write by the forked workers (see gunicorn.conf.py)
+if app.config["ENGINES_PRELOAD"]:
+    preload_engines(app.config["ENGINES_PRELOAD"])
 
 
 def token_required(func):
@@ -66,6 +114,63 @@ def token_required(func):
     return decorated
 
 
+def _optional_user_id():
+    """
+    Returns the user id of the token of a request on which a token is optional.
+
+    Returns:
+        tuple: (user_id, error). user_id is None if the request has no token. error is None,
+        or a 401 response if the token has an invalid format, is expired or cannot be
+        decoded: a request with a bad token is refused rather than served anonymously.
+    """
+    token = request.headers.get("Authorization")
+    if not token:
+        return None, None
+    if not token.startswith("Bearer "):
+        return None, (
+            jsonify({"Alert!": "Invalid token format. Use 'Bearer <token>'"}),
+            401,
+        )
+    try:
+        decoded_token = jwt.decode(
+            token.split(" ")[1], app.config["SECRET_KEY"], algorithms=["HS256"]
+        )
+    except jwt.ExpiredSignatureError:
+        return None, (jsonify({"Message": "Token expired"}), 401)
+    except jwt.InvalidTokenError:
+        return None, (jsonify({"Message": "Invalid token. Unable to decode."}), 401)
+    return decoded_token["user_id"], None
+
+
+@app.before_request
+def start_request_timer():
+    """Starts timing the request for the /metrics request histograms."""
+    begin_request()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """
+    Records the duration and status of the request. If the request sent the profiling header
+    (METRICS_PROFILE_HEADER), its per-stage timing breakdown is returned in a Server-Timing
+    header.
+    """
+    return end_request(response)
+
+
+@app.after_request
+def compress(response):
+    """Compresses the response with gzip or brotli if the client accepts it."""
+    return compress_response(response)
+
+
+def _raw_mimetype(scraping_method, clean):
+    """Returns the media type of a scrape result sent by the "raw" format."""
+    if scraping_method == "extract":
+        return "application/json"
+    return "text/plain" if clean else "text/html"
+
+
 # API Routes
 
 
@@ -77,13 +182,39 @@ def scrape():
     - "scraping_method": The method to use for scraping, either "requests", "bs4", or "selenium" (required).
     - "clean_data": A boolean indicating whether to clean the data (optional, default is False).
     - "company_name": The name of the company (required for "selenium" method).
+    - "rule_set": The name of a structured extraction rule set (required for "extract" method,
+      see /extract/rule-sets). The scrape_result is then a compact JSON object of its fields.
+    - "async": A boolean indicating whether to queue the scrape as a background job
+      (optional, default is False). The response then contains a "job_id" to poll at /jobs/<job_id>.
+    - "timeout": The deadline of the whole scrape (connect, download, render and parse) in
+      seconds (optional, default SCRAPE_DEFAULT_TIMEOUT, between SCRAPE_MIN_TIMEOUT and
+      SCRAPE_MAX_TIMEOUT). The scrape is aborted when it passes the deadline.
+    - "format": How a successful result is sent (optional, default is "json"):
+        - "json": One JSON object.
+        - "stream": The same JSON object, streamed in chunks without building it in memory.
+        - "raw": The scrape_result itself as text/plain (cleaned), text/html or application/json
+          ("extract"), without JSON escaping. The cache and engine keys are sent as the
+          X-Scrape-Cache and X-Scrape-Engine headers.
+      Errors are always sent as JSON. Responses are compressed with gzip or brotli if the
+      client accepts it (Accept-Encoding).
+    - "detect_changes": A boolean enabling change detection (optional, default is False,
+      requires a token). The response then contains a change key: "new", "modified" (with
+      a unified diff against the previous content instead of the scrape_result, unless the
+      diff is too large) or "not_modified" (no history record is stored, status code 200).
     Returns:
     - JSON response with a status key:
         - status: 1 -> success
         - status: 2 -> error
+      and a cache key reporting how the content cache served "requests"/"bs4" scrapes:
+        - "hit", "miss", "revalidated" (stale entry confirmed by a 304) or "bypass"
+      and an engine key reporting what produced the result: "http" or "browser"
+      ("auto" only uses the browser for pages that need JavaScript rendering)
     - HTTP status code:
         - 201 on success
+        - 202 if the scrape was queued as a job
         - 400 on error
+        - 401 if the token is invalid or expired, or change detection is asked without one
+        - 504 if the scrape did not finish within its timeout
     The function performs the following steps:
     1. Retrieves the JSON data from the POST request.
     2. Validates the presence of "url" and "scraping_method" in the JSON body.
@@ -98,6 +229,11 @@ def scrape():
     scraping_method = data.get("scraping_method")
     clean_data = data.get("clean_data", False)
     company_name = data.get("company_name")
+    rule_set = data.get("rule_set")
+    run_async = data.get("async", False)
+    response_format = data.get("format", "json")
+    detect_changes = data.get("detect_changes", False)
+    timeout, timeout_error = validate_timeout(data.get("timeout"))
 
     if not url:
         return jsonify({"error": "URL is required", "status": 2}), 400
@@ -113,32 +249,368 @@ def scrape():
             400,
         )
 
-    if scraping_method == "requests":
-        scrape_result = scrape_with_requests(url)
-    elif scraping_method == "bs4":
-        scrape_result = scrape_with_bs4(url, clean=clean_data)
-    elif scraping_method == "selenium":
-        scrape_result = scrape_with_selenium(url, company_name, clean=clean_data)
-    else:
+    if scraping_method not in SCRAPING_METHODS:
         return jsonify({"error": "Invalid scraping method", "status": 2}), 400
 
-    # Store scrape result to db only if the request has a valid token
-    if request.headers.get("Authorization"):
-        token = request.headers.get("Authorization").split(" ")[1]
-        decoded_token = jwt.decode(
-            token, app.config["SECRET_KEY"], algorithms=["HS256"]
+    if response_format not in RESPONSE_FORMATS:
+        return jsonify({"error": "Invalid response format", "status": 2}), 400
+
+    if timeout_error:
+        return jsonify({"error": timeout_error, "status": 2}), 400
+
+    user_id, token_error = _optional_user_id()
+    if token_error:
+        return token_error
+
+    if detect_changes and user_id is None:
+        return (
+            jsonify({"error": "Change detection requires a token", "status": 2}),
+            401,
+        )
+
+    if detect_changes and run_async:
+        return (
+            jsonify(
+                {"error": "Change detection is not available for async", "status": 2}
+            ),
+            400,
+        )
+
+    if scraping_method == "extract":
+        try:
+            get_rule_set(rule_set)
+        except RuleSetError as e:
+            return jsonify({"error": str(e), "status": 2}), 400
+
+    if run_async:
+        job_id = enqueue_scrape_job(
+            url, scraping_method, clean_data, company_name, user_id, rule_set, timeout
+        )
+        return (
+            jsonify({"message": "Scrape job queued", "status": 1, "job_id": job_id}),
+            202,
+        )
+
+    scrape_result = run_scraper(
+        url,
+        scraping_method,
+        clean=clean_data,
+        company_name=company_name,
+        rule_set=rule_set,
+        timeout=timeout,
+    )
+    if isinstance(g.get("deadline_error"), DeadlineExceeded):
+        return jsonify({"error": scrape_result, "status": 2}), 504
+    # Pages that could not be retrieved are answered with the scrape function's error response
+    if isinstance(scrape_result, tuple):
+        return scrape_result
+
+    change = fingerprint = None
+    if detect_changes and not is_scrape_error(scrape_result):
+        with stage("changes"):
+            change, fingerprint = detect_change(
+                user_id, url, scraping_method, scrape_result, clean_data
+            )
+
+    # Store scrape result to db only if the request has a valid token, the scrape succeeded and
+    # the content changed
+    if (
+        user_id is not None
+        and not is_scrape_error(scrape_result)
+        and (change is None or change["change"] != "not_modified")
+    ):
+        with stage("history"):
+            save_user_history(
+                url,
+                scraping_method,
+                scrape_result,
+                user_id,
+                fingerprint,
+                cleaned=is_cleaned(scraping_method, clean_data),
+            )
+
+    fields = {
+        "message": f"URL Scraped with {scraping_method} and content saved",
+        "status": 1,
+        # hit, miss, revalidated or bypass (None for uncached methods)
+        "cache": g.get("cache_status"),
+        # http or browser, the engine that produced the result
+        "engine": g.get("scrape_engine"),
+    }
+    if change is not None:
+        fields.update(change)
+        if change["change"] == "not_modified":
+            fields["message"] = (
+                f"URL Scraped with {scraping_method}, content not modified"
+            )
+            return jsonify(fields), 200
+        if change.get("diff") is not None:
+            # The diff replaces the content, the client already has the previous one
+            fields["message"] = (
+                f"URL Scraped with {scraping_method}, content modified, diff returned"
+            )
+            return jsonify(fields), 201
+
+    # Errors are not strings or short messages, they are always sent as JSON
+    if response_format == "raw" and not is_scrape_error(scrape_result):
+        headers = {
+            "X-Scrape-Cache": fields["cache"] or "",
+            "X-Scrape-Engine": fields["engine"] or "",
+        }
+        return Response(
+            scrape_result,
+            status=201,
+            mimetype=_raw_mimetype(scraping_method, clean_data),
+            headers=headers,
+        )
+    if response_format == "stream" and not is_scrape_error(scrape_result):
+        return Response(
+            stream_json(fields, "scrape_result", scrape_result),
+            status=201,
+            mimetype="application/json",
+        )
+
+    with stage("serialize"):
+        # this contains the scrape_result data
+        response = jsonify({**fields, "scrape_result": scrape_result})
+    return response, 201
+
+
+@app.route("/scrape/batch", methods=["POST"])
+def scrape_batch_route():
+    """
+    Expects a JSON body with the following key:
+    - "items": A list of objects, each with the keys accepted by /scrape
+      ("url", "scraping_method", "clean_data", "timeout", and "company_name" for "selenium"
+      or "rule_set" for "extract").
+    Returns:
+    - JSON response with a status key and a "results" list in the same order as "items".
+      Every result has its own status key:
+        - status: 1 -> success, the result contains "scrape_result"
+        - status: 2 -> error, the result contains "error"
+    - HTTP status code:
+        - 200 when the batch was processed (even if some items failed)
+        - 400 if the body is invalid or the batch is too large
+        - 401 if the token is invalid or expired
+    The items are scraped concurrently with bounded global and per-host concurrency.
+    If the request has a valid token, all successful results are stored in the history.
+    """
+    data = request.json
+    items = data.get("items") if isinstance(data, dict) else None
+
+    if not isinstance(items, list) or not items:
+        return (
+            jsonify({"error": "A non-empty list of items is required", "status": 2}),
+            400,
+        )
+    if len(items) > app.config["BATCH_MAX_ITEMS"]:
+        return (
+            jsonify(
+                {
+                    "error": f"A batch can contain at most {app.config['BATCH_MAX_ITEMS']} items",
+                    "status": 2,
+                }
+            ),
+            400,
+        )
+
+    user_id, token_error = _optional_user_id()
+    if token_error:
+        return token_error
+
+    results = scrape_batch(items)
+
+    # Store successful results to db only if the request has a valid token
+    if user_id is not None:
+        # The results are in the order of the items
+        save_user_history_bulk(
+            [
+                (
+                    result["url"],
+                    result["scraping_method"],
+                    result["scrape_result"],
+                    is_cleaned(result["scraping_method"], item.get("clean_data")),
+                )
+                for item, result in zip(items, results)
+                if result["status"] == 1
+            ],
+            user_id,
+        )
+    return jsonify({"status": 1, "results": results}), 200
+
+
+@app.route("/crawl", methods=["POST"])
+def crawl_route():
+    """
+    Queues a crawl: the seed URL is scraped, then the pages it links to, and so on.
+    Expects a JSON body with the following keys:
+    - "url": The seed URL (required).
+    - "scraping_method": "requests", "bs4" or "extract" (optional, default is "bs4").
+    - "clean_data", "rule_set": As for /scrape.
+    - "max_depth": The number of links followed from the seed (optional, default
+      CRAWL_DEFAULT_MAX_DEPTH, at most CRAWL_MAX_DEPTH).
+    - "max_pages": The maximum number of pages fetched (optional, default
+      CRAWL_DEFAULT_MAX_PAGES, at most CRAWL_MAX_PAGES).
+    - "same_domain": Whether only pages of the seed's host are crawled (optional, default true).
+    - "timeout": The deadline of every page in seconds, as for /scrape.
+    Returns:
+    - JSON response with a status key and the "job_id" to poll at /jobs/<job_id>. Once
+      finished, the scrape_result of the job is a JSON document with every page (url, depth,
+      status and scrape_result or error) and the statistics of the crawl. If the request has a
+      valid token, the document is stored as a single history record.
+    - HTTP status code:
+        - 202 if the crawl was queued
+        - 400 if an option is invalid
+        - 401 if the token is invalid or expired
+    """
+    options, error = validate_crawl_request(request.json)
+    if error:
+        return jsonify({"error": error, "status": 2}), 400
+
+    user_id, token_error = _optional_user_id()
+    if token_error:
+        return token_error
+    job_id = enqueue_crawl_job(options, user_id)
+    return jsonify({"message": "Crawl job queued", "status": 1, "job_id": job_id}), 202
+
+
+def _get_visible_job(job_id, user_id):
+    """
+    Returns a job if the request may access it: jobs queued with a token are only visible
+    with a token of the same user.
+
+    Args:
+        job_id (str): The id of the job.
+        user_id (int): The user id of the request's token, None without a token.
+
+    Returns:
+        ScrapeJob: The job, or None if it does not exist or belongs to another user.
+    """
+    job = get_job(job_id)
+    if job is not None and job.user_id is not None and job.user_id != user_id:
+        return None
+    return job
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """
+    Returns the status of an asynchronous scrape or crawl job.
+    Jobs queued with a token can only be read with a token of the same user.
+    Returns:
+    - JSON response with a status key and a "job" object containing:
+        - job_id, kind ("scrape" or "crawl"), url, scrape_method, created_at, started_at,
+          finished_at
+        - status: "queued", "running", "finished", "failed" or "cancelled"
+        - options (crawls), timeout and progress (running crawls: pages, failed, disallowed,
+          discovered, dropped and queued URLs)
+        - cancel_requested (running jobs being cancelled)
+        - scrape_result (once finished, and cancelled crawls) or error (once failed)
+    - HTTP status code:
+        - 200 if the job exists
+        - 401 if the token is invalid or expired
+        - 404 if the job does not exist or belongs to another user
+    """
+    user_id, token_error = _optional_user_id()
+    if token_error:
+        return token_error
+    job = _get_visible_job(job_id, user_id)
+    if job is None:
+        return jsonify({"error": "Job not found", "status": 2}), 404
+    return jsonify({"status": 1, "job": job_to_dict(job)}), 200
+
+
+@app.route("/jobs/<job_id>", methods=["DELETE"])
+def cancel_job_route(job_id):
+    """
+    Cancels an asynchronous scrape or crawl job.
+    Jobs queued with a token can only be cancelled with a token of the same user.
+    A queued job is cancelled at once. A running job keeps the status "running" with
+    cancel_requested until its worker has aborted the scrape, it then becomes "cancelled"
+    (a cancelled crawl keeps the pages crawled until then as its scrape_result).
+    Returns:
+    - JSON response with a status key and the "job" object of /jobs/<job_id>.
+    - HTTP status code:
+        - 202 if the job was cancelled or its cancellation requested
+        - 401 if the token is invalid or expired
+        - 404 if the job does not exist or belongs to another user
+        - 409 if the job has already ended
+    """
+    user_id, token_error = _optional_user_id()
+    if token_error:
+        return token_error
+    job = _get_visible_job(job_id, user_id)
+    if job is None:
+        return jsonify({"error": "Job not found", "status": 2}), 404
+    if not cancel_job(job):
+        return (
+            jsonify(
+                {
+                    "error": f"The job has already ended ({job.status})",
+                    "status": 2,
+                    "job": job_to_dict(job),
+                }
+            ),
+            409,
         )
-        user_id = decoded_token["user_id"]
-        store_user_history(url, scraping_method, scrape_result, user_id)
+    return jsonify({"status": 1, "job": job_to_dict(job)}), 202
+
+
+@app.route("/extract/rule-sets", methods=["GET"])
+def extraction_rule_sets():
+    """
+    Lists the structured extraction rule sets usable with the "extract" scraping method.
+    Returns:
+    - JSON response with a status key and "rule_sets", mapping every rule set name
+      to the list of its field names.
+    - HTTP status code 200
+    """
+    return jsonify({"status": 1, "rule_sets": list_rule_sets()}), 200
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    Returns the metrics of the scrape pipeline in the Prometheus text format: scrape counts and
+    durations, per-stage duration histograms (labelled by stage, method and host), fetched
+    bytes, error classes, API request durations, and the content cache, browser pool,
+    connection, politeness and history writer statistics.
+    Returns:
+    - text/plain response with the metrics
+    - HTTP status code:
+        - 200 on success
+        - 404 if METRICS_ENABLED is off
+    """
+    if not app.config["METRICS_ENABLED"]:
+        return jsonify({"error": "Metrics are disabled", "status": 2}), 404
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/metrics/hosts", methods=["GET"])
+def host_metrics():
+    """
+    Returns the state of the per-host politeness scheduler and connection pool.
+    Returns:
+    - JSON response with a status key and:
+        - hosts: maps every host to its scheduler state: configured rate, burst,
+          concurrency and crawl_delay, the active and waiting (queued) requests, the current
+          backoff and pause, and the requests, throttled, timeouts, wait_seconds_total and
+          wait_seconds_max counters.
+        - connections: maps every host to its requests, handshakes and reused connections.
+    - HTTP status code 200
+    """
     return (
         jsonify(
             {
-                "message": f"URL Scraped with {scraping_method} and content saved",
                 "status": 1,
-                "scrape_result": scrape_result,  # this contains the scrape_result data
+                "hosts": get_politeness_stats(),
+                # Nothing to report before the first HTTP fetch loads the http engine
+                "connections": (
+                    get_engine("http").get_host_stats() if is_loaded("http") else {}
+                ),
             }
         ),
-        201,
+        200,
     )
 
 
@@ -249,44 +721,179 @@ def sign_up():
         return jsonify({"message": "Account created successfully!", "status": 1})
 
 
+def _current_user_id():
+    """Returns the user id of the token of a request that passed @token_required."""
+    token = request.headers.get("Authorization").split(" ")[1]
+    decoded_token = jwt.decode(token, app.config["SECRET_KEY"], algorithms=["HS256"])
+    return decoded_token["user_id"]
+
+
 @app.route("/history", methods=["GET"])
 @token_required
 def history():
     """
-    Fetches and returns the history of scraped data for the currently logged-in user.
+    Fetches one page of the scraping history of the currently logged-in user, newest first.
     This endpoint is protected by the @token_required decorator, ensuring that only authenticated
     users can access it.
+    The listing only contains the metadata of each record, the scraped content of a record is
+    returned by /history/<id>.
+    Query parameters:
+    - "limit": The number of records per page (optional, default HISTORY_PAGE_SIZE,
+      at most HISTORY_MAX_PAGE_SIZE).
+    - "cursor": The "next_cursor" of the previous page (optional, omit for the first page).
     Returns:
-        Response: A JSON response containing a list of dictionaries, each representing a history
-        record with the following keys:
-            - url (str): The URL that was scraped.
-            - scraped_data (str): The content that was scraped from the URL.
-            - date (str): The date and time when the data was scraped,
-            formatted as "%Y-%m-%d %H:%M:%S".
+        Response: A JSON response with a status key and the following keys:
+            - items (list): The records of the page, each with the following keys:
+                - id (int): The id of the record.
+                - url (str): The URL that was scraped.
+                - scrape_method (str): The scraping method.
+                - date (str): The date and time when the data was scraped,
+                formatted as "%Y-%m-%d %H:%M:%S".
+            - next_cursor (str): The cursor of the next page, or None on the last page.
         HTTP Status Code:
             200: If the history is successfully retrieved.
+            400: If limit or cursor is invalid.
     """
-    # Extract user_id from the token
-    token = request.headers.get("Authorization").split(" ")[1]
-    decoded_token = jwt.decode(token, app.config["SECRET_KEY"], algorithms=["HS256"])
-    user_id = decoded_token["user_id"]
-    print(user_id)
+    user_id = _current_user_id()
+
+    try:
+        limit = int(request.args.get("limit", app.config["HISTORY_PAGE_SIZE"]))
+        cursor = request.args.get("cursor")
+        cursor = int(cursor) if cursor else None
+    except ValueError:
+        return jsonify({"error": "limit and cursor must be integers", "status": 2}), 400
+    if limit < 1:
+        return jsonify({"error": "limit must be at least 1", "status": 2}), 400
+    limit = min(limit, app.config["HISTORY_MAX_PAGE_SIZE"])
+
+    records, next_cursor = get_history_page(user_id, limit, cursor)
+    return (
+        jsonify(
+            {
+                "status": 1,
+                "items": [history_to_dict(record) for record in records],
+                "next_cursor": str(next_cursor) if next_cursor is not None else None,
+            }
+        ),
+        200,
+    )
+
+
+@app.route("/history/search", methods=["GET"])
+@token_required
+def history_search():
+    """
+    Searches the scraping history of the currently logged-in user, best matches first.
+    The URL and the visible text of every record are indexed when the record is stored, so
+    only the matching records are read and their content is not sent.
+    Query parameters:
+    - "q": The search query: words (all of them must match), "quoted phrases" and prefix*
+      terms (required, at most SEARCH_MAX_QUERY_LENGTH characters).
+    - "limit": The number of results per page (optional, default SEARCH_PAGE_SIZE,
+      at most SEARCH_MAX_PAGE_SIZE).
+    - "cursor": The "next_cursor" of the previous page (optional, omit for the first page).
+    Returns:
+        Response: A JSON response with a status key and the following keys:
+            - items (list): The results of the page, each with the id, url, scrape_method and
+              date of the record (like /history) and the following keys:
+                - snippet (str): The text around the matches, HTML-escaped, with the matches
+                  in <mark> tags.
+                - score (float): The relevance of the record, higher is better.
+            - next_cursor (str): The cursor of the next page, or None on the last page.
+        HTTP Status Code:
+            200: If the search succeeded.
+            400: If q, limit or cursor is invalid.
+            503: If the database has no search index.
+    """
+    user_id = _current_user_id()
 
-    user_history = (
-        History.query.filter_by(user_id=user_id).order_by(History.date.desc()).all()
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"error": "q is required", "status": 2}), 400
+    if len(query) > app.config["SEARCH_MAX_QUERY_LENGTH"]:
+        return (
+            jsonify(
+                {
+                    "error": "q must be at most "
+                    f"{app.config['SEARCH_MAX_QUERY_LENGTH']} characters",
+                    "status": 2,
+                }
+            ),
+            400,
+        )
+    try:
+        limit = int(request.args.get("limit", app.config["SEARCH_PAGE_SIZE"]))
+        cursor = request.args.get("cursor")
+        cursor = int(cursor) if cursor else None
+    except ValueError:
+        return jsonify({"error": "limit and cursor must be integers", "status": 2}), 400
+    if limit < 1:
+        return jsonify({"error": "limit must be at least 1", "status": 2}), 400
+    limit = min(limit, app.config["SEARCH_MAX_PAGE_SIZE"])
+
+    try:
+        results, next_cursor = search_user_history(user_id, query, limit, cursor)
+    except SearchUnavailable as e:
+        return jsonify({"error": str(e), "status": 2}), 503
+    return (
+        jsonify(
+            {
+                "status": 1,
+                "items": results,
+                "next_cursor": str(next_cursor) if next_cursor is not None else None,
+            }
+        ),
+        200,
     )
 
-    history_list = [
-        {
-            "url": record.url,
-            "scrape_method": record.scrape_method,
-            "scraped_data": record.scraped_data,
-            "date": record.date.strftime("%Y-%m-%d %H:%M:%S") if record.date else None,
-        }
-        for record in user_history
-    ]
 
-    return jsonify(history_list), 200
+@app.route("/history/<int:record_id>", methods=["GET"])
+@token_required
+def history_record(record_id):
+    """
+    Returns a single history record of the currently logged-in user, including its content.
+    With ?format=raw, only the content is returned, as text/plain.
+    Returns:
+        Response: A JSON response with a status key and a "record" object containing the id,
+        url, scrape_method, date and scraped_data of the record.
+        HTTP Status Code:
+            200: If the record exists.
+            404: If the record does not exist or belongs to another user.
+    """
+    record = get_history_record(_current_user_id(), record_id)
+    if record is None:
+        return jsonify({"error": "History record not found", "status": 2}), 404
+    if request.args.get("format") == "raw":
+        return Response(load_content(record), status=200, mimetype="text/plain")
+    return jsonify({"status": 1, "record": history_to_dict(record, True)}), 200
+
+
+@app.route("/history/export", methods=["GET"])
+@token_required
+def history_export():
+    """
+    Exports the whole scraping history of the currently logged-in user as NDJSON.
+    The response is streamed: one JSON object per line (id, url, scrape_method, date and
+    scraped_data, newest first), loaded from the database a batch at a time, so the history
+    is never held in memory as a whole.
+    Returns:
+        Response: An application/x-ndjson attachment.
+        HTTP Status Code:
+            200: The export is streamed.
+    """
+    user_id = _current_user_id()
+
+    def generate():
+        for record in iter_history_records(
+            user_id, app.config["HISTORY_EXPORT_BATCH_SIZE"]
+        ):
+            yield json.dumps(history_to_dict(record, True)) + "\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=history.ndjson"},
+    )
 
 
 login_manager = LoginManager()
@@ -299,8 +906,31 @@ def load_user(user_id):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the development server.")
+    parser.add_argument(
+        "--preload",
+        nargs="?",
+        const="all",
+        help="Load the scraping engines (all, or a comma-separated list) at startup "
+        "instead of on first use.",
+    )
+    args = parser.parse_args()
+
     with app.app_context():
         if not path.exists("instance/" + str(os.getenv("DATABASE_NAME"))):
             db.create_all()
             print("Database created!")
+        else:
+            # Only creates the tables that do not exist yet (e.g. the job queue)
+            db.create_all()
+        run_migrations()
+        # With the reloader, only start background work in the process serving requests
+        if os.getenv("WERKZEUG_RUN_MAIN") == "true":
+            if args.preload:
+                preload_engines(args.preload)
+            # Only load Selenium at startup when the browsers are pre-warmed
+            if app.config["SELENIUM_POOL_PREWARM"]:
+                get_engine("browser").prewarm_driver_pool()
+            if app.config["JOB_WORKERS"] > 0:
+                JobWorkerPool(app.config["JOB_WORKERS"]).start()
         app.run(debug=True)
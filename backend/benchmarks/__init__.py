@@ -0,0 +1,5 @@
+"""
+Benchmarks for the data scraping application.
+
+Run them from the backend directory, e.g. `python -m benchmarks.bench_clean_text`.
+"""
@@ -0,0 +1,162 @@
+"""
+Benchmark of the HTML cleaning pipeline (clean_text).
+
+Compares the previous implementation (BeautifulSoup with html.parser, unused extra parse and a
+per-line regex) with the single-parse engine in core.cleaning, using lxml when installed and the
+streaming HTMLParser fallback otherwise. Every engine is run on every page of the corpus and the
+outputs are checked against the previous implementation.
+
+The corpus is every *.html file in benchmarks/corpus (or --corpus). Save large real pages there
+with --save URL [URL ...]. If the corpus is empty, synthetic pages of 100 KB to 5 MB are used.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_clean_text
+    python -m benchmarks.bench_clean_text --save https://en.wikipedia.org/wiki/Web_scraping
+    python -m benchmarks.bench_clean_text --corpus /path/to/pages --repeat 5
+"""
+
+import argparse
+import os
+import re
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from benchmarks.pages import CORPUS_DIR, load_corpus, synthetic_page
+from core import cleaning
+
+
+def legacy_clean_text(html_content):
+    """
+    The clean_text implementation before the single-parse engine.
+    Its title lookup is made None-safe, the original crashed on an empty <title>.
+    """
+    from bs4 import BeautifulSoup
+
+    # scrape_with_bs4 built a soup that was not used when cleaning
+    BeautifulSoup(html_content, "html.parser")
+
+    soup = BeautifulSoup(html_content, "html.parser")
+    for tag in soup(
+        ["script", "style", "meta", "noscript", "iframe", "svg", "form", "link"]
+    ):
+        tag.decompose()
+
+    text = soup.get_text(separator=" ", strip=True)
+    cleaned_text = " ".join(text.split())
+    lines = cleaned_text.splitlines()
+    formatted_lines = []
+    title = (soup.title.string or "").strip() if soup.title else "No Title Found"
+    formatted_lines.append(f"### {title}\n")
+    for line in lines:
+        line = line.strip()
+        if line:
+            line = re.sub(r"\s+", " ", line)
+            formatted_lines.append(f"- {line}")
+    return "\n".join(formatted_lines)
+
+
+def _clean_with(extract):
+    def clean(html_content):
+        return cleaning.format_clean_text(*extract(html_content))
+
+    return clean
+
+
+def load_pages(corpus_dir):
+    """
+    Loads the corpus pages, or synthetic pages if the corpus is empty.
+
+    Returns:
+        list: (name, html) tuples.
+    """
+    pages = load_corpus(corpus_dir)
+    if not pages:
+        print(f"No *.html files in {corpus_dir}, using synthetic pages")
+        for index, size in enumerate((100_000, 1_000_000, 5_000_000)):
+            pages.append((f"synthetic-{size // 1000}KB", synthetic_page(size, index)))
+    return pages
+
+
+def save_pages(urls, corpus_dir):
+    """Downloads pages into the corpus directory."""
+    import requests
+
+    os.makedirs(corpus_dir, exist_ok=True)
+    for url in urls:
+        response = requests.get(url, timeout=30)
+        response.raise_for_status()
+        parts = urlsplit(url)
+        name = re.sub(r"[^A-Za-z0-9]+", "_", parts.netloc + parts.path).strip("_")
+        path = os.path.join(corpus_dir, f"{name}.html")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(response.text)
+        print(f"Saved {url} ({len(response.text) / 1e6:.2f} MB) to {path}")
+
+
+def time_engine(clean, html_content, repeat):
+    """Returns the median runtime in seconds of `repeat` runs."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        clean(html_content)
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark clean_text engines.")
+    parser.add_argument(
+        "--corpus", default=CORPUS_DIR, help="Directory of *.html pages."
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Runs per page and engine."
+    )
+    parser.add_argument(
+        "--save", nargs="+", metavar="URL", help="Save pages to the corpus."
+    )
+    args = parser.parse_args()
+
+    if args.save:
+        save_pages(args.save, args.corpus)
+
+    engines = {"legacy (bs4)": legacy_clean_text}
+    if cleaning._lxml() is not None:
+        engines["lxml"] = _clean_with(cleaning._extract_with_lxml)
+    engines["html.parser stream"] = _clean_with(cleaning._extract_with_html_parser)
+
+    pages = load_pages(args.corpus)
+    totals = dict.fromkeys(engines, 0.0)
+    total_bytes = 0
+
+    header = f"{'page':<32}{'MB':>7}" + "".join(f"{name:>22}" for name in engines)
+    print(header)
+    print("-" * len(header))
+    for name, html_content in pages:
+        size = len(html_content.encode("utf-8"))
+        total_bytes += size
+        expected = legacy_clean_text(html_content)
+        row = f"{name[:31]:<32}{size / 1e6:>7.2f}"
+        for engine, clean in engines.items():
+            duration = time_engine(clean, html_content, args.repeat)
+            totals[engine] += duration
+            same = "" if clean(html_content) == expected else "*"
+            row += f"{duration * 1000:>19.1f}ms{same:1}"
+        print(row)
+
+    print("-" * len(header))
+    summary = f"{'total':<32}{total_bytes / 1e6:>7.2f}"
+    for engine in engines:
+        summary += f"{totals[engine] * 1000:>20.1f}ms"
+    print(summary)
+    baseline = totals["legacy (bs4)"]
+    for engine in engines:
+        throughput = total_bytes / 1e6 / totals[engine]
+        print(
+            f"{engine:<22}{throughput:>8.1f} MB/s  {baseline / totals[engine]:>6.1f}x"
+        )
+    print("* output differs from the legacy implementation")
+
+
+if __name__ == "__main__":
+    main()
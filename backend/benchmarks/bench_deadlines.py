@@ -0,0 +1,150 @@
+"""
+Benchmark of the scrape deadline (core.deadlines): a pool of scrape workers saturated by slow
+targets.
+
+--workers threads (like the batch or job workers) scrape --scrapes pages of the local fixture
+server, a share of them (--slow-share) from a target that trickles its body 1 KB every
+--trickle-ms milliseconds (never idle long enough for a read timeout). Every run scrapes the
+same list with a different deadline (--timeouts): slow scrapes hold their worker until their
+deadline, so with a long one the fast scrapes queue behind them. The largest timeout lets
+every slow page download in full, like the socket timeouts alone did.
+Reported are the total runtime, the throughput, the median and p99 latency of the fast scrapes
+(including the time queued for a worker) and the number of scrapes aborted by their deadline.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_deadlines
+    python -m benchmarks.bench_deadlines --workers 8 --scrapes 200 --slow-share 0.1
+    python -m benchmarks.bench_deadlines --timeouts 1 5 60
+"""
+
+import argparse
+import os
+import queue
+import statistics
+import sys
+import threading
+import time
+from contextlib import redirect_stdout
+
+from benchmarks.fixture_server import FixtureServer
+
+# Size of the slow pages, they take 100 ticks of --trickle-ms to download
+SLOW_PAGE_BYTES = 100 * 1024
+
+
+def run_pool(urls, workers, timeout):
+    """
+    Scrapes every URL with a pool of worker threads.
+
+    Args:
+        urls (list): (url, slow) tuples in submission order.
+        workers (int): Number of worker threads.
+        timeout (float): The deadline of every scrape in seconds.
+
+    Returns:
+        dict: seconds, the total runtime, fast_ms, the latencies of the fast scrapes, and
+        aborted, the number of scrapes that hit their deadline.
+    """
+    from config import app
+    from core.scraper import is_scrape_error, run_scraper
+
+    tasks = queue.Queue()
+    for url, slow in urls:
+        tasks.put((url, slow))
+    fast_ms = []
+    aborted = []
+    started = time.perf_counter()
+
+    def work():
+        with app.app_context():
+            while True:
+                try:
+                    url, slow = tasks.get_nowait()
+                except queue.Empty:
+                    return
+                result = run_scraper(url, "bs4", clean=True, timeout=timeout)
+                if is_scrape_error(result) and "deadline" in result:
+                    aborted.append(url)
+                if not slow:
+                    fast_ms.append((time.perf_counter() - started) * 1000)
+
+    threads = [threading.Thread(target=work) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        "seconds": time.perf_counter() - started,
+        "fast_ms": fast_ms or [0.0],
+        "aborted": len(aborted),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scrape deadline.")
+    parser.add_argument("--workers", type=int, default=4, help="Scrape workers.")
+    parser.add_argument("--scrapes", type=int, default=100, help="Scrapes per run.")
+    parser.add_argument(
+        "--slow-share", type=float, default=0.1, help="Share of slow targets."
+    )
+    parser.add_argument(
+        "--trickle-ms", type=int, default=50, help="Milliseconds between 1 KB chunks."
+    )
+    parser.add_argument(
+        "--timeouts",
+        type=float,
+        nargs="+",
+        default=[1, 2, 60],
+        help="Deadlines of the runs in seconds.",
+    )
+    args = parser.parse_args()
+
+    # A throwaway setup: no cache, politeness or robots.txt between the workers and the server
+    os.environ.setdefault("DATABASE_URI", "sqlite://")
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.update(
+        CACHE_ENABLED="false",
+        POLITENESS_ENABLED="false",
+        ROBOTS_ENABLED="false",
+        METRICS_ENABLED="false",
+        SCRAPE_MAX_TIMEOUT=str(max(args.timeouts)),
+    )
+
+    slow_every = round(1 / args.slow_share) if args.slow_share > 0 else 0
+    with FixtureServer() as server:
+        urls = [
+            (
+                (server.url(f"/trickle/{args.trickle_ms}/{SLOW_PAGE_BYTES}.html"), True)
+                if slow_every and index % slow_every == 0
+                else (server.url(f"/synthetic/{20_000 + index}.html"), False)
+            )
+            for index in range(args.scrapes)
+        ]
+        slow = sum(1 for _, is_slow in urls if is_slow)
+        print(
+            f"{args.workers} workers, {args.scrapes} scrapes ({slow} slow, "
+            f"{args.trickle_ms * SLOW_PAGE_BYTES / 1024 / 1000:.1f}s to download each)"
+        )
+        header = (
+            f"{'timeout':<10}{'seconds':>10}{'scrapes/s':>11}"
+            f"{'fast p50':>12}{'fast p99':>12}{'aborted':>9}"
+        )
+        print(header)
+        print("-" * len(header))
+        for timeout in args.timeouts:
+            # The scrapers log every scrape
+            with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                result = run_pool(urls, args.workers, timeout)
+            fast_ms = sorted(result["fast_ms"])
+            p99 = fast_ms[min(int(len(fast_ms) * 0.99), len(fast_ms) - 1)]
+            print(
+                f"{timeout:<10g}{result['seconds']:>10.2f}"
+                f"{args.scrapes / result['seconds']:>11.1f}"
+                f"{statistics.median(fast_ms):>10.0f}ms{p99:>10.0f}ms"
+                f"{result['aborted']:>9}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
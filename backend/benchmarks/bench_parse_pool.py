@@ -0,0 +1,144 @@
+"""
+Benchmark of the parse pool (core.parse_pool): cleaning large pages in the request threads
+versus in worker processes.
+
+--threads threads each clean --documents pages of --size bytes, like concurrent /scrape
+requests of a threaded server. Meanwhile a probe thread measures the latency of a small
+request (cleaning a 10 KB page inline), which is what the other requests of the process see
+while the large pages are parsed. Runs:
+- inline: the pages are cleaned in the threads, serialized by the GIL.
+- pool-N: the pages are cleaned by a pool of N worker processes (--workers, default 1, 2 and
+  the number of CPUs).
+Reported are the throughput in pages and MB per second and the median and maximum probe
+latency. Throughput of the pool scales with the number of cores, up to --threads.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_parse_pool
+    python -m benchmarks.bench_parse_pool --threads 8 --documents 4 --size 2000000
+    python -m benchmarks.bench_parse_pool --workers 1 4 8
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+from benchmarks.pages import synthetic_page
+from core.parse_pool import TASKS, ParsePool
+
+
+def run_load(parse, pages, threads, probe_page):
+    """
+    Parses every page in `threads` threads while probing the latency of a small parse.
+
+    Args:
+        parse (callable): Parses one page.
+        pages (list): The pages of every thread.
+        threads (int): Number of concurrent threads.
+        probe_page (str): The page of the probe.
+
+    Returns:
+        dict: seconds, the total runtime, and probe_ms, the probe latencies.
+    """
+    done = threading.Event()
+    probes = []
+
+    def probe():
+        while not done.is_set():
+            started = time.perf_counter()
+            TASKS["text"](probe_page)
+            probes.append((time.perf_counter() - started) * 1000)
+            time.sleep(0.01)
+
+    def work():
+        for html_content in pages:
+            parse(html_content)
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    prober = threading.Thread(target=probe)
+    started = time.perf_counter()
+    prober.start()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    seconds = time.perf_counter() - started
+    done.set()
+    prober.join()
+    return {"seconds": seconds, "probe_ms": probes or [0.0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the parse pool.")
+    parser.add_argument(
+        "--threads", type=int, default=4, help="Concurrent request threads."
+    )
+    parser.add_argument(
+        "--documents", type=int, default=3, help="Pages cleaned by every thread."
+    )
+    parser.add_argument(
+        "--size", type=int, default=1_000_000, help="Size of a page in bytes."
+    )
+    parser.add_argument(
+        "--workers", type=int, nargs="+", help="Pool sizes (default: 1, 2 and CPUs)."
+    )
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    pool_sizes = args.workers or sorted({1, 2, cpus})
+    pages = [synthetic_page(args.size, seed) for seed in range(args.documents)]
+    probe_page = synthetic_page(10_000, 99)
+    total_mb = args.size * args.documents * args.threads / 1e6
+    print(
+        f"{args.threads} threads x {args.documents} pages of {args.size / 1e6:.1f} MB, "
+        f"{cpus} CPUs"
+    )
+
+    runs = {"inline": lambda html_content: TASKS["text"](html_content)}
+    pools = []
+    for size in pool_sizes:
+        pool = ParsePool(size, max_queue=args.threads, timeout=300)
+        # Start the workers, their startup is not part of the measurement
+        warmups = [
+            threading.Thread(target=pool.run, args=("text", probe_page))
+            for _ in range(size)
+        ]
+        for warmup in warmups:
+            warmup.start()
+        for warmup in warmups:
+            warmup.join()
+        pools.append(pool)
+        runs[f"pool-{size}"] = lambda html_content, pool=pool: pool.run(
+            "text", html_content
+        )
+
+    header = (
+        f"{'run':<12}{'seconds':>10}{'pages/s':>10}{'MB/s':>10}"
+        f"{'probe p50':>12}{'probe max':>12}"
+    )
+    print(header)
+    print("-" * len(header))
+    baseline = None
+    try:
+        for name, parse in runs.items():
+            result = run_load(parse, pages, args.threads, probe_page)
+            seconds = result["seconds"]
+            baseline = baseline or seconds
+            print(
+                f"{name:<12}{seconds:>10.2f}"
+                f"{args.documents * args.threads / seconds:>10.1f}"
+                f"{total_mb / seconds:>10.1f}"
+                f"{statistics.median(result['probe_ms']):>10.1f}ms"
+                f"{max(result['probe_ms']):>10.1f}ms"
+                f"   {baseline / seconds:.2f}x"
+            )
+    finally:
+        for pool in pools:
+            pool.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+"""
+Benchmark of the history search (core/search.py) on a large history.
+
+A throwaway SQLite database is filled with --records history records of --users users, stored
+through core.repository in batches like the history writer does, so every record is indexed
+on the way in. The records are cleaned text of --words words drawn from a Zipf-distributed
+vocabulary, so some words are in almost every record and others in a handful. Then the
+queries below are run for one user with repository.search_user_history, --repeat times each.
+
+Reported are the insert rate, the size of the database and of the index, and the median and
+p99 latency and the result count of every query.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_search
+    python -m benchmarks.bench_search --records 300000 --users 1
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+from sqlalchemy import text
+
+# Size of the vocabulary, word i is drawn with a probability proportional to 1 / (i + 1)
+VOCABULARY_SIZE = 20000
+
+# (label, query, page)
+QUERIES = (
+    ("common word", "w0", 1),
+    ("rare word", "w15000", 1),
+    ("two words", "w3 w250", 1),
+    ("phrase", '"w1 w2"', 1),
+    ("prefix", "w123*", 1),
+    ("url word", "page", 1),
+    ("no match", "nothinglikethis", 1),
+    ("common word, page 10", "w0", 10),
+)
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+def build_history(records, users, words, batch_size=500):
+    """
+    Stores synthetic history records through core.repository.
+
+    Args:
+        records (int): Number of records.
+        users (int): Number of users the records are spread over.
+        words (int): Words per record.
+        batch_size (int): Records per transaction.
+
+    Returns:
+        tuple: (user_ids, seconds), the ids of the users and the time taken to store.
+    """
+    from config import db
+    from core.models import User
+    from core.repository import store_history_records
+
+    user_ids = []
+    for index in range(users):
+        user = User(email=f"u{index}@example.com", username=f"u{index}", password="-")
+        db.session.add(user)
+        db.session.commit()
+        user_ids.append(user.id)
+
+    rng = random.Random(42)
+    vocabulary = [f"w{index}" for index in range(VOCABULARY_SIZE)]
+    weights = [1 / (index + 1) for index in range(VOCABULARY_SIZE)]
+    started = time.perf_counter()
+    for start in range(0, records, batch_size):
+        batch = []
+        for index in range(start, min(start + batch_size, records)):
+            content = " ".join(rng.choices(vocabulary, weights, k=words))
+            batch.append(
+                (
+                    f"https://site{index % 97}.example/page/{index}",
+                    "bs4",
+                    f"{content} {index}",
+                    user_ids[index % users],
+                )
+            )
+        store_history_records(batch)
+        db.session.expunge_all()
+    return user_ids, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the history search.")
+    parser.add_argument("--records", type=int, default=200000, help="History records.")
+    parser.add_argument("--users", type=int, default=4, help="Users owning them.")
+    parser.add_argument("--words", type=int, default=150, help="Words per record.")
+    parser.add_argument("--limit", type=int, default=20, help="Results per page.")
+    parser.add_argument("--repeat", type=int, default=50, help="Runs per query.")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="bench-search-")
+    database = os.path.join(directory, "history.db")
+    os.environ.update(
+        DATABASE_URI=f"sqlite:///{database}",
+        SECRET_KEY=os.getenv("SECRET_KEY", "benchmark"),
+        HISTORY_WRITE_BEHIND="false",
+    )
+    # The application reads its configuration when it is imported
+    from config import app, db
+    from core.migrations import run_migrations
+    from core.repository import search_user_history
+
+    with app.app_context():
+        db.create_all()
+        run_migrations()
+        # The repository logs every batch
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            user_ids, seconds = build_history(args.records, args.users, args.words)
+        index_bytes = db.session.execute(
+            text("SELECT SUM(pgsize) FROM dbstat WHERE name LIKE 'history_search%'")
+        ).scalar()
+        print(
+            f"{args.records} records of {args.users} users stored in {seconds:.1f}s "
+            f"({args.records / seconds:.0f} records/s), database "
+            f"{os.path.getsize(database) / 2**20:.0f} MB, search index "
+            f"{(index_bytes or 0) / 2**20:.0f} MB"
+        )
+
+        header = f"{'query':<24}{'results':>9}{'p50':>10}{'p99':>10}"
+        print(header)
+        print("-" * len(header))
+        for label, query, page in QUERIES:
+            # The cursor of the page is found once, only the page itself is timed
+            cursor = None
+            for _ in range(page - 1):
+                _, cursor = search_user_history(user_ids[0], query, args.limit, cursor)
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                results, _ = search_user_history(user_ids[0], query, args.limit, cursor)
+                timings.append((time.perf_counter() - started) * 1000)
+            print(
+                f"{label:<24}{len(results):>9}"
+                f"{percentile(timings, 0.5):>8.1f}ms{percentile(timings, 0.99):>8.1f}ms"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+"""
+Benchmark of the application startup: import time and memory of a worker process.
+
+Every measurement runs in a fresh interpreter (`python -c`), so nothing is imported before
+the application:
+- import: `import app` as a gunicorn worker does it, the time it takes, the RSS afterwards
+  and the scraping engines it loaded.
+- import_preload: the same, followed by loading all scraping engines (what a worker pays
+  before its first scrape, or the master with --preload).
+- workers_lazy / workers_preload (Linux only): a master imports the application and forks
+  --workers workers, like gunicorn. Every worker then loads all engines, as it would serving
+  scrapes. Without preload the workers import the engines themselves, with preload the master
+  loaded them before the fork and the workers share that memory copy-on-write. Reported are
+  the private memory per worker and the proportional set size (PSS) of all processes.
+Every measurement is repeated --repeat times, the median is reported.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --repeat 10 --workers 4 --output startup.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+from benchmarks.bench_suite import BACKEND_DIR, RESULTS_DIR, bench_environment
+
+# Runs in the fresh interpreter: argv is the mode and the number of workers. Only the
+# standard library modules the interpreter loads anyway are imported before the application.
+PROBE = r"""
+import json, os, sys, time
+
+HEAVY_MODULES = ("selenium", "bs4", "lxml", "requests", "cssselect")
+
+
+def memory():
+    # The current RSS, and the private memory and PSS on Linux
+    stats = {}
+    try:
+        with open("/proc/self/smaps_rollup") as file:
+            for line in file:
+                key, value = line.split(":", 1)
+                if key in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                    stats[key] = int(value.split()[0]) / 1024
+    except OSError:
+        import resource
+        stats["Rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {
+        "rss_mb": round(stats["Rss"], 1),
+        "pss_mb": round(stats.get("Pss", stats["Rss"]), 1),
+        "private_mb": round(
+            stats.get("Private_Clean", 0) + stats.get("Private_Dirty", stats["Rss"]), 1
+        ),
+    }
+
+
+def load_engines():
+    try:
+        from core.engines import preload_engines
+    except ImportError:  # before the engine registry, the engines load with the app
+        return
+    preload_engines("all")
+
+
+mode, workers = sys.argv[1], int(sys.argv[2])
+started = time.perf_counter()
+import app  # noqa: E402,F401
+result = {"import_seconds": round(time.perf_counter() - started, 4)}
+if mode in ("import_preload", "workers_preload"):
+    started = time.perf_counter()
+    load_engines()
+    result["preload_seconds"] = round(time.perf_counter() - started, 4)
+result["engines_loaded"] = sorted(m for m in HEAVY_MODULES if m in sys.modules)
+result.update(memory())
+
+if mode.startswith("workers_"):
+    ready_read, ready_write = os.pipe()
+    go_read, go_write = os.pipe()
+    result_read, result_write = os.pipe()
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            load_engines()
+            os.write(ready_write, b"r")
+            # Measure once every worker is loaded, the PSS depends on who shares the pages
+            os.read(go_read, 1)
+            os.write(result_write, (json.dumps(memory()) + "\n").encode())
+            os._exit(0)
+        children.append(pid)
+    for _ in range(workers):
+        os.read(ready_read, 1)
+    master = memory()
+    os.write(go_write, b"g" * workers)
+    lines = b""
+    while lines.count(b"\n") < workers:
+        lines += os.read(result_read, 65536)
+    for pid in children:
+        os.waitpid(pid, 0)
+    worker_stats = [json.loads(line) for line in lines.decode().splitlines()]
+    result["worker_private_mb"] = round(
+        sum(s["private_mb"] for s in worker_stats) / workers, 1
+    )
+    result["total_pss_mb"] = round(
+        master["pss_mb"] + sum(s["pss_mb"] for s in worker_stats), 1
+    )
+print(json.dumps(result))
+"""
+
+MODES = {
+    "import": "Import the application (cold worker start).",
+    "import_preload": "Import the application and load all scraping engines.",
+    "workers_lazy": "Fork workers, every worker imports the engines itself.",
+    "workers_preload": "Load the engines in the master, then fork the workers.",
+}
+
+
+def run_probe(mode, workers, env):
+    """
+    Runs one measurement in a fresh interpreter.
+
+    Args:
+        mode (str): One of MODES.
+        workers (int): Number of forked workers of the workers_* modes.
+        env (dict): The environment of the interpreter.
+
+    Returns:
+        dict: The measurement.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-c", PROBE, mode, str(workers)],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # The application prints while it loads, the measurement is the last line
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def median_result(runs):
+    """
+    Combines repeated measurements into their medians.
+
+    Args:
+        runs (list): The measurements of one mode.
+
+    Returns:
+        dict: The median of every numeric value, the other values of the first run.
+    """
+    combined = dict(runs[0])
+    for key, value in runs[0].items():
+        if isinstance(value, (int, float)):
+            combined[key] = round(statistics.median(run[key] for run in runs), 4)
+    return combined
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the application startup.")
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Measurements per mode (median)."
+    )
+    parser.add_argument(
+        "--workers", type=int, default=4, help="Forked workers of the workers_* modes."
+    )
+    parser.add_argument(
+        "--only", nargs="+", choices=list(MODES), metavar="MODE", help="Modes to run."
+    )
+    parser.add_argument(
+        "--output",
+        help="Result file (default: benchmarks/results/startup-<time>.json).",
+    )
+    args = parser.parse_args()
+
+    modes = args.only or list(MODES)
+    if not sys.platform.startswith("linux"):
+        # Forking workers and reading smaps are Linux only
+        modes = [mode for mode in modes if not mode.startswith("workers_")]
+
+    workdir = tempfile.mkdtemp(prefix="scraper-startup-")
+    env = {**os.environ, **bench_environment(workdir)}
+    env.pop("ENGINES_PRELOAD", None)
+    results = {}
+    try:
+        for mode in modes:
+            runs = [run_probe(mode, args.workers, env) for _ in range(args.repeat)]
+            results[mode] = {"description": MODES[mode], **median_result(runs)}
+            values = ", ".join(
+                f"{key}={value}"
+                for key, value in results[mode].items()
+                if key != "description"
+            )
+            print(f"{mode:<16}{values}", file=sys.stderr)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"startup-{stamp}.json")
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(
+            {
+                "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "settings": {"repeat": args.repeat, "workers": args.workers},
+                "modes": results,
+            },
+            file,
+            indent=2,
+        )
+    print(f"Results saved to {output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,660 @@
+"""
+Benchmark suite of the scrape pipeline and the API.
+
+Every run starts the local fixture server (benchmarks.fixture_server) and measures scenarios:
+- scrape_*: the scraper functions called directly (fetch, download, parse, clean, extract),
+  for synthetic pages of different sizes, recorded corpus pages, chunked (streamed) pages,
+  redirect chains, slow endpoints and cache hits.
+- api_*_test_client: the Flask endpoints called through the test client (no network).
+- api_*_load: the Flask endpoints served by a real threaded HTTP server, driven by the
+  concurrent load generator (benchmarks.loadgen).
+For every scenario the throughput, p50/p90/p99 latency and the peak RSS of the process are
+reported. The peak RSS only grows during a run, use --isolate to measure every scenario in a
+fresh process.
+
+The application runs against a throwaway database, without content cache (unless the scenario
+is about the cache), politeness delays or background job workers, so runs are reproducible.
+Results are saved as JSON, and two result files can be compared.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_suite
+    python -m benchmarks.bench_suite --quick --only scrape_bs4_clean_100KB api_history_load
+    python -m benchmarks.bench_suite --isolate --output before.json
+    python -m benchmarks.bench_suite --compare before.json after.json
+    python -m benchmarks.bench_suite --list
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.fixture_server import FixtureServer
+from benchmarks.loadgen import peak_rss_mb, run_load
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# Number of history records of the benchmark user, listed by the /history scenarios
+HISTORY_RECORDS = 2000
+
+
+def bench_environment(workdir):
+    """
+    Returns the environment variables the application is configured with during a run.
+
+    Args:
+        workdir (str): Directory of the throwaway database and cache.
+
+    Returns:
+        dict: The environment variables.
+    """
+    return {
+        "DATABASE_URI": "sqlite:///" + os.path.join(workdir, "bench.db"),
+        "SECRET_KEY": "benchmark-secret-key-not-for-production",
+        "CACHE_ENABLED": "false",
+        "CACHE_DISK_DIR": os.path.join(workdir, "cache"),
+        # The fixture server is local, rate limits would only measure the scheduler delays
+        "POLITENESS_ENABLED": "false",
+        "ROBOTS_ENABLED": "false",
+        "JOB_WORKERS": "0",
+        "SELENIUM_POOL_PREWARM": "false",
+    }
+
+
+class BenchContext:
+    """
+    The application, fixture server and benchmark user shared by the scenarios.
+
+    Args:
+        fixtures (FixtureServer): The running fixture server.
+        scale (float): Factor applied to the number of requests of every scenario.
+        concurrency (int): Number of concurrent clients of the load scenarios.
+    """
+
+    def __init__(self, fixtures, scale, concurrency):
+        # The application reads its configuration when it is imported
+        from app import app
+        from config import db
+        from core.migrations import run_migrations
+
+        self.app = app
+        self.fixtures = fixtures
+        self.scale = scale
+        self.concurrency = concurrency
+        self.client = app.test_client()
+        self._server = None
+        self._local = threading.local()
+
+        with app.app_context():
+            db.create_all()
+            run_migrations()
+        self.user_id = self._create_user()
+        self.headers = {"Authorization": f"Bearer {self._token()}"}
+
+    def requests(self, count):
+        """Returns the number of requests of a scenario, scaled by --quick."""
+        return max(int(count * self.scale), 1)
+
+    def _create_user(self):
+        from werkzeug.security import generate_password_hash
+
+        from config import db
+        from core.models import User
+        from core.repository import store_history_records
+
+        with self.app.app_context():
+            user = User(
+                email="bench@example.com",
+                username="bench",
+                password=generate_password_hash("bench"),
+            )
+            db.session.add(user)
+            db.session.commit()
+            user_id = user.id
+            for start in range(0, HISTORY_RECORDS, 200):
+                store_history_records(
+                    [
+                        (
+                            self.fixtures.url(f"/synthetic/{index}.html"),
+                            "bs4",
+                            f"### Page {index}\n- " + "scraped text " * 50,
+                            user_id,
+                        )
+                        for index in range(start, min(start + 200, HISTORY_RECORDS))
+                    ]
+                )
+        return user_id
+
+    def _token(self):
+        import jwt
+
+        return jwt.encode(
+            {
+                "user": "bench@example.com",
+                "user_id": self.user_id,
+                "exp": datetime.now(timezone.utc) + timedelta(days=1),
+            },
+            self.app.config["SECRET_KEY"],
+            algorithm="HS256",
+        )
+
+    def api_url(self, path):
+        """
+        Returns the URL of an API path on a real threaded HTTP server, started on first use.
+
+        Args:
+            path (str): The API path, e.g. "/history".
+        """
+        if self._server is None:
+            from werkzeug.serving import make_server
+
+            logging.getLogger("werkzeug").setLevel(logging.ERROR)
+            self._server = make_server("127.0.0.1", 0, self.app, threaded=True)
+            threading.Thread(
+                target=self._server.serve_forever, name="api-server", daemon=True
+            ).start()
+        return f"http://127.0.0.1:{self._server.server_port}{path}"
+
+    def session(self):
+        """Returns the requests session of the calling load generator thread."""
+        import requests
+
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+
+
+SCENARIOS: dict = {}
+
+
+def scenario(name, description):
+    """Registers a scenario function, which takes a BenchContext and returns its stats."""
+
+    def register(func):
+        SCENARIOS[name] = (description, func)
+        return func
+
+    return register
+
+
+def _scrape(ctx, url, method, clean=False, rule_set=None):
+    """Returns an operation running a scrape directly, True when it succeeds."""
+    from core.scraper import is_scrape_error, run_scraper
+
+    def operation():
+        with ctx.app.app_context():
+            result = run_scraper(url, method, clean=clean, rule_set=rule_set)
+        return not is_scrape_error(result)
+
+    return operation
+
+
+@scenario("scrape_requests_100KB", "requests method, 100 KB page")
+def scrape_requests_100kb(ctx):
+    url = ctx.fixtures.url("/synthetic/100000.html")
+    return run_load(_scrape(ctx, url, "requests"), requests=ctx.requests(300), warmup=3)
+
+
+@scenario("scrape_bs4_clean_10KB", "bs4 method with cleaning, 10 KB page")
+def scrape_bs4_clean_10kb(ctx):
+    url = ctx.fixtures.url("/synthetic/10000.html")
+    operation = _scrape(ctx, url, "bs4", clean=True)
+    return run_load(operation, requests=ctx.requests(500), warmup=3)
+
+
+@scenario("scrape_bs4_clean_100KB", "bs4 method with cleaning, 100 KB page")
+def scrape_bs4_clean_100kb(ctx):
+    url = ctx.fixtures.url("/synthetic/100000.html")
+    operation = _scrape(ctx, url, "bs4", clean=True)
+    return run_load(operation, requests=ctx.requests(200), warmup=3)
+
+
+@scenario("scrape_bs4_clean_1MB", "bs4 method with cleaning, 1 MB page")
+def scrape_bs4_clean_1mb(ctx):
+    url = ctx.fixtures.url("/synthetic/1000000.html")
+    operation = _scrape(ctx, url, "bs4", clean=True)
+    return run_load(operation, requests=ctx.requests(30), warmup=1)
+
+
+@scenario("scrape_bs4_prettify_100KB", "bs4 method without cleaning, 100 KB page")
+def scrape_bs4_prettify_100kb(ctx):
+    url = ctx.fixtures.url("/synthetic/100000.html")
+    return run_load(_scrape(ctx, url, "bs4"), requests=ctx.requests(100), warmup=2)
+
+
+@scenario("scrape_bs4_clean_chunked_5MB", "bs4 cleaning a streamed 5 MB chunked page")
+def scrape_bs4_clean_chunked_5mb(ctx):
+    url = ctx.fixtures.url("/chunked/5000000.html")
+    operation = _scrape(ctx, url, "bs4", clean=True)
+    return run_load(operation, requests=ctx.requests(10), warmup=1)
+
+
+@scenario("scrape_extract_100KB", "extract method (page_meta rule set), 100 KB page")
+def scrape_extract_100kb(ctx):
+    url = ctx.fixtures.url("/synthetic/100000.html")
+    operation = _scrape(ctx, url, "extract", rule_set="page_meta")
+    return run_load(operation, requests=ctx.requests(300), warmup=3)
+
+
+@scenario("scrape_corpus_bs4_clean", "bs4 cleaning the recorded corpus pages in turn")
+def scrape_corpus_bs4_clean(ctx):
+    names = ctx.fixtures.corpus_names
+    if not names:
+        return None
+    operations = [
+        _scrape(ctx, ctx.fixtures.url(f"/corpus/{name}"), "bs4", clean=True)
+        for name in names
+    ]
+    counter = iter(range(10**9))
+    lock = threading.Lock()
+
+    def operation():
+        with lock:
+            index = next(counter)
+        return operations[index % len(operations)]()
+
+    return run_load(operation, requests=ctx.requests(10 * len(names)), warmup=1)
+
+
+@scenario("scrape_redirect_chain", "bs4 cleaning a 100 KB page behind 3 redirects")
+def scrape_redirect_chain(ctx):
+    url = ctx.fixtures.url("/redirect/3/100000.html")
+    operation = _scrape(ctx, url, "bs4", clean=True)
+    return run_load(operation, requests=ctx.requests(100), warmup=2)
+
+
+@scenario("scrape_slow_concurrent", "requests method, 100 ms endpoint, concurrent")
+def scrape_slow_concurrent(ctx):
+    url = ctx.fixtures.url("/slow/100/10000.html")
+    return run_load(
+        _scrape(ctx, url, "requests"),
+        concurrency=ctx.concurrency,
+        requests=ctx.requests(10 * ctx.concurrency),
+        warmup=1,
+    )
+
+
+@scenario("scrape_bs4_cached_100KB", "bs4 cleaning served from the content cache")
+def scrape_bs4_cached_100kb(ctx):
+    url = ctx.fixtures.url("/synthetic/100000.html?cached")
+    ctx.app.config["CACHE_ENABLED"] = True
+    try:
+        operation = _scrape(ctx, url, "bs4", clean=True)
+        return run_load(operation, requests=ctx.requests(1000), warmup=1)
+    finally:
+        ctx.app.config["CACHE_ENABLED"] = False
+
+
+@scenario(
+    "crawl_site_100", "crawl of a 100-page linked site (bs4, clean), whole crawls"
+)
+def crawl_site_100(ctx):
+    from core.crawl import crawl, validate_crawl_request
+
+    options, _ = validate_crawl_request(
+        {
+            "url": ctx.fixtures.url("/site/100/0.html"),
+            "clean_data": True,
+            "max_depth": 5,
+            "max_pages": 100,
+        }
+    )
+
+    def operation():
+        with ctx.app.app_context():
+            stats = crawl(options)["stats"]
+        return stats["pages"] == 100 and stats["failed"] == 0
+
+    return run_load(operation, requests=ctx.requests(5), warmup=1)
+
+
+def _flush_history():
+    from core.history_writer import flush_history
+
+    flush_history()
+
+
+@scenario("api_scrape_test_client", "POST /scrape (bs4, clean, 100 KB) with history")
+def api_scrape_test_client(ctx):
+    body = {
+        "url": ctx.fixtures.url("/synthetic/100000.html"),
+        "scraping_method": "bs4",
+        "clean_data": True,
+    }
+
+    def operation():
+        return (
+            ctx.client.post("/scrape", json=body, headers=ctx.headers).status_code
+            == 201
+        )
+
+    try:
+        return run_load(operation, requests=ctx.requests(200), warmup=3)
+    finally:
+        _flush_history()
+
+
+@scenario("api_history_test_client", "GET /history (50 records per page)")
+def api_history_test_client(ctx):
+    def operation():
+        response = ctx.client.get("/history?limit=50", headers=ctx.headers)
+        return response.status_code == 200
+
+    return run_load(operation, requests=ctx.requests(500), warmup=3)
+
+
+@scenario("api_history_record_test_client", "GET /history/<id> (record with content)")
+def api_history_record_test_client(ctx):
+    first = ctx.client.get("/history?limit=1", headers=ctx.headers).get_json()
+    path = f"/history/{first['items'][0]['id']}"
+
+    def operation():
+        return ctx.client.get(path, headers=ctx.headers).status_code == 200
+
+    return run_load(operation, requests=ctx.requests(500), warmup=3)
+
+
+@scenario(
+    "api_history_search_test_client",
+    "GET /history/search (20 ranked results of all records, with snippets)",
+)
+def api_history_search_test_client(ctx):
+    def operation():
+        response = ctx.client.get(
+            "/history/search?q=scraped+text&limit=20", headers=ctx.headers
+        )
+        return response.status_code == 200
+
+    return run_load(operation, requests=ctx.requests(500), warmup=3)
+
+
+@scenario(
+    "api_scrape_load", "POST /scrape (bs4, clean, 100 KB), concurrent HTTP clients"
+)
+def api_scrape_load(ctx):
+    url = ctx.api_url("/scrape")
+    body = {
+        "url": ctx.fixtures.url("/synthetic/100000.html"),
+        "scraping_method": "bs4",
+        "clean_data": True,
+    }
+
+    def operation():
+        response = ctx.session().post(url, json=body, headers=ctx.headers, timeout=60)
+        return response.status_code == 201
+
+    try:
+        return run_load(
+            operation,
+            concurrency=ctx.concurrency,
+            requests=ctx.requests(400),
+            warmup=3,
+        )
+    finally:
+        _flush_history()
+
+
+@scenario(
+    "api_history_load", "GET /history (50 records per page), concurrent HTTP clients"
+)
+def api_history_load(ctx):
+    url = ctx.api_url("/history?limit=50")
+
+    def operation():
+        response = ctx.session().get(url, headers=ctx.headers, timeout=60)
+        return response.status_code == 200
+
+    return run_load(
+        operation,
+        concurrency=ctx.concurrency,
+        requests=ctx.requests(1000),
+        warmup=3,
+    )
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_scenarios(names, scale, concurrency):
+    """
+    Runs scenarios in this process.
+
+    Args:
+        names (list): The scenario names.
+        scale (float): Factor applied to the number of requests.
+        concurrency (int): Number of concurrent clients of the load scenarios.
+
+    Returns:
+        dict: Maps every scenario name to its stats (None if it was skipped).
+    """
+    workdir = tempfile.mkdtemp(prefix="scraper-bench-")
+    os.environ.update(bench_environment(workdir))
+    results = {}
+    try:
+        with FixtureServer() as fixtures:
+            # The scrape functions print a line per request
+            with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                ctx = BenchContext(fixtures, scale, concurrency)
+                try:
+                    for name in names:
+                        description, func = SCENARIOS[name]
+                        stats = func(ctx)
+                        if stats is not None:
+                            stats = {
+                                "description": description,
+                                **stats,
+                                "peak_rss_mb": peak_rss_mb(),
+                            }
+                        results[name] = stats
+                        print(_format_result(name, stats), file=sys.stderr)
+                finally:
+                    ctx.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def run_isolated(names, args):
+    """
+    Runs every scenario in its own process, so its peak RSS is its own.
+
+    Returns:
+        dict: Maps every scenario name to its stats (None if it was skipped).
+    """
+    results = {}
+    for name in names:
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as file:
+            output = file.name
+        try:
+            subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "benchmarks.bench_suite",
+                    "--only",
+                    name,
+                    "--output",
+                    output,
+                    "--concurrency",
+                    str(args.concurrency),
+                ]
+                + (["--quick"] if args.quick else []),
+                cwd=BACKEND_DIR,
+                check=True,
+            )
+            with open(output, encoding="utf-8") as file:
+                results.update(json.load(file)["scenarios"])
+        finally:
+            os.remove(output)
+    return results
+
+
+def _format_result(name, stats):
+    if stats is None:
+        return f"{name:<34} skipped"
+    rss = stats["peak_rss_mb"]
+    return (
+        f"{name:<34}{stats['throughput']:>10.1f}/s"
+        f"{stats['p50_ms']:>11.2f}ms{stats['p99_ms']:>11.2f}ms"
+        f"{stats['errors']:>8}{'' if rss is None else f'{rss:>10.1f}MB'}"
+    )
+
+
+def _change(old, new):
+    if not old:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def compare(old_path, new_path, threshold):
+    """
+    Prints the changes between two result files.
+
+    Args:
+        old_path (str): The baseline results.
+        new_path (str): The new results.
+        threshold (float): Relative change (e.g. 0.1) above which a change is flagged.
+
+    Returns:
+        int: The number of flagged regressions.
+    """
+    with open(old_path, encoding="utf-8") as file:
+        old = json.load(file)
+    with open(new_path, encoding="utf-8") as file:
+        new = json.load(file)
+    print(f"baseline: {old_path} ({old.get('git_commit')}, {old.get('created')})")
+    print(f"new:      {new_path} ({new.get('git_commit')}, {new.get('created')})")
+    header = f"{'scenario':<34}{'throughput':>25}{'p50':>25}{'p99':>25}{'peak RSS':>12}"
+    print(header)
+    print("-" * len(header))
+
+    regressions = 0
+    for name, new_stats in new["scenarios"].items():
+        old_stats = old["scenarios"].get(name)
+        if not old_stats or not new_stats:
+            continue
+        flags = ""
+        if new_stats["throughput"] < old_stats["throughput"] * (1 - threshold):
+            flags += " throughput"
+        if new_stats["p99_ms"] > old_stats["p99_ms"] * (1 + threshold):
+            flags += " p99"
+        regressions += bool(flags)
+        print(
+            f"{name:<34}"
+            f"{old_stats['throughput']:>9.1f} {new_stats['throughput']:>7.1f}"
+            f"{_change(old_stats['throughput'], new_stats['throughput']):>9}"
+            f"{old_stats['p50_ms']:>9.2f} {new_stats['p50_ms']:>7.2f}"
+            f"{_change(old_stats['p50_ms'], new_stats['p50_ms']):>9}"
+            f"{old_stats['p99_ms']:>9.2f} {new_stats['p99_ms']:>7.2f}"
+            f"{_change(old_stats['p99_ms'], new_stats['p99_ms']):>9}"
+            f"{_change(old_stats['peak_rss_mb'], new_stats['peak_rss_mb']):>12}"
+            + (f"  ! regression:{flags}" if flags else "")
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scraper and the API.")
+    parser.add_argument(
+        "--only", nargs="+", metavar="SCENARIO", help="Scenarios to run."
+    )
+    parser.add_argument("--list", action="store_true", help="List the scenarios.")
+    parser.add_argument(
+        "--quick", action="store_true", help="Run a fifth of the requests."
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=8, help="Clients of the load scenarios."
+    )
+    parser.add_argument(
+        "--isolate",
+        action="store_true",
+        help="Run every scenario in its own process (per-scenario peak RSS).",
+    )
+    parser.add_argument(
+        "--output", help="Result file (default: benchmarks/results/<time>.json)."
+    )
+    parser.add_argument(
+        "--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files."
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative change flagged as a regression by --compare.",
+    )
+    parser.add_argument(
+        "--fail-on-regression",
+        action="store_true",
+        help="Exit with status 1 when --compare flags a regression.",
+    )
+    args = parser.parse_args()
+
+    if args.list:
+        for name, (description, _) in SCENARIOS.items():
+            print(f"{name:<34}{description}")
+        return 0
+    if args.compare:
+        regressions = compare(*args.compare, args.threshold)
+        return 1 if regressions and args.fail_on_regression else 0
+
+    names = args.only or list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}")
+
+    scale = 0.2 if args.quick else 1.0
+    if args.isolate:
+        scenarios = run_isolated(names, args)
+    else:
+        scenarios = run_scenarios(names, scale, args.concurrency)
+
+    results = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {
+            "quick": args.quick,
+            "concurrency": args.concurrency,
+            "isolate": args.isolate,
+        },
+        "scenarios": scenarios,
+    }
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{stamp}.json")
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results saved to {output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,302 @@
+"""
+A local HTTP fixture server for the benchmarks, so they never depend on the internet.
+
+It is a threaded HTTP/1.1 (keep-alive) server with the following endpoints:
+    /robots.txt                      Allows everything, without a Crawl-delay.
+    /synthetic/<bytes>.html          A synthetic page of about <bytes> bytes (with an ETag).
+    /chunked/<bytes>.html            The same page without Content-Length (chunked encoding).
+    /corpus/<name>                   A recorded page of benchmarks/corpus.
+    /slow/<ms>/<bytes>.html          A synthetic page sent after waiting <ms> milliseconds.
+    /trickle/<ms>/<bytes>.html       A synthetic page sent 1 KB at a time every <ms> milliseconds,
+                                     like a server holding its clients (never idle long enough
+                                     for a read timeout).
+    /redirect/<hops>/<bytes>.html    A chain of <hops> redirects ending at a synthetic page.
+    /status/<code>                   An empty response with the given status code.
+    /site/<pages>/<index>.html       Page <index> of a site of <pages> linked pages, for crawls:
+                                     every page links to 5 others (and twice to one of them,
+                                     spelled differently).
+
+Pages are generated once per size and served from memory, so the server costs as little
+as possible on the measurements.
+
+Usage (from the backend directory):
+    python -m benchmarks.fixture_server --port 8900
+
+Classes:
+    FixtureServer: The fixture server, running in a background thread.
+"""
+
+import argparse
+import hashlib
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.pages import CORPUS_DIR, load_corpus, synthetic_page
+
+# Pages larger than this are refused, so a typo cannot exhaust the memory
+MAX_PAGE_BYTES = 200_000_000
+
+_ROUTES = (
+    (re.compile(r"^/synthetic/(\d+)\.html$"), "synthetic"),
+    (re.compile(r"^/chunked/(\d+)\.html$"), "chunked"),
+    (re.compile(r"^/corpus/([\w.-]+)$"), "corpus"),
+    (re.compile(r"^/slow/(\d+)/(\d+)\.html$"), "slow"),
+    (re.compile(r"^/trickle/(\d+)/(\d+)\.html$"), "trickle"),
+    (re.compile(r"^/redirect/(\d+)/(\d+)\.html$"), "redirect"),
+    (re.compile(r"^/status/(\d{3})$"), "status"),
+    (re.compile(r"^/site/(\d+)/(\d+)\.html$"), "site"),
+)
+
+# Links per page of the /site/ pages
+SITE_LINKS = 5
+
+# Bytes sent per tick by the /trickle/ pages
+TRICKLE_BYTES = 1024
+
+
+class _FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, with Nagle small pages would wait for the
+    # delayed ACK of the client (~40 ms)
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        # One line per request would distort the measurements
+        pass
+
+    def _send(
+        self, status, body=b"", content_type="text/html; charset=utf-8", headers=()
+    ):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _send_page(self, body, etag=None):
+        if etag and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self._send(200, body, headers=(("ETag", etag),) if etag else ())
+
+    def _send_chunked(self, body):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        chunk_size = 64 * 1024
+        for start in range(0, len(body), chunk_size):
+            end = start + chunk_size
+            chunk = body[start:end]
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _send_trickle(self, body, interval):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            for start in range(0, len(body), TRICKLE_BYTES):
+                end = start + TRICKLE_BYTES
+                self.wfile.write(body[start:end])
+                self.wfile.flush()
+                time.sleep(interval)
+        except OSError:
+            # The client gave up
+            self.close_connection = True
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/robots.txt":
+            self._send(200, b"User-agent: *\nAllow: /\n", "text/plain")
+            return
+
+        for pattern, route in _ROUTES:
+            match = pattern.match(path)
+            if match is not None:
+                break
+        else:
+            self._send(404, b"Not found", "text/plain")
+            return
+
+        server = self.server
+        if route == "status":
+            self._send(int(match.group(1)), b"", "text/plain")
+        elif route == "corpus":
+            page = server.corpus.get(match.group(1))
+            if page is None:
+                self._send(404, b"Not found", "text/plain")
+            else:
+                self._send_page(*page)
+        elif route == "redirect":
+            hops, size = int(match.group(1)), match.group(2)
+            if hops > 0:
+                location = f"/redirect/{hops - 1}/{size}.html"
+                self._send(302, b"", "text/plain", (("Location", location),))
+            else:
+                self._send_page(*server.page(int(size)))
+        elif route == "slow":
+            time.sleep(int(match.group(1)) / 1000)
+            self._send_page(*server.page(int(match.group(2))))
+        elif route == "trickle":
+            interval = int(match.group(1)) / 1000
+            self._send_trickle(server.page(int(match.group(2)))[0], interval)
+        elif route == "site":
+            pages, index = int(match.group(1)), int(match.group(2))
+            if index >= pages:
+                self._send(404, b"Not found", "text/plain")
+            else:
+                self._send_page(*_with_etag(site_page(pages, index).encode("utf-8")))
+        elif route == "chunked":
+            self._send_chunked(server.page(int(match.group(1)))[0])
+        else:
+            self._send_page(*server.page(int(match.group(1))))
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Load tests open many connections at once
+    request_queue_size = 256
+
+    def __init__(self, address, corpus_dir):
+        super().__init__(address, _FixtureHandler)
+        self._pages: dict = {}
+        self._pages_lock = threading.Lock()
+        self.corpus = {
+            name: _with_etag(html.encode("utf-8"))
+            for name, html in load_corpus(corpus_dir)
+        }
+
+    def handle_error(self, request, client_address):
+        # Clients aborted by their deadline hang up in the middle of a response
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def page(self, size):
+        """Returns the (body, etag) of the synthetic page of the given size."""
+        size = min(size, MAX_PAGE_BYTES)
+        with self._pages_lock:
+            page = self._pages.get(size)
+            if page is None:
+                page = self._pages[size] = _with_etag(
+                    synthetic_page(size, seed=size).encode("utf-8")
+                )
+        return page
+
+
+def site_page(pages, index):
+    """
+    Returns page `index` of the /site/ site of `pages` pages, about 2 KB of text and links.
+
+    Args:
+        pages (int): The number of pages of the site.
+        index (int): The page number, from 0.
+
+    Returns:
+        str: The HTML of the page.
+    """
+    targets = [(index * 7 + offset) % pages for offset in range(1, SITE_LINKS + 1)]
+    links = "".join(
+        f'<li><a href="{target}.html">Page {target}</a></li>' for target in targets
+    )
+    # The same page again, spelled differently, deduplicated by URL normalization
+    links += f'<li><a href="./{targets[0]}.html#top">Page {targets[0]}</a></li>'
+    text = " ".join(
+        f"Paragraph {line} of page {index} of the site." for line in range(40)
+    )
+    return (
+        f"<!DOCTYPE html><html><head><title>Page {index}</title></head>"
+        f"<body><h1>Page {index}</h1><p>{text}</p><ul>{links}</ul></body></html>"
+    )
+
+
+def _with_etag(body):
+    return body, '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+
+
+class FixtureServer:
+    """
+    The fixture server, running in a background thread.
+
+    Args:
+        host (str): The interface to listen on.
+        port (int): The port to listen on, 0 picks a free one.
+        corpus_dir (str): Directory of the recorded pages served under /corpus/.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, corpus_dir=CORPUS_DIR):
+        self._server = _Server((host, port), corpus_dir)
+        self._thread = None
+
+    @property
+    def base_url(self):
+        """str: The URL of the server, e.g. http://127.0.0.1:8900."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def corpus_names(self):
+        """list: The names of the recorded pages."""
+        return sorted(self._server.corpus)
+
+    def url(self, path):
+        """
+        Returns the URL of a path on the server.
+
+        Args:
+            path (str): The path, e.g. "/synthetic/100000.html".
+        """
+        return self.base_url + path
+
+    def start(self):
+        """Starts serving in a background thread."""
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="fixture-server", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops the server."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmark fixture server.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on.")
+    parser.add_argument("--port", type=int, default=8900, help="Port to listen on.")
+    parser.add_argument(
+        "--corpus", default=CORPUS_DIR, help="Directory of *.html pages."
+    )
+    args = parser.parse_args()
+
+    server = FixtureServer(args.host, args.port, args.corpus)
+    print(f"Serving fixtures at {server.base_url} (Ctrl+C to stop)")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
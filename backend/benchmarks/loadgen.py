@@ -0,0 +1,146 @@
+"""
+A small concurrent load generator and the statistics reported by the benchmarks.
+
+Functions:
+    run_load(operation, concurrency, requests, duration, warmup): Runs an operation concurrently.
+    summarize(latencies, errors, elapsed): Computes throughput and latency percentiles.
+    percentile(sorted_values, fraction): Returns a percentile of sorted values.
+    peak_rss_mb(): Returns the peak resident memory of the process.
+"""
+
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # resource is not available on Windows
+    resource = None
+
+
+def percentile(sorted_values, fraction):
+    """
+    Returns a percentile of sorted values (nearest rank).
+
+    Args:
+        sorted_values (list): The values, sorted in ascending order.
+        fraction (float): The percentile as a fraction, e.g. 0.99.
+
+    Returns:
+        float: The percentile, 0.0 if there are no values.
+    """
+    if not sorted_values:
+        return 0.0
+    index = min(int(fraction * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def peak_rss_mb():
+    """
+    Returns the peak resident memory of the process since it started.
+
+    Returns:
+        float: The peak RSS in MB, or None if it cannot be measured on this platform.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def summarize(latencies, errors, elapsed):
+    """
+    Computes the throughput and latency percentiles of a run.
+
+    Args:
+        latencies (list): The latency of every operation in seconds.
+        errors (int): The number of failed operations (included in latencies).
+        elapsed (float): The wall time of the run in seconds.
+
+    Returns:
+        dict: requests, errors, seconds, throughput (operations per second) and the
+        mean, p50, p90, p99 and max latencies in milliseconds.
+    """
+    ordered = sorted(latencies)
+    count = len(ordered)
+    return {
+        "requests": count,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput": round(count / elapsed, 2) if elapsed > 0 else 0.0,
+        "mean_ms": round(sum(ordered) / count * 1000, 3) if count else 0.0,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 3),
+        "p90_ms": round(percentile(ordered, 0.90) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3) if count else 0.0,
+    }
+
+
+def run_load(operation, concurrency=1, requests=None, duration=None, warmup=0):
+    """
+    Runs an operation from `concurrency` threads (closed loop: every thread starts its next
+    operation as soon as the previous one finished) until `requests` operations ran or
+    `duration` seconds passed.
+
+    Args:
+        operation (callable): Runs one operation and returns True on success. Exceptions
+            count as errors. It is called from several threads at once.
+        concurrency (int): Number of threads.
+        requests (int): Number of measured operations (across all threads).
+        duration (float): Seconds to run, used when requests is None.
+        warmup (int): Operations run before the measurement starts (e.g. to open
+            connections and fill caches).
+
+    Returns:
+        dict: The statistics of the run, see summarize().
+    """
+    if requests is None and duration is None:
+        raise ValueError("Either requests or duration is required")
+
+    for _ in range(warmup):
+        try:
+            operation()
+        except Exception:
+            pass
+
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    remaining = [requests]
+    start = time.perf_counter()
+    deadline = start + duration if requests is None else None
+
+    def worker():
+        local_latencies = []
+        local_errors = 0
+        while True:
+            if deadline is not None:
+                if time.perf_counter() >= deadline:
+                    break
+            else:
+                with lock:
+                    if remaining[0] <= 0:
+                        break
+                    remaining[0] -= 1
+            started = time.perf_counter()
+            try:
+                ok = operation()
+            except Exception:
+                ok = False
+            local_latencies.append(time.perf_counter() - started)
+            if not ok:
+                local_errors += 1
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+
+    threads = [
+        threading.Thread(target=worker, name=f"load-{index}", daemon=True)
+        for index in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors[0], time.perf_counter() - start)
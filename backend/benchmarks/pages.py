@@ -0,0 +1,77 @@
+"""
+Pages used by the benchmarks: synthetic pages of any size and the recorded corpus.
+
+The corpus is every *.html file in benchmarks/corpus. Save large real pages there with
+`python -m benchmarks.bench_clean_text --save URL [URL ...]`.
+
+Functions:
+    synthetic_page(size_bytes, seed): Builds a synthetic page of about the given size.
+    load_corpus(corpus_dir): Loads the recorded pages.
+"""
+
+import os
+import random
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), "corpus")
+
+WORDS = (
+    "scraping data market price company report share value growth quarter revenue "
+    "analysis forecast customer product service network server request response"
+).split()
+
+
+def synthetic_page(size_bytes, seed):
+    """
+    Builds a synthetic page mixing text, nested markup, scripts, styles, forms and svg.
+
+    Args:
+        size_bytes (int): Approximate size of the page.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        str: The HTML page.
+    """
+    rng = random.Random(seed)
+    parts = [
+        "<!DOCTYPE html><html><head><title>Synthetic page</title>",
+        '<meta charset="utf-8"><link rel="stylesheet" href="/s.css">',
+        "<style>body { font-family: sans-serif; }</style></head><body>",
+    ]
+    size = sum(len(part) for part in parts)
+    while size < size_bytes:
+        words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 40)))
+        block = rng.choice(
+            (
+                f"<div class='row'><p>{words} &amp; <b>{rng.choice(WORDS)}</b></p></div>",
+                f"<ul><li><a href='/x'>{words}</a></li><li>{words}</li></ul>",
+                f"<script>var data = {{'k': '{words}'}}; render(data);</script>",
+                f"<form><label>{words}</label><input name='q'></form>",
+                f"<svg><title>icon</title><path d='M0 0'/></svg><span>{words}</span>",
+                f"<table><tr><td>{words}</td><td>{rng.random():.4f}</td></tr></table>",
+                "<!-- tracking comment -->",
+            )
+        )
+        parts.append(block)
+        size += len(block)
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def load_corpus(corpus_dir=CORPUS_DIR):
+    """
+    Loads the recorded pages of the corpus.
+
+    Args:
+        corpus_dir (str): Directory of *.html pages.
+
+    Returns:
+        list: (name, html) tuples, sorted by name (empty if there are no pages).
+    """
+    pages = []
+    if os.path.isdir(corpus_dir):
+        for name in sorted(os.listdir(corpus_dir)):
+            if name.endswith(".html"):
+                path = os.path.join(corpus_dir, name)
+                with open(path, encoding="utf-8", errors="replace") as file:
+                    pages.append((name, file.read()))
+    return pages
@@ -15,14 +15,16 @@ Attributes:
 """
 
 import os
+import sqlite3
 from dotenv import load_dotenv
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 
 app = Flask(__name__)  # create an app instance
-CORS(app)
 CORS(app, supports_credentials=True)
 
 # Load environment variables from .env file
@@ -36,3 +38,287 @@ app.config["SQLALCHEMY_DATABASE_URI"] = database_uri
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
 db = SQLAlchemy(app)  # create a database instance
+
+# HTTP fetch layer configuration (see core/http_client.py)
+# Number of per-host connection pools kept alive
+app.config["HTTP_POOL_CONNECTIONS"] = int(os.getenv("HTTP_POOL_CONNECTIONS", "100"))
+# Maximum number of keep-alive connections kept per host
+app.config["HTTP_POOL_MAXSIZE"] = int(os.getenv("HTTP_POOL_MAXSIZE", "10"))
+app.config["HTTP_MAX_RETRIES"] = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+app.config["HTTP_RETRY_BACKOFF"] = float(os.getenv("HTTP_RETRY_BACKOFF", "0.3"))
+app.config["HTTP_MAX_REDIRECTS"] = int(os.getenv("HTTP_MAX_REDIRECTS", "5"))
+app.config["HTTP_TIMEOUT"] = float(os.getenv("HTTP_TIMEOUT", "10"))
+
+# Batch scraping configuration (see core/batch.py)
+app.config["BATCH_MAX_ITEMS"] = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+# Maximum number of scrapes running at once across all batch requests
+app.config["BATCH_MAX_WORKERS"] = int(os.getenv("BATCH_MAX_WORKERS", "16"))
+# Maximum number of batch scrapes running at once against a single host
+app.config["BATCH_PER_HOST_CONCURRENCY"] = int(
+    os.getenv("BATCH_PER_HOST_CONCURRENCY", "4")
+)
+
+# Asynchronous scrape job queue configuration (see core/jobs.py)
+# Number of job workers started inside the API process (0 -> only standalone worker.py)
+app.config["JOB_WORKERS"] = int(os.getenv("JOB_WORKERS", "2"))
+# Seconds an idle worker waits before polling the queue again
+app.config["JOB_POLL_INTERVAL"] = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+# Seconds after which a running job is considered abandoned by its worker
+app.config["JOB_STALE_SECONDS"] = int(os.getenv("JOB_STALE_SECONDS", "600"))
+app.config["JOB_MAX_ATTEMPTS"] = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Seconds between two checks of a worker process for cancelled jobs it is running
+app.config["JOB_CANCEL_POLL_INTERVAL"] = float(
+    os.getenv("JOB_CANCEL_POLL_INTERVAL", "1")
+)
+
+# Selenium browser pool configuration (see core/browser_pool.py)
+app.config["SELENIUM_POOL_SIZE"] = int(os.getenv("SELENIUM_POOL_SIZE", "2"))
+# Number of scrapes after which a browser is replaced by a fresh one
+app.config["SELENIUM_POOL_MAX_USES"] = int(os.getenv("SELENIUM_POOL_MAX_USES", "50"))
+# Memory usage (MB) above which a browser is replaced, 0 disables the check
+app.config["SELENIUM_POOL_MAX_MEMORY_MB"] = float(
+    os.getenv("SELENIUM_POOL_MAX_MEMORY_MB", "1024")
+)
+app.config["SELENIUM_POOL_CHECKOUT_TIMEOUT"] = float(
+    os.getenv("SELENIUM_POOL_CHECKOUT_TIMEOUT", "30")
+)
+# Start all browsers when the server or worker starts instead of on first use
+app.config["SELENIUM_POOL_PREWARM"] = os.getenv(
+    "SELENIUM_POOL_PREWARM", "false"
+).lower() in ("1", "true", "yes")
+# Seconds a page may take to load in the browser (capped at the time left to the scrape)
+app.config["SELENIUM_PAGE_LOAD_TIMEOUT"] = float(
+    os.getenv("SELENIUM_PAGE_LOAD_TIMEOUT", "30")
+)
+
+# Selenium wait configuration (see core/waits.py)
+# Default seconds an interaction step waits for its condition
+app.config["SELENIUM_STEP_TIMEOUT"] = float(os.getenv("SELENIUM_STEP_TIMEOUT", "10"))
+# Seconds between two checks of a wait condition
+app.config["SELENIUM_POLL_INTERVAL"] = float(os.getenv("SELENIUM_POLL_INTERVAL", "0.1"))
+
+# Content cache configuration (see core/cache.py)
+app.config["CACHE_ENABLED"] = os.getenv("CACHE_ENABLED", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+app.config["CACHE_MEMORY_BYTES"] = int(os.getenv("CACHE_MEMORY_BYTES", str(64 * 2**20)))
+# Directory of the disk cache tier, empty disables it
+app.config["CACHE_DISK_DIR"] = os.getenv(
+    "CACHE_DISK_DIR", os.path.join(app.instance_path, "scrape_cache")
+)
+app.config["CACHE_DISK_BYTES"] = int(os.getenv("CACHE_DISK_BYTES", str(2**30)))
+# TTL (seconds) of pages without caching headers, and the maximum TTL of any page
+app.config["CACHE_DEFAULT_TTL"] = float(os.getenv("CACHE_DEFAULT_TTL", "300"))
+app.config["CACHE_MAX_TTL"] = float(os.getenv("CACHE_MAX_TTL", "86400"))
+
+# Streaming fetch configuration (see core/http_client.py and core/scraper.py)
+app.config["FETCH_CHUNK_SIZE"] = int(os.getenv("FETCH_CHUNK_SIZE", str(64 * 2**10)))
+# Maximum body size of pages that are read into memory as a whole
+app.config["FETCH_MAX_BODY_BYTES"] = int(
+    os.getenv("FETCH_MAX_BODY_BYTES", str(50 * 2**20))
+)
+# Maximum body size of pages that are cleaned incrementally while they download
+app.config["FETCH_MAX_STREAM_BYTES"] = int(
+    os.getenv("FETCH_MAX_STREAM_BYTES", str(1024 * 2**20))
+)
+# Bytes of a body without a declared charset its encoding is detected from
+app.config["FETCH_ENCODING_SNIFF_BYTES"] = int(
+    os.getenv("FETCH_ENCODING_SNIFF_BYTES", str(64 * 2**10))
+)
+# Pages above this size (or of unknown size) are cleaned incrementally
+app.config["STREAM_PARSE_THRESHOLD"] = int(
+    os.getenv("STREAM_PARSE_THRESHOLD", str(2**20))
+)
+
+# History listing configuration (see core/repository.py)
+app.config["HISTORY_PAGE_SIZE"] = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+app.config["HISTORY_MAX_PAGE_SIZE"] = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "200"))
+# Records loaded per query by the NDJSON export
+app.config["HISTORY_EXPORT_BATCH_SIZE"] = int(
+    os.getenv("HISTORY_EXPORT_BATCH_SIZE", "100")
+)
+
+# History search configuration (see core/search.py)
+app.config["SEARCH_PAGE_SIZE"] = int(os.getenv("SEARCH_PAGE_SIZE", "20"))
+app.config["SEARCH_MAX_PAGE_SIZE"] = int(os.getenv("SEARCH_MAX_PAGE_SIZE", "100"))
+app.config["SEARCH_MAX_QUERY_LENGTH"] = int(os.getenv("SEARCH_MAX_QUERY_LENGTH", "256"))
+# Characters of the visible text of a record that are indexed
+app.config["SEARCH_MAX_INDEX_CHARS"] = int(
+    os.getenv("SEARCH_MAX_INDEX_CHARS", "200000")
+)
+app.config["SEARCH_SNIPPET_TOKENS"] = int(os.getenv("SEARCH_SNIPPET_TOKENS", "16"))
+# BM25 weight of matches in the URL, relative to matches in the content
+app.config["SEARCH_URL_WEIGHT"] = float(os.getenv("SEARCH_URL_WEIGHT", "2"))
+
+# Blob store configuration (see core/blobs.py)
+# "zstd" (falls back to "zlib" without the zstandard package), "zlib" or "none"
+app.config["BLOB_COMPRESSION"] = os.getenv("BLOB_COMPRESSION", "zstd")
+# Compression level of the codec (zstd: 1-22, zlib: 1-9)
+app.config["BLOB_COMPRESSION_LEVEL"] = int(os.getenv("BLOB_COMPRESSION_LEVEL", "6"))
+
+# Write-behind history writer configuration (see core/history_writer.py)
+app.config["HISTORY_WRITE_BEHIND"] = os.getenv(
+    "HISTORY_WRITE_BEHIND", "true"
+).lower() in ("1", "true", "yes")
+# Maximum number of buffered records, callers wait for room when it is full
+app.config["HISTORY_WRITER_MAX_PENDING"] = int(
+    os.getenv("HISTORY_WRITER_MAX_PENDING", "10000")
+)
+# Records per transaction, and milliseconds a record waits at most before it is written
+app.config["HISTORY_WRITER_BATCH_SIZE"] = int(
+    os.getenv("HISTORY_WRITER_BATCH_SIZE", "200")
+)
+app.config["HISTORY_WRITER_FLUSH_MS"] = float(
+    os.getenv("HISTORY_WRITER_FLUSH_MS", "200")
+)
+# Seconds a caller waits for room in a full buffer before writing synchronously
+app.config["HISTORY_WRITER_PUT_TIMEOUT"] = float(
+    os.getenv("HISTORY_WRITER_PUT_TIMEOUT", "1")
+)
+
+# SQLite configuration
+# WAL mode lets readers run concurrently with the writer, synchronous=NORMAL only fsyncs at
+# checkpoints (safe in WAL mode), and writers wait for the lock instead of failing at once
+app.config["SQLITE_WAL"] = os.getenv("SQLITE_WAL", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+app.config["SQLITE_BUSY_TIMEOUT_MS"] = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+
+@event.listens_for(Engine, "connect")
+def _configure_sqlite(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout = {app.config['SQLITE_BUSY_TIMEOUT_MS']}")
+    if app.config["SQLITE_WAL"]:
+        cursor.execute("PRAGMA journal_mode = WAL")
+        cursor.execute("PRAGMA synchronous = NORMAL")
+    cursor.close()
+
+
+# Per-host politeness scheduler configuration (see core/politeness.py)
+app.config["POLITENESS_ENABLED"] = os.getenv(
+    "POLITENESS_ENABLED", "true"
+).lower() in ("1", "true", "yes")
+# Token bucket per host: requests per second (0 disables the limit) and burst size
+app.config["POLITENESS_RATE"] = float(os.getenv("POLITENESS_RATE", "2"))
+app.config["POLITENESS_BURST"] = int(os.getenv("POLITENESS_BURST", "5"))
+# Maximum number of requests in flight per host
+app.config["POLITENESS_HOST_CONCURRENCY"] = int(
+    os.getenv("POLITENESS_HOST_CONCURRENCY", "4")
+)
+# Seconds a request waits at most for its host before it fails
+app.config["POLITENESS_MAX_WAIT"] = float(os.getenv("POLITENESS_MAX_WAIT", "30"))
+# Pause of a host after a 429/503 response, doubled for every further one up to the maximum
+app.config["POLITENESS_BACKOFF_INITIAL"] = float(
+    os.getenv("POLITENESS_BACKOFF_INITIAL", "1")
+)
+app.config["POLITENESS_BACKOFF_MAX"] = float(os.getenv("POLITENESS_BACKOFF_MAX", "60"))
+# robots.txt Crawl-delay support
+app.config["ROBOTS_ENABLED"] = os.getenv("ROBOTS_ENABLED", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+app.config["ROBOTS_CACHE_TTL"] = float(os.getenv("ROBOTS_CACHE_TTL", "3600"))
+app.config["ROBOTS_TIMEOUT"] = float(os.getenv("ROBOTS_TIMEOUT", "5"))
+app.config["ROBOTS_MAX_CRAWL_DELAY"] = float(os.getenv("ROBOTS_MAX_CRAWL_DELAY", "30"))
+# robots.txt files larger than this are ignored, like robots.txt files that cannot be fetched
+app.config["ROBOTS_MAX_BYTES"] = int(os.getenv("ROBOTS_MAX_BYTES", str(512 * 2**10)))
+
+# Structured extraction configuration (see core/extraction.py)
+# Directory of JSON rule set files (<name>.json), in addition to the built-in rule sets
+app.config["EXTRACTION_RULES_DIR"] = os.getenv(
+    "EXTRACTION_RULES_DIR", os.path.join(app.root_path, "extraction_rules")
+)
+
+# "auto" scraping method configuration (see core/rendering.py)
+# Pages with at least this much visible text never need a browser
+app.config["AUTO_MIN_TEXT_CHARS"] = int(os.getenv("AUTO_MIN_TEXT_CHARS", "500"))
+# Inline script characters per text character above which a page needs a browser
+app.config["AUTO_SCRIPT_TEXT_RATIO"] = float(os.getenv("AUTO_SCRIPT_TEXT_RATIO", "2"))
+# Seconds the engine chosen for a domain is remembered, and number of domains remembered
+app.config["AUTO_DECISION_TTL"] = float(os.getenv("AUTO_DECISION_TTL", "86400"))
+app.config["AUTO_MAX_DOMAINS"] = int(os.getenv("AUTO_MAX_DOMAINS", "10000"))
+
+# Metrics configuration (see core/metrics.py)
+app.config["METRICS_ENABLED"] = os.getenv("METRICS_ENABLED", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+# Hosts with their own label, the others are counted as "other"
+app.config["METRICS_MAX_HOSTS"] = int(os.getenv("METRICS_MAX_HOSTS", "100"))
+# Request header asking for the per-stage timing breakdown (empty disables it)
+app.config["METRICS_PROFILE_HEADER"] = os.getenv("METRICS_PROFILE_HEADER", "X-Profile")
+
+# Response compression configuration (see core/compression.py)
+app.config["COMPRESS_ENABLED"] = os.getenv("COMPRESS_ENABLED", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+# Smaller responses are sent uncompressed (streamed responses are always compressed)
+app.config["COMPRESS_MIN_BYTES"] = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+app.config["COMPRESS_LEVEL"] = int(os.getenv("COMPRESS_LEVEL", "6"))
+# Brotli quality 0-11, high qualities are too slow for on-the-fly compression
+app.config["COMPRESS_BROTLI_QUALITY"] = int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"))
+
+# Change detection configuration (see core/changes.py)
+# Simhash distances (differing bits of 64) below this count as unchanged, 0 only treats an
+# identical visible text as unchanged
+app.config["CHANGES_SIMHASH_THRESHOLD"] = int(
+    os.getenv("CHANGES_SIMHASH_THRESHOLD", "0")
+)
+# Unchanged lines shown around every change of a diff
+app.config["CHANGES_DIFF_CONTEXT"] = int(os.getenv("CHANGES_DIFF_CONTEXT", "2"))
+# Diffs longer than this fraction of the content are replaced by the content itself
+app.config["CHANGES_MAX_DIFF_RATIO"] = float(os.getenv("CHANGES_MAX_DIFF_RATIO", "0.5"))
+
+# Scraping engine configuration (see core/engines.py)
+# Engines imported at startup instead of on first use: "all" or a comma-separated list
+# (e.g. "http,bs4,lxml"), empty loads every engine on first use
+app.config["ENGINES_PRELOAD"] = os.getenv("ENGINES_PRELOAD", "")
+
+# Parse pool configuration (see core/parse_pool.py)
+# Worker processes parsing large documents off the GIL, 0 parses everything in the request
+# thread. Every server process has its own pool.
+app.config["PARSE_POOL_WORKERS"] = int(
+    os.getenv("PARSE_POOL_WORKERS", str(os.cpu_count() or 1))
+)
+# Smaller documents (in characters) are parsed inline, handing them over costs more
+app.config["PARSE_POOL_MIN_BYTES"] = int(os.getenv("PARSE_POOL_MIN_BYTES", "65536"))
+# Seconds a document may take to parse, and at most to wait for a free worker
+app.config["PARSE_POOL_TIMEOUT"] = float(os.getenv("PARSE_POOL_TIMEOUT", "30"))
+# Documents waiting for a worker, more are rejected at once
+app.config["PARSE_POOL_MAX_QUEUE"] = int(os.getenv("PARSE_POOL_MAX_QUEUE", "64"))
+
+# Crawl configuration (see core/crawl.py)
+# Link depth and page count of a crawl when the request does not set them, and their maximums
+app.config["CRAWL_DEFAULT_MAX_DEPTH"] = int(os.getenv("CRAWL_DEFAULT_MAX_DEPTH", "2"))
+app.config["CRAWL_MAX_DEPTH"] = int(os.getenv("CRAWL_MAX_DEPTH", "5"))
+app.config["CRAWL_DEFAULT_MAX_PAGES"] = int(os.getenv("CRAWL_DEFAULT_MAX_PAGES", "50"))
+app.config["CRAWL_MAX_PAGES"] = int(os.getenv("CRAWL_MAX_PAGES", "1000"))
+# Pages of a crawl fetched at once (the per-host politeness limits still apply)
+app.config["CRAWL_CONCURRENCY"] = int(os.getenv("CRAWL_CONCURRENCY", "4"))
+# URLs waiting to be fetched, more discovered links are dropped
+app.config["CRAWL_MAX_FRONTIER"] = int(os.getenv("CRAWL_MAX_FRONTIER", "100000"))
+# Seen URLs after which a crawl deduplicates with a Bloom filter instead of a set
+app.config["CRAWL_BLOOM_THRESHOLD"] = int(os.getenv("CRAWL_BLOOM_THRESHOLD", "10000"))
+# False positive rate of the Bloom filter (links wrongly taken for already seen)
+app.config["CRAWL_BLOOM_ERROR_RATE"] = float(
+    os.getenv("CRAWL_BLOOM_ERROR_RATE", "0.001")
+)
+
+# Scrape deadline configuration (see core/deadlines.py)
+# Seconds a scrape may take end to end (connect, download, render and parse) when the request
+# does not set a "timeout", and the bounds of the timeouts requests may set. Synchronous
+# scrapes hold a server worker, keep the maximum below GUNICORN_TIMEOUT.
+app.config["SCRAPE_DEFAULT_TIMEOUT"] = float(os.getenv("SCRAPE_DEFAULT_TIMEOUT", "60"))
+app.config["SCRAPE_MIN_TIMEOUT"] = float(os.getenv("SCRAPE_MIN_TIMEOUT", "1"))
+app.config["SCRAPE_MAX_TIMEOUT"] = float(os.getenv("SCRAPE_MAX_TIMEOUT", "110"))
@@ -0,0 +1,224 @@
+"""
+This module provides concurrent batch scraping for the /scrape/batch endpoint.
+
+Items are scraped on a process-wide thread pool, so the total number of concurrent scrapes is
+bounded no matter how many batch requests arrive at once. At most BATCH_PER_HOST_CONCURRENCY
+items per host are handed to the pool at a time; the other items of the host wait in a
+per-host queue outside the pool and are submitted as the running ones finish, so a batch of
+URLs of a single site never ties up pool threads that items of other sites could use. Every
+item is scraped under its own deadline (see core/deadlines.py), so a slow site cannot hold a
+pool thread.
+
+Functions:
+    validate_batch_item(item): Validates and normalizes a single batch item.
+    scrape_batch(items): Scrapes all items concurrently and returns the results in input order.
+"""
+
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from config import app
+from core.deadlines import validate_timeout
+from core.extraction import RuleSetError, get_rule_set
+from core.scraper import SCRAPING_METHODS, is_scrape_error, run_scraper
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Per host: the number of items submitted to the pool and the queue of the other items
+_host_running: dict = {}
+_host_pending: dict = {}
+_hosts_lock = threading.Lock()
+
+
+def _get_executor():
+    """
+    Returns the shared batch thread pool, creating it on first use.
+
+    Returns:
+        ThreadPoolExecutor: The thread pool bounding global batch concurrency.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=app.config["BATCH_MAX_WORKERS"],
+                    thread_name_prefix="batch-scrape",
+                )
+    return _executor
+
+
+def _submit_item(item):
+    """
+    Submits a validated item to the thread pool, or queues it while its host already has
+    BATCH_PER_HOST_CONCURRENCY items in the pool.
+
+    Args:
+        item (dict): A normalized batch item.
+
+    Returns:
+        Future: The future of the item's result (see _scrape_item()).
+    """
+    future = Future()
+    host = urlsplit(item["url"]).netloc.lower()
+    with _hosts_lock:
+        running = _host_running.get(host, 0)
+        if running >= app.config["BATCH_PER_HOST_CONCURRENCY"]:
+            _host_pending.setdefault(host, deque()).append((item, future))
+            return future
+        _host_running[host] = running + 1
+    _get_executor().submit(_run_item, host, item, future)
+    return future
+
+
+def _run_item(host, item, future):
+    """
+    Scrapes an item in a pool thread, then submits the next queued item of its host.
+
+    Args:
+        host (str): The host of the item's URL.
+        item (dict): A normalized batch item.
+        future (Future): The future of the item's result.
+    """
+    try:
+        future.set_result(_scrape_item(item))
+    except BaseException as e:
+        future.set_exception(e)
+    finally:
+        with _hosts_lock:
+            pending = _host_pending.get(host)
+            if pending:
+                next_item, next_future = pending.popleft()
+                if not pending:
+                    del _host_pending[host]
+            else:
+                next_item = None
+                _host_running[host] -= 1
+                if not _host_running[host]:
+                    del _host_running[host]
+        # The host's slot passes to its next item
+        if next_item is not None:
+            _get_executor().submit(_run_item, host, next_item, next_future)
+
+
+def validate_batch_item(item):
+    """
+    Validates and normalizes a single batch item.
+
+    Args:
+        item (dict): A dictionary with "url", "scraping_method" and optional "clean_data",
+            "timeout" and "company_name" (for "selenium") or "rule_set" (for "extract") keys.
+
+    Returns:
+        tuple: (normalized_item, error). Exactly one of the two is None.
+    """
+    if not isinstance(item, dict):
+        return None, "Item must be an object"
+
+    url = item.get("url")
+    scraping_method = item.get("scraping_method")
+    company_name = item.get("company_name")
+    rule_set = item.get("rule_set")
+
+    if not url:
+        return None, "URL is required"
+    # Ensure the URL starts with "https://"
+    if url.startswith("www."):
+        url = "https://" + url[4:]
+    if not scraping_method:
+        return None, "Scraping method is required"
+    if scraping_method not in SCRAPING_METHODS:
+        return None, "Invalid scraping method"
+    if scraping_method == "selenium" and not company_name:
+        return None, "Company name is required for Selenium"
+    if scraping_method == "extract":
+        try:
+            get_rule_set(rule_set)
+        except RuleSetError as e:
+            return None, str(e)
+    timeout, error = validate_timeout(item.get("timeout"))
+    if error:
+        return None, error
+
+    return {
+        "url": url,
+        "scraping_method": scraping_method,
+        "clean_data": bool(item.get("clean_data", False)),
+        "company_name": company_name,
+        "rule_set": rule_set,
+        "timeout": timeout,
+    }, None
+
+
+def _scrape_item(item):
+    """
+    Scrapes a single validated item.
+
+    Args:
+        item (dict): A normalized batch item.
+
+    Returns:
+        dict: The result of the item with a status key (1 -> success, 2 -> error).
+    """
+    with app.app_context():
+        try:
+            scrape_result = run_scraper(
+                item["url"],
+                item["scraping_method"],
+                clean=item["clean_data"],
+                company_name=item["company_name"],
+                rule_set=item["rule_set"],
+                timeout=item["timeout"],
+            )
+        except Exception as e:
+            scrape_result = f"An error occurred: {e}"
+
+    if is_scrape_error(scrape_result):
+        error = scrape_result if isinstance(scrape_result, str) else "Scraping failed"
+        if isinstance(scrape_result, dict):
+            error = scrape_result.get("error", error)
+        return {
+            "url": item["url"],
+            "scraping_method": item["scraping_method"],
+            "status": 2,
+            "error": error,
+        }
+    return {
+        "url": item["url"],
+        "scraping_method": item["scraping_method"],
+        "status": 1,
+        "scrape_result": scrape_result,
+    }
+
+
+def scrape_batch(items):
+    """
+    Scrapes all items concurrently and returns the results in input order.
+
+    Args:
+        items (list): A list of batch item dictionaries.
+
+    Returns:
+        list: One result dictionary per input item. Successful results contain
+        "scrape_result", failed ones contain "error".
+    """
+    slots = []
+    for item in items:
+        normalized, error = validate_batch_item(item)
+        if error:
+            item = item if isinstance(item, dict) else {}
+            slots.append(
+                {
+                    "url": item.get("url"),
+                    "scraping_method": item.get("scraping_method"),
+                    "status": 2,
+                    "error": error,
+                }
+            )
+        else:
+            slots.append(_submit_item(normalized))
+
+    return [slot if isinstance(slot, dict) else slot.result() for slot in slots]
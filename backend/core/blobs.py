@@ -0,0 +1,201 @@
+"""
+This module provides the content-addressed blob store for scraped content.
+
+Scraped content is stored in the `content_blob` table instead of inline in every History row:
+- Each blob is keyed by the SHA-256 hash of its content, so rescrapes of an unchanged page
+  (by any user) reference the same blob instead of storing another copy.
+- Blobs are compressed with zstd (when the optional zstandard package is installed) or zlib.
+  The codec is stored per blob, so blobs written with either codec can always be read back.
+
+Functions:
+    content_hash(content): Returns the SHA-256 hash of a content.
+    compress(content): Compresses a content with the configured codec.
+    decompress(codec, data): Decompresses the data of a blob.
+    store_content(content): Stores a content (if it is not stored yet) and returns its hash.
+    load_content(record): Returns the scraped content of a History record.
+    storage_report(): Reports the space saved by deduplication and compression.
+"""
+
+import hashlib
+import zlib
+
+from sqlalchemy import LargeBinary, cast, func
+from sqlalchemy.exc import IntegrityError
+
+from config import app, db
+from core.models import ContentBlob, History
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional, zlib is used instead
+    zstandard = None
+
+
+def content_hash(content):
+    """
+    Returns the SHA-256 hash of a content, the key of its blob.
+
+    Args:
+        content (str): The content.
+
+    Returns:
+        str: The hex digest of the UTF-8 encoded content.
+    """
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _codec():
+    codec = app.config["BLOB_COMPRESSION"]
+    if codec == "zstd" and zstandard is None:
+        return "zlib"
+    return codec
+
+
+def compress(content):
+    """
+    Compresses a content with the configured codec (BLOB_COMPRESSION).
+
+    Args:
+        content (str): The content.
+
+    Returns:
+        tuple: (codec, data), the codec name and the compressed bytes.
+    """
+    raw = content.encode("utf-8")
+    codec = _codec()
+    level = app.config["BLOB_COMPRESSION_LEVEL"]
+    if codec == "zstd":
+        return codec, zstandard.ZstdCompressor(level=level).compress(raw)
+    if codec == "zlib":
+        return codec, zlib.compress(raw, min(level, 9))
+    return "none", raw
+
+
+def decompress(codec, data):
+    """
+    Decompresses the data of a blob.
+
+    Args:
+        codec (str): The codec the data was compressed with ("zstd", "zlib" or "none").
+        data (bytes): The compressed data.
+
+    Returns:
+        str: The content.
+
+    Raises:
+        ValueError: If the codec is unknown or not available.
+    """
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd blobs require the zstandard package")
+        raw = zstandard.ZstdDecompressor().decompress(data)
+    elif codec == "zlib":
+        raw = zlib.decompress(data)
+    elif codec == "none":
+        raw = data
+    else:
+        raise ValueError(f"Unknown blob codec: {codec}")
+    return raw.decode("utf-8")
+
+
+def store_content(content):
+    """
+    Stores a content in the blob store, unless a blob with the same hash already exists.
+    The blob is added to the current session, it is saved with the caller's commit.
+
+    Args:
+        content (str): The content.
+
+    Returns:
+        str: The hash referencing the blob.
+    """
+    digest = content_hash(content)
+    if db.session.get(ContentBlob, digest) is not None:
+        return digest
+
+    codec, data = compress(content)
+    blob = ContentBlob(
+        hash=digest,
+        codec=codec,
+        data=data,
+        size=len(content.encode("utf-8")),
+        compressed_size=len(data),
+    )
+    try:
+        # A savepoint, so a blob inserted concurrently by another request is not an error
+        with db.session.begin_nested():
+            db.session.add(blob)
+    except IntegrityError:
+        pass
+    return digest
+
+
+def load_content(record):
+    """
+    Returns the scraped content of a History record, decompressing its blob.
+
+    Args:
+        record (History): The record.
+
+    Returns:
+        str: The content. Records stored before the blob store return their inline content.
+    """
+    if record.content_hash is None:
+        return record.scraped_data
+    blob = record.content_blob
+    return decompress(blob.codec, blob.data)
+
+
+def storage_report():
+    """
+    Reports the space used by scraped content and the space saved by the blob store.
+
+    Returns:
+        dict: A dictionary with the following keys:
+            - records (int): Number of History records.
+            - blobs (int): Number of distinct contents stored.
+            - inline_records (int): Records whose content is still stored inline.
+            - logical_bytes (int): Size of the content of all records, uncompressed.
+            - deduplicated_bytes (int): Size of the distinct contents, uncompressed.
+            - stored_bytes (int): Size of the stored (compressed) blobs and inline contents.
+            - saved_bytes (int): logical_bytes - stored_bytes.
+            - dedup_ratio (float): logical_bytes / deduplicated_bytes.
+            - compression_ratio (float): deduplicated_bytes / compressed blob bytes.
+    """
+    records = db.session.query(func.count(History.id)).scalar()
+    referenced_bytes = (
+        db.session.query(func.coalesce(func.sum(ContentBlob.size), 0))
+        .select_from(History)
+        .join(ContentBlob, History.content_hash == ContentBlob.hash)
+        .scalar()
+    )
+    inline_records, inline_bytes = (
+        db.session.query(
+            func.count(History.id),
+            # Cast to a blob, so the length is in bytes instead of characters
+            func.coalesce(
+                func.sum(func.length(cast(History.scraped_data, LargeBinary))), 0
+            ),
+        )
+        .filter(History.content_hash.is_(None))
+        .one()
+    )
+    blobs, blob_bytes, compressed_bytes = db.session.query(
+        func.count(ContentBlob.hash),
+        func.coalesce(func.sum(ContentBlob.size), 0),
+        func.coalesce(func.sum(ContentBlob.compressed_size), 0),
+    ).one()
+
+    logical_bytes = referenced_bytes + inline_bytes
+    stored_bytes = compressed_bytes + inline_bytes
+    return {
+        "records": records,
+        "blobs": blobs,
+        "inline_records": inline_records,
+        "logical_bytes": logical_bytes,
+        "deduplicated_bytes": blob_bytes + inline_bytes,
+        "stored_bytes": stored_bytes,
+        "saved_bytes": logical_bytes - stored_bytes,
+        "dedup_ratio": referenced_bytes / blob_bytes if blob_bytes else 1.0,
+        "compression_ratio": blob_bytes / compressed_bytes if compressed_bytes else 1.0,
+    }
@@ -0,0 +1,368 @@
+"""
+This module provides a pool of reusable headless browser instances for the Selenium scraper.
+
+Starting Chrome takes seconds and hundreds of MB of RAM, so instead of starting and quitting a
+browser on every scrape, drivers are created once and checked out per request. Between uses a
+driver is reset (cookies and web storage cleared, blank page loaded). A driver is recycled
+(quit and replaced) after SELENIUM_POOL_MAX_USES checkouts, when its memory usage exceeds
+SELENIUM_POOL_MAX_MEMORY_MB, or when it can no longer be reset.
+
+Every checkout sets the page load timeout of the driver to SELENIUM_PAGE_LOAD_TIMEOUT, capped at
+the time left to the scrape. If the scrape passes its deadline (or is cancelled) while it holds
+a driver, the driver is quit at once, which ends whatever command the scrape is blocked on,
+and it is replaced (see core/deadlines.py).
+
+The pool takes a driver factory, so any object with the WebDriver methods used here can be
+pooled (e.g. a fake driver instead of Chrome).
+
+Classes:
+    DriverPool: A bounded pool of reusable WebDriver instances.
+    DriverPoolTimeout: Raised when no driver becomes available in time.
+Functions:
+    create_chrome_driver(): Starts a headless Chrome WebDriver.
+    get_driver_pool(): Returns the process-wide Chrome driver pool.
+    prewarm_driver_pool(): Starts the pool's browsers in the background if configured.
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+
+from config import app
+from core.deadlines import check_deadline, on_expire, remaining_timeout
+from core.metrics import register_collector
+
+try:
+    import psutil
+except ImportError:  # psutil is optional, the JS heap size is used instead
+    psutil = None
+
+
+class DriverPoolTimeout(Exception):
+    """Raised when no driver becomes available within the checkout timeout."""
+
+
+class _PooledDriver:
+    """A driver together with its pool bookkeeping."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+        # Set when the driver was quit because its scrape passed its deadline
+        self.aborted = False
+
+
+def create_chrome_driver():
+    """
+    Starts a headless Chrome WebDriver.
+
+    Environment Variables:
+        CHROME_PATH (str): The path to the ChromeDriver executable.
+
+    Returns:
+        selenium.webdriver.Chrome: The started driver.
+    """
+    chrome_options = Options()
+    chrome_options.add_argument("--headless=new")
+    chrome_options.add_argument("--lang=en")
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+
+    service = Service(executable_path=os.getenv("CHROME_PATH"))
+    return webdriver.Chrome(service=service, options=chrome_options)
+
+
+def _driver_memory_mb(driver):
+    """
+    Estimates the memory used by a driver in MB.
+
+    With psutil installed, this is the resident memory of the driver process and all browser
+    processes it started. Otherwise the JavaScript heap size of the current page is used.
+
+    Args:
+        driver: The WebDriver to measure.
+
+    Returns:
+        float: The estimated memory in MB, or None if it cannot be determined.
+    """
+    process = getattr(getattr(driver, "service", None), "process", None)
+    if psutil is not None and process is not None:
+        try:
+            root = psutil.Process(process.pid)
+            processes = [root] + root.children(recursive=True)
+            return sum(p.memory_info().rss for p in processes) / (1024 * 1024)
+        except psutil.Error:
+            return None
+
+    try:
+        heap_size = driver.execute_script(
+            "return window.performance.memory ? performance.memory.usedJSHeapSize : null;"
+        )
+    except Exception:
+        return None
+    return heap_size / (1024 * 1024) if heap_size else None
+
+
+def _reset_driver(driver):
+    """
+    Clears cookies and web storage of a driver and loads a blank page.
+
+    Args:
+        driver: The WebDriver to reset.
+
+    Raises:
+        Exception: If the driver is no longer usable.
+    """
+    try:
+        driver.execute_script(
+            "window.localStorage.clear(); window.sessionStorage.clear();"
+        )
+    except Exception:
+        # Pages like about:blank or data: URLs have no accessible storage
+        pass
+    driver.delete_all_cookies()
+    if hasattr(driver, "execute_cdp_cmd"):
+        # delete_all_cookies only clears the current domain, CDP clears every domain
+        driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+    driver.get("about:blank")
+
+
+class DriverPool:
+    """
+    A bounded pool of reusable WebDriver instances.
+
+    Args:
+        factory (callable): Creates a new driver.
+        size (int): Maximum number of drivers alive at once.
+        max_uses (int): Number of checkouts after which a driver is recycled.
+        max_memory_mb (float): Memory usage above which a driver is recycled (0 disables).
+        checkout_timeout (float): Seconds to wait for a free driver.
+    """
+
+    def __init__(
+        self, factory, size=2, max_uses=50, max_memory_mb=0, checkout_timeout=30
+    ):
+        self.factory = factory
+        self.size = size
+        self.max_uses = max_uses
+        self.max_memory_mb = max_memory_mb
+        self.checkout_timeout = checkout_timeout
+
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {"checkouts": 0, "created": 0, "recycled": 0, "reset_failures": 0}
+
+    def warm(self):
+        """Starts drivers until the pool holds `size` of them."""
+        while True:
+            with self._lock:
+                if self._created >= self.size:
+                    return
+                self._created += 1
+            self._idle.put(self._create())
+
+    def _create(self):
+        try:
+            pooled = _PooledDriver(self.factory())
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+        with self._lock:
+            self.stats["created"] += 1
+        return pooled
+
+    def _discard(self, pooled):
+        with self._lock:
+            self._created -= 1
+            self.stats["recycled"] += 1
+        try:
+            pooled.driver.quit()
+        except Exception as e:
+            print(f"Failed to quit browser driver: {e}")
+
+    def _abort(self, pooled):
+        """Quits the driver of a scrape past its deadline, in the background."""
+        pooled.aborted = True
+        threading.Thread(
+            target=self._discard, args=(pooled,), name="browser-abort", daemon=True
+        ).start()
+
+    def _checkout(self):
+        deadline = time.monotonic() + remaining_timeout(self.checkout_timeout)
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                return self._create()
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                check_deadline()
+                raise DriverPoolTimeout(
+                    f"No browser available after {self.checkout_timeout} seconds"
+                )
+            # Wake up regularly, a recycled driver frees a slot without returning to the queue
+            try:
+                return self._idle.get(timeout=min(remaining, 0.5))
+            except queue.Empty:
+                continue
+
+    def _checkin(self, pooled):
+        if pooled.aborted:
+            # Already being quit by _abort()
+            return
+        if self._closed or pooled.uses >= self.max_uses:
+            self._discard(pooled)
+            return
+
+        if self.max_memory_mb:
+            memory_mb = _driver_memory_mb(pooled.driver)
+            if memory_mb is not None and memory_mb > self.max_memory_mb:
+                self._discard(pooled)
+                return
+
+        try:
+            _reset_driver(pooled.driver)
+        except Exception as e:
+            print(f"Failed to reset browser driver, recycling it: {e}")
+            with self._lock:
+                self.stats["reset_failures"] += 1
+            self._discard(pooled)
+            return
+        self._idle.put(pooled)
+
+    @contextmanager
+    def driver(self):
+        """
+        Checks out a driver for the duration of the `with` block.
+        The driver always goes back to the pool (or is recycled), even if the block raises.
+        If the scrape passes its deadline during the block, the driver is quit and replaced.
+
+        Yields:
+            The checked out WebDriver.
+
+        Raises:
+            DriverPoolTimeout: If no driver becomes available within the checkout timeout.
+            DeadlineExceeded: If the scrape passes its deadline while waiting for a driver,
+                or the block fails after it passed its deadline.
+            ScrapeCancelled: The same for a cancelled scrape.
+        """
+        pooled = self._checkout()
+        pooled.uses += 1
+        with self._lock:
+            self.stats["checkouts"] += 1
+        try:
+            pooled.driver.set_page_load_timeout(
+                remaining_timeout(app.config["SELENIUM_PAGE_LOAD_TIMEOUT"])
+            )
+            with on_expire(lambda: self._abort(pooled)):
+                yield pooled.driver
+        except Exception:
+            # The driver may have been quit by the deadline, report that instead
+            check_deadline()
+            raise
+        finally:
+            self._checkin(pooled)
+
+    def close(self):
+        """Quits all idle drivers. Drivers in use are quit when they are checked in."""
+        self._closed = True
+        while True:
+            try:
+                pooled = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(pooled)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_driver_pool():
+    """
+    Returns the process-wide Chrome driver pool, creating it on first use.
+
+    Returns:
+        DriverPool: The pool configured from the SELENIUM_POOL_* settings.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = DriverPool(
+                    create_chrome_driver,
+                    size=app.config["SELENIUM_POOL_SIZE"],
+                    max_uses=app.config["SELENIUM_POOL_MAX_USES"],
+                    max_memory_mb=app.config["SELENIUM_POOL_MAX_MEMORY_MB"],
+                    checkout_timeout=app.config["SELENIUM_POOL_CHECKOUT_TIMEOUT"],
+                )
+                # Make sure no Chrome processes outlive the application
+                atexit.register(_pool.close)
+    return _pool
+
+
+def prewarm_driver_pool():
+    """
+    Starts the browsers of the process-wide pool in a background thread
+    when SELENIUM_POOL_PREWARM is enabled, so the first Selenium scrapes don't pay for it.
+    """
+    if not app.config["SELENIUM_POOL_PREWARM"]:
+        return
+
+    def warm():
+        try:
+            get_driver_pool().warm()
+        except Exception as e:
+            print(f"Failed to pre-warm browser pool: {e}")
+
+    threading.Thread(target=warm, name="browser-pool-warmup", daemon=True).start()
+
+
+def _event_metrics():
+    if _pool is None:
+        return {}
+    with _pool._lock:
+        return {(event,): count for event, count in _pool.stats.items()}
+
+
+def _driver_metrics():
+    if _pool is None:
+        return {}
+    idle = _pool._idle.qsize()
+    with _pool._lock:
+        alive = _pool._created
+    return {("idle",): idle, ("in_use",): max(alive - idle, 0)}
+
+
+register_collector(
+    "browser_pool_events_total",
+    "Browser pool checkouts, created and recycled drivers and reset failures.",
+    "counter",
+    ("event",),
+    _event_metrics,
+)
+register_collector(
+    "browser_pool_drivers",
+    "Browser drivers alive in the pool by state.",
+    "gauge",
+    ("state",),
+    _driver_metrics,
+)
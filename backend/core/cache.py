@@ -0,0 +1,418 @@
+"""
+This module provides a two-tier content cache for scrape results.
+
+Results are cached per (url, scraping method, clean flag):
+- Memory tier: an LRU cache bounded by a byte budget (CACHE_MEMORY_BYTES).
+- Disk tier: one JSON file per entry in CACHE_DISK_DIR, bounded by CACHE_DISK_BYTES with
+  least recently used files evicted first. It survives restarts and is shared by all
+  processes on the machine.
+
+Every entry has its own TTL, derived from the response's Cache-Control/Expires headers
+(CACHE_DEFAULT_TTL when absent, capped at CACHE_MAX_TTL). Once an entry is stale it is not
+dropped: its ETag/Last-Modified validators are sent with If-None-Match/If-Modified-Since, and a
+304 response refreshes the entry without downloading or processing the page again.
+
+Classes:
+    CacheEntry: A cached scrape result with its validators and expiry.
+    ContentCache: The memory + disk cache.
+Functions:
+    cache_key(url, scraping_method, clean): Builds the cache key of a scrape.
+    entry_from_response(result, response): Builds a cache entry from an HTTP response.
+    refresh_entry(entry, response): Refreshes a stale entry after a 304 response.
+    get_content_cache(): Returns the process-wide cache, or None when caching is disabled.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+
+from config import app
+from core.metrics import register_collector
+
+
+class CacheEntry:
+    """
+    A cached scrape result with its validators and expiry.
+
+    Args:
+        result (str): The processed scrape result.
+        etag (str): The ETag header of the response, if any.
+        last_modified (str): The Last-Modified header of the response, if any.
+        expires_at (float): Unix time after which the entry must be revalidated.
+        final_url (str): The URL of the page after redirects, if known.
+    """
+
+    def __init__(
+        self, result, etag=None, last_modified=None, expires_at=0.0, final_url=None
+    ):
+        self.result = result
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+        self.final_url = final_url
+        self.size = len(result.encode("utf-8"))
+
+    def is_fresh(self):
+        """Returns True if the entry can be served without revalidation."""
+        return time.time() < self.expires_at
+
+    def can_revalidate(self):
+        """Returns True if the entry has a validator for a conditional request."""
+        return bool(self.etag or self.last_modified)
+
+    def conditional_headers(self):
+        """
+        Returns the headers of a conditional request revalidating this entry.
+
+        Returns:
+            dict: If-None-Match and/or If-Modified-Since headers.
+        """
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def to_dict(self):
+        return {
+            "result": self.result,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "expires_at": self.expires_at,
+            "final_url": self.final_url,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        # Entries written before final_url was cached do not have it
+        return cls(
+            data["result"],
+            data["etag"],
+            data["last_modified"],
+            data["expires_at"],
+            data.get("final_url"),
+        )
+
+
+def _response_ttl(headers):
+    """
+    Computes the TTL of a response from its caching headers.
+
+    Args:
+        headers (Mapping): The response headers.
+
+    Returns:
+        float: The TTL in seconds, or None if the response must not be stored.
+    """
+    cache_control = {
+        directive.strip().split("=", 1)[0].lower(): directive.strip()
+        for directive in headers.get("Cache-Control", "").split(",")
+        if directive.strip()
+    }
+    if "no-store" in cache_control or "private" in cache_control:
+        return None
+    if "no-cache" in cache_control:
+        # May be stored, but every use must be revalidated
+        return 0.0
+
+    ttl = None
+    for directive in ("s-maxage", "max-age"):
+        if directive in cache_control:
+            try:
+                ttl = float(cache_control[directive].split("=", 1)[1].strip('" '))
+                break
+            except (IndexError, ValueError):
+                pass
+    if ttl is None and headers.get("Expires"):
+        try:
+            ttl = parsedate_to_datetime(headers["Expires"]).timestamp() - time.time()
+        except (TypeError, ValueError):
+            ttl = 0.0
+    if ttl is None:
+        ttl = app.config["CACHE_DEFAULT_TTL"]
+    return min(max(ttl, 0.0), app.config["CACHE_MAX_TTL"])
+
+
+def entry_from_response(result, response):
+    """
+    Builds a cache entry for a scrape result from the response it was produced from.
+
+    Args:
+        result (str): The processed scrape result.
+        response (requests.Response): The response of the page.
+
+    Returns:
+        CacheEntry: The entry, or None if the response must not be cached.
+    """
+    ttl = _response_ttl(response.headers)
+    if ttl is None:
+        return None
+    return CacheEntry(
+        result,
+        etag=response.headers.get("ETag"),
+        last_modified=response.headers.get("Last-Modified"),
+        expires_at=time.time() + ttl,
+        final_url=response.url,
+    )
+
+
+def refresh_entry(entry, response):
+    """
+    Refreshes a stale entry after a 304 Not Modified response.
+
+    Args:
+        entry (CacheEntry): The revalidated entry.
+        response (requests.Response): The 304 response.
+
+    Returns:
+        CacheEntry: The refreshed entry, or None if it must no longer be cached.
+    """
+    ttl = _response_ttl(response.headers)
+    if ttl is None:
+        return None
+    return CacheEntry(
+        entry.result,
+        etag=response.headers.get("ETag", entry.etag),
+        last_modified=response.headers.get("Last-Modified", entry.last_modified),
+        expires_at=time.time() + ttl,
+        final_url=entry.final_url,
+    )
+
+
+def cache_key(url, scraping_method, clean):
+    """
+    Builds the cache key of a scrape.
+
+    Args:
+        url (str): The scraped URL.
+        scraping_method (str): The scraping method.
+        clean (bool): Whether the result is cleaned.
+
+    Returns:
+        str: The cache key.
+    """
+    return json.dumps([url, scraping_method, bool(clean)])
+
+
+class ContentCache:
+    """
+    A two-tier (memory LRU + disk) cache of scrape results.
+
+    Args:
+        memory_bytes (int): Byte budget of the memory tier.
+        disk_dir (str): Directory of the disk tier, None disables it.
+        disk_bytes (int): Byte budget of the disk tier.
+    """
+
+    def __init__(self, memory_bytes, disk_dir=None, disk_bytes=0):
+        self.memory_bytes = memory_bytes
+        self.disk_dir = disk_dir
+        self.disk_bytes = disk_bytes
+
+        self._memory: OrderedDict = OrderedDict()
+        self._memory_size = 0
+        self._disk_size = None
+        self._lock = threading.Lock()
+        self.stats = {"hit": 0, "miss": 0, "revalidated": 0}
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def record(self, status):
+        """Counts a cache lookup outcome ("hit", "miss" or "revalidated")."""
+        with self._lock:
+            self.stats[status] += 1
+
+    # Memory tier
+
+    def _memory_put(self, key, entry):
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_size -= previous.size
+            if entry.size > self.memory_bytes:
+                return
+            self._memory[key] = entry
+            self._memory_size += entry.size
+            while self._memory_size > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_size -= evicted.size
+
+    def _memory_get(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+            return entry
+
+    # Disk tier
+
+    def _disk_path(self, key):
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.disk_dir, digest + ".json")
+
+    def _disk_get(self, key):
+        path = self._disk_path(key)
+        try:
+            with open(path, encoding="utf-8") as file:
+                entry = CacheEntry.from_dict(json.load(file))
+            # The modification time orders files for LRU eviction
+            os.utime(path)
+            return entry
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _disk_put(self, key, entry):
+        path = self._disk_path(key)
+        temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump(entry.to_dict(), file)
+        written = os.path.getsize(temporary_path)
+        # Atomic, so concurrent readers never see a partially written entry
+        os.replace(temporary_path, path)
+
+        with self._lock:
+            if self._disk_size is None:
+                self._disk_size = self._scan_disk()[1]
+            else:
+                self._disk_size += written
+            over_budget = self._disk_size > self.disk_bytes
+        if over_budget:
+            self._prune_disk()
+
+    def _scan_disk(self):
+        files = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.disk_dir, name))
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, name))
+        return files, sum(size for _, size, _ in files)
+
+    def _prune_disk(self):
+        """Removes the least recently used files until the disk tier fits its budget."""
+        files, total = self._scan_disk()
+        for _, size, name in sorted(files):
+            if total <= self.disk_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.disk_dir, name))
+            except OSError:
+                pass
+            total -= size
+        with self._lock:
+            self._disk_size = total
+
+    # Public API
+
+    def get(self, key):
+        """
+        Returns the entry stored under a key, fresh or stale.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            CacheEntry: The entry, or None if the key is not cached.
+        """
+        entry = self._memory_get(key)
+        if entry is None and self.disk_dir:
+            entry = self._disk_get(key)
+            if entry is not None:
+                self._memory_put(key, entry)
+        return entry
+
+    def put(self, key, entry):
+        """
+        Stores an entry in both tiers.
+
+        Args:
+            key (str): The cache key.
+            entry (CacheEntry): The entry to store.
+        """
+        self._memory_put(key, entry)
+        if self.disk_dir:
+            try:
+                self._disk_put(key, entry)
+            except OSError as e:
+                print(f"Failed to write cache entry to disk: {e}")
+
+    def delete(self, key):
+        """
+        Removes an entry from both tiers.
+
+        Args:
+            key (str): The cache key.
+        """
+        with self._lock:
+            entry = self._memory.pop(key, None)
+            if entry is not None:
+                self._memory_size -= entry.size
+        if self.disk_dir:
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_content_cache():
+    """
+    Returns the process-wide content cache, creating it on first use.
+
+    Returns:
+        ContentCache: The cache, or None if CACHE_ENABLED is off.
+    """
+    global _cache
+    if not app.config["CACHE_ENABLED"]:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ContentCache(
+                    app.config["CACHE_MEMORY_BYTES"],
+                    disk_dir=app.config["CACHE_DISK_DIR"] or None,
+                    disk_bytes=app.config["CACHE_DISK_BYTES"],
+                )
+    return _cache
+
+
+def _lookup_metrics():
+    if _cache is None:
+        return {}
+    with _cache._lock:
+        return {(outcome,): count for outcome, count in _cache.stats.items()}
+
+
+def _size_metrics():
+    if _cache is None:
+        return {}
+    with _cache._lock:
+        return {("memory",): _cache._memory_size, ("disk",): _cache._disk_size or 0}
+
+
+register_collector(
+    "content_cache_lookups_total",
+    "Content cache lookups by outcome (hit, miss or revalidated).",
+    "counter",
+    ("outcome",),
+    _lookup_metrics,
+)
+register_collector(
+    "content_cache_bytes",
+    "Size of the content cache tiers in bytes.",
+    "gauge",
+    ("tier",),
+    _size_metrics,
+)
@@ -0,0 +1,322 @@
+"""
+This module provides the change detection of recurring scrapes.
+
+Users often rescrape the same URL on a schedule only to find out whether it changed. With
+change detection, a scrape is compared with the latest history record of the user for the URL
+(and scraping method). The fingerprints of that record's content are kept in the
+content_fingerprint table, so the previous content is only loaded to diff it:
+- text_hash: the SHA-256 hash of the visible text, whitespace-normalized. Markup-only changes
+  (nonces, tracking attributes, reordered scripts) do not change it.
+- simhash: a 64-bit similarity hash of the word 3-grams of the visible text. The number of
+  differing bits between two simhashes estimates how different the texts are, it is reported
+  as a similarity and, with CHANGES_SIMHASH_THRESHOLD, lets near-identical texts count as
+  unchanged.
+
+A rescrape whose text is unchanged is reported as "not_modified" and stores no history record.
+A changed page is reported as "modified" with a compact unified diff against the content of
+the previous history record.
+
+The fingerprints are written in the transaction that stores the new history record (see
+core/repository.py), so they never describe content that was not stored. Fingerprints that do
+not belong to the latest record (e.g. of records stored without change detection) are ignored
+and the previous content is fingerprinted again. A record still waiting in the write-behind
+buffer (see core/history_writer.py) is the baseline as long as it waits, the buffer is never
+flushed for a comparison.
+
+Results are compared by their visible text, whether they are cleaned text or HTML is derived
+from the scraping method (methods like "requests" ignore the clean flag) and is stored with
+every history record.
+
+Functions:
+    visible_text(scrape_result, scrape_method, clean): Returns the text a result is compared by.
+    simhash(text): Returns the 64-bit simhash of a text.
+    hamming_distance(first, second): Returns the number of differing bits of two hashes.
+    compact_diff(previous, current, context): Returns a unified diff of two contents.
+    detect_change(user_id, url, scrape_method, scrape_result, clean): Compares a scrape result
+    with the last content the user stored for the URL.
+"""
+
+import difflib
+import hashlib
+import re
+from collections import Counter
+
+from sqlalchemy.sql import func
+
+from config import app, db
+from core.blobs import load_content
+from core.history_writer import pending_history_record
+from core.models import ContentFingerprint, History
+from core.parse_pool import run_parse
+from core.repository import HISTORY_RECORD_SIZE
+from core.scraper import CLEANING_METHODS, is_cleaned, looks_cleaned
+
+_WORD = re.compile(r"\w+")
+
+# Cleaned text is mostly one long line, so long lines are diffed sentence by sentence
+MAX_DIFF_LINE_CHARS = 200
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# Words per shingle of the simhash, 3-grams notice reordered words as well as changed ones
+SHINGLE_WORDS = 3
+
+# The simhash sums the bits of every shingle hash in one big integer with a 32-bit lane per
+# bit instead of looping over the 64 bits in Python. _SPREAD[k][b] is byte b of a hash at
+# position k, with each of its bits moved to the start of its lane.
+_LANE_BITS = 32
+_LANE_MASK = (1 << _LANE_BITS) - 1
+_SPREAD = [
+    [
+        sum(1 << ((8 * k + j) * _LANE_BITS) for j in range(8) if value >> j & 1)
+        for value in range(256)
+    ]
+    for k in range(8)
+]
+
+
+def visible_text(scrape_result, scrape_method, clean):
+    """
+    Returns the text a scrape result is compared by: the visible text of HTML results, the
+    result itself for cleaned text and extracted fields.
+
+    Args:
+        scrape_result (str): The scrape result.
+        scrape_method (str): The scraping method that produced it.
+        clean (bool): Whether the result is cleaned text.
+
+    Returns:
+        str: The text, with whitespace runs collapsed into single spaces.
+    """
+    if clean or scrape_method == "extract":
+        text = scrape_result
+    else:
+        title, text = run_parse("text", scrape_result)
+        if title:
+            text = f"{title} {text}"
+    return " ".join(text.split())
+
+
+def simhash(text):
+    """
+    Returns the 64-bit simhash of a text: bit i is set if most of its word 3-grams (weighted
+    by their counts) have bit i set in their hash. Similar texts get hashes with few
+    differing bits.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        int: The simhash, 0 for a text without words.
+    """
+    words = _WORD.findall(text.lower())
+    if len(words) <= SHINGLE_WORDS:
+        shingles = [" ".join(words)] if words else []
+    else:
+        # zip() of shifted word lists builds the 3-grams without slicing
+        shingles = [
+            " ".join(gram)
+            for gram in zip(*(words[offset:] for offset in range(SHINGLE_WORDS)))
+        ]
+
+    lanes = 0
+    total = 0
+    for shingle, count in Counter(shingles).items():
+        digest = hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest()
+        spread = 0
+        for position, value in enumerate(digest):
+            spread += _SPREAD[position][value]
+        lanes += spread * count
+        total += count
+
+    result = 0
+    for bit in range(64):
+        if 2 * ((lanes >> (bit * _LANE_BITS)) & _LANE_MASK) > total:
+            result |= 1 << bit
+    return result
+
+
+def hamming_distance(first, second):
+    """
+    Returns the number of differing bits of two hashes.
+
+    Args:
+        first (int): The first hash.
+        second (int): The second hash.
+
+    Returns:
+        int: The distance, 0 to 64 for simhashes.
+    """
+    return (first ^ second).bit_count()
+
+
+def _diff_lines(content):
+    lines = []
+    for line in content.splitlines():
+        if len(line) > MAX_DIFF_LINE_CHARS:
+            lines.extend(_SENTENCE_END.split(line))
+        else:
+            lines.append(line)
+    return lines
+
+
+def compact_diff(previous, current, context=2):
+    """
+    Returns a unified diff between two contents, line by line. Lines longer than
+    MAX_DIFF_LINE_CHARS are split after the end of every sentence.
+
+    Args:
+        previous (str): The previous content.
+        current (str): The current content.
+        context (int): The number of unchanged lines shown around every change.
+
+    Returns:
+        tuple: (diff, added, removed), the diff text and the number of added and removed lines.
+    """
+    lines = difflib.unified_diff(
+        _diff_lines(previous),
+        _diff_lines(current),
+        fromfile="previous",
+        tofile="current",
+        n=context,
+        lineterm="",
+    )
+    added = removed = 0
+    diff = []
+    for line in lines:
+        if line.startswith("+") and not line.startswith("+++"):
+            added += 1
+        elif line.startswith("-") and not line.startswith("---"):
+            removed += 1
+        diff.append(line)
+    return "\n".join(diff), added, removed
+
+
+def _format_date(value):
+    return value.strftime("%Y-%m-%d %H:%M:%S") if value else None
+
+
+def _latest_record(user_id, url, scrape_method):
+    """Returns the latest stored history record of the user for the URL and method, or None."""
+    return (
+        History.query.filter_by(user_id=user_id, url=url, scrape_method=scrape_method)
+        .order_by(History.date.desc(), History.id.desc())
+        .first()
+    )
+
+
+def _fingerprint_content(content, scrape_method, cleaned):
+    """
+    Returns the text_hash and simhash of a previous content.
+
+    Args:
+        content (str): The content of a history record.
+        scrape_method (str): The scraping method of the record.
+        cleaned (bool): Whether the content is cleaned text, None if the record does not say.
+
+    Returns:
+        tuple: (text_hash, simhash).
+    """
+    if cleaned is None:
+        cleaned = scrape_method in CLEANING_METHODS and looks_cleaned(content)
+    text = visible_text(content, scrape_method, cleaned)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest(), simhash(text)
+
+
+def detect_change(user_id, url, scrape_method, scrape_result, clean=False):
+    """
+    Compares a scrape result with the latest history record of the user for the URL (with the
+    same scraping method).
+
+    Args:
+        user_id (int): The ID of the user.
+        url (str): The scraped URL.
+        scrape_method (str): The scraping method.
+        scrape_result (str): The scrape result, not an error.
+        clean (bool): The clean flag of the scrape, ignored by methods that do not clean.
+
+    Returns:
+        tuple: (change, fingerprint). change is a dictionary with the following keys:
+            - change (str): "new" (first record of the URL), "modified" or "not_modified".
+            - similarity (float): 1 - differing simhash bits / 64, None for "new".
+            - last_changed (str): When the content last changed, None for "new".
+            - diff (str): The unified diff against the previous content ("modified" only),
+              None if the diff is longer than CHANGES_MAX_DIFF_RATIO times the content, the
+              caller then sends the content.
+            - added, removed (int): The number of added and removed lines of the diff.
+        fingerprint is a dictionary with the text_hash and simhash of the result, to be stored
+        with its history record, None for "not_modified": the caller stores no record then.
+    """
+    text = visible_text(scrape_result, scrape_method, is_cleaned(scrape_method, clean))
+    text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    current_simhash = simhash(text)
+    current = {"text_hash": text_hash, "simhash": f"{current_simhash:016x}"}
+
+    fingerprint = None
+    pending = pending_history_record(user_id, url, scrape_method)
+    if pending is not None:
+        # The latest record is not stored yet, it carries its content and fingerprint
+        record, submitted_at = pending
+        record += (None,) * (HISTORY_RECORD_SIZE - len(record))
+        previous_content, cleaned, pending_fingerprint = record[2], record[4], record[5]
+        if pending_fingerprint is not None:
+            previous_text_hash = pending_fingerprint["text_hash"]
+            previous_simhash = int(pending_fingerprint["simhash"], 16)
+        else:
+            previous_text_hash, previous_simhash = _fingerprint_content(
+                previous_content, scrape_method, cleaned
+            )
+        last_changed = _format_date(submitted_at)
+    else:
+        previous_record = _latest_record(user_id, url, scrape_method)
+        if previous_record is None:
+            return {"change": "new", "similarity": None, "last_changed": None}, current
+
+        fingerprint = ContentFingerprint.query.filter_by(
+            user_id=user_id, url=url, scrape_method=scrape_method
+        ).first()
+        previous_content = None
+        if (
+            fingerprint is not None
+            and previous_record.content_hash is not None
+            and fingerprint.content_hash == previous_record.content_hash
+        ):
+            previous_text_hash = fingerprint.text_hash
+            previous_simhash = int(fingerprint.simhash, 16)
+            last_changed = _format_date(fingerprint.changed_at)
+        else:
+            # The record was stored without change detection, fingerprint its content
+            fingerprint = None
+            previous_content = load_content(previous_record)
+            previous_text_hash, previous_simhash = _fingerprint_content(
+                previous_content, scrape_method, previous_record.cleaned
+            )
+            last_changed = _format_date(previous_record.date)
+
+    distance = hamming_distance(previous_simhash, current_simhash)
+    similarity = round(1 - distance / 64, 4)
+    threshold = app.config["CHANGES_SIMHASH_THRESHOLD"]
+    if previous_text_hash == text_hash or distance < threshold:
+        if fingerprint is not None:
+            fingerprint.checked_at = func.now()
+            db.session.commit()
+        return {
+            "change": "not_modified",
+            "similarity": similarity,
+            "last_changed": last_changed,
+        }, None
+
+    if previous_content is None:
+        previous_content = load_content(previous_record)
+    diff, added, removed = compact_diff(
+        previous_content, scrape_result, app.config["CHANGES_DIFF_CONTEXT"]
+    )
+    if len(diff) > len(scrape_result) * app.config["CHANGES_MAX_DIFF_RATIO"]:
+        diff = None
+    return {
+        "change": "modified",
+        "similarity": similarity,
+        "last_changed": last_changed,
+        "diff": diff,
+        "added": added,
+        "removed": removed,
+    }, current
@@ -0,0 +1,273 @@
+"""
+This module provides the HTML cleaning engine behind clean_text().
+
+Each document is parsed exactly once. Unwanted tags (scripts, styles, forms, ...) are skipped
+and the visible text is extracted in the same pass, without building a BeautifulSoup tree:
+- With lxml installed, the document is parsed by lxml's C parser, unwanted elements are
+  emptied and the text is collected with itertext().
+- Without lxml (or if lxml rejects the document), the standard library's HTMLParser streams
+  through the markup and collects the text of everything outside unwanted tags.
+
+lxml is loaded on first use through the engine registry (see core.engines).
+
+For huge pages, stream_extract_text() consumes the document chunk by chunk and never builds a
+tree (lxml's feed parser with a parser target, or the TextExtractor), so its memory use only
+depends on the size of the extracted text, not on the size of the page.
+
+Classes:
+    TextExtractor: A streaming HTML parser collecting the title and the visible text.
+Functions:
+    extract_text(html_content): Returns the title and the visible text of a document.
+    stream_extract_text(chunks): Same as extract_text() for a document given in chunks.
+    format_clean_text(title, text): Formats title and text as the clean_text() output.
+"""
+
+from html.parser import HTMLParser
+
+from core.engines import get_engine
+
+# Tags whose content is not part of the readable text
+UNWANTED_TAGS = ("script", "style", "meta", "noscript", "iframe", "svg", "form", "link")
+
+# Elements without an end tag, they never contain text
+VOID_TAGS = frozenset(
+    (
+        "area",
+        "base",
+        "br",
+        "col",
+        "embed",
+        "hr",
+        "img",
+        "input",
+        "link",
+        "meta",
+        "param",
+        "source",
+        "track",
+        "wbr",
+    )
+)
+
+
+class TextExtractor(HTMLParser):
+    """
+    A streaming HTML parser collecting the title and the visible text of a document.
+
+    Feed it the document (at once or in chunks) with feed(), then call close().
+    The text of unwanted tags is skipped, end tags close every element opened after
+    the matching start tag (like BeautifulSoup's html.parser tree builder).
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = None
+        # Text nodes are joined into larger blocks, many small strings cost a lot of memory
+        self._blocks: list = []
+        # The pieces of the current text node, split at the chunk boundaries of feed()
+        self._data: list = []
+        self._pending: list = []
+        self._pending_size = 0
+        self._title_parts: list = []
+        self._open_tags: list = []
+        self._unwanted_depth = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        self._flush()
+        if tag in VOID_TAGS:
+            return
+        self._open_tags.append(tag)
+        if tag in UNWANTED_TAGS:
+            self._unwanted_depth += 1
+        elif tag == "title" and self.title is None and not self._unwanted_depth:
+            self._in_title = True
+
+    def handle_startendtag(self, tag, attrs):
+        # Self-closing tags (<br/>, <svg/>) have no content
+        self._flush()
+
+    def handle_endtag(self, tag):
+        self._flush()
+        if tag not in self._open_tags:
+            return
+        while self._open_tags:
+            closed = self._open_tags.pop()
+            if closed in UNWANTED_TAGS:
+                self._unwanted_depth -= 1
+            elif closed == "title" and self._in_title:
+                self._in_title = False
+                self.title = "".join(self._title_parts)
+            if closed == tag:
+                return
+
+    def handle_data(self, data):
+        self._data.append(data)
+
+    def handle_comment(self, data):
+        # Comments are skipped, but separate the text around them
+        self._flush()
+
+    def handle_decl(self, decl):
+        self._flush()
+
+    def handle_pi(self, data):
+        self._flush()
+
+    def unknown_decl(self, data):
+        self._flush()
+
+    def _flush(self):
+        """Adds the current text node, once all its pieces have been received."""
+        if not self._data:
+            return
+        data = "".join(self._data)
+        self._data = []
+        if self._unwanted_depth:
+            return
+        if self._in_title:
+            self._title_parts.append(data)
+        # Collapsing whitespace per text node avoids splitting the whole text at the end
+        words = " ".join(data.split())
+        if words:
+            self._pending.append(words)
+            self._pending_size += len(words)
+            if self._pending_size > 65536:
+                self._blocks.append(" ".join(self._pending))
+                self._pending = []
+                self._pending_size = 0
+
+    def close(self):
+        super().close()
+        self._flush()
+        if self._in_title:
+            self.title = "".join(self._title_parts)
+            self._in_title = False
+
+    @property
+    def text(self):
+        """The visible text with all whitespace runs collapsed into single spaces."""
+        return " ".join(self._blocks + [" ".join(self._pending)]).strip()
+
+
+class _LxmlTextTarget:
+    """
+    lxml parser target collecting the title and the visible text from parser events,
+    so no tree is built. lxml closes implicitly closed elements itself.
+    """
+
+    def __init__(self):
+        self.extractor = TextExtractor()
+
+    def start(self, tag, attrib):
+        self.extractor.handle_starttag(tag.lower(), ())
+
+    def end(self, tag):
+        self.extractor.handle_endtag(tag.lower())
+
+    def data(self, data):
+        # lxml splits a text node into several events (e.g. around entities), the extractor
+        # joins them back
+        self.extractor.handle_data(data)
+
+    def comment(self, text):
+        self.extractor.handle_comment(text)
+
+    def close(self):
+        self.extractor.close()
+        return self.extractor
+
+
+def _lxml():
+    """Returns lxml.html (its etree is lxml.html.etree), None if lxml is not installed."""
+    try:
+        return get_engine("lxml")
+    except ImportError:  # lxml is optional, the standard library parser is used instead
+        return None
+
+
+def _extract_with_lxml(html_content):
+    document = _lxml().document_fromstring(html_content)
+    # Emptying (instead of removing) unwanted elements keeps their tail text a separate string
+    for element in list(document.iter(*UNWANTED_TAGS)):
+        element.clear(keep_tail=True)
+
+    title_element = document.find(".//title")
+    title = "".join(title_element.itertext()) if title_element is not None else None
+    text = " ".join(" ".join(document.itertext()).split())
+    return title, text
+
+
+def _extract_with_html_parser(html_content):
+    extractor = TextExtractor()
+    extractor.feed(html_content)
+    extractor.close()
+    return extractor.title, extractor.text
+
+
+def extract_text(html_content):
+    """
+    Returns the title and the visible text of a document, parsing it only once.
+
+    Args:
+        html_content (str): The raw HTML content.
+
+    Returns:
+        tuple: (title, text). The title is None if the document has none, the text has
+        all whitespace runs collapsed into single spaces.
+    """
+    lxml_html = _lxml()
+    if lxml_html is not None:
+        try:
+            return _extract_with_lxml(html_content)
+        except (lxml_html.etree.ParserError, ValueError):
+            # Empty documents or strings with an XML encoding declaration
+            pass
+    return _extract_with_html_parser(html_content)
+
+
+def stream_extract_text(chunks):
+    """
+    Returns the title and the visible text of a document given as an iterable of text chunks.
+    The chunks are parsed incrementally, without building a document tree.
+
+    Args:
+        chunks (iterable): The chunks of the raw HTML content.
+
+    Returns:
+        tuple: (title, text), like extract_text().
+    """
+    lxml_html = _lxml()
+    if lxml_html is not None:
+        parser = lxml_html.etree.HTMLParser(target=_LxmlTextTarget())
+        fed = False
+        for chunk in chunks:
+            parser.feed(chunk)
+            fed = True
+        if not fed:
+            return None, ""
+        extractor = parser.close()
+    else:
+        extractor = TextExtractor()
+        for chunk in chunks:
+            extractor.feed(chunk)
+        extractor.close()
+    return extractor.title, extractor.text
+
+
+def format_clean_text(title, text):
+    """
+    Formats a title and text as readable, structured output.
+
+    Args:
+        title (str): The document title, None if there is none.
+        text (str): The visible text.
+
+    Returns:
+        str: A markdown-style title followed by the text as a bullet point.
+    """
+    title = title.strip() if title is not None else "No Title Found"
+    formatted_lines = [f"### {title}\n"]
+    if text:
+        formatted_lines.append(f"- {text}")
+    return "\n".join(formatted_lines)
@@ -0,0 +1,160 @@
+"""
+This module provides the compression of API responses and the streamed /scrape responses.
+
+Responses are compressed with the best encoding the client accepts (Accept-Encoding): brotli
+when the optional brotli package is installed, otherwise gzip. Only text-like responses
+(JSON, NDJSON, text/*) of at least COMPRESS_MIN_BYTES are compressed. Streamed responses
+(e.g. /history/export and the "stream" format of /scrape) are compressed chunk by chunk while
+they are sent, so they are never held in memory as a whole.
+
+Functions:
+    negotiate_encoding(accept_encoding): Picks the response encoding for an Accept-Encoding.
+    compress_response(response): Compresses a response if the client accepts it.
+    stream_json(fields, key, text): Streams a JSON object with a large string field.
+    iter_chunks(text): Splits a large string into chunks.
+"""
+
+import json
+import zlib
+
+from flask import request
+
+from config import app
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is used instead
+    brotli = None
+
+# Media types worth compressing, besides text/*
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+)
+
+# Characters of a large string sent per chunk by the streamed formats
+STREAM_CHUNK_CHARS = 64 * 1024
+
+
+def negotiate_encoding(accept_encoding):
+    """
+    Picks the response encoding for an Accept-Encoding header.
+
+    Args:
+        accept_encoding: The parsed Accept-Encoding header (request.accept_encodings).
+
+    Returns:
+        str: "br", "gzip", or None if the response is sent uncompressed.
+    """
+    candidates = ("br", "gzip") if brotli is not None else ("gzip",)
+    best, best_quality = None, 0
+    for encoding in candidates:
+        quality = accept_encoding.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def _compressible(response):
+    if response.direct_passthrough or "Content-Encoding" in response.headers:
+        return False
+    if response.status_code < 200 or response.status_code in (204, 304):
+        return False
+    mimetype = response.mimetype or ""
+    return mimetype.startswith("text/") or mimetype in COMPRESSIBLE_TYPES
+
+
+def _compressor(encoding):
+    """Returns (compress, finish) functions of a streaming compressor."""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=app.config["COMPRESS_BROTLI_QUALITY"])
+        return compressor.process, compressor.finish
+    # wbits 31: gzip container
+    compressor = zlib.compressobj(app.config["COMPRESS_LEVEL"], zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+def _compress_stream(chunks, encoding):
+    compress, finish = _compressor(encoding)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            data = compress(chunk)
+            if data:
+                yield data
+        yield finish()
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+def compress_response(response):
+    """
+    Compresses a response with the best encoding the client of the current request accepts.
+    Meant to be registered with app.after_request.
+
+    Args:
+        response (flask.Response): The response.
+
+    Returns:
+        flask.Response: The (possibly compressed) response.
+    """
+    if not app.config["COMPRESS_ENABLED"] or not _compressible(response):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < app.config["COMPRESS_MIN_BYTES"]:
+            return response
+        compress, finish = _compressor(encoding)
+        response.set_data(compress(data) + finish())
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def iter_chunks(text, size=STREAM_CHUNK_CHARS):
+    """
+    Splits a large string into chunks.
+
+    Args:
+        text (str): The string.
+        size (int): The number of characters per chunk.
+
+    Yields:
+        str: The chunks.
+    """
+    for start in range(0, len(text), size):
+        end = start + size
+        yield text[start:end]
+
+
+def stream_json(fields, key, text):
+    """
+    Streams a JSON object with a large string field, without building the JSON document
+    in memory: the large string is escaped and sent chunk by chunk.
+
+    Args:
+        fields (dict): The other fields of the object (sent first).
+        key (str): The name of the large string field (sent last).
+        text (str): The large string.
+
+    Yields:
+        str: The parts of the JSON document.
+    """
+    head = json.dumps(fields)
+    yield head[:-1] + (", " if fields else "") + json.dumps(key) + ': "'
+    for chunk in iter_chunks(text):
+        # Escaping chunk by chunk is exact, JSON escapes never span two characters
+        yield json.dumps(chunk)[1:-1]
+    yield '"}'
@@ -0,0 +1,523 @@
+"""
+This module provides crawl mode: following the links of a seed URL and scraping every page
+reached, with the static scraping methods ("requests", "bs4" and "extract").
+
+Crawls run as jobs of the asynchronous job queue (see core/jobs.py):
+- Frontier: discovered URLs wait in a priority queue, shallower pages first and, at the same
+  depth, pages without a query string (listings, facets and sort orders) after the others.
+  At most CRAWL_MAX_FRONTIER URLs wait, more links are dropped.
+- Deduplication: every link is normalized (see core/links.py) and kept in a set of seen URLs.
+  Once a crawl has seen CRAWL_BLOOM_THRESHOLD URLs, the set is replaced by a scalable Bloom
+  filter (CRAWL_BLOOM_ERROR_RATE false positives, i.e. pages wrongly skipped), whose memory
+  no longer grows with the length of the URLs.
+- Limits: links are followed up to max_depth hops from the seed, at most max_pages pages are
+  fetched and, with same_domain, only pages of the seed's host (ignoring "www.") are crawled.
+  Pages disallowed by robots.txt and links to non-HTML files are skipped.
+- Concurrency: CRAWL_CONCURRENCY pages of a crawl are fetched at once. Every fetch still goes
+  through the per-host politeness scheduler and the content cache, and links are extracted
+  in the parse pool for large pages.
+- Deadlines: every page is fetched and processed under its own deadline of `timeout` seconds
+  (see core/deadlines.py), nested in the deadline of the crawl. Cancelling the crawl cancels
+  the pages in flight and stops it, the pages crawled until then are kept.
+- Links are resolved against the URL a page was served from, after redirects.
+The result of a crawl is one JSON document with every page, stored as a single history entry.
+
+Classes:
+    BloomFilter: A fixed-size Bloom filter of strings.
+    SeenUrls: The set of URLs a crawl has seen, turning into a Bloom filter when it grows large.
+    Frontier: The priority queue of the URLs waiting to be fetched.
+Functions:
+    validate_crawl_request(data): Validates and normalizes the options of a crawl.
+    crawl(options, progress): Runs a crawl and returns its result document.
+"""
+
+import hashlib
+import heapq
+import itertools
+import math
+import posixpath
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+from flask import g
+
+from config import app
+from core.deadlines import current_deadline, deadline_scope, validate_timeout
+from core.extraction import RuleSetError, get_rule_set
+from core.links import normalize_url, site_of
+from core.metrics import Counter, count_error
+from core.parse_pool import run_parse
+from core.politeness import robots_allowed
+from core.scraper import (
+    STATIC_SCRAPING_METHODS,
+    is_scrape_error,
+    process_static_page,
+    run_scraper,
+)
+
+# Links to these files are not followed, they are not HTML pages
+SKIPPED_EXTENSIONS = frozenset(
+    (
+        ".7z .avi .bmp .css .csv .doc .docx .exe .gif .gz .ico .jpeg .jpg .js .json .mov "
+        ".mp3 .mp4 .pdf .png .ppt .pptx .rar .rss .svg .tar .tgz .wav .webm .webp .woff "
+        ".woff2 .xls .xlsx .xml .zip"
+    ).split()
+)
+
+CRAWLED_PAGES = Counter(
+    "crawl_pages_total",
+    "Pages fetched by crawls, by outcome (ok, failed or disallowed by robots.txt).",
+    ("outcome",),
+)
+
+
+class BloomFilter:
+    """
+    A fixed-size Bloom filter of strings.
+
+    Args:
+        capacity (int): The number of items the filter is sized for.
+        error_rate (float): The false positive probability at capacity.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(
+            int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)), 8
+        )
+        self.hash_count = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    @staticmethod
+    def hashes(item):
+        """
+        Returns the two base hashes of an item, shared by the filters of a SeenUrls.
+
+        Args:
+            item (str): The item.
+
+        Returns:
+            tuple: Two 64-bit integers, the second one odd.
+        """
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return first, second
+
+    def _positions(self, hashes):
+        # Double hashing: k positions from two hashes (Kirsch and Mitzenmacher)
+        first, second = hashes
+        return [
+            (first + index * second) % self.size for index in range(self.hash_count)
+        ]
+
+    def contains(self, hashes):
+        """
+        Checks whether an item may have been added.
+
+        Args:
+            hashes (tuple): The hashes of the item, see hashes().
+
+        Returns:
+            bool: False if the item was never added, True if it probably was.
+        """
+        bits = self._bits
+        return all(
+            bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(hashes)
+        )
+
+    def add(self, hashes):
+        """
+        Adds an item.
+
+        Args:
+            hashes (tuple): The hashes of the item, see hashes().
+        """
+        for position in self._positions(hashes):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return self.contains(self.hashes(item))
+
+
+class SeenUrls:
+    """
+    The set of URLs a crawl has seen.
+
+    URLs are kept in a set until `bloom_threshold` of them have been seen, then in a scalable
+    Bloom filter: a chain of filters, each twice the capacity of the previous one and with half
+    its error rate, so the overall false positive rate stays below error_rate however many
+    URLs are added.
+
+    Args:
+        bloom_threshold (int): Number of URLs after which the set turns into a Bloom filter.
+        error_rate (float): The maximum false positive probability of the Bloom filters.
+    """
+
+    def __init__(self, bloom_threshold, error_rate):
+        self.bloom_threshold = max(bloom_threshold, 1)
+        self.error_rate = error_rate
+        self.count = 0
+        self._urls: set = set()
+        self._filters: list = []
+
+    @property
+    def uses_bloom(self):
+        """bool: Whether the URLs are kept in a Bloom filter."""
+        return bool(self._filters)
+
+    def _add_filter(self):
+        if self._filters:
+            last = self._filters[-1]
+            capacity, error_rate = last.capacity * 2, last.error_rate / 2
+        else:
+            capacity, error_rate = self.bloom_threshold * 2, self.error_rate / 2
+        self._filters.append(BloomFilter(capacity, error_rate))
+
+    def add(self, url):
+        """
+        Adds a URL unless it has been seen before.
+
+        Args:
+            url (str): A normalized URL.
+
+        Returns:
+            bool: True if the URL is new (Bloom filters rarely report a new URL as seen).
+        """
+        if not self._filters:
+            if url in self._urls:
+                return False
+            self._urls.add(url)
+            self.count += 1
+            if self.count >= self.bloom_threshold:
+                self._add_filter()
+                for seen in self._urls:
+                    self._filters[-1].add(BloomFilter.hashes(seen))
+                self._urls = set()
+            return True
+
+        hashes = BloomFilter.hashes(url)
+        if any(bloom.contains(hashes) for bloom in self._filters):
+            return False
+        if self._filters[-1].count >= self._filters[-1].capacity:
+            self._add_filter()
+        self._filters[-1].add(hashes)
+        self.count += 1
+        return True
+
+    def __len__(self):
+        return self.count
+
+
+class Frontier:
+    """
+    The priority queue of the URLs waiting to be fetched, see the module documentation.
+
+    Args:
+        max_size (int): Maximum number of waiting URLs.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._heap: list = []
+        self._counter = 0
+
+    @staticmethod
+    def priority(url, depth):
+        """
+        Returns the priority of a URL, lower values are fetched first.
+
+        Args:
+            url (str): A normalized URL.
+            depth (int): Its number of hops from the seed.
+
+        Returns:
+            tuple: (depth, has a query string, number of path segments).
+        """
+        parts = urlsplit(url)
+        return depth, bool(parts.query), parts.path.count("/")
+
+    def push(self, url, depth):
+        """
+        Adds a URL to the frontier.
+
+        Args:
+            url (str): A normalized URL.
+            depth (int): Its number of hops from the seed.
+
+        Returns:
+            bool: False if the frontier is full and the URL was dropped.
+        """
+        if len(self._heap) >= self.max_size:
+            return False
+        # The counter keeps the discovery order among URLs of the same priority
+        self._counter += 1
+        heapq.heappush(
+            self._heap, (self.priority(url, depth), self._counter, url, depth)
+        )
+        return True
+
+    def pop(self):
+        """
+        Removes the URL with the best priority.
+
+        Returns:
+            tuple: (url, depth).
+        """
+        _, _, url, depth = heapq.heappop(self._heap)
+        return url, depth
+
+    def __len__(self):
+        return len(self._heap)
+
+
+def _int_option(data, key, default, minimum, maximum):
+    """
+    Reads an integer option of a crawl request.
+
+    Returns:
+        tuple: (value, error). Exactly one of the two is None.
+    """
+    value = data.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, int):
+        return None, f"{key} must be an integer"
+    if not minimum <= value <= maximum:
+        return None, f"{key} must be between {minimum} and {maximum}"
+    return value, None
+
+
+def validate_crawl_request(data):
+    """
+    Validates and normalizes the options of a crawl.
+
+    Args:
+        data (dict): A dictionary with a "url" key and the optional keys "scraping_method"
+            (one of STATIC_SCRAPING_METHODS, default "bs4"), "clean_data", "rule_set" (for
+            "extract"), "max_depth", "max_pages", "same_domain" (default True) and "timeout"
+            (the deadline of every page in seconds).
+
+    Returns:
+        tuple: (options, error). Exactly one of the two is None.
+    """
+    if not isinstance(data, dict):
+        return None, "The body must be an object"
+
+    url = data.get("url")
+    if not url:
+        return None, "URL is required"
+    # Ensure the URL starts with "https://"
+    if url.startswith("www."):
+        url = "https://" + url[4:]
+    seed = normalize_url(url)
+    if seed is None:
+        return None, "URL must be an http or https URL"
+
+    scraping_method = data.get("scraping_method", "bs4")
+    if scraping_method not in STATIC_SCRAPING_METHODS:
+        return None, "Crawls support the scraping methods " + ", ".join(
+            STATIC_SCRAPING_METHODS
+        )
+    rule_set = data.get("rule_set")
+    if scraping_method == "extract":
+        try:
+            get_rule_set(rule_set)
+        except RuleSetError as e:
+            return None, str(e)
+
+    max_depth, error = _int_option(
+        data,
+        "max_depth",
+        app.config["CRAWL_DEFAULT_MAX_DEPTH"],
+        0,
+        app.config["CRAWL_MAX_DEPTH"],
+    )
+    if error:
+        return None, error
+    max_pages, error = _int_option(
+        data,
+        "max_pages",
+        app.config["CRAWL_DEFAULT_MAX_PAGES"],
+        1,
+        app.config["CRAWL_MAX_PAGES"],
+    )
+    if error:
+        return None, error
+    timeout, error = validate_timeout(data.get("timeout"))
+    if error:
+        return None, error
+
+    return {
+        "url": seed,
+        "scraping_method": scraping_method,
+        "clean_data": bool(data.get("clean_data", False)),
+        "rule_set": rule_set,
+        "max_depth": max_depth,
+        "max_pages": max_pages,
+        "same_domain": bool(data.get("same_domain", True)),
+        "timeout": timeout,
+    }, None
+
+
+def _error_message(scrape_result):
+    if isinstance(scrape_result, dict):
+        return scrape_result.get("error", "Scraping failed")
+    return scrape_result if isinstance(scrape_result, str) else "Scraping failed"
+
+
+def _crawl_page(url, follow_links, options, parent):
+    """
+    Fetches a page of a crawl, scrapes it and extracts its links, under the page's deadline.
+
+    Args:
+        url (str): The normalized URL of the page.
+        follow_links (bool): Whether the links of the page are needed.
+        options (dict): The options of the crawl.
+        parent (Deadline): The deadline of the crawl (None: the page's own only).
+
+    Returns:
+        tuple: (page, links). page is None if robots.txt disallows the URL, otherwise a
+        dictionary with status 1 and the scrape_result, or status 2 and the error.
+    """
+    with app.app_context(), deadline_scope(options["timeout"], parent):
+        try:
+            if not robots_allowed(url):
+                CRAWLED_PAGES.inc(("disallowed",))
+                return None, []
+            # The raw HTML is needed for the links, the content cache keeps it for recrawls
+            html_content = run_scraper(url, "requests")
+            if is_scrape_error(html_content):
+                CRAWLED_PAGES.inc(("failed",))
+                return {"status": 2, "error": _error_message(html_content)}, []
+            # Relative links are relative to the page the redirects ended on
+            final_url = g.get("final_url") or url
+            links = run_parse("links", html_content, final_url) if follow_links else []
+            scrape_result = process_static_page(
+                html_content,
+                options["scraping_method"],
+                final_url,
+                clean=options["clean_data"],
+                rule_set=options["rule_set"],
+            )
+        except Exception as e:
+            count_error(e)
+            CRAWLED_PAGES.inc(("failed",))
+            return {"status": 2, "error": f"An error occurred: {e}"}, []
+    CRAWLED_PAGES.inc(("ok",))
+    return {"status": 1, "scrape_result": scrape_result}, links
+
+
+def _followable(link, site, same_domain):
+    if same_domain and site_of(link) != site:
+        return False
+    extension = posixpath.splitext(urlsplit(link).path)[1].lower()
+    return extension not in SKIPPED_EXTENSIONS
+
+
+def crawl(options, progress=None):
+    """
+    Runs a crawl, see the module documentation.
+
+    Args:
+        options (dict): The options returned by validate_crawl_request().
+        progress (callable): Called with the statistics of the crawl whenever a page is done
+            (optional).
+
+    Returns:
+        dict: The result document: the seed URL, the options, the pages in crawl order (url,
+        depth and status, with scrape_result or error) and the statistics of the crawl.
+        The crawl stops early if the current deadline is cancelled, "cancelled" is then set
+        in its statistics.
+    """
+    seed = options["url"]
+    site = site_of(seed)
+    max_depth, max_pages = options["max_depth"], options["max_pages"]
+    concurrency = max(app.config["CRAWL_CONCURRENCY"], 1)
+
+    seen = SeenUrls(
+        app.config["CRAWL_BLOOM_THRESHOLD"], app.config["CRAWL_BLOOM_ERROR_RATE"]
+    )
+    frontier = Frontier(app.config["CRAWL_MAX_FRONTIER"])
+    # The pages run in other threads, they get the deadline of the crawl as their parent
+    deadline = current_deadline()
+    seen.add(seed)
+    frontier.push(seed, 0)
+
+    pages = []
+    stats = {
+        "pages": 0,
+        "failed": 0,
+        "disallowed": 0,
+        "discovered": 1,
+        "dropped": 0,
+        "queued": 0,
+    }
+    started = time.monotonic()
+    # Pages submitted (and not disallowed), and the crawl order of the submitted pages
+    scheduled = 0
+    order = itertools.count()
+    pending = {}
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="crawl")
+    try:
+        while frontier or pending:
+            while frontier and len(pending) < concurrency and scheduled < max_pages:
+                url, depth = frontier.pop()
+                future = executor.submit(
+                    _crawl_page, url, depth < max_depth, options, deadline
+                )
+                pending[future] = (next(order), url, depth)
+                scheduled += 1
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            cancelled = deadline is not None and deadline.cancelled
+            for future in done:
+                index, url, depth = pending.pop(future)
+                page, links = future.result()
+                if page is None:
+                    # Disallowed pages do not count against max_pages
+                    stats["disallowed"] += 1
+                    scheduled -= 1
+                    continue
+                if cancelled and page["status"] != 1:
+                    # The page may have failed because the crawl was cancelled
+                    continue
+                pages.append((index, {"url": url, "depth": depth, **page}))
+                stats["pages"] += 1
+                stats["failed"] += page["status"] != 1
+                for link in links:
+                    if not _followable(link, site, options["same_domain"]):
+                        continue
+                    if not seen.add(link):
+                        continue
+                    stats["discovered"] += 1
+                    if not frontier.push(link, depth + 1):
+                        stats["dropped"] += 1
+            if cancelled:
+                # The pages still in flight were cancelled too, their errors are not kept
+                stats["cancelled"] = True
+                break
+            stats["queued"] = len(frontier)
+            if progress is not None:
+                progress(dict(stats))
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    stats["seconds"] = round(time.monotonic() - started, 3)
+    stats["bloom_filter"] = seen.uses_bloom
+    pages.sort(key=lambda item: item[0])
+    return {
+        "seed": seed,
+        "scraping_method": options["scraping_method"],
+        "clean_data": options["clean_data"],
+        "max_depth": max_depth,
+        "max_pages": max_pages,
+        "same_domain": options["same_domain"],
+        "pages": [page for _, page in pages],
+        "stats": stats,
+    }
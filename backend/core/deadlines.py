@@ -0,0 +1,375 @@
+"""
+This module provides the end-to-end deadline and the cancellation of scrapes.
+
+A socket timeout only bounds how long a server may stay silent, not how long a scrape takes:
+a server trickling a byte every few seconds holds a worker for as long as it likes, and so
+does a page that never finishes loading in the browser. Every scrape therefore runs under a
+Deadline (SCRAPE_DEFAULT_TIMEOUT seconds, or the "timeout" of the request within
+SCRAPE_MIN_TIMEOUT and SCRAPE_MAX_TIMEOUT), which every stage enforces:
+- connect and download: socket timeouts are capped at the time left, and the connection in use
+  is shut down when the deadline passes (see core/http_client.py);
+- politeness: waiting for a request slot of the host is capped at the time left
+  (see core/politeness.py);
+- render: the page load and wait timeouts of the browser are capped at the time left, and the
+  browser is quit when the deadline passes (see core/browser_pool.py and core/waits.py);
+- parse: the parse pool timeout is capped at the time left, and the worker is killed when the
+  deadline passes (see core/parse_pool.py).
+The blocked stage then fails at once and its resources are released by the usual error paths.
+
+A deadline can also be cancelled (e.g. by cancelling its job, see core/jobs.py), which runs the
+same cleanup right away. Deadlines nest: a deadline expires at the latest with its parent and
+is cancelled with it, so cancelling a crawl cancels the pages it is fetching.
+
+The deadline of the running scrape is held in a context variable, so the stages find it without
+it being passed around. Threads do not inherit it, they are given the deadline as the parent
+of their own. The cleanup callbacks of expired deadlines are run by a single watchdog thread.
+
+Classes:
+    Deadline: The expiry time and cancellation state of a scrape.
+    DeadlineExceeded: Raised when a scrape does not finish within its deadline.
+    ScrapeCancelled: Raised when a scrape is cancelled.
+Functions:
+    validate_timeout(value): Validates the timeout of a scrape requested by a client.
+    deadline_scope(seconds, parent): Context manager running a block under a new deadline.
+    current_deadline(): Returns the deadline of the running scrape.
+    remaining_timeout(limit): Caps a timeout at the time left to the running scrape.
+    check_deadline(): Raises if the running scrape expired or was cancelled.
+    on_expire(callback): Context manager running a cleanup callback if the deadline passes.
+"""
+
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+from config import app
+
+# The smallest timeout handed to a blocking call, 0 would make sockets non-blocking
+MIN_TIMEOUT = 0.001
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a scrape does not finish within its deadline."""
+
+
+class ScrapeCancelled(Exception):
+    """Raised when a scrape is cancelled."""
+
+
+class _Watchdog:
+    """A thread running the callbacks of deadlines when they expire."""
+
+    def __init__(self):
+        self._heap = []
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def watch(self, deadline):
+        """Runs the callbacks of a deadline once it expires."""
+        with self._condition:
+            heapq.heappush(
+                self._heap, (deadline.expires_at, next(self._order), deadline)
+            )
+            # Threads do not survive a fork, the child starts its own
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="deadline-watchdog", daemon=True
+                )
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    now = time.monotonic()
+                    if self._heap and self._heap[0][0] <= now:
+                        deadline = heapq.heappop(self._heap)[2]
+                        break
+                    self._condition.wait(self._heap[0][0] - now if self._heap else None)
+            deadline.fire()
+
+
+_watchdog = _Watchdog()
+
+
+class Deadline:
+    """
+    The expiry time and cancellation state of a scrape.
+
+    Callbacks registered with add_callback() run once, when the deadline expires or is
+    cancelled, to abort whatever the scrape is blocked on.
+
+    Args:
+        seconds (float): Seconds until the deadline expires (None: only the parent's expiry).
+        parent (Deadline): The enclosing deadline (optional).
+    """
+
+    def __init__(self, seconds=None, parent=None):
+        self.parent = parent
+        self.timeout = seconds
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+        if parent is not None and parent.expires_at is not None:
+            if self.expires_at is None or parent.expires_at < self.expires_at:
+                self.expires_at, self.timeout = parent.expires_at, parent.timeout
+
+        # Callbacks run while holding the lock, so none runs after remove_callback() returned
+        self._lock = threading.RLock()
+        self._callbacks = {}
+        self._tokens = itertools.count()
+        self._watched = False
+        self._fired = False
+        self._cancelled = False
+        self._parent_token = None
+        if parent is not None:
+            self._parent_token = parent.add_callback(self.fire)
+
+    @property
+    def cancelled(self):
+        """bool: Whether the deadline or one of its parents was cancelled."""
+        return self._cancelled or (self.parent is not None and self.parent.cancelled)
+
+    @property
+    def expired(self):
+        """bool: Whether the deadline has passed."""
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def remaining(self):
+        """
+        Returns the seconds left until the deadline.
+
+        Returns:
+            float: The seconds left (0 once expired), None if the deadline never expires.
+        """
+        if self.expires_at is None:
+            return None
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def error(self):
+        """
+        Returns the error of a cancelled or expired deadline.
+
+        Returns:
+            Exception: A ScrapeCancelled or DeadlineExceeded instance, None if the deadline
+            is still running.
+        """
+        if self.cancelled:
+            return ScrapeCancelled("The scrape was cancelled")
+        if self.expired:
+            return DeadlineExceeded(
+                f"The scrape could not finish within its {self.timeout:g}s deadline"
+            )
+        return None
+
+    def check(self):
+        """
+        Raises if the deadline expired or was cancelled.
+
+        Raises:
+            ScrapeCancelled: If the deadline was cancelled.
+            DeadlineExceeded: If the deadline has passed.
+        """
+        error = self.error()
+        if error is not None:
+            raise error
+
+    def cap(self, limit):
+        """
+        Caps a timeout at the time left.
+
+        Args:
+            limit (float): The timeout of the stage (None: no limit of its own).
+
+        Returns:
+            float: The smaller of `limit` and the seconds left.
+
+        Raises:
+            ScrapeCancelled: If the deadline was cancelled.
+            DeadlineExceeded: If the deadline has passed.
+        """
+        self.check()
+        remaining = self.remaining()
+        if remaining is None:
+            return limit
+        if limit is not None:
+            remaining = min(limit, remaining)
+        return max(remaining, MIN_TIMEOUT)
+
+    def add_callback(self, callback):
+        """
+        Registers a callback run when the deadline expires or is cancelled. It runs at once if
+        that already happened.
+
+        Args:
+            callback (callable): Called without arguments, from the watchdog thread or from
+                the thread cancelling the deadline.
+
+        Returns:
+            int: The token to pass to remove_callback().
+        """
+        with self._lock:
+            token = next(self._tokens)
+            if not self._fired:
+                self._callbacks[token] = callback
+                if self.expires_at is not None and not self._watched:
+                    self._watched = True
+                    _watchdog.watch(self)
+                return token
+        callback()
+        return token
+
+    def remove_callback(self, token):
+        """
+        Unregisters a callback. Waits for it to finish if it is running.
+
+        Args:
+            token (int): The token returned by add_callback().
+        """
+        with self._lock:
+            self._callbacks.pop(token, None)
+
+    def fire(self):
+        """Runs the callbacks once the deadline expired or was cancelled (only once)."""
+        with self._lock:
+            if self._fired or not (self.expired or self.cancelled):
+                return
+            self._fired = True
+            callbacks = list(self._callbacks.values())
+            self._callbacks.clear()
+            for callback in callbacks:
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"Deadline callback failed: {e}")
+
+    def cancel(self):
+        """Cancels the deadline (and every deadline nested in it) and runs its callbacks."""
+        self._cancelled = True
+        self.fire()
+
+    def expire(self):
+        """
+        Expires the deadline now, e.g. when a stage knows the scrape cannot finish in time.
+        """
+        self.expires_at = time.monotonic()
+        self.fire()
+
+    def close(self):
+        """Drops the callbacks of a deadline that is no longer used."""
+        with self._lock:
+            self._callbacks.clear()
+        if self.parent is not None:
+            self.parent.remove_callback(self._parent_token)
+
+
+_current_deadline = contextvars.ContextVar("scrape_deadline", default=None)
+
+
+def validate_timeout(value):
+    """
+    Validates the timeout of a scrape requested by a client.
+
+    Args:
+        value: The "timeout" of the request in seconds, or None for SCRAPE_DEFAULT_TIMEOUT.
+
+    Returns:
+        tuple: (seconds, error). Exactly one of the two is None.
+    """
+    if value is None:
+        return app.config["SCRAPE_DEFAULT_TIMEOUT"], None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None, "timeout must be a number of seconds"
+    minimum = app.config["SCRAPE_MIN_TIMEOUT"]
+    maximum = app.config["SCRAPE_MAX_TIMEOUT"]
+    if not minimum <= value <= maximum:
+        return None, f"timeout must be between {minimum:g} and {maximum:g} seconds"
+    return float(value), None
+
+
+@contextmanager
+def deadline_scope(seconds=None, parent=None):
+    """
+    Runs the `with` block under a new deadline, nested in the current one.
+
+    Args:
+        seconds (float): Seconds until the deadline expires (None: only the parent's expiry).
+        parent (Deadline): The enclosing deadline, by default the current one. Threads pass
+            the deadline of the thread that started them.
+
+    Yields:
+        Deadline: The new deadline, the current one until the block ends.
+    """
+    deadline = Deadline(
+        seconds, parent if parent is not None else _current_deadline.get()
+    )
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+        deadline.close()
+
+
+def current_deadline():
+    """
+    Returns the deadline of the running scrape.
+
+    Returns:
+        Deadline: The innermost deadline of this thread, None outside of deadline_scope().
+    """
+    return _current_deadline.get()
+
+
+def remaining_timeout(limit):
+    """
+    Caps the timeout of a stage at the time left to the running scrape.
+
+    Args:
+        limit (float): The timeout of the stage.
+
+    Returns:
+        float: The smaller of `limit` and the seconds left (`limit` without a deadline).
+
+    Raises:
+        ScrapeCancelled: If the running scrape was cancelled.
+        DeadlineExceeded: If the running scrape is past its deadline.
+    """
+    deadline = _current_deadline.get()
+    return limit if deadline is None else deadline.cap(limit)
+
+
+def check_deadline():
+    """
+    Raises if the running scrape expired or was cancelled. Called between stages, and after
+    errors that may have been caused by the cleanup of an expired deadline.
+
+    Raises:
+        ScrapeCancelled: If the running scrape was cancelled.
+        DeadlineExceeded: If the running scrape is past its deadline.
+    """
+    deadline = _current_deadline.get()
+    if deadline is not None:
+        deadline.check()
+
+
+@contextmanager
+def on_expire(callback):
+    """
+    Runs a cleanup callback if the deadline of the running scrape passes (or the scrape is
+    cancelled) during the `with` block, e.g. to close the connection the block is reading from.
+
+    Args:
+        callback (callable): Called without arguments, from another thread.
+    """
+    deadline = _current_deadline.get()
+    if deadline is None:
+        yield
+        return
+    token = deadline.add_callback(callback)
+    try:
+        yield
+    finally:
+        deadline.remove_callback(token)
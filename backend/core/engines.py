@@ -0,0 +1,164 @@
+"""
+This module provides the registry of the scraping engines, the heavy libraries behind the
+scraping methods (Selenium, requests, BeautifulSoup, lxml).
+
+Engines are imported on first use instead of when the application starts, so workers that
+only serve /login or /history never pay for them in startup time and memory. Every engine is
+registered by name with an import target, "module" or "module:attribute"; more engines can be
+plugged in with register_engine().
+
+With ENGINES_PRELOAD (or `gunicorn --preload`, see gunicorn.conf.py), engines are imported
+once in the gunicorn master, before the workers are forked: the workers then share the
+memory of the imported modules copy-on-write instead of importing them each.
+
+Functions:
+    register_engine(name, target, description): Registers an engine.
+    get_engine(name): Returns an engine, importing it on first use.
+    is_loaded(name): Checks whether an engine has been imported.
+    preload_engines(names): Imports engines ahead of their first use.
+    engine_names(): Returns the names of the registered engines.
+"""
+
+import importlib
+import threading
+import time
+
+from core.metrics import register_collector
+
+# name -> {"target": "module[:attribute]", "description": str}
+ENGINES: dict = {}
+
+_loaded: dict = {}
+_load_seconds: dict = {}
+# Engines that are not installed, their ImportError is raised again without a new import
+_unavailable: dict = {}
+_lock = threading.Lock()
+
+
+def register_engine(name, target, description=""):
+    """
+    Registers an engine, replacing an engine registered with the same name.
+
+    Args:
+        name (str): The name of the engine, e.g. "browser".
+        target (str): What to import, "module" or "module:attribute".
+        description (str): What the engine is used for.
+    """
+    with _lock:
+        ENGINES[name] = {"target": target, "description": description}
+        _loaded.pop(name, None)
+        _unavailable.pop(name, None)
+
+
+def get_engine(name):
+    """
+    Returns an engine, importing it on first use.
+
+    Args:
+        name (str): The name of the engine.
+
+    Returns:
+        The imported module, or its attribute for "module:attribute" targets.
+
+    Raises:
+        ValueError: If no engine is registered with this name.
+        ImportError: If the engine is not installed (optional engines catch it).
+    """
+    engine = _loaded.get(name)
+    if engine is not None:
+        return engine
+    if name in _unavailable:
+        raise _unavailable[name]
+    if name not in ENGINES:
+        raise ValueError(f"Unknown engine: {name}")
+
+    module_name, _, attribute = ENGINES[name]["target"].partition(":")
+    started = time.perf_counter()
+    try:
+        # Imports are thread-safe, concurrent first uses wait for the same import
+        engine = importlib.import_module(module_name)
+    except ImportError as e:
+        _unavailable[name] = e
+        raise
+    if attribute:
+        engine = getattr(engine, attribute)
+    with _lock:
+        if name not in _loaded:
+            _loaded[name] = engine
+            _load_seconds[name] = time.perf_counter() - started
+            print(f"Loaded the {name} engine in {_load_seconds[name] * 1000:.0f} ms")
+    return _loaded[name]
+
+
+def is_loaded(name):
+    """
+    Checks whether an engine has been imported.
+
+    Args:
+        name (str): The name of the engine.
+
+    Returns:
+        bool: True if the engine has been imported.
+    """
+    return name in _loaded
+
+
+def engine_names():
+    """
+    Returns the names of the registered engines.
+
+    Returns:
+        list: The names, in registration order.
+    """
+    return list(ENGINES)
+
+
+def preload_engines(names="all"):
+    """
+    Imports engines ahead of their first use. Engines that are not installed are skipped.
+
+    Args:
+        names: "all", a comma-separated string or a list of engine names.
+
+    Returns:
+        list: The names of the engines that are loaded.
+
+    Raises:
+        ValueError: If a name is not a registered engine.
+    """
+    if isinstance(names, str):
+        if names.strip().lower() == "all":
+            names = engine_names()
+        else:
+            names = [name.strip() for name in names.split(",") if name.strip()]
+    loaded = []
+    for name in names:
+        try:
+            get_engine(name)
+            loaded.append(name)
+        except ImportError as e:
+            print(f"Engine {name} is not available: {e}")
+    return loaded
+
+
+register_engine("http", "core.http_client", "requests/urllib3 HTTP client")
+register_engine("browser", "core.browser_pool", "Selenium browser pool")
+register_engine("waits", "core.waits", "Selenium wait conditions and site flows")
+register_engine("bs4", "bs4:BeautifulSoup", "BeautifulSoup, for prettified HTML")
+register_engine("lxml", "lxml.html", "lxml HTML parser, for cleaning and extraction")
+register_engine("cssselect", "cssselect", "CSS selector compiler, for extraction")
+
+register_collector(
+    "scraper_engine_loaded",
+    "Whether a scraping engine has been imported in this process.",
+    "gauge",
+    ("engine",),
+    lambda: {(name,): int(name in _loaded) for name in ENGINES},
+)
+register_collector(
+    "scraper_engine_load_seconds",
+    "Time it took to import a scraping engine.",
+    "gauge",
+    ("engine",),
+    lambda: {(name,): seconds for name, seconds in _load_seconds.items()},
+)
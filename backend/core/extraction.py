@@ -0,0 +1,301 @@
+"""
+This module provides structured extraction with named, reusable selector rule sets.
+
+A rule set maps field names to CSS or XPath selectors. Instead of returning the whole page, the
+"extract" scraping method parses the page once and returns only the fields of its rule set as
+compact JSON, e.g. {"title": "...", "links": ["https://...", ...]}.
+
+Rule sets are compiled once (CSS selectors are translated to XPath and every XPath expression
+is compiled by lxml) and cached. Built-in rule sets are registered in RULE_SETS; more can be
+added without code as JSON files in EXTRACTION_RULES_DIR (the file name is the rule set name),
+which are recompiled when the file changes. lxml and cssselect are loaded on first use through
+the engine registry (see core.engines).
+
+Field rules:
+    "title": "h1"                                    CSS selector, text of the first match
+    "title": {"css": "h1"}                           same
+    "description": {"xpath": "//meta[@name='description']/@content"}
+    "links": {"css": "a[href]", "attr": "href", "many": True}
+Every rule also accepts:
+    "many" (bool): Return a list of all matches instead of the first match.
+    "attr" (str): Return an attribute of the matched elements instead of their text.
+      "href" and "src" values are resolved against the page URL.
+XPath rules may also select strings (attributes, text()) or compute values (count(), ...).
+
+Classes:
+    RuleSet: A compiled rule set.
+    RuleSetError: Raised when a rule set is invalid.
+Functions:
+    get_rule_set(name): Returns the compiled rule set registered under a name.
+    list_rule_sets(): Returns the names and fields of all available rule sets.
+    extract_fields(rule_set, html_content, url): Applies a rule set to a page.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from urllib.parse import urljoin
+
+from config import app
+from core.engines import get_engine
+
+# Attributes holding URLs, resolved against the page URL
+URL_ATTRIBUTES = ("href", "src")
+
+RULE_SETS = {
+    "page_meta": {
+        "title": "title",
+        "description": {"xpath": "//meta[@name='description']/@content"},
+        "canonical": {"css": "link[rel='canonical']", "attr": "href"},
+        "language": {"xpath": "/html/@lang"},
+        "og_title": {"xpath": "//meta[@property='og:title']/@content"},
+        "og_image": {"xpath": "//meta[@property='og:image']/@content"},
+        "h1": {"css": "h1", "many": True},
+    },
+    "headings": {
+        "h1": {"css": "h1", "many": True},
+        "h2": {"css": "h2", "many": True},
+        "h3": {"css": "h3", "many": True},
+    },
+    "links": {
+        "links": {"css": "a[href]", "attr": "href", "many": True},
+        "images": {"css": "img[src]", "attr": "src", "many": True},
+    },
+}
+
+
+def _backends():
+    """
+    Returns the parser backends of the extraction, loading them on first use.
+
+    Returns:
+        tuple: (lxml.etree, lxml.html, cssselect), or None if lxml or cssselect is not
+        installed (extraction is only available with both).
+    """
+    try:
+        lxml_html = get_engine("lxml")
+        cssselect = get_engine("cssselect")
+    except ImportError:
+        return None
+    return lxml_html.etree, lxml_html, cssselect
+
+
+class RuleSetError(Exception):
+    """Raised when a rule set does not exist or is invalid."""
+
+
+class _FieldRule:
+    """A compiled field rule."""
+
+    def __init__(self, name, xpath, attr, many):
+        self.name = name
+        self.xpath = xpath
+        self.attr = attr
+        self.many = many
+
+
+def _compile_field(name, rule):
+    """
+    Compiles a field rule.
+
+    Args:
+        name (str): The field name.
+        rule (str or dict): The field rule, see the module documentation.
+
+    Returns:
+        _FieldRule: The compiled rule.
+
+    Raises:
+        RuleSetError: If the rule is invalid.
+    """
+    if isinstance(rule, str):
+        rule = {"css": rule}
+    if not isinstance(rule, dict) or ("css" in rule) == ("xpath" in rule):
+        raise RuleSetError(f"Field {name!r} needs exactly one of 'css' or 'xpath'")
+    etree, _, cssselect = _backends()
+    try:
+        if "css" in rule:
+            expression = cssselect.GenericTranslator().css_to_xpath(rule["css"])
+        else:
+            expression = rule["xpath"]
+        xpath = etree.XPath(expression)
+    except (cssselect.SelectorError, etree.XPathSyntaxError, TypeError) as e:
+        raise RuleSetError(f"Invalid selector of field {name!r}: {e}") from e
+    return _FieldRule(name, xpath, rule.get("attr"), bool(rule.get("many", False)))
+
+
+class RuleSet:
+    """
+    A compiled rule set.
+
+    Args:
+        name (str): The rule set name.
+        rules (dict): Maps field names to field rules.
+
+    Raises:
+        RuleSetError: If a rule is invalid.
+    """
+
+    def __init__(self, name, rules):
+        if not isinstance(rules, dict) or not rules:
+            raise RuleSetError(f"Rule set {name!r} must map field names to rules")
+        self.name = name
+        self.fields = [_compile_field(field, rule) for field, rule in rules.items()]
+        # Part of the cache key, so results are not reused after the rules change
+        self.digest = hashlib.sha256(
+            json.dumps(rules, sort_keys=True).encode("utf-8")
+        ).hexdigest()[:16]
+
+    def apply(self, document, url=None):
+        """
+        Applies every field rule to a parsed document.
+
+        Args:
+            document: The lxml document.
+            url (str): The page URL, used to resolve href/src attributes.
+
+        Returns:
+            dict: Maps each field name to its value (a list for "many" fields).
+        """
+        return {field.name: _field_value(field, document, url) for field in self.fields}
+
+
+def _value(field, match, url):
+    """Turns a single XPath match into a JSON value."""
+    if isinstance(match, (bool, float, int)):
+        return match
+    if isinstance(match, str):
+        return " ".join(match.split())
+    if field.attr:
+        value = match.get(field.attr)
+        if value is not None and url and field.attr in URL_ATTRIBUTES:
+            value = urljoin(url, value.strip())
+        return value
+    return " ".join(match.text_content().split())
+
+
+def _field_value(field, document, url):
+    matches = field.xpath(document)
+    # Expressions like count() return a single value instead of a list
+    if not isinstance(matches, list):
+        return _value(field, matches, url)
+    values = [_value(field, match, url) for match in matches]
+    if field.attr:
+        values = [value for value in values if value is not None]
+    if field.many:
+        return values
+    return values[0] if values else None
+
+
+_compiled: dict = {}
+_compiled_lock = threading.Lock()
+
+
+def _rule_file(name):
+    directory = app.config["EXTRACTION_RULES_DIR"]
+    if not directory or not name.replace("_", "").replace("-", "").isalnum():
+        return None
+    path = os.path.join(directory, f"{name}.json")
+    return path if os.path.isfile(path) else None
+
+
+def get_rule_set(name):
+    """
+    Returns the compiled rule set registered under a name.
+    Rule set files in EXTRACTION_RULES_DIR take precedence over the built-in RULE_SETS and
+    are recompiled when they change.
+
+    Args:
+        name (str): The rule set name.
+
+    Returns:
+        RuleSet: The compiled rule set.
+
+    Raises:
+        RuleSetError: If the rule set does not exist or is invalid, or lxml and cssselect are
+        not installed.
+    """
+    if _backends() is None:
+        raise RuleSetError("Structured extraction requires lxml and cssselect")
+    if not isinstance(name, str) or not name:
+        raise RuleSetError("A rule set name is required")
+
+    path = _rule_file(name)
+    if path is not None:
+        key = (name, path, os.path.getmtime(path))
+    elif name in RULE_SETS:
+        key = (name, None, None)
+    else:
+        raise RuleSetError(f"Unknown rule set: {name}")
+
+    with _compiled_lock:
+        rule_set = _compiled.get(key)
+    if rule_set is not None:
+        return rule_set
+
+    if path is not None:
+        try:
+            with open(path, encoding="utf-8") as file:
+                rules = json.load(file)
+        except (OSError, ValueError) as e:
+            raise RuleSetError(f"Failed to load rule set {name!r}: {e}") from e
+    else:
+        rules = RULE_SETS[name]
+    rule_set = RuleSet(name, rules)
+    with _compiled_lock:
+        # Drop the versions compiled from older copies of the file
+        for stale in [cached for cached in _compiled if cached[0] == name]:
+            del _compiled[stale]
+        _compiled[key] = rule_set
+    return rule_set
+
+
+def list_rule_sets():
+    """
+    Returns the names and fields of all available rule sets.
+
+    Returns:
+        dict: Maps each rule set name to the list of its field names.
+    """
+    names = set(RULE_SETS)
+    directory = app.config["EXTRACTION_RULES_DIR"]
+    if directory and os.path.isdir(directory):
+        names.update(
+            file_name[: -len(".json")]
+            for file_name in os.listdir(directory)
+            if file_name.endswith(".json")
+        )
+    available = {}
+    for name in sorted(names):
+        try:
+            available[name] = [field.name for field in get_rule_set(name).fields]
+        except RuleSetError as e:
+            print(f"Skipping rule set {name}: {e}")
+    return available
+
+
+def extract_fields(rule_set, html_content, url=None):
+    """
+    Parses a page once and applies all rules of a rule set to it.
+
+    Args:
+        rule_set (RuleSet): The compiled rule set.
+        html_content (str): The raw HTML content.
+        url (str): The page URL, used to resolve href/src attributes.
+
+    Returns:
+        str: The extracted fields as compact JSON.
+    """
+    etree, lxml_html, _ = _backends()
+    try:
+        document = lxml_html.document_fromstring(html_content)
+    except ValueError:
+        # Strings with an XML encoding declaration are only accepted as bytes
+        document = lxml_html.document_fromstring(html_content.encode("utf-8"))
+    except etree.ParserError:
+        # Empty documents, every field is empty
+        document = lxml_html.document_fromstring("<html></html>")
+    return json.dumps(
+        rule_set.apply(document, url), ensure_ascii=False, separators=(",", ":")
+    )
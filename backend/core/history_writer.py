@@ -0,0 +1,417 @@
+"""
+This module provides the write-behind writer of the scraping history.
+
+Storing a history record synchronously puts a committed (fsync'd) SQLite transaction into the
+response time of every scrape, and concurrent requests serialize on the database write lock.
+Instead, records are put into a bounded in-process buffer and a background thread inserts them
+in bulk, one transaction per HISTORY_WRITER_BATCH_SIZE records or HISTORY_WRITER_FLUSH_MS
+milliseconds, whichever comes first.
+
+- Backpressure: when the buffer (HISTORY_WRITER_MAX_PENDING records) is full, callers wait up to
+  HISTORY_WRITER_PUT_TIMEOUT seconds for room, then store their record synchronously, so the
+  buffer never drops records to make room and memory stays bounded.
+- Failures: a batch that cannot be stored after its retries is stored record by record, so only
+  the records that fail on their own are lost (and logged). Scrape errors are refused when they
+  are submitted, they are never buffered.
+- Shutdown: the buffer is flushed when the process exits (atexit) or close() is called.
+- A record shows up in /history once its batch is flushed, at most a flush interval later.
+  Until then, pending_history_record() returns the latest buffered record of a user's URL, so
+  change detection compares with it without waiting for the buffer to be flushed.
+
+With HISTORY_WRITE_BEHIND disabled, records are stored synchronously.
+
+Classes:
+    HistoryWriter: A bounded buffer of history records flushed in bulk by a background thread.
+Functions:
+    get_history_writer(): Returns the process-wide history writer.
+    save_user_history(url, scrape_method, scrape_result, user_id, fingerprint, cleaned): Saves a
+    history record.
+    save_user_history_bulk(records, user_id): Saves several history records of a user.
+    pending_history_record(user_id, url, scrape_method): Returns the latest buffered record of
+    a URL.
+    flush_history(): Waits until all buffered history records are stored.
+"""
+
+import atexit
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from config import app, db
+from core.metrics import Histogram, register_collector
+from core.repository import store_history_records, store_user_history_bulk
+from core.scraper import is_scrape_error
+
+# Put into the buffer to wake the flusher up when the writer is closed
+_STOP = object()
+
+BATCH_SECONDS = Histogram(
+    "history_writer_batch_duration_seconds",
+    "Duration of the transactions storing a batch of history records.",
+)
+
+
+def _check_record(record):
+    """
+    Refuses a history record whose result is not scraped content.
+
+    Args:
+        record (tuple): A history record (see store_history_records()).
+
+    Raises:
+        ValueError: If the result is not a string or is a scrape error.
+    """
+    scrape_result = record[2]
+    if not isinstance(scrape_result, str) or is_scrape_error(scrape_result):
+        raise ValueError(
+            f"Refusing to store a failed scrape of {record[0]} in the history"
+        )
+
+
+def _record_key(record):
+    url, scrape_method, _, user_id = record[:4]
+    return user_id, url, scrape_method
+
+
+class HistoryWriter:
+    """
+    A bounded buffer of history records, flushed in bulk by a background thread.
+
+    Args:
+        max_pending (int): Maximum number of buffered records.
+        batch_size (int): Maximum number of records per transaction.
+        flush_interval (float): Seconds a record waits at most for its batch to fill up.
+        put_timeout (float): Seconds a caller waits for room in a full buffer.
+        max_attempts (int): Attempts to store a batch before it is given up.
+    """
+
+    def __init__(
+        self,
+        max_pending=10000,
+        batch_size=200,
+        flush_interval=0.2,
+        put_timeout=1.0,
+        max_attempts=3,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.max_attempts = max_attempts
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._closed = False
+        # The latest submitted record and its submission time per (user_id, url, method),
+        # until it is stored
+        self._latest: dict = {}
+        self.stats = {
+            "queued": 0,
+            "written": 0,
+            "batches": 0,
+            "sync_writes": 0,
+            "failed": 0,
+        }
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def start(self):
+        """Starts the flusher thread."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="history-writer", daemon=True
+            )
+            self._thread.start()
+
+    def submit(self, record):
+        """
+        Buffers a history record. If the buffer stays full for put_timeout seconds, or the
+        writer is closed, the record is stored synchronously instead.
+
+        Args:
+            record (tuple): A history record (see store_history_records()).
+
+        Raises:
+            ValueError: If the result is not scraped content (see is_scrape_error()).
+        """
+        _check_record(record)
+        with self._lock:
+            self._latest[_record_key(record)] = (record, datetime.now(timezone.utc))
+        try:
+            if not self._closed:
+                try:
+                    self._queue.put(record, timeout=self.put_timeout)
+                    self._count("queued")
+                    return
+                except queue.Full:
+                    pass
+            self._count("sync_writes")
+            store_history_records([record])
+        except BaseException:
+            self._forget([record])
+            raise
+        self._forget([record])
+
+    def pending(self, user_id, url, scrape_method):
+        """
+        Returns the latest submitted record of a user's URL that is not stored yet.
+
+        Args:
+            user_id (int): The ID of the user.
+            url (str): The scraped URL.
+            scrape_method (str): The scraping method.
+
+        Returns:
+            tuple: (record, submitted_at), None if no record of the URL is waiting.
+        """
+        with self._lock:
+            return self._latest.get((user_id, url, scrape_method))
+
+    def _forget(self, records):
+        """Drops stored (or given up) records from the pending ones."""
+        with self._lock:
+            for record in records:
+                key = _record_key(record)
+                latest = self._latest.get(key)
+                # A newer record of the URL may have been submitted meanwhile
+                if latest is not None and latest[0] is record:
+                    del self._latest[key]
+
+    def flush(self):
+        """Blocks until every buffered record has been stored (or given up)."""
+        self._queue.join()
+
+    def close(self, timeout=None):
+        """
+        Stores the buffered records and stops the flusher thread.
+
+        Args:
+            timeout (float): Seconds to wait for the flusher, None waits until it is done.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def _next_batch(self):
+        """
+        Waits for a record, then collects more until the batch is full or the flush
+        interval of its first record is over.
+
+        Returns:
+            tuple: (batch, stop), the records and whether the writer was closed.
+        """
+        record = self._queue.get()
+        if record is _STOP:
+            self._queue.task_done()
+            return [], True
+
+        batch = [record]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    record = self._queue.get(timeout=remaining)
+                else:
+                    record = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is _STOP:
+                self._queue.task_done()
+                return batch, True
+            batch.append(record)
+        return batch, False
+
+    def _store(self, records):
+        """Stores records in one transaction, rolled back if it fails."""
+        with app.app_context():
+            try:
+                store_history_records(records)
+            except Exception:
+                db.session.rollback()
+                raise
+
+    def _write(self, batch):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                started = time.perf_counter()
+                self._store(batch)
+                BATCH_SECONDS.observe(time.perf_counter() - started)
+                self._count("written", len(batch))
+                self._count("batches")
+                return
+            except Exception as e:
+                print(
+                    f"Failed to store {len(batch)} history records "
+                    f"(attempt {attempt}/{self.max_attempts}): {e}"
+                )
+                time.sleep(min(0.1 * 2**attempt, 2))
+        # One bad record must not lose the records batched with it
+        for record in batch:
+            try:
+                self._store([record])
+                self._count("written")
+            except Exception as e:
+                url, scrape_method, _, user_id = record[:4]
+                print(
+                    f"Dropped the history record of {url} ({scrape_method}) "
+                    f"of user {user_id}: {e}"
+                )
+                self._count("failed")
+
+    def _run(self):
+        while True:
+            batch, stop = self._next_batch()
+            if batch:
+                self._write(batch)
+                self._forget(batch)
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                break
+        # Records submitted while closing are stored in one last batch
+        remaining = []
+        while True:
+            try:
+                remaining.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if remaining:
+            self._write(remaining)
+            self._forget(remaining)
+            for _ in remaining:
+                self._queue.task_done()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_history_writer():
+    """
+    Returns the process-wide history writer, creating and starting it on first use.
+
+    Returns:
+        HistoryWriter: The writer configured from the HISTORY_WRITER_* settings.
+    """
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                writer = HistoryWriter(
+                    max_pending=app.config["HISTORY_WRITER_MAX_PENDING"],
+                    batch_size=app.config["HISTORY_WRITER_BATCH_SIZE"],
+                    flush_interval=app.config["HISTORY_WRITER_FLUSH_MS"] / 1000,
+                    put_timeout=app.config["HISTORY_WRITER_PUT_TIMEOUT"],
+                )
+                writer.start()
+                # Don't lose buffered records when the process exits
+                atexit.register(writer.close)
+                _writer = writer
+    return _writer
+
+
+def save_user_history(
+    url, scrape_method, scrape_result, user_id, fingerprint=None, cleaned=None
+):
+    """
+    Saves a history record, through the write-behind writer if HISTORY_WRITE_BEHIND is on.
+
+    Args:
+        url (str): The URL that was scraped.
+        scrape_method (str): The method used for scraping.
+        scrape_result (str): The result of the scraping process.
+        user_id (int): The ID of the user.
+        fingerprint (dict): The change detection fingerprint of the result, stored with the
+            record (see core.changes.detect_change()).
+        cleaned (bool): Whether the result is cleaned text (see core.scraper.is_cleaned()).
+
+    Raises:
+        ValueError: If the result is not scraped content (see is_scrape_error()).
+    """
+    record = (url, scrape_method, scrape_result, user_id, cleaned, fingerprint)
+    if not app.config["HISTORY_WRITE_BEHIND"]:
+        _check_record(record)
+        store_history_records([record])
+        return
+    get_history_writer().submit(record)
+
+
+def save_user_history_bulk(records, user_id):
+    """
+    Saves several history records of a user: through the write-behind writer if
+    HISTORY_WRITE_BEHIND is on, in a single transaction otherwise.
+
+    Args:
+        records (list): A list of (url, scrape_method, scrape_result, cleaned) tuples.
+        user_id (int): The ID of the user.
+
+    Raises:
+        ValueError: If a result is not scraped content, no record is saved then.
+    """
+    for url, scrape_method, scrape_result, _ in records:
+        _check_record((url, scrape_method, scrape_result, user_id))
+    if not app.config["HISTORY_WRITE_BEHIND"]:
+        store_user_history_bulk(records, user_id)
+        return
+    writer = get_history_writer()
+    for url, scrape_method, scrape_result, cleaned in records:
+        writer.submit((url, scrape_method, scrape_result, user_id, cleaned))
+
+
+def pending_history_record(user_id, url, scrape_method):
+    """
+    Returns the latest history record of a user's URL still waiting in the write-behind
+    buffer, without waiting for the buffer to be flushed.
+
+    Args:
+        user_id (int): The ID of the user.
+        url (str): The scraped URL.
+        scrape_method (str): The scraping method.
+
+    Returns:
+        tuple: (record, submitted_at), None if no record of the URL is waiting.
+    """
+    if _writer is None:
+        return None
+    return _writer.pending(user_id, url, scrape_method)
+
+
+def flush_history():
+    """Waits until all buffered history records are stored."""
+    if _writer is not None:
+        _writer.flush()
+
+
+def _writer_metrics():
+    if _writer is None:
+        return {}
+    with _writer._lock:
+        return {(event,): count for event, count in _writer.stats.items()}
+
+
+register_collector(
+    "history_writer_records_total",
+    "History records queued, written, written synchronously and failed, and batches.",
+    "counter",
+    ("event",),
+    _writer_metrics,
+)
+register_collector(
+    "history_writer_pending",
+    "History records waiting in the write-behind buffer.",
+    "gauge",
+    (),
+    lambda: {(): _writer._queue.qsize()} if _writer is not None else {},
+)
@@ -0,0 +1,408 @@
+"""
+This module provides the shared HTTP fetch layer used by the scraping functions.
+
+Instead of calling `requests.get` for every scrape (which performs a fresh DNS lookup,
+TCP connect and TLS handshake each time), all fetches go through one process-wide
+`requests.Session`. The session keeps a pool of keep-alive connections per host, negotiates
+compressed transfer encodings (gzip/deflate, plus brotli and zstd when the optional decoders
+are installed) and applies bounded retry and redirect policies.
+
+Fetches honour the deadline of the running scrape (see core/deadlines.py): the connect and read
+timeouts are capped at the time left, and when the deadline passes while a connection is
+checked out, its socket is shut down, so a server trickling its body cannot hold the request
+past the deadline.
+
+Pool sizes, retries, redirects and the default timeout are read from the Flask config
+(see config.py).
+
+Functions:
+    get_session(): Returns the process-wide session, creating it on first use.
+    close_session(): Closes the session and drops all pooled connections.
+    fetch(url, **kwargs): Performs a GET request through the shared session.
+    get_host_stats(): Returns per-host request, handshake and connection reuse counters.
+    iter_body(response, max_bytes): Streams the body of a response in chunks, up to a size cap.
+    iter_text(response, max_bytes): Streams the body of a response as decoded text chunks.
+    read_text(response, max_bytes): Reads the whole body of a response as text, up to a size cap.
+Classes:
+    ResponseTooLarge: Raised when a response body exceeds its size cap.
+"""
+
+import codecs
+import itertools
+import socket
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.compat import chardet
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.request import ACCEPT_ENCODING
+from urllib3.util.retry import Retry
+
+from config import app
+from core.deadlines import check_deadline, current_deadline, remaining_timeout
+from core.metrics import count_bytes, register_collector
+
+_session = None
+_session_lock = threading.Lock()
+
+_stats: dict = {}
+_stats_lock = threading.Lock()
+
+
+class ResponseTooLarge(Exception):
+    """Raised when a response body exceeds its size cap."""
+
+
+def _record(host, key):
+    """
+    Increments a per-host counter.
+
+    Args:
+        host (str): The host the counter belongs to.
+        key (str): The counter name ("requests" or "handshakes").
+    """
+    with _stats_lock:
+        host_stats = _stats.setdefault(host, {"requests": 0, "handshakes": 0})
+        host_stats[key] += 1
+
+
+class _CountingHTTPConnection(HTTPConnection):
+    """HTTP connection that records every new TCP connection it opens."""
+
+    def connect(self):
+        _record(self.host, "handshakes")
+        super().connect()
+
+
+class _CountingHTTPSConnection(HTTPSConnection):
+    """HTTPS connection that records every new TCP/TLS handshake it performs."""
+
+    def connect(self):
+        _record(self.host, "handshakes")
+        super().connect()
+
+
+def _abort_connection(conn):
+    """Shuts down the socket of a connection, so a blocked read on it returns at once."""
+    sock = getattr(conn, "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+def _watch_connection(conn):
+    """Aborts a checked out connection when the deadline of the running scrape passes."""
+    deadline = current_deadline()
+    if deadline is not None:
+        token = deadline.add_callback(lambda: _abort_connection(conn))
+        conn.deadline_callback = (deadline, token)
+
+
+def _unwatch_connection(conn):
+    """Detaches a connection going back to its pool from the deadline it was checked out by."""
+    deadline_callback = getattr(conn, "deadline_callback", None)
+    if deadline_callback is not None:
+        deadline, token = deadline_callback
+        deadline.remove_callback(token)
+        conn.deadline_callback = None
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    """
+    Per-host HTTP pool that records every connection checkout and ties checked out connections
+    to the deadline of the scrape.
+    """
+
+    ConnectionCls = _CountingHTTPConnection
+
+    def _get_conn(self, timeout=None):
+        # Retries and redirects of an expired scrape are not attempted
+        check_deadline()
+        _record(self.host, "requests")
+        conn = super()._get_conn(timeout=timeout)
+        _watch_connection(conn)
+        return conn
+
+    def _put_conn(self, conn):
+        if conn is not None:
+            _unwatch_connection(conn)
+        super()._put_conn(conn)
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    """
+    Per-host HTTPS pool that records every connection checkout and ties checked out
+    connections to the deadline of the scrape.
+    """
+
+    ConnectionCls = _CountingHTTPSConnection
+
+    def _get_conn(self, timeout=None):
+        # Retries and redirects of an expired scrape are not attempted
+        check_deadline()
+        _record(self.host, "requests")
+        conn = super()._get_conn(timeout=timeout)
+        _watch_connection(conn)
+        return conn
+
+    def _put_conn(self, conn):
+        if conn is not None:
+            _unwatch_connection(conn)
+        super()._put_conn(conn)
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose pool manager creates instrumented per-host connection pools.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+
+def _build_session():
+    """
+    Builds a session configured from the Flask config.
+
+    Returns:
+        requests.Session: The configured session.
+    """
+    retries = Retry(
+        total=app.config["HTTP_MAX_RETRIES"],
+        backoff_factor=app.config["HTTP_RETRY_BACKOFF"],
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        # Redirects are followed (and limited) by the session, not by urllib3
+        redirect=False,
+        raise_on_status=False,
+    )
+    adapter = PooledHTTPAdapter(
+        pool_connections=app.config["HTTP_POOL_CONNECTIONS"],
+        pool_maxsize=app.config["HTTP_POOL_MAXSIZE"],
+        max_retries=retries,
+    )
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.max_redirects = app.config["HTTP_MAX_REDIRECTS"]
+    # Advertise every content encoding urllib3 can decode in this environment
+    session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+    return session
+
+
+def get_session():
+    """
+    Returns the process-wide session, creating it on first use.
+
+    Returns:
+        requests.Session: The shared session.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def close_session():
+    """
+    Closes the shared session and drops all pooled connections.
+    The next call to get_session() builds a new one.
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def fetch(url: str, **kwargs):
+    """
+    Performs a GET request through the shared, pooled session.
+    The timeout is capped at the time left to the running scrape.
+
+    Args:
+        url (str): The URL to fetch.
+        **kwargs: Extra keyword arguments passed to `requests.Session.get`.
+
+    Returns:
+        requests.Response: The response of the request.
+
+    Raises:
+        DeadlineExceeded: If the running scrape is past its deadline.
+        ScrapeCancelled: If the running scrape was cancelled.
+    """
+    kwargs["timeout"] = remaining_timeout(
+        kwargs.get("timeout", app.config["HTTP_TIMEOUT"])
+    )
+    try:
+        return get_session().get(url, **kwargs)
+    except requests.RequestException:
+        # The connection may have been shut down by the deadline
+        check_deadline()
+        raise
+
+
+def get_host_stats():
+    """
+    Returns per-host connection statistics.
+
+    Returns:
+        dict: Maps each host to a dictionary with the following keys:
+            - requests (int): Number of connection checkouts (one per request attempt).
+            - handshakes (int): Number of new TCP (and TLS) connections opened.
+            - reused (int): Number of requests served over an already open connection.
+    """
+    with _stats_lock:
+        return {
+            host: {
+                "requests": counts["requests"],
+                "handshakes": counts["handshakes"],
+                "reused": max(counts["requests"] - counts["handshakes"], 0),
+            }
+            for host, counts in _stats.items()
+        }
+
+
+def iter_body(response, max_bytes):
+    """
+    Streams the body of a response (fetched with stream=True) in chunks.
+    The chunks are decompressed, so the cap also protects against compression bombs.
+
+    Args:
+        response (requests.Response): The streamed response.
+        max_bytes (int): Maximum number of body bytes to read.
+
+    Yields:
+        bytes: The chunks of the body.
+
+    Raises:
+        ResponseTooLarge: If the body is larger than max_bytes.
+        DeadlineExceeded: If the running scrape passes its deadline while the body downloads.
+        ScrapeCancelled: If the running scrape is cancelled while the body downloads.
+    """
+    content_length = response.headers.get("Content-Length", "")
+    if content_length.isdigit() and int(content_length) > max_bytes:
+        response.close()
+        raise ResponseTooLarge(f"Response body exceeds {max_bytes} bytes")
+
+    received = 0
+    try:
+        for chunk in response.iter_content(chunk_size=app.config["FETCH_CHUNK_SIZE"]):
+            received += len(chunk)
+            if received > max_bytes:
+                response.close()
+                raise ResponseTooLarge(f"Response body exceeds {max_bytes} bytes")
+            yield chunk
+            check_deadline()
+    except requests.RequestException:
+        # The connection may have been shut down by the deadline
+        check_deadline()
+        raise
+    finally:
+        count_bytes(received)
+    # A body without length ends when the connection is shut down, it is incomplete then
+    check_deadline()
+
+
+def _detect_encoding(prefix):
+    """
+    Guesses the encoding of a body without a declared charset from its first bytes, like
+    requests' Response.apparent_encoding does from the whole body.
+
+    Args:
+        prefix (bytes): The first FETCH_ENCODING_SNIFF_BYTES bytes of the body.
+
+    Returns:
+        str: The name of the encoding.
+    """
+    encoding = chardet.detect(prefix)["encoding"] if chardet is not None else None
+    # A prefix that is plain ASCII says nothing about the rest of the body
+    if encoding is None or encoding.lower() == "ascii":
+        return "utf-8"
+    return encoding
+
+
+def iter_text(response, max_bytes):
+    """
+    Streams the body of a response as decoded text chunks. Bodies without a declared
+    charset are decoded with the encoding detected from their first bytes.
+
+    Args:
+        response (requests.Response): The streamed response.
+        max_bytes (int): Maximum number of body bytes to read.
+
+    Yields:
+        str: The decoded chunks of the body.
+
+    Raises:
+        ResponseTooLarge: If the body is larger than max_bytes.
+    """
+    chunks = iter_body(response, max_bytes)
+    # requests falls back to ISO-8859-1 for text/* without charset, keep that behaviour
+    encoding = response.encoding
+    if encoding is None:
+        head = []
+        size = 0
+        for chunk in chunks:
+            head.append(chunk)
+            size += len(chunk)
+            if size >= app.config["FETCH_ENCODING_SNIFF_BYTES"]:
+                break
+        encoding = _detect_encoding(b"".join(head))
+        chunks = itertools.chain(head, chunks)
+    try:
+        decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    except LookupError:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+def read_text(response, max_bytes):
+    """
+    Reads the whole body of a response (fetched with stream=True) as text.
+
+    Args:
+        response (requests.Response): The streamed response.
+        max_bytes (int): Maximum number of body bytes to read.
+
+    Returns:
+        str: The decoded body.
+
+    Raises:
+        ResponseTooLarge: If the body is larger than max_bytes.
+    """
+    return "".join(iter_text(response, max_bytes))
+
+
+def _connection_metrics():
+    return {
+        (host, event): count
+        for host, counts in get_host_stats().items()
+        for event, count in counts.items()
+    }
+
+
+register_collector(
+    "http_client_connections_total",
+    "Outgoing requests, new connections (handshakes) and reused connections by host.",
+    "counter",
+    ("host", "event"),
+    _connection_metrics,
+)
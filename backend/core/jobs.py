@@ -0,0 +1,500 @@
+"""
+This module provides an asynchronous job queue for scrapes.
+
+Jobs are stored in the `scrape_job` table next to `History`, so queued work survives restarts
+and can be processed by any number of worker processes sharing the database. A worker claims a
+job with a conditional UPDATE (queued -> running), which guarantees that each job is processed
+by exactly one worker.
+
+Crawls (see core/crawl.py) are jobs too. A running crawl stores its progress and a heartbeat every
+PROGRESS_INTERVAL seconds, so crawls running longer than JOB_STALE_SECONDS are not mistaken for
+abandoned jobs.
+
+Jobs can be cancelled (DELETE /jobs/<job_id>): a queued job is cancelled right away, a running
+one is flagged with cancel_requested and its scrape is cancelled through its deadline (see
+core/deadlines.py), which aborts the fetch, browser or parse it is blocked on. Jobs running in
+the process that received the request are cancelled at once, the workers of other processes
+check for flagged jobs every JOB_CANCEL_POLL_INTERVAL seconds.
+
+Workers either run inside the API process (see JOB_WORKERS in config.py) or standalone with
+`python worker.py`, so scrape workers can be scaled separately from API workers.
+
+Functions:
+    enqueue_scrape_job(url, scrape_method, clean_data, company_name, user_id, rule_set,
+    timeout): Adds a scrape to the queue and returns its job id.
+    enqueue_crawl_job(options, user_id): Adds a crawl to the queue and returns its job id.
+    get_job(job_id): Returns a job by its id.
+    job_to_dict(job): Serializes a job for the API.
+    claim_next_job(): Atomically claims the oldest queued job.
+    run_job(job): Runs a claimed job and stores its outcome.
+    cancel_job(job): Cancels a queued or running job.
+    requeue_stale_jobs(): Puts jobs abandoned by crashed workers back in the queue.
+Classes:
+    JobWorkerPool: A pool of background threads processing queued jobs.
+"""
+
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, update
+
+from config import app, db
+from core.crawl import crawl
+from core.deadlines import deadline_scope
+from core.models import ScrapeJob
+from core.history_writer import save_user_history
+from core.scraper import is_cleaned, is_scrape_error, run_scraper
+
+# Seconds between two progress updates (and heartbeats) of a running crawl
+PROGRESS_INTERVAL = 5
+
+# The options of a crawl stored in ScrapeJob.options, the others have their own columns
+CRAWL_OPTIONS = ("max_depth", "max_pages", "same_domain")
+
+# The deadlines of the jobs running in this process by job id, cancelling one stops its job
+_running: dict = {}
+_running_lock = threading.Lock()
+
+
+def enqueue_scrape_job(
+    url,
+    scrape_method,
+    clean_data=False,
+    company_name=None,
+    user_id=None,
+    rule_set=None,
+    timeout=None,
+):
+    """
+    Adds a scrape to the queue.
+
+    Args:
+        url (str): The URL to scrape.
+        scrape_method (str): The scraping method to use.
+        clean_data (bool): Whether the scraped data should be cleaned.
+        company_name (str): The company to search for (only used by "selenium").
+        user_id (int): The user the result belongs to, or None for anonymous scrapes.
+        rule_set (str): The extraction rule set (only used by "extract").
+        timeout (float): The deadline of the scrape in seconds (None: SCRAPE_DEFAULT_TIMEOUT).
+
+    Returns:
+        str: The id of the new job.
+    """
+    job = ScrapeJob(
+        id=uuid.uuid4().hex,
+        status="queued",
+        url=url,
+        scrape_method=scrape_method,
+        clean_data=bool(clean_data),
+        company_name=company_name,
+        rule_set=rule_set,
+        timeout=timeout,
+        user_id=user_id,
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job.id
+
+
+def enqueue_crawl_job(options, user_id=None):
+    """
+    Adds a crawl to the queue.
+
+    Args:
+        options (dict): The options returned by core.crawl.validate_crawl_request().
+        user_id (int): The user the result belongs to, or None for anonymous crawls.
+
+    Returns:
+        str: The id of the new job.
+    """
+    job = ScrapeJob(
+        id=uuid.uuid4().hex,
+        kind="crawl",
+        status="queued",
+        url=options["url"],
+        scrape_method=options["scraping_method"],
+        clean_data=options["clean_data"],
+        rule_set=options["rule_set"],
+        options=json.dumps({key: options[key] for key in CRAWL_OPTIONS}),
+        timeout=options["timeout"],
+        user_id=user_id,
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job.id
+
+
+def get_job(job_id):
+    """
+    Returns a job by its id.
+
+    Args:
+        job_id (str): The id of the job.
+
+    Returns:
+        ScrapeJob: The job, or None if it does not exist.
+    """
+    return db.session.get(ScrapeJob, job_id)
+
+
+def _format_date(value):
+    return value.strftime("%Y-%m-%d %H:%M:%S") if value else None
+
+
+def job_to_dict(job):
+    """
+    Serializes a job for the API.
+
+    Args:
+        job (ScrapeJob): The job to serialize.
+
+    Returns:
+        dict: The job status, its timestamps and, once done, its result or error.
+        Crawl jobs also have their options and, while running, their progress. Cancelled
+        crawls keep the result document of the pages crawled until then.
+    """
+    job_dict = {
+        "job_id": job.id,
+        "kind": job.kind or "scrape",
+        "status": job.status,
+        "url": job.url,
+        "scrape_method": job.scrape_method,
+        "created_at": _format_date(job.created_at),
+        "started_at": _format_date(job.started_at),
+        "finished_at": _format_date(job.finished_at),
+    }
+    if job.options:
+        job_dict["options"] = json.loads(job.options)
+    if job.timeout is not None:
+        job_dict["timeout"] = job.timeout
+    if job.status == "running" and job.progress:
+        job_dict["progress"] = json.loads(job.progress)
+    if job.status == "running" and job.cancel_requested:
+        job_dict["cancel_requested"] = True
+    if job.status == "finished" or (job.status == "cancelled" and job.result):
+        job_dict["scrape_result"] = job.result
+    elif job.status == "failed":
+        job_dict["error"] = job.error
+    return job_dict
+
+
+def claim_next_job():
+    """
+    Atomically claims the oldest queued job.
+
+    Returns:
+        ScrapeJob: The claimed job (now "running"), or None if the queue is empty.
+    """
+    while True:
+        job_id = db.session.scalar(
+            db.select(ScrapeJob.id)
+            .where(ScrapeJob.status == "queued")
+            .order_by(ScrapeJob.created_at, ScrapeJob.id)
+            .limit(1)
+        )
+        if job_id is None:
+            return None
+
+        claimed = db.session.execute(
+            update(ScrapeJob)
+            .where(ScrapeJob.id == job_id, ScrapeJob.status == "queued")
+            .values(
+                status="running",
+                started_at=func.now(),
+                attempts=ScrapeJob.attempts + 1,
+            )
+        )
+        db.session.commit()
+        # Another worker may have claimed the job in the meantime, try the next one
+        if claimed.rowcount == 1:
+            return get_job(job_id)
+
+
+def _finish_job(job, status, result=None, error=None):
+    job.status = status
+    job.result = result
+    job.error = error
+    job.finished_at = datetime.now(timezone.utc)
+    db.session.commit()
+
+
+def run_job(job):
+    """
+    Runs a claimed job and stores its outcome.
+    Successful results of jobs owned by a user are also saved to the user's history.
+    The job runs under a deadline registered in this process, so cancel_job() can stop it.
+
+    Args:
+        job (ScrapeJob): A job in the "running" state.
+
+    Returns:
+        None
+    """
+    with deadline_scope() as deadline:
+        with _running_lock:
+            _running[job.id] = deadline
+        try:
+            if job.kind == "crawl":
+                _run_crawl_job(job, deadline)
+            else:
+                _run_scrape_job(job, deadline)
+        finally:
+            with _running_lock:
+                _running.pop(job.id, None)
+
+
+def _run_scrape_job(job, deadline):
+    """
+    Runs a claimed scrape job and stores its outcome.
+
+    Args:
+        job (ScrapeJob): A scrape job in the "running" state.
+        deadline (Deadline): The deadline of the job, cancelled by cancel_job().
+    """
+    try:
+        scrape_result = run_scraper(
+            job.url,
+            job.scrape_method,
+            clean=job.clean_data,
+            company_name=job.company_name,
+            rule_set=job.rule_set,
+            timeout=job.timeout,
+        )
+    except Exception as e:
+        scrape_result = f"An error occurred: {e}"
+
+    if deadline.cancelled:
+        _finish_job(job, "cancelled")
+        return
+
+    if is_scrape_error(scrape_result):
+        error = scrape_result if isinstance(scrape_result, str) else "Scraping failed"
+        if isinstance(scrape_result, dict):
+            error = scrape_result.get("error", error)
+        _finish_job(job, "failed", error=error)
+        return
+
+    _finish_job(job, "finished", result=scrape_result)
+    if job.user_id is not None:
+        save_user_history(
+            job.url,
+            job.scrape_method,
+            scrape_result,
+            job.user_id,
+            cleaned=is_cleaned(job.scrape_method, job.clean_data),
+        )
+
+
+def _run_crawl_job(job, deadline):
+    """
+    Runs a claimed crawl job and stores its outcome. The result document of the crawl is saved
+    to the history of the job's user as a single record (scrape method "crawl").
+    A cancelled crawl keeps the document of the pages crawled until then, it is not saved to
+    the history.
+
+    Args:
+        job (ScrapeJob): A crawl job in the "running" state.
+        deadline (Deadline): The deadline of the job, cancelled by cancel_job().
+    """
+    options = {
+        "url": job.url,
+        "scraping_method": job.scrape_method,
+        "clean_data": job.clean_data,
+        "rule_set": job.rule_set,
+        "timeout": job.timeout or app.config["SCRAPE_DEFAULT_TIMEOUT"],
+        **json.loads(job.options),
+    }
+    last_update = time.monotonic()
+
+    def progress(stats):
+        nonlocal last_update
+        if time.monotonic() - last_update < PROGRESS_INTERVAL:
+            return
+        last_update = time.monotonic()
+        job.progress = json.dumps(stats)
+        job.heartbeat_at = datetime.now(timezone.utc)
+        db.session.commit()
+
+    try:
+        document = crawl(options, progress)
+    except Exception as e:
+        _finish_job(job, "failed", error=f"An error occurred: {e}")
+        return
+
+    result = json.dumps(document, ensure_ascii=False, separators=(",", ":"))
+    job.progress = None
+    if deadline.cancelled:
+        _finish_job(job, "cancelled", result=result)
+        return
+
+    pages = document["pages"]
+    if not any(page["status"] == 1 for page in pages):
+        error = (
+            pages[0]["error"] if pages else "The seed URL is disallowed by robots.txt"
+        )
+        _finish_job(job, "failed", error=error)
+        return
+
+    _finish_job(job, "finished", result=result)
+    if job.user_id is not None:
+        save_user_history(job.url, "crawl", result, job.user_id)
+
+
+def _cancel_running(job_ids):
+    """
+    Cancels the deadlines of the jobs running in this process among the given ones.
+
+    Args:
+        job_ids (iterable): The ids of jobs to cancel.
+    """
+    with _running_lock:
+        deadlines = [_running[job_id] for job_id in job_ids if job_id in _running]
+    for deadline in deadlines:
+        deadline.cancel()
+
+
+def cancel_job(job):
+    """
+    Cancels a job. A queued job is cancelled at once. A running job is flagged with
+    cancel_requested and stopped by its worker: at once if it runs in this process, within
+    JOB_CANCEL_POLL_INTERVAL seconds otherwise. It then ends with the status "cancelled".
+
+    Args:
+        job (ScrapeJob): The job to cancel.
+
+    Returns:
+        bool: True if the job was cancelled or flagged, False if it had already ended.
+    """
+    cancelled = db.session.execute(
+        update(ScrapeJob)
+        .where(ScrapeJob.id == job.id, ScrapeJob.status == "queued")
+        .values(status="cancelled", finished_at=func.now())
+    ).rowcount
+    if not cancelled:
+        cancelled = db.session.execute(
+            update(ScrapeJob)
+            .where(ScrapeJob.id == job.id, ScrapeJob.status == "running")
+            .values(cancel_requested=True)
+        ).rowcount
+    db.session.commit()
+    db.session.refresh(job)
+    if cancelled:
+        _cancel_running((job.id,))
+    return bool(cancelled)
+
+
+def requeue_stale_jobs():
+    """
+    Puts jobs abandoned by crashed workers back in the queue.
+    A running job is considered abandoned once it has been running longer than
+    JOB_STALE_SECONDS without a heartbeat. Jobs that already used up JOB_MAX_ATTEMPTS are
+    marked as failed, and jobs whose cancellation was requested as cancelled.
+
+    Returns:
+        int: The number of jobs put back in the queue.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(
+        seconds=app.config["JOB_STALE_SECONDS"]
+    )
+    stale = (
+        ScrapeJob.status == "running",
+        func.coalesce(ScrapeJob.heartbeat_at, ScrapeJob.started_at) < cutoff,
+    )
+
+    db.session.execute(
+        update(ScrapeJob)
+        .where(*stale, ScrapeJob.cancel_requested.is_(True))
+        .values(status="cancelled", finished_at=func.now())
+    )
+    db.session.execute(
+        update(ScrapeJob)
+        .where(*stale, ScrapeJob.attempts >= app.config["JOB_MAX_ATTEMPTS"])
+        .values(
+            status="failed", error="Job abandoned by its worker", finished_at=func.now()
+        )
+    )
+    requeued = db.session.execute(
+        update(ScrapeJob)
+        .where(*stale)
+        .values(status="queued", started_at=None, heartbeat_at=None, progress=None)
+    )
+    db.session.commit()
+    return requeued.rowcount
+
+
+class JobWorkerPool:
+    """
+    A pool of background threads processing queued jobs.
+
+    Each thread repeatedly claims the oldest queued job and runs it, and waits
+    JOB_POLL_INTERVAL seconds whenever the queue is empty. Another thread cancels the running
+    jobs whose cancellation was requested to another process.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._stop_event = threading.Event()
+        self._threads: list = []
+
+    def start(self):
+        """Requeues abandoned jobs and starts the worker threads."""
+        with app.app_context():
+            requeue_stale_jobs()
+        for index in range(self.size):
+            thread = threading.Thread(
+                target=self._work, name=f"scrape-job-worker-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(
+            target=self._watch_cancellations, name="scrape-job-canceller", daemon=True
+        )
+        thread.start()
+        self._threads.append(thread)
+        print(f"Started {self.size} scrape job workers")
+
+    def stop(self, timeout=None):
+        """Signals the worker threads to stop and waits for them."""
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _work(self):
+        while not self._stop_event.is_set():
+            job = None
+            with app.app_context():
+                try:
+                    job = claim_next_job()
+                    if job is not None:
+                        run_job(job)
+                except Exception as e:
+                    # The job stays "running" and is requeued once it becomes stale
+                    db.session.rollback()
+                    print(f"Scrape job worker error: {e}")
+            if job is None:
+                self._stop_event.wait(app.config["JOB_POLL_INTERVAL"])
+
+    def _watch_cancellations(self):
+        interval = app.config["JOB_CANCEL_POLL_INTERVAL"]
+        while not self._stop_event.wait(interval):
+            with _running_lock:
+                running = list(_running)
+            if not running:
+                continue
+            with app.app_context():
+                try:
+                    cancelled = db.session.scalars(
+                        db.select(ScrapeJob.id).where(
+                            ScrapeJob.id.in_(running),
+                            ScrapeJob.cancel_requested.is_(True),
+                        )
+                    ).all()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Scrape job cancellation check failed: {e}")
+                    continue
+            _cancel_running(cancelled)
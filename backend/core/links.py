@@ -0,0 +1,197 @@
+"""
+This module provides URL normalization and link extraction for the crawler (see core/crawl.py).
+
+The same page is often linked under different spellings (http://Example.com:80/a/./b#top and
+http://example.com/a/b), so every discovered URL is normalized before it is deduplicated:
+- the scheme and host are lowercased, the host is IDNA-encoded, default ports, credentials and
+  the fragment are removed;
+- dot segments are removed from the path, percent-encodings are uppercased and unreserved
+  characters are decoded, other unsafe characters are percent-encoded;
+- tracking parameters (utm_*, fbclid, gclid, ...) are removed and the query is sorted.
+Only http and https URLs are kept.
+
+Links are extracted from <a href> and <area href> elements (resolved against <base href>),
+except those marked rel="nofollow". lxml is used when installed, the standard library's
+HTMLParser otherwise.
+
+Functions:
+    normalize_url(url, base): Returns the normalized form of a URL, None if it is not crawlable.
+    site_of(url): Returns the host of a URL without its "www." prefix.
+    extract_links(html_content, base_url): Returns the normalized links of a page.
+"""
+
+import re
+from html.parser import HTMLParser
+from urllib.parse import parse_qsl, quote, urlencode, urljoin, urlsplit, urlunsplit
+
+from core.engines import get_engine
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+# Query parameters that only track where a visitor came from
+TRACKING_PARAMETERS = ("fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "_ga")
+TRACKING_PREFIXES = ("utm_",)
+
+# RFC 3986 unreserved characters, their percent-encodings are decoded
+_UNRESERVED = set("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~")
+_PERCENT_ENCODING = re.compile(r"%([0-9A-Fa-f]{2})")
+# Characters that stay as they are in a path (reserved ones and existing percent-encodings)
+_PATH_SAFE = "/%:@!$&'()*+,;=-._~"
+
+
+def _normalize_escape(match):
+    character = chr(int(match.group(1), 16))
+    return character if character in _UNRESERVED else "%" + match.group(1).upper()
+
+
+def _remove_dot_segments(path):
+    segments = path.split("/")
+    output = []
+    for index, segment in enumerate(segments):
+        last = index == len(segments) - 1
+        if segment == "..":
+            if len(output) > 1:
+                output.pop()
+        elif segment != ".":
+            output.append(segment)
+            continue
+        # "/a/b/.." and "/a/." name the directory
+        if last:
+            output.append("")
+    return "/".join(output) or "/"
+
+
+def _is_tracking_parameter(name):
+    return name in TRACKING_PARAMETERS or name.startswith(TRACKING_PREFIXES)
+
+
+def normalize_url(url, base=None):
+    """
+    Returns the normalized form of a URL, see the module documentation.
+
+    Args:
+        url (str): The URL, absolute or relative to `base`.
+        base (str): The URL `url` is relative to (optional).
+
+    Returns:
+        str: The normalized URL, or None if it is not an http(s) URL or is malformed.
+    """
+    url = url.strip()
+    try:
+        if base:
+            url = urljoin(base, url)
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").rstrip(".")
+    if scheme not in DEFAULT_PORTS or not host:
+        return None
+    try:
+        host = host.encode("idna").decode("ascii")
+    except UnicodeError:
+        return None
+    netloc = f"[{host}]" if ":" in host else host
+    if port is not None and port != DEFAULT_PORTS[scheme]:
+        netloc += f":{port}"
+
+    path = quote(_remove_dot_segments(parts.path), safe=_PATH_SAFE)
+    path = _PERCENT_ENCODING.sub(_normalize_escape, path)
+    query = urlencode(
+        sorted(
+            (name, value)
+            for name, value in parse_qsl(parts.query, keep_blank_values=True)
+            if not _is_tracking_parameter(name)
+        )
+    )
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+def site_of(url):
+    """
+    Returns the host of a URL without its "www." prefix, the unit of same-domain crawls.
+
+    Args:
+        url (str): A normalized URL.
+
+    Returns:
+        str: The host, e.g. "example.com" for https://www.example.com/a.
+    """
+    host = urlsplit(url).hostname or ""
+    return host[4:] if host.startswith("www.") else host
+
+
+class _LinkCollector(HTMLParser):
+    """Collects the followable links and the <base href> of a document."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.base = None
+        self.hrefs = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in ("a", "area", "base"):
+            return
+        attributes = dict(attrs)
+        href = attributes.get("href")
+        if not href:
+            return
+        if tag == "base":
+            if self.base is None:
+                self.base = href
+        elif "nofollow" not in (attributes.get("rel") or "").lower().split():
+            self.hrefs.append(href)
+
+
+def _hrefs_with_lxml(lxml_html, html_content):
+    # Bytes, lxml rejects strings with an XML encoding declaration
+    document = lxml_html.document_fromstring(html_content.encode("utf-8"))
+    base = document.xpath("string(//base/@href)") or None
+    hrefs = [
+        element.get("href")
+        for element in document.xpath("//a[@href] | //area[@href]")
+        if "nofollow" not in (element.get("rel") or "").lower().split()
+    ]
+    return base, hrefs
+
+
+def _hrefs_with_html_parser(html_content):
+    collector = _LinkCollector()
+    collector.feed(html_content)
+    collector.close()
+    return collector.base, collector.hrefs
+
+
+def extract_links(html_content, base_url):
+    """
+    Returns the normalized links of a page, see the module documentation.
+
+    Args:
+        html_content (str): The HTML of the page.
+        base_url (str): The URL of the page, relative links are resolved against it.
+
+    Returns:
+        list: The distinct normalized http(s) links, in document order.
+    """
+    try:
+        lxml_html = get_engine("lxml")
+    except ImportError:
+        lxml_html = None
+    if lxml_html is not None:
+        try:
+            base, hrefs = _hrefs_with_lxml(lxml_html, html_content)
+        except (ValueError, lxml_html.etree.ParserError):
+            # Empty or unparsable documents, the HTMLParser copes with anything
+            lxml_html = None
+    if lxml_html is None:
+        base, hrefs = _hrefs_with_html_parser(html_content)
+    if base:
+        base_url = urljoin(base_url, base)
+
+    links = {}
+    for href in hrefs:
+        link = normalize_url(href, base_url)
+        if link is not None:
+            links[link] = None
+    return list(links)
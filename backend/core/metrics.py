@@ -0,0 +1,405 @@
+"""
+This module provides the metrics of the scrape pipeline, served in the Prometheus text format
+at /metrics.
+
+Every scrape is timed as a whole and stage by stage, labelled by scraping method and host:
+- wait: waiting for a slot of the host's politeness scheduler (core.politeness).
+- fetch: DNS, connect and request, until the response headers arrive.
+- download: reading the response body.
+- stream_parse: downloading and cleaning huge pages at the same time.
+- cache: content cache lookups (core.cache).
+- browser: loading and scripting the page in Selenium.
+- parse, clean, detect, extract: turning the HTML into the scrape result.
+- serialize, history: building the JSON response and saving the history record.
+Bytes fetched and error classes are counted too, and the statistics the components already
+keep (content cache, browser pool, connections, politeness, history writer) are exported by
+collectors registered with register_collector().
+
+Sending the METRICS_PROFILE_HEADER request header (X-Profile: 1) returns the timing breakdown of
+that request in a Server-Timing response header, e.g. `fetch;dur=84.1, parse;dur=12.9`.
+
+Classes:
+    Counter: A counter with labels, registered when created.
+    Histogram: A histogram with labels, registered when created.
+Functions:
+    register_collector(name, help_text, metric_type, label_names, callback): Exports stats.
+    begin_scrape(scraping_method, url): Sets the labels of the current scrape.
+    end_scrape(failed, seconds): Records the outcome and duration of the current scrape.
+    stage(name): Context manager timing a stage of the current scrape.
+    record_stage(name, seconds): Records the duration of a stage of the current scrape.
+    count_error(error): Counts an error of the current scrape by class.
+    count_bytes(amount): Counts body bytes fetched by the current scrape.
+    begin_request(): Starts timing the current API request.
+    end_request(response): Records the current API request, adds the Server-Timing header.
+    render_metrics(): Returns all metrics in the Prometheus text format.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from flask import g, has_app_context, request
+
+from config import app
+
+# Upper bounds of the latency histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Host label of all hosts beyond METRICS_MAX_HOSTS, to bound the number of series
+OTHER_HOST = "other"
+
+# Every Counter and Histogram registers itself here when it is created
+_metrics: list = []
+_collectors: list = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(label_names, label_values, extra=()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """
+    A counter with labels.
+
+    Args:
+        name (str): The metric name.
+        help_text (str): The description of the metric.
+        label_names (tuple): The label names.
+    """
+
+    metric_type = "counter"
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values: dict = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, label_values=(), amount=1):
+        """
+        Increments the series of the given label values.
+
+        Args:
+            label_values (tuple): One value per label name.
+            amount (float): The increment.
+        """
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        """
+        Returns the samples of the counter.
+
+        Returns:
+            list: (suffix, label values, extra labels, value) tuples.
+        """
+        with self._lock:
+            return [("", labels, (), value) for labels, value in self._values.items()]
+
+
+class Histogram:
+    """
+    A histogram with labels and cumulative buckets.
+
+    Args:
+        name (str): The metric name.
+        help_text (str): The description of the metric.
+        label_names (tuple): The label names.
+        buckets (tuple): The sorted upper bounds of the buckets.
+    """
+
+    metric_type = "histogram"
+
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # Maps label values to [count per bucket..., sum, count]
+        self._values: dict = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, label_values=()):
+        """
+        Records an observation in the series of the given label values.
+
+        Args:
+            value (float): The observed value.
+            label_values (tuple): One value per label name.
+        """
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        """
+        Returns the samples of the histogram.
+
+        Returns:
+            list: (suffix, label values, extra labels, value) tuples.
+        """
+        with self._lock:
+            values = {labels: list(series) for labels, series in self._values.items()}
+        samples = []
+        for labels, series in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                samples.append(("_bucket", labels, (("le", bound),), cumulative))
+            samples.append(("_bucket", labels, (("le", float("inf")),), series[-1]))
+            samples.append(("_sum", labels, (), series[-2]))
+            samples.append(("_count", labels, (), series[-1]))
+        return samples
+
+
+SCRAPES = Counter(
+    "scrape_requests_total",
+    "Scrapes by method, host and outcome (success or error).",
+    ("method", "host", "outcome"),
+)
+SCRAPE_SECONDS = Histogram(
+    "scrape_duration_seconds",
+    "Duration of whole scrapes by method and host.",
+    ("method", "host"),
+)
+STAGE_SECONDS = Histogram(
+    "scrape_stage_duration_seconds",
+    "Duration of the stages of scrapes by stage, method and host.",
+    ("stage", "method", "host"),
+)
+FETCHED_BYTES = Counter(
+    "scrape_fetched_bytes_total",
+    "Response body bytes fetched (decompressed) by method and host.",
+    ("method", "host"),
+)
+ERRORS = Counter(
+    "scrape_errors_total",
+    "Scrape errors by method and error class.",
+    ("method", "error"),
+)
+REQUESTS = Counter(
+    "http_requests_total",
+    "API requests by endpoint and status code.",
+    ("endpoint", "status"),
+)
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Duration of API requests by endpoint.",
+    ("endpoint",),
+)
+
+_hosts: set = set()
+_hosts_lock = threading.Lock()
+
+
+def register_collector(name, help_text, metric_type, label_names, callback):
+    """
+    Exports statistics kept elsewhere as a metric, read whenever the metrics are rendered.
+
+    Args:
+        name (str): The metric name.
+        help_text (str): The description of the metric.
+        metric_type (str): "counter" or "gauge".
+        label_names (tuple): The label names.
+        callback (callable): Returns a dictionary mapping label value tuples to values.
+    """
+    _collectors.append((name, help_text, metric_type, tuple(label_names), callback))
+
+
+def _host_label(url):
+    """Returns the host label of a URL, OTHER_HOST once METRICS_MAX_HOSTS hosts are known."""
+    host = (urlsplit(url).hostname or "") if url else ""
+    with _hosts_lock:
+        if host in _hosts:
+            return host
+        if len(_hosts) >= app.config["METRICS_MAX_HOSTS"]:
+            return OTHER_HOST
+        _hosts.add(host)
+    return host
+
+
+def _scrape_labels():
+    """Returns the (method, host) labels of the current scrape."""
+    if has_app_context():
+        return g.get("metric_labels", ("none", "none"))
+    return ("none", "none")
+
+
+def begin_scrape(scraping_method, url):
+    """
+    Sets the labels of the current scrape, used by every metric recorded until it ends.
+
+    Args:
+        scraping_method (str): The scraping method.
+        url (str): The scraped URL.
+    """
+    if app.config["METRICS_ENABLED"] and has_app_context():
+        g.metric_labels = (scraping_method, _host_label(url))
+
+
+def end_scrape(failed, seconds):
+    """
+    Records the outcome and duration of the current scrape.
+
+    Args:
+        failed (bool): Whether the scrape returned an error.
+        seconds (float): The duration of the scrape.
+    """
+    if not app.config["METRICS_ENABLED"]:
+        return
+    labels = _scrape_labels()
+    SCRAPES.inc(labels + ("error" if failed else "success",))
+    SCRAPE_SECONDS.observe(seconds, labels)
+
+
+def record_stage(name, seconds):
+    """
+    Records the duration of a stage of the current scrape, and adds it to the timing
+    breakdown of the current request.
+
+    Args:
+        name (str): The stage name.
+        seconds (float): The duration of the stage.
+    """
+    if not app.config["METRICS_ENABLED"]:
+        return
+    STAGE_SECONDS.observe(seconds, (name,) + _scrape_labels())
+    if has_app_context():
+        timings = g.setdefault("stage_timings", {})
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name):
+    """
+    Times the `with` block as a stage of the current scrape (see record_stage()).
+
+    Args:
+        name (str): The stage name.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def count_error(error):
+    """
+    Counts an error of the current scrape.
+
+    Args:
+        error (Exception or str): The exception (counted by class name) or an error class.
+    """
+    if not app.config["METRICS_ENABLED"]:
+        return
+    error_class = error if isinstance(error, str) else type(error).__name__
+    ERRORS.inc((_scrape_labels()[0], error_class))
+
+
+def count_bytes(amount):
+    """
+    Counts body bytes fetched by the current scrape.
+
+    Args:
+        amount (int): The number of bytes.
+    """
+    if app.config["METRICS_ENABLED"] and amount:
+        FETCHED_BYTES.inc(_scrape_labels(), amount)
+
+
+def begin_request():
+    """Starts timing the current API request."""
+    g.request_started = time.perf_counter()
+
+
+def _profiling_requested():
+    header = app.config["METRICS_PROFILE_HEADER"]
+    return bool(header) and request.headers.get(header, "").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+
+
+def end_request(response):
+    """
+    Records the duration and status of the current API request. If the profiling header was
+    sent, the timing breakdown of the request is added as a Server-Timing header.
+
+    Args:
+        response (flask.Response): The response of the request.
+
+    Returns:
+        flask.Response: The same response.
+    """
+    started = g.get("request_started")
+    if not app.config["METRICS_ENABLED"] or started is None:
+        return response
+    seconds = time.perf_counter() - started
+    endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    REQUESTS.inc((endpoint, str(response.status_code)))
+    REQUEST_SECONDS.observe(seconds, (endpoint,))
+
+    if _profiling_requested():
+        timings = dict(g.get("stage_timings", {}))
+        timings["total"] = seconds
+        response.headers["Server-Timing"] = ", ".join(
+            f"{name};dur={duration * 1000:.1f}" for name, duration in timings.items()
+        )
+    return response
+
+
+def render_metrics():
+    """
+    Returns all metrics in the Prometheus text exposition format.
+
+    Returns:
+        str: The metrics, one sample per line.
+    """
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.metric_type}")
+        for suffix, labels, extra, value in metric.samples():
+            formatted = _format_labels(metric.label_names, labels, extra)
+            lines.append(f"{metric.name}{suffix}{formatted} {_format_value(value)}")
+
+    for name, help_text, metric_type, label_names, callback in _collectors:
+        try:
+            values = callback()
+        except Exception as e:
+            print(f"Failed to collect metric {name}: {e}")
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for labels, value in values.items():
+            formatted = _format_labels(label_names, labels)
+            lines.append(f"{name}{formatted} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,98 @@
+"""
+This module brings existing databases up to date with the models.
+
+db.create_all() only creates missing tables, so columns and indexes added to an existing table
+(e.g. History.content_hash and History.cleaned, ScrapeJob.rule_set, the crawl, timeout and
+cancellation columns of ScrapeJob and the history listing and lookup indexes) are never
+created on databases that already exist.
+run_migrations() is called after db.create_all() and adds them, as well as the full-text
+search index of the history (see core/search.py).
+
+Moving the content of existing History rows into the blob store and indexing them for search
+can take a while on large databases, so it is not part of run_migrations() and is run with
+`python migrate.py`.
+
+Functions:
+    run_migrations(): Applies the schema changes db.create_all() does not handle.
+    migrate_history_content(batch_size): Moves inline History content into the blob store.
+"""
+
+from sqlalchemy import inspect, text
+
+from config import db
+from core.blobs import store_content
+from core.models import History, ScrapeJob
+from core.search import create_search_index
+
+
+def _add_missing_columns(model):
+    """
+    Adds the nullable columns of a model that do not exist in the database yet.
+
+    Args:
+        model: The model whose table columns are checked.
+    """
+    table = model.__table__
+    existing = {column["name"] for column in inspect(db.engine).get_columns(table.name)}
+    for column in table.columns:
+        if column.name in existing or not column.nullable:
+            continue
+        column_type = column.type.compile(dialect=db.engine.dialect)
+        with db.engine.begin() as connection:
+            connection.execute(
+                text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+            )
+        print(f"Added column {table.name}.{column.name}")
+
+
+def _create_missing_indexes(model):
+    """
+    Creates the indexes of a model that do not exist in the database yet.
+
+    Args:
+        model: The model whose table indexes are checked.
+    """
+    for index in model.__table__.indexes:
+        index.create(bind=db.engine, checkfirst=True)
+
+
+def run_migrations():
+    """
+    Applies the schema changes db.create_all() does not handle.
+    Must be called inside an application context, after db.create_all().
+    """
+    _add_missing_columns(History)
+    _add_missing_columns(ScrapeJob)
+    _create_missing_indexes(History)
+    create_search_index()
+
+
+def migrate_history_content(batch_size=100):
+    """
+    Moves the inline content of History rows stored before the blob store into blobs.
+    Every batch is committed on its own, so the migration can be interrupted and resumed.
+    Must be called inside an application context, after run_migrations().
+
+    Args:
+        batch_size (int): The number of rows migrated per transaction.
+
+    Returns:
+        int: The number of migrated rows.
+    """
+    migrated = 0
+    while True:
+        records = (
+            History.query.filter(History.content_hash.is_(None))
+            .order_by(History.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not records:
+            return migrated
+        for record in records:
+            record.content_hash = store_content(record.scraped_data)
+            record.scraped_data = ""
+        db.session.commit()
+        db.session.expunge_all()
+        migrated += len(records)
+        print(f"Migrated {migrated} history records to the blob store")
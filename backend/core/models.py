@@ -4,6 +4,17 @@ This module defines the History model for the data scraping application.
 The History model represents a record of a web scraping activity, including the URL scraped,
 the method used for scraping, the data obtained, the date of the scraping,
 and the user who performed the scraping.
+
+The scraped content of a History record is stored once per distinct content, compressed, in the
+ContentBlob table (see core/blobs.py). History rows reference it by its SHA-256 hash.
+
+History is listed per user, newest first, so it has a composite index on (user_id, date, id).
+
+The ScrapeJob model is the durable queue of asynchronous scrapes and crawls (see core/jobs.py
+and core/crawl.py).
+
+The ContentFingerprint model holds the fingerprints of the last content a user stored for a URL
+(and scraping method), used by the change detection of recurring scrapes (see core/changes.py).
 """
 
 from config import db
@@ -15,10 +26,53 @@ class History(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     url = db.Column(db.String(512), nullable=False)
     scrape_method = db.Column(db.String(20), nullable=False)
-    scraped_data = db.Column(db.Text, nullable=False)
+    # Only holds content stored before the blob store, new content lives in content_blob
+    scraped_data = db.Column(db.Text, nullable=False, default="")
+    content_hash = db.Column(db.String(64), db.ForeignKey("content_blob.hash"))
+    content_blob = db.relationship("ContentBlob")
+    # Whether the content is cleaned text rather than HTML (None for records stored before)
+    cleaned = db.Column(db.Boolean)
     date = db.Column(db.DateTime(timezone=True), default=func.now())
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
 
+    __table_args__ = (
+        # Serves the per-user history listing, newest first, with keyset pagination on (date, id)
+        db.Index("ix_history_user_id_date", "user_id", "date", "id"),
+        # Serves the latest record of a URL, the baseline of change detection
+        db.Index(
+            "ix_history_user_id_url", "user_id", "url", "scrape_method", "date", "id"
+        ),
+    )
+
+
+class ContentBlob(db.Model):
+    hash = db.Column(db.String(64), primary_key=True)
+    codec = db.Column(db.String(10), nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    compressed_size = db.Column(db.Integer, nullable=False)
+
+
+class ContentFingerprint(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    url = db.Column(db.String(512), nullable=False)
+    scrape_method = db.Column(db.String(20), nullable=False)
+    # SHA-256 of the normalized visible text, equal hashes mean the page did not change
+    text_hash = db.Column(db.String(64), nullable=False)
+    # 64-bit simhash of the visible text as 16 hex digits (SQLite integers are signed)
+    simhash = db.Column(db.String(16), nullable=False)
+    # The stored content the next scrape is diffed against
+    content_hash = db.Column(db.String(64))
+    checked_at = db.Column(db.DateTime(timezone=True), default=func.now())
+    changed_at = db.Column(db.DateTime(timezone=True), default=func.now())
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "user_id", "url", "scrape_method", name="uq_content_fingerprint_key"
+        ),
+    )
+
 
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
@@ -26,3 +80,32 @@ class User(db.Model, UserMixin):
     username = db.Column(db.String(150))
     password = db.Column(db.String(150))
     history = db.relationship("History")
+
+
+class ScrapeJob(db.Model):
+    id = db.Column(db.String(32), primary_key=True)
+    # "scrape" or "crawl" (None on jobs queued before crawls existed)
+    kind = db.Column(db.String(20), default="scrape")
+    status = db.Column(db.String(20), nullable=False, default="queued", index=True)
+    url = db.Column(db.String(512), nullable=False)
+    scrape_method = db.Column(db.String(20), nullable=False)
+    clean_data = db.Column(db.Boolean, nullable=False, default=False)
+    company_name = db.Column(db.String(150))
+    rule_set = db.Column(db.String(100))
+    # The crawl options as JSON (max_depth, max_pages, same_domain)
+    options = db.Column(db.Text)
+    # The deadline of the scrape (of every page of a crawl) in seconds, None -> default
+    timeout = db.Column(db.Float)
+    # Set when a running job is cancelled, its worker then stops it
+    cancel_requested = db.Column(db.Boolean)
+    # The statistics of a running crawl as JSON, updated every few seconds
+    progress = db.Column(db.Text)
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime(timezone=True), default=func.now())
+    started_at = db.Column(db.DateTime(timezone=True))
+    # Last sign of life of a long-running job, a job is stale when it stops coming
+    heartbeat_at = db.Column(db.DateTime(timezone=True))
+    finished_at = db.Column(db.DateTime(timezone=True))
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
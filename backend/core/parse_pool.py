@@ -0,0 +1,450 @@
+"""
+This module provides the process pool that parses and cleans documents off the GIL.
+
+Parsing a large page (extracting its text or links, prettifying it with BeautifulSoup,
+applying an extraction rule set) is CPU work that holds the GIL, so under a threaded server it
+stalls every other request of the process. Documents of at least PARSE_POOL_MIN_BYTES are
+therefore parsed by a pool of PARSE_POOL_WORKERS worker processes; smaller ones are parsed
+inline, where handing them over would cost more than it saves.
+
+- Little copying: a document is encoded once into a shared memory block and the worker decodes
+  it straight from there; only the block name crosses the pipe. Streamed documents are spooled
+  while they download (in memory up to SPOOL_MEMORY_BYTES, then to a temporary file) and sent
+  to the worker chunk by chunk, so they are never held in memory as a whole, and no worker is
+  held while the network is slow.
+- Timeout: a document not parsed within PARSE_POOL_TIMEOUT seconds of being sent fails with
+  ParseTimeout, and its worker is killed and replaced. Waiting for a free worker is limited to
+  PARSE_POOL_TIMEOUT seconds as well. Both are capped at the time left to the scrape, and a
+  worker still parsing when the scrape passes its deadline (or is cancelled) is killed at once
+  (see core/deadlines.py).
+- Queue limit: at most PARSE_POOL_MAX_QUEUE documents wait for a worker, more fail at once
+  with ParsePoolFull instead of piling up.
+
+Workers are started on first use, with the forkserver start method where available (forking
+a threaded server is unsafe), and the pool is recreated in forked processes. As with any
+multiprocessing code, workers import the main module (app.py, worker.py, ...) when they start,
+so it must only start the server under `if __name__ == "__main__"`.
+
+Classes:
+    ParsePool: A pool of parse worker processes.
+    ParseTimeout: Raised when a document is not parsed in time.
+    ParsePoolFull: Raised when too many documents are waiting for a worker.
+Functions:
+    get_parse_pool(): Returns the process-wide parse pool, None if it is disabled.
+    run_parse(task, html_content, *args): Runs a parse task, in the pool for large documents.
+    run_parse_stream(task, chunks, *args): Runs a parse task on a document given in chunks.
+"""
+
+import atexit
+import multiprocessing
+import os
+import queue
+import signal
+import tempfile
+import threading
+import time
+from multiprocessing import shared_memory
+
+from config import app
+from core.cleaning import extract_text, stream_extract_text
+from core.deadlines import check_deadline, on_expire, remaining_timeout
+from core.engines import get_engine
+from core.extraction import extract_fields, get_rule_set
+from core.links import extract_links
+from core.metrics import register_collector
+
+
+class ParseTimeout(Exception):
+    """Raised when a document is not parsed within PARSE_POOL_TIMEOUT seconds."""
+
+
+class ParsePoolFull(Exception):
+    """Raised when PARSE_POOL_MAX_QUEUE documents are already waiting for a worker."""
+
+
+def _prettify(html_content):
+    return get_engine("bs4")(html_content, "html.parser").prettify()
+
+
+def _extract(html_content, rule_set_name, url):
+    # Compiled rule sets cannot be pickled, every worker compiles (and caches) its own
+    return extract_fields(get_rule_set(rule_set_name), html_content, url)
+
+
+# Seconds a new worker process may take to import its modules
+WORKER_START_TIMEOUT = 60
+
+# Streamed documents are spooled in memory up to this many characters, then to a temporary file
+SPOOL_MEMORY_BYTES = 4 * 2**20
+
+# Characters of a spooled document sent to the worker at a time
+SPOOL_CHUNK_CHARS = 64 * 2**10
+
+# The parse tasks by name, the same functions run inline and in the workers
+TASKS = {
+    "text": extract_text,
+    "prettify": _prettify,
+    "extract": _extract,
+    "links": extract_links,
+}
+STREAM_TASKS = {
+    "text": stream_extract_text,
+}
+
+
+def _attach(name):
+    try:
+        # The parent owns the block, the worker must not unlink it when it exits
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13 has no track argument
+        return shared_memory.SharedMemory(name=name)
+
+
+def _receive_chunks(conn):
+    while True:
+        chunk = conn.recv_bytes()
+        if not chunk:
+            return
+        yield chunk.decode("utf-8")
+
+
+def _worker_main(conn):
+    """The loop of a worker process: runs tasks until the pipe is closed."""
+    # Ctrl+C is handled by the server process, which stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    conn.send("ready")
+    while True:
+        try:
+            task, block_name, size, args = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            if block_name is None:
+                result = STREAM_TASKS[task](_receive_chunks(conn), *args)
+            else:
+                block = _attach(block_name)
+                try:
+                    with block.buf[:size] as view:
+                        html_content = str(view, "utf-8")
+                finally:
+                    block.close()
+                result = TASKS[task](html_content, *args)
+            reply = (True, result)
+        except Exception as e:
+            reply = (False, e)
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # The exception itself may not be picklable
+            conn.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
+
+
+class _Worker:
+    """A worker process and the parent's end of its pipe."""
+
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn,), name="parse-worker", daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        # Wait until the worker imported its modules, so that is not part of a parse timeout
+        if not self.conn.poll(WORKER_START_TIMEOUT) or self.conn.recv() != "ready":
+            self.kill()
+            raise RuntimeError("The parse worker did not start")
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(5)
+        self.conn.close()
+
+
+class ParsePool:
+    """
+    A pool of parse worker processes.
+
+    Args:
+        workers (int): Number of worker processes.
+        max_queue (int): Maximum number of documents waiting for a worker.
+        timeout (float): Seconds a document may take to parse, and to wait for a worker.
+    """
+
+    def __init__(self, workers, max_queue=64, timeout=30.0):
+        self.workers = workers
+        self.timeout = timeout
+        methods = multiprocessing.get_all_start_methods()
+        self._context = multiprocessing.get_context(
+            "forkserver" if "forkserver" in methods else "spawn"
+        )
+        if "forkserver" in methods:
+            # Workers are forked from a server that imported the parsers once
+            self._context.set_forkserver_preload(["core.parse_pool"])
+        # A None slot starts its worker when it is first checked out
+        self._idle: queue.Queue = queue.Queue()
+        for _ in range(workers):
+            self._idle.put(None)
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {
+            "done": 0,
+            "failed": 0,
+            "timeouts": 0,
+            "rejected": 0,
+            "restarts": 0,
+        }
+        self._busy = 0
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _checkout(self, deadline):
+        try:
+            worker = self._idle.get(timeout=max(deadline - time.monotonic(), 0))
+        except queue.Empty:
+            self._count("timeouts")
+            raise ParseTimeout(
+                f"No parse worker was free within {self.timeout:g} seconds"
+            ) from None
+        if worker is None or not worker.process.is_alive():
+            try:
+                worker = _Worker(self._context)
+            except BaseException:
+                self._idle.put(None)
+                raise
+        with self._lock:
+            self._busy += 1
+        return worker
+
+    def _checkin(self, worker):
+        with self._lock:
+            self._busy -= 1
+        self._idle.put(worker)
+
+    def _call(self, send_document):
+        if self._closed:
+            raise RuntimeError("The parse pool is closed")
+        if not self._slots.acquire(blocking=False):
+            self._count("rejected")
+            raise ParsePoolFull("Too many documents are waiting to be parsed")
+        try:
+            worker = self._checkout(time.monotonic() + remaining_timeout(self.timeout))
+            try:
+                # Killing the process ends the wait for its reply with an EOFError
+                with on_expire(worker.process.kill):
+                    send_document(worker.conn)
+                    # The parse timeout starts once the worker has the whole document
+                    deadline = time.monotonic() + remaining_timeout(self.timeout)
+                    if not worker.conn.poll(max(deadline - time.monotonic(), 0)):
+                        raise ParseTimeout(
+                            f"The document was not parsed within {self.timeout:g} seconds"
+                        )
+                    ok, result = worker.conn.recv()
+            except BaseException as e:
+                # The worker is in an unknown state (busy, dead or mid-document)
+                worker.kill()
+                self._count("restarts")
+                self._count("timeouts" if isinstance(e, ParseTimeout) else "failed")
+                self._checkin(None)
+                check_deadline()
+                raise
+            self._checkin(worker)
+        finally:
+            self._slots.release()
+        if not ok:
+            self._count("failed")
+            raise result
+        self._count("done")
+        return result
+
+    def run(self, task, html_content, *args):
+        """
+        Runs a parse task in a worker process.
+
+        Args:
+            task (str): The name of the task in TASKS.
+            html_content (str): The document, at least one character long.
+            *args: Extra arguments of the task (picklable).
+
+        Returns:
+            The result of the task.
+
+        Raises:
+            ParseTimeout: If the document is not parsed in time.
+            ParsePoolFull: If too many documents are waiting for a worker.
+        """
+        data = html_content.encode("utf-8")
+        size = len(data)
+        block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        try:
+            block.buf[:size] = data
+            del data
+            return self._call(lambda conn: conn.send((task, block.name, size, args)))
+        finally:
+            block.close()
+            block.unlink()
+
+    def run_stream(self, task, chunks, *args):
+        """
+        Runs a parse task in a worker process on a document given as an iterable of text
+        chunks. The chunks are spooled until the iterable is exhausted (e.g. the download is
+        complete), then a worker is checked out and the document is sent to it chunk by chunk.
+
+        Args:
+            task (str): The name of the task in STREAM_TASKS.
+            chunks (iterable): The chunks of the document.
+            *args: Extra arguments of the task (picklable).
+
+        Returns:
+            The result of the task.
+
+        Raises:
+            ParseTimeout: If the document is not parsed in time.
+            ParsePoolFull: If too many documents are waiting for a worker.
+        """
+        with tempfile.SpooledTemporaryFile(
+            max_size=SPOOL_MEMORY_BYTES, mode="w+", encoding="utf-8", newline=""
+        ) as spool:
+            for chunk in chunks:
+                spool.write(chunk)
+            spool.seek(0)
+
+            def send_document(conn):
+                conn.send((task, None, 0, args))
+                while True:
+                    chunk = spool.read(SPOOL_CHUNK_CHARS)
+                    if not chunk:
+                        break
+                    conn.send_bytes(chunk.encode("utf-8"))
+                conn.send_bytes(b"")
+
+            return self._call(send_document)
+
+    def close(self):
+        """Stops the worker processes."""
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            if worker is not None:
+                worker.kill()
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_parse_pool():
+    """
+    Returns the process-wide parse pool, creating it on first use.
+
+    Returns:
+        ParsePool: The pool configured from the PARSE_POOL_* settings, or None if
+        PARSE_POOL_WORKERS is 0.
+    """
+    global _pool, _pool_pid
+    if app.config["PARSE_POOL_WORKERS"] <= 0:
+        return None
+    # A forked process (e.g. a gunicorn worker) cannot use the pipes of its parent's pool
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                pool = ParsePool(
+                    app.config["PARSE_POOL_WORKERS"],
+                    max_queue=app.config["PARSE_POOL_MAX_QUEUE"],
+                    timeout=app.config["PARSE_POOL_TIMEOUT"],
+                )
+                atexit.register(pool.close)
+                _pool, _pool_pid = pool, os.getpid()
+    return _pool
+
+
+def run_parse(task, html_content, *args):
+    """
+    Runs a parse task: in the parse pool for documents of at least PARSE_POOL_MIN_BYTES
+    characters, inline otherwise (or when the pool is disabled).
+
+    Args:
+        task (str): "text" (title and visible text, see core.cleaning.extract_text),
+            "prettify" (prettified HTML) or "extract" (args: rule set name and page URL,
+            see core.extraction.extract_fields).
+        html_content (str): The document.
+        *args: Extra arguments of the task.
+
+    Returns:
+        The result of the task.
+
+    Raises:
+        ParseTimeout: If the document is not parsed in time.
+        ParsePoolFull: If too many documents are waiting for a worker.
+        DeadlineExceeded: If the scrape passes its deadline before the document is parsed.
+        ScrapeCancelled: If the scrape is cancelled before the document is parsed.
+    """
+    pool = None
+    if len(html_content) >= app.config["PARSE_POOL_MIN_BYTES"]:
+        pool = get_parse_pool()
+    if pool is None:
+        # Inline parses cannot be interrupted, at least they do not start past the deadline
+        check_deadline()
+        return TASKS[task](html_content, *args)
+    return pool.run(task, html_content, *args)
+
+
+def run_parse_stream(task, chunks, *args):
+    """
+    Runs a parse task on a document given as an iterable of chunks, in the parse pool unless
+    it is disabled. Streamed documents are large, they always go to the pool.
+
+    Args:
+        task (str): "text" (see core.cleaning.stream_extract_text).
+        chunks (iterable): The chunks of the document.
+        *args: Extra arguments of the task.
+
+    Returns:
+        The result of the task.
+
+    Raises:
+        ParseTimeout: If the document is not parsed in time.
+        ParsePoolFull: If too many documents are waiting for a worker.
+        DeadlineExceeded: If the scrape passes its deadline before the document is parsed.
+        ScrapeCancelled: If the scrape is cancelled before the document is parsed.
+    """
+    pool = get_parse_pool()
+    if pool is None:
+        return STREAM_TASKS[task](chunks, *args)
+    return pool.run_stream(task, chunks, *args)
+
+
+def _task_metrics():
+    if _pool is None:
+        return {}
+    with _pool._lock:
+        return {(outcome,): count for outcome, count in _pool.stats.items()}
+
+
+def _worker_metrics():
+    if _pool is None:
+        return {}
+    with _pool._lock:
+        return {("busy",): _pool._busy, ("total",): _pool.workers}
+
+
+register_collector(
+    "parse_pool_documents_total",
+    "Documents parsed by the pool, failed, timed out and rejected, and worker restarts.",
+    "counter",
+    ("outcome",),
+    _task_metrics,
+)
+register_collector(
+    "parse_pool_workers",
+    "Parse worker processes, busy and total.",
+    "gauge",
+    ("state",),
+    _worker_metrics,
+)
@@ -0,0 +1,478 @@
+"""
+This module provides the per-host politeness scheduler in front of the scrape fetch path.
+
+Every request to a site (HTTP fetches and Selenium page loads) first acquires a slot from the
+scheduler of its host, which enforces:
+- A token-bucket rate limit (POLITENESS_RATE requests per second, bursts of POLITENESS_BURST).
+- A concurrency cap (POLITENESS_HOST_CONCURRENCY requests in flight).
+- The Crawl-delay of the site's robots.txt (fetched once and cached for ROBOTS_CACHE_TTL
+  seconds), as the minimum time between two request starts. Its Disallow rules are checked by
+  the crawler with robots_allowed().
+- An adaptive backoff: a 429 or 503 response pauses the host for its Retry-After, or for a delay
+  that doubles with every throttled response (POLITENESS_BACKOFF_INITIAL up to
+  POLITENESS_BACKOFF_MAX) and halves again with every successful one.
+
+A request that would have to wait longer than POLITENESS_MAX_WAIT seconds fails with
+PolitenessTimeout instead of hanging, and one that cannot get a slot before the deadline of its
+scrape (see core/deadlines.py) fails with DeadlineExceeded. Queue lengths and wait times are
+reported by get_stats().
+
+Classes:
+    HostScheduler: The rate limit, concurrency cap and backoff state of a single host.
+    PolitenessTimeout: Raised when a request cannot get a slot in time.
+Functions:
+    host_slot(url): Context manager holding a request slot of the URL's host.
+    robots_allowed(url): Checks whether robots.txt allows fetching a URL.
+    polite_fetch(url, **kwargs): Context manager fetching a URL within a request slot.
+    get_stats(): Returns the scheduler state and wait statistics of every host.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+from config import app
+from core.deadlines import (
+    DeadlineExceeded,
+    ScrapeCancelled,
+    current_deadline,
+    on_expire,
+    remaining_timeout,
+)
+from core.engines import get_engine
+from core.metrics import record_stage, register_collector
+
+# Responses telling us to slow down
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+class PolitenessTimeout(Exception):
+    """Raised when a request cannot get a slot of its host within POLITENESS_MAX_WAIT."""
+
+
+class HostScheduler:
+    """
+    The rate limit, concurrency cap and backoff state of a single host.
+
+    Args:
+        rate (float): Requests per second refilling the token bucket (0 disables the limit).
+        burst (int): Capacity of the token bucket.
+        concurrency (int): Maximum number of requests in flight.
+        crawl_delay (float): Minimum seconds between two request starts.
+    """
+
+    def __init__(self, rate, burst, concurrency, crawl_delay=0.0):
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.crawl_delay = crawl_delay
+        # The parsed robots.txt of the host (None: none), read again after robots_expires_at
+        self.robots = None
+        self.robots_expires_at = 0.0
+        self.robots_lock = threading.Lock()
+
+        self._condition = threading.Condition()
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._last_start = None
+        self._backoff = 0.0
+        self._backoff_until = 0.0
+        self.active = 0
+        self.waiting = 0
+        self.stats = {
+            "requests": 0,
+            "throttled": 0,
+            "timeouts": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+
+    def _refill(self, now):
+        if self.rate > 0:
+            elapsed = now - self._refilled_at
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+        self._refilled_at = now
+
+    def _ready_at(self, now):
+        """Returns the earliest time the next request may start (ignoring concurrency)."""
+        ready_at = max(now, self._backoff_until)
+        if self.rate > 0 and self._tokens < 1:
+            ready_at = max(ready_at, now + (1 - self._tokens) / self.rate)
+        if self.crawl_delay and self._last_start is not None:
+            ready_at = max(ready_at, self._last_start + self.crawl_delay)
+        return ready_at
+
+    def acquire(self, max_wait, scrape_deadline=None):
+        """
+        Waits until a request may start and takes a slot.
+
+        Args:
+            max_wait (float): Maximum seconds to wait.
+            scrape_deadline (Deadline): The deadline of the scrape, checked whenever the waiter
+                wakes up (optional).
+
+        Returns:
+            float: The seconds waited.
+
+        Raises:
+            PolitenessTimeout: If no slot becomes available within max_wait seconds.
+            ScrapeCancelled: If the scrape is cancelled while waiting.
+        """
+        start = time.monotonic()
+        deadline = start + max_wait
+        with self._condition:
+            self.waiting += 1
+            try:
+                while True:
+                    if scrape_deadline is not None and scrape_deadline.cancelled:
+                        raise ScrapeCancelled("The scrape was cancelled")
+                    now = time.monotonic()
+                    self._refill(now)
+                    ready_at = self._ready_at(now)
+                    if self.active < self.concurrency and ready_at <= now:
+                        break
+                    if ready_at > deadline or now >= deadline:
+                        self.stats["timeouts"] += 1
+                        raise PolitenessTimeout(
+                            f"No request slot available within {max_wait} seconds"
+                        )
+                    # Woken up early by release() when a concurrency slot frees up
+                    timeout = ready_at - now if ready_at > now else deadline - now
+                    self._condition.wait(timeout)
+            finally:
+                self.waiting -= 1
+
+            if self.rate > 0:
+                self._tokens -= 1
+            self._last_start = now
+            self.active += 1
+            waited = now - start
+            self.stats["requests"] += 1
+            self.stats["wait_seconds_total"] += waited
+            self.stats["wait_seconds_max"] = max(self.stats["wait_seconds_max"], waited)
+            return waited
+
+    def release(self):
+        """Gives a slot back."""
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    def wake_waiters(self):
+        """Wakes up every waiting request, e.g. so a cancelled one stops waiting."""
+        with self._condition:
+            self._condition.notify_all()
+
+    def record_response(self, status_code, retry_after=None):
+        """
+        Adapts the backoff to the status of a response.
+
+        Args:
+            status_code (int): The HTTP status code.
+            retry_after (float): The Retry-After delay of the response in seconds, if any.
+        """
+        with self._condition:
+            if status_code in THROTTLE_STATUS_CODES:
+                self.stats["throttled"] += 1
+                self._backoff = min(
+                    max(self._backoff * 2, app.config["POLITENESS_BACKOFF_INITIAL"]),
+                    app.config["POLITENESS_BACKOFF_MAX"],
+                )
+                delay = self._backoff
+                if retry_after is not None:
+                    delay = min(
+                        max(delay, retry_after), app.config["POLITENESS_BACKOFF_MAX"]
+                    )
+                self._backoff_until = max(self._backoff_until, time.monotonic() + delay)
+            elif self._backoff:
+                self._backoff = self._backoff / 2
+                if self._backoff < app.config["POLITENESS_BACKOFF_INITIAL"]:
+                    self._backoff = 0.0
+
+    def snapshot(self):
+        """
+        Returns the current state and statistics of the host.
+
+        Returns:
+            dict: Configured limits, active and waiting requests, backoff and wait statistics.
+        """
+        with self._condition:
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "concurrency": self.concurrency,
+                "crawl_delay": self.crawl_delay,
+                "active": self.active,
+                "waiting": self.waiting,
+                "backoff_seconds": self._backoff,
+                "paused_seconds": max(self._backoff_until - time.monotonic(), 0.0),
+                **self.stats,
+            }
+
+
+_schedulers: dict = {}
+_schedulers_lock = threading.Lock()
+
+
+def _host(url):
+    return urlsplit(url).netloc.lower()
+
+
+def _user_agent():
+    return get_engine("http").get_session().headers.get("User-Agent", "*")
+
+
+def _read_robots(url):
+    """
+    Fetches and parses the robots.txt of the URL's site, up to ROBOTS_MAX_BYTES.
+
+    Args:
+        url (str): A URL of the site.
+
+    Returns:
+        RobotFileParser: The parsed robots.txt, or None if the site has none or it could not
+        be fetched (everything is allowed then).
+    """
+    parts = urlsplit(url)
+    robots_url = f"{parts.scheme}://{parts.netloc}/robots.txt"
+    parser = RobotFileParser(robots_url)
+    http_client = get_engine("http")
+    try:
+        with http_client.fetch(
+            robots_url, timeout=app.config["ROBOTS_TIMEOUT"], stream=True
+        ) as response:
+            if response.status_code != 200:
+                return None
+            # A huge robots.txt is not held in memory, it counts as unavailable
+            content = http_client.read_text(response, app.config["ROBOTS_MAX_BYTES"])
+            parser.parse(content.splitlines())
+    except (DeadlineExceeded, ScrapeCancelled):
+        # Not the site's fault, robots.txt is read again by the next request
+        raise
+    except Exception as e:
+        print(f"Failed to fetch {robots_url}: {e}")
+        return None
+    return parser
+
+
+def _crawl_delay(robots):
+    """
+    Returns the Crawl-delay of a robots.txt for our user agent.
+
+    Args:
+        robots (RobotFileParser): The parsed robots.txt, or None.
+
+    Returns:
+        float: The crawl delay in seconds (capped at ROBOTS_MAX_CRAWL_DELAY), 0 if none.
+    """
+    if robots is None:
+        return 0.0
+    delay = robots.crawl_delay(_user_agent())
+    return min(float(delay or 0), app.config["ROBOTS_MAX_CRAWL_DELAY"])
+
+
+def _get_scheduler(url):
+    """
+    Returns the scheduler of the URL's host, (re)reading its robots.txt when the cached copy
+    is older than ROBOTS_CACHE_TTL.
+
+    Args:
+        url (str): The URL about to be requested.
+
+    Returns:
+        HostScheduler: The scheduler of the host.
+
+    Raises:
+        PolitenessTimeout: If robots.txt is being read by another request for longer than
+            POLITENESS_MAX_WAIT seconds.
+        DeadlineExceeded: If that read does not finish before the deadline of the scrape.
+    """
+    host = _host(url)
+    with _schedulers_lock:
+        scheduler = _schedulers.get(host)
+        if scheduler is None:
+            scheduler = _schedulers[host] = HostScheduler(
+                rate=app.config["POLITENESS_RATE"],
+                burst=app.config["POLITENESS_BURST"],
+                concurrency=app.config["POLITENESS_HOST_CONCURRENCY"],
+            )
+
+    if app.config["ROBOTS_ENABLED"] and time.monotonic() >= scheduler.robots_expires_at:
+        # Only one request per host reads robots.txt, the others wait for its Crawl-delay
+        max_wait = app.config["POLITENESS_MAX_WAIT"]
+        wait_limit = remaining_timeout(max_wait)
+        if not scheduler.robots_lock.acquire(timeout=wait_limit):
+            if wait_limit < max_wait:
+                # The wait was cut short by the deadline, the scrape cannot finish in time
+                deadline = current_deadline()
+                deadline.expire()
+                deadline.check()
+            raise PolitenessTimeout(f"robots.txt not read within {max_wait} seconds")
+        try:
+            if time.monotonic() >= scheduler.robots_expires_at:
+                scheduler.robots = _read_robots(url)
+                scheduler.crawl_delay = _crawl_delay(scheduler.robots)
+                scheduler.robots_expires_at = (
+                    time.monotonic() + app.config["ROBOTS_CACHE_TTL"]
+                )
+        finally:
+            scheduler.robots_lock.release()
+    return scheduler
+
+
+@contextmanager
+def host_slot(url):
+    """
+    Holds a request slot of the URL's host for the duration of the `with` block.
+
+    Args:
+        url (str): The URL about to be requested.
+
+    Yields:
+        HostScheduler: The scheduler of the host (None when POLITENESS_ENABLED is off).
+
+    Raises:
+        PolitenessTimeout: If no slot becomes available within POLITENESS_MAX_WAIT seconds.
+        DeadlineExceeded: If no slot becomes available before the deadline of the scrape.
+        ScrapeCancelled: If the scrape is cancelled while waiting.
+    """
+    if not app.config["POLITENESS_ENABLED"]:
+        yield None
+        return
+    scheduler = _get_scheduler(url)
+    max_wait = app.config["POLITENESS_MAX_WAIT"]
+    wait_limit = remaining_timeout(max_wait)
+    deadline = current_deadline()
+    try:
+        with on_expire(scheduler.wake_waiters):
+            waited = scheduler.acquire(wait_limit, deadline)
+    except PolitenessTimeout:
+        if wait_limit < max_wait:
+            # The wait was cut short by the deadline, the scrape cannot finish in time
+            deadline.expire()
+            deadline.check()
+        raise
+    record_stage("wait", waited)
+    try:
+        yield scheduler
+    finally:
+        scheduler.release()
+
+
+def robots_allowed(url):
+    """
+    Checks whether the robots.txt of the URL's site allows our user agent to fetch the URL.
+    Used by the crawler before it follows a link (see core/crawl.py).
+
+    Args:
+        url (str): The URL about to be requested.
+
+    Returns:
+        bool: False if robots.txt disallows the URL, True otherwise (or if ROBOTS_ENABLED is
+        off).
+    """
+    if not app.config["ROBOTS_ENABLED"]:
+        return True
+    robots = _get_scheduler(url).robots
+    return robots is None or robots.can_fetch(_user_agent(), url)
+
+
+def _retry_after(headers):
+    """
+    Parses the Retry-After header of a response.
+
+    Returns:
+        float: The delay in seconds, or None if the header is absent or invalid.
+    """
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+@contextmanager
+def polite_fetch(url, **kwargs):
+    """
+    Fetches a URL within a request slot of its host and adapts the host's backoff to the
+    response status. The slot is held until the `with` block ends, so streamed bodies count
+    against the concurrency cap while they download.
+
+    Args:
+        url (str): The URL to fetch.
+        **kwargs: Extra keyword arguments passed to core.http_client.fetch().
+
+    Yields:
+        requests.Response: The response, closed when the block ends.
+
+    Raises:
+        PolitenessTimeout: If no slot becomes available within POLITENESS_MAX_WAIT seconds.
+    """
+    with host_slot(url) as scheduler:
+        started = time.perf_counter()
+        with get_engine("http").fetch(url, **kwargs) as response:
+            # Until the headers arrived, the body is downloaded by the caller
+            record_stage("fetch", time.perf_counter() - started)
+            if scheduler is not None:
+                # Throttled attempts retried by urllib3 (honouring their Retry-After) count too
+                retries = getattr(response.raw, "retries", None)
+                for attempt in getattr(retries, "history", ()):
+                    if attempt.status is not None:
+                        scheduler.record_response(attempt.status)
+                scheduler.record_response(
+                    response.status_code, _retry_after(response.headers)
+                )
+            yield response
+
+
+def get_stats():
+    """
+    Returns the scheduler state and wait statistics of every host.
+
+    Returns:
+        dict: Maps each host to the dictionary returned by HostScheduler.snapshot().
+    """
+    with _schedulers_lock:
+        schedulers = dict(_schedulers)
+    return {host: scheduler.snapshot() for host, scheduler in schedulers.items()}
+
+
+def _host_metrics(key):
+    return {(host,): snapshot[key] for host, snapshot in get_stats().items()}
+
+
+register_collector(
+    "politeness_requests_waiting",
+    "Requests waiting for a slot of their host.",
+    "gauge",
+    ("host",),
+    lambda: _host_metrics("waiting"),
+)
+register_collector(
+    "politeness_requests_active",
+    "Requests holding a slot of their host.",
+    "gauge",
+    ("host",),
+    lambda: _host_metrics("active"),
+)
+register_collector(
+    "politeness_throttled_total",
+    "429/503 responses by host.",
+    "counter",
+    ("host",),
+    lambda: _host_metrics("throttled"),
+)
+register_collector(
+    "politeness_timeouts_total",
+    "Requests that got no slot of their host within POLITENESS_MAX_WAIT.",
+    "counter",
+    ("host",),
+    lambda: _host_metrics("timeouts"),
+)
@@ -0,0 +1,122 @@
+"""
+This module decides whether a page needs a browser (JavaScript rendering) to be scraped.
+
+The "auto" scraping method fetches a page over plain HTTP first and only escalates to Selenium
+when the static HTML looks like a JavaScript-rendered page. A page needs JavaScript when it
+has little visible text (less than AUTO_MIN_TEXT_CHARS) and at least one of:
+- an empty single-page-app mount point (<div id="root"></div>, <app-root>, ...),
+- a <noscript> hint asking to enable JavaScript,
+- much more inline script than text (AUTO_SCRIPT_TEXT_RATIO), or external script bundles
+  and almost no text at all.
+
+The decision is remembered per domain (for AUTO_DECISION_TTL seconds), so domains known to
+need a browser skip the wasted HTTP fetch.
+
+Functions:
+    detect_javascript(html_content): Returns why a page needs JavaScript, or None.
+    remembered_engine(url): Returns the engine remembered for the URL's domain.
+    remember_engine(url, engine): Remembers the engine that worked for the URL's domain.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+from config import app
+from core.parse_pool import run_parse
+
+_INLINE_SCRIPT = re.compile(
+    r"<script(?![^>]*\bsrc=)[^>]*>(.*?)</script\s*>", re.IGNORECASE | re.DOTALL
+)
+_EXTERNAL_SCRIPT = re.compile(r"<script[^>]*\bsrc=", re.IGNORECASE)
+_EMPTY_MOUNT_POINT = re.compile(
+    r"<div[^>]*\bid\s*=\s*[\"']?(?:root|app|__next|__nuxt|svelte|main-app|react-root)"
+    r"[\"']?[^>]*>\s*</div\s*>"
+    r"|<(app-root|ng-app)[^>]*>\s*</\1\s*>",
+    re.IGNORECASE,
+)
+_NOSCRIPT = re.compile(r"<noscript[^>]*>(.*?)</noscript\s*>", re.IGNORECASE | re.DOTALL)
+_JAVASCRIPT_HINT = re.compile(
+    r"(?:enable|requires?|turn on|needs?)\s+(?:\w+\s+)?javascript", re.IGNORECASE
+)
+
+
+def detect_javascript(html_content):
+    """
+    Decides whether a page needs JavaScript rendering to show its content.
+
+    Args:
+        html_content (str): The static HTML of the page.
+
+    Returns:
+        str: The reason the page needs JavaScript, or None if the static HTML is enough.
+    """
+    _, text = run_parse("text", html_content)
+    text_chars = len(text)
+    if text_chars >= app.config["AUTO_MIN_TEXT_CHARS"]:
+        return None
+
+    if _EMPTY_MOUNT_POINT.search(html_content):
+        return "empty app mount point"
+    if any(_JAVASCRIPT_HINT.search(hint) for hint in _NOSCRIPT.findall(html_content)):
+        return "noscript asks for JavaScript"
+    script_chars = sum(len(script) for script in _INLINE_SCRIPT.findall(html_content))
+    if script_chars > app.config["AUTO_SCRIPT_TEXT_RATIO"] * max(text_chars, 1):
+        return f"{script_chars} script characters for {text_chars} text characters"
+    if text_chars < app.config["AUTO_MIN_TEXT_CHARS"] / 4 and _EXTERNAL_SCRIPT.search(
+        html_content
+    ):
+        return f"script bundles and only {text_chars} text characters"
+    return None
+
+
+_decisions: OrderedDict = OrderedDict()
+_decisions_lock = threading.Lock()
+
+
+def _domain(url):
+    return urlsplit(url).hostname or ""
+
+
+def remembered_engine(url):
+    """
+    Returns the engine remembered for the URL's domain.
+
+    Args:
+        url (str): The URL about to be scraped.
+
+    Returns:
+        str: "http" or "browser", or None if there is no (unexpired) decision.
+    """
+    domain = _domain(url)
+    with _decisions_lock:
+        decision = _decisions.get(domain)
+        if decision is None:
+            return None
+        engine, expires_at = decision
+        if time.monotonic() >= expires_at:
+            del _decisions[domain]
+            return None
+        _decisions.move_to_end(domain)
+        return engine
+
+
+def remember_engine(url, engine):
+    """
+    Remembers the engine that worked for the URL's domain for AUTO_DECISION_TTL seconds.
+
+    Args:
+        url (str): The scraped URL.
+        engine (str): "http" or "browser".
+    """
+    domain = _domain(url)
+    with _decisions_lock:
+        _decisions[domain] = (
+            engine,
+            time.monotonic() + app.config["AUTO_DECISION_TTL"],
+        )
+        _decisions.move_to_end(domain)
+        while len(_decisions) > app.config["AUTO_MAX_DOMAINS"]:
+            _decisions.popitem(last=False)
@@ -1,16 +1,50 @@
 """
 This module provides functionality to store user scraping history in the database.
 Functions:
-    store_user_history(url, scrape_method, scrape_result, current_user_id):
+    store_user_history(url, scrape_method, scrape_result, current_user_id, cleaned):
     Stores the scraping history of a user in the database.
+    store_user_history_bulk(records, current_user_id):
+    Stores several scraping results of a user in a single transaction.
+    store_history_records(records):
+    Stores scraping results of any users in a single transaction.
+    get_history_page(current_user_id, limit, cursor):
+    Returns one page of a user's history metadata, newest first.
+    search_user_history(current_user_id, query, limit, cursor):
+    Searches the history of a user, best matches first.
+    get_history_record(current_user_id, record_id):
+    Returns a single history record of a user, including its scraped data.
+    iter_history_records(current_user_id, batch_size):
+    Yields all history records of a user, newest first, a batch at a time.
+    history_to_dict(record, include_data):
+    Serializes a history record for the API.
+
+Scraped content is stored compressed and deduplicated in the blob store (see core/blobs.py).
+Every stored record is added to the full-text search index in the same transaction
+(see core/search.py), as are the change detection fingerprints of its content
+(see core/changes.py).
+
+The history is paginated with keyset pagination on (date, id): a page continues after the last
+record of the previous page, so every page is an index range scan on (user_id, date, id),
+however deep the page is.
 """
 
-from core.models import History
+from sqlalchemy import and_, func, or_
+
+from sqlalchemy.orm import joinedload
+
+from core.blobs import load_content, store_content
+from core.models import ContentFingerprint, History
+from core.search import index_history_records, index_text, search_history
 from config import db
 from flask_login import login_required
 
+# (url, scrape_method, scrape_result, user_id, cleaned, fingerprint), see store_history_records()
+HISTORY_RECORD_SIZE = 6
+
 
-def store_user_history(url, scrape_method, scrape_result, current_user_id):
+def store_user_history(
+    url, scrape_method, scrape_result, current_user_id, cleaned=None
+):
     """
     Stores the user's scraping history in the database.
 
@@ -19,16 +53,271 @@ def store_user_history(url, scrape_method, scrape_result, current_user_id):
         scrape_method (str): The method used for scraping.
         scrape_result (str): The result of the scraping process.
         current_user_id (int): The ID of the current user.
+        cleaned (bool): Whether the result is cleaned text (see core.scraper.is_cleaned()).
 
     Returns:
         None
     """
+    content = index_text(scrape_method, scrape_result, cleaned)
     new_history = History(
         url=url,
         scrape_method=scrape_method,
-        scraped_data=scrape_result,
+        content_hash=store_content(scrape_result),
+        cleaned=cleaned,
         user_id=current_user_id,
     )
     db.session.add(new_history)
+    db.session.flush()
+    index_history_records([(new_history, content)])
     db.session.commit()
     print("user history saved to database")
+
+
+def store_user_history_bulk(records, current_user_id):
+    """
+    Stores several scraping results of a user in a single transaction.
+
+    Args:
+        records (list): A list of (url, scrape_method, scrape_result, cleaned) tuples.
+        current_user_id (int): The ID of the current user.
+
+    Returns:
+        None
+    """
+    store_history_records(
+        [
+            (url, scrape_method, scrape_result, current_user_id, cleaned)
+            for url, scrape_method, scrape_result, cleaned in records
+        ]
+    )
+
+
+def store_history_records(records):
+    """
+    Stores scraping results of any users in a single transaction.
+
+    Args:
+        records (list): A list of (url, scrape_method, scrape_result, user_id, cleaned,
+            fingerprint) tuples, the last two are optional. cleaned tells whether the result
+            is cleaned text (see core.scraper.is_cleaned()). The fingerprint returned by
+            core.changes.detect_change() updates the change detection fingerprints of the URL
+            in the same transaction.
+
+    Returns:
+        None
+    """
+    if not records:
+        return
+    records = [
+        record + (None,) * (HISTORY_RECORD_SIZE - len(record)) for record in records
+    ]
+    # Parsed before the first write, so the database is not locked meanwhile
+    contents = [index_text(record[1], record[2], record[4]) for record in records]
+    history = [
+        History(
+            url=url,
+            scrape_method=scrape_method,
+            content_hash=store_content(scrape_result),
+            cleaned=cleaned,
+            user_id=user_id,
+        )
+        for url, scrape_method, scrape_result, user_id, cleaned, _ in records
+    ]
+    db.session.add_all(history)
+    db.session.flush()
+    index_history_records(list(zip(history, contents)))
+    _store_fingerprints(
+        [
+            (record, item[5])
+            for record, item in zip(history, records)
+            if item[5] is not None
+        ]
+    )
+    db.session.commit()
+    print(f"{len(records)} user history records saved to database")
+
+
+def _store_fingerprints(records):
+    """
+    Points the change detection fingerprints of the URLs of stored records at their content.
+
+    Args:
+        records (list): A list of (record, fingerprint) tuples, flushed History records and
+            the text_hash and simhash of their content.
+    """
+    for record, fingerprint in records:
+        row = ContentFingerprint.query.filter_by(
+            user_id=record.user_id, url=record.url, scrape_method=record.scrape_method
+        ).first()
+        if row is None:
+            row = ContentFingerprint(
+                user_id=record.user_id,
+                url=record.url,
+                scrape_method=record.scrape_method,
+            )
+            db.session.add(row)
+        row.text_hash = fingerprint["text_hash"]
+        row.simhash = fingerprint["simhash"]
+        row.content_hash = record.content_hash
+        row.checked_at = func.now()
+        row.changed_at = func.now()
+
+
+# The history columns without the scraped data, which can be several MB per record
+HISTORY_METADATA_COLUMNS = (
+    History.id,
+    History.url,
+    History.scrape_method,
+    History.date,
+)
+
+
+def _history_after(query, current_user_id, cursor):
+    """
+    Restricts a newest-first history query to the records after the cursor record.
+
+    Args:
+        query: The history query.
+        current_user_id (int): The ID of the current user.
+        cursor (int): The ID of the last record of the previous page.
+
+    Returns:
+        The restricted query.
+    """
+    # The cursor's date is read by the database itself, so it is compared in its stored format
+    cursor_date = (
+        db.session.query(History.date)
+        .filter(History.id == cursor, History.user_id == current_user_id)
+        .scalar_subquery()
+    )
+    return query.filter(
+        or_(
+            History.date < cursor_date,
+            and_(History.date == cursor_date, History.id < cursor),
+        )
+    )
+
+
+def _newest_first(query, current_user_id):
+    return query.filter(History.user_id == current_user_id).order_by(
+        History.date.desc(), History.id.desc()
+    )
+
+
+def get_history_page(current_user_id, limit, cursor=None):
+    """
+    Returns one page of a user's history, newest first, without the scraped data.
+
+    Args:
+        current_user_id (int): The ID of the current user.
+        limit (int): The maximum number of records on the page.
+        cursor (int): The ID of the last record of the previous page, None for the first page.
+
+    Returns:
+        tuple: (records, next_cursor). The records are rows with the id, url, scrape_method
+        and date columns, next_cursor is None on the last page.
+    """
+    query = _newest_first(db.session.query(*HISTORY_METADATA_COLUMNS), current_user_id)
+    if cursor is not None:
+        query = _history_after(query, current_user_id, cursor)
+    # One extra row tells whether there is a next page
+    records = query.limit(limit + 1).all()
+    if len(records) > limit:
+        records = records[:limit]
+        return records, records[-1].id
+    return records, None
+
+
+def search_user_history(current_user_id, query, limit, cursor=None):
+    """
+    Searches the history of a user, best matches first.
+
+    Args:
+        current_user_id (int): The ID of the current user.
+        query (str): The search query: words, "quoted phrases" and prefix* terms.
+        limit (int): The maximum number of results on the page.
+        cursor (int): The ID of the last record of the previous page, None for the first page.
+
+    Returns:
+        tuple: (results, next_cursor). The results are the metadata of the records
+        (see history_to_dict()) with their snippet and score, next_cursor is None on the
+        last page.
+
+    Raises:
+        SearchUnavailable: If the database has no search index.
+    """
+    hits, next_cursor = search_history(current_user_id, query, limit, cursor)
+    results = [
+        dict(history_to_dict(record), snippet=snippet, score=score)
+        for record, snippet, score in hits
+    ]
+    return results, next_cursor
+
+
+def get_history_record(current_user_id, record_id):
+    """
+    Returns a single history record of a user, including its scraped data.
+
+    Args:
+        current_user_id (int): The ID of the current user.
+        record_id (int): The ID of the record.
+
+    Returns:
+        History: The record, or None if it does not exist or belongs to another user.
+    """
+    return (
+        History.query.options(joinedload(History.content_blob))
+        .filter_by(id=record_id, user_id=current_user_id)
+        .first()
+    )
+
+
+def iter_history_records(current_user_id, batch_size=100):
+    """
+    Yields all history records of a user, newest first, including their scraped data.
+    Only one batch of records is held in memory at a time.
+
+    Args:
+        current_user_id (int): The ID of the current user.
+        batch_size (int): The number of records loaded per query.
+
+    Yields:
+        History: The records.
+    """
+    cursor = None
+    while True:
+        query = _newest_first(
+            History.query.options(joinedload(History.content_blob)), current_user_id
+        )
+        if cursor is not None:
+            query = _history_after(query, current_user_id, cursor)
+        records = query.limit(batch_size).all()
+        if not records:
+            return
+        yield from records
+        cursor = records[-1].id
+        # Drop the loaded records from the session before loading the next batch
+        db.session.expunge_all()
+
+
+def history_to_dict(record, include_data=False):
+    """
+    Serializes a history record for the API.
+
+    Args:
+        record: A History record, or a row of the metadata columns.
+        include_data (bool): Whether to include the scraped data.
+
+    Returns:
+        dict: The id, url, scrape_method and date of the record, plus scraped_data
+        if include_data is set.
+    """
+    data = {
+        "id": record.id,
+        "url": record.url,
+        "scrape_method": record.scrape_method,
+        "date": record.date.strftime("%Y-%m-%d %H:%M:%S") if record.date else None,
+    }
+    if include_data:
+        data["scraped_data"] = load_content(record)
+    return data
@@ -1,23 +1,49 @@
 """
 This module provides functionality for web scraping using various methods:
 - Requests: For simple HTTP GET requests to retrieve raw HTML content.
+  HTTP fetches go through the pooled keep-alive session in core.http_client,
+  and their results are cached (with conditional revalidation) by core.cache.
+  Every request to a site waits for a slot of the per-host politeness scheduler
+  in core.politeness (rate limit, concurrency cap, robots.txt Crawl-delay, backoff).
 - BeautifulSoup: For parsing and prettifying HTML content.
 - Selenium: For scraping dynamic web pages that require JavaScript execution.
+- Auto: For fetching over HTTP first and escalating to Selenium only for pages that need
+  JavaScript rendering (see core.rendering).
+- Extract: For returning only the fields selected by a named rule set of CSS/XPath selectors,
+  as compact JSON (see core.extraction).
 It also includes a utility function to clean and format HTML content into readable text.
+
+Every scrape runs under an end-to-end deadline (see core.deadlines), enforced by the fetch,
+politeness, browser and parse stages. A scrape past its deadline (or cancelled) returns an
+error naming the deadline, whatever stage it was in.
+
+The heavy engines (requests, Selenium, BeautifulSoup, lxml) are imported on first use through
+the registry in core.engines, so importing this module stays cheap.
 """
 
-import os
+import itertools
 import re
 import time
 
-import requests
-from bs4 import BeautifulSoup
-from flask import jsonify
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
+from flask import g, has_app_context, jsonify
+
+from config import app
+
+from core.cache import cache_key, entry_from_response, get_content_cache, refresh_entry
+from core.cleaning import format_clean_text
+from core.deadlines import current_deadline, deadline_scope
+from core.engines import get_engine
+from core.extraction import get_rule_set
+from core.metrics import begin_scrape, count_error, end_scrape, stage
+from core.parse_pool import run_parse, run_parse_stream
+from core.politeness import host_slot, polite_fetch
+from core.rendering import detect_javascript, remember_engine, remembered_engine
+
+# Browser results start with the page title (see scrape_with_selenium())
+BROWSER_TITLE_PREFIX = "Scraped Page Title: "
+
+# The start of a page's markup, as the browser returns it
+_DOCUMENT_START = re.compile(r"<(?:!doctype|html)[\s>]", re.IGNORECASE)
 
 
 def scrape_with_requests(url: str):
@@ -31,12 +57,12 @@ def scrape_with_requests(url: str):
       str: The raw HTML content of the page, or an error message.
     """
     try:
-        # send an http get request to the url
-        response = requests.get(url, timeout=10)
+        # send an http get request to the url (or serve it from the content cache)
         print("Scraping URL with requests...")
+        scrape_result = _scrape_static(url, "requests", False, lambda html: html)
 
         # Check if the response was successful (status code 200).
-        if response.status_code != 200:
+        if scrape_result is None:
             return (
                 jsonify(
                     {"status": "failure", "error": "Failed to retrieve URL content"}
@@ -45,10 +71,11 @@ def scrape_with_requests(url: str):
             )
 
         # Return the entire HTML content.
-        return response.text
+        return scrape_result
 
     except Exception as e:
         # If an error occurs, return a message with the error details.
+        count_error(e)
         return {"status": "failure", "error": f"An error occurred: {e}"}
 
 
@@ -64,12 +91,20 @@ def scrape_with_bs4(url: str, clean):
       str: The cleaned text or prettified HTML content of the page, or an error message.
     """
     try:
-        # send an http get request to the url
-        response = requests.get(url, timeout=10)
+        # send an http get request to the url (or serve it from the content cache)
         print("Scraping URL with bs4...")
+        scrape_result = _scrape_static(
+            url,
+            "bs4",
+            clean,
+            # parse the html content using beautifullsp
+            lambda html: clean_text(html) if clean else prettify_html(html),
+            # huge pages are cleaned while they download, without building a tree
+            stream_clean_text if clean else None,
+        )
 
         # Check if the response was successful (status code 200).
-        if response.status_code != 200:
+        if scrape_result is None:
             return (
                 jsonify(
                     {"status": "failure", "error": "Failed to retrieve URL content"}
@@ -77,16 +112,284 @@ def scrape_with_bs4(url: str, clean):
                 400,
             )
 
-        # parse the html content using beautifullsp
-        soup = BeautifulSoup(response.text, "html.parser")
+        return scrape_result
+
+    except Exception as e:
+        # If an error occurs, return a message with the error details.
+        count_error(e)
+        return f"An error occurred: {e}"
+
+
+def scrape_with_extract(url: str, rule_set: str):
+    """
+    Scrapes the given URL and returns the fields selected by a structured extraction rule set.
+
+    Parameters:
+      url (str): The URL of the website to scrape.
+      rule_set (str): The name of the rule set (see core.extraction).
+
+    Returns:
+      str: The extracted fields as compact JSON, or an error message.
+    """
+    try:
+        # the rule set is compiled once and cached, the page is parsed once for all its rules
+        print("Scraping URL with extract...")
+        rules = get_rule_set(rule_set)
+        scrape_result = _scrape_static(
+            url,
+            # a changed rule set must not reuse results cached for its previous version
+            f"extract:{rules.name}:{rules.digest}",
+            False,
+            lambda html: _extract(rules, html, url),
+        )
+
+        # Check if the response was successful (status code 200).
+        if scrape_result is None:
+            return (
+                jsonify(
+                    {"status": "failure", "error": "Failed to retrieve URL content"}
+                ),
+                400,
+            )
+
+        return scrape_result
+
+    except Exception as e:
+        # If an error occurs, return a message with the error details.
+        count_error(e)
+        return f"An error occurred: {e}"
+
+
+class _NeedsBrowser(Exception):
+    """Raised while processing a static page that needs JavaScript rendering."""
+
+
+def scrape_with_auto(url: str, clean, company_name=None):
+    """
+    Scrapes the given URL over plain HTTP and escalates to Selenium only if the page needs
+    JavaScript rendering (see core.rendering). The engine that worked is remembered per domain.
+
+    Parameters:
+      url (str): The URL of the website to scrape.
+      clean (bool): Flag to determine if the HTML content should be cleaned and formatted.
+      company_name (str): The name of the company, for the site's interaction script if the
+        browser is used (optional).
 
-        return clean_text(response.text) if clean else soup.prettify()
+    Returns:
+      str: The output of scrape_with_bs4 for static pages, or of scrape_with_selenium for
+      pages that need a browser, or an error message.
+    """
+
+    def process(html):
+        with stage("detect"):
+            reason = detect_javascript(html)
+        if reason is not None:
+            raise _NeedsBrowser(reason)
+        return clean_text(html) if clean else prettify_html(html)
+
+    try:
+        if remembered_engine(url) != "browser":
+            print("Scraping URL with auto (http)...")
+            try:
+                # Only static results are cached, pages needing a browser raise before that
+                scrape_result = _scrape_static(url, "auto", clean, process)
+            except _NeedsBrowser as e:
+                print(f"Page needs JavaScript ({e}), escalating to the browser")
+            else:
+                if scrape_result is None:
+                    return (
+                        jsonify(
+                            {
+                                "status": "failure",
+                                "error": "Failed to retrieve URL content",
+                            }
+                        ),
+                        400,
+                    )
+                remember_engine(url, "http")
+                _set_scrape_engine("http")
+                return scrape_result
+
+        remember_engine(url, "browser")
+        _set_scrape_engine("browser")
+        return scrape_with_selenium(url, company_name, clean)
 
     except Exception as e:
         # If an error occurs, return a message with the error details.
+        count_error(e)
         return f"An error occurred: {e}"
 
 
+def _set_scrape_engine(engine):
+    """
+    Records which engine served the current scrape, so the API can report it.
+
+    Args:
+        engine (str): "http" or "browser".
+    """
+    if has_app_context():
+        g.scrape_engine = engine
+
+
+def _set_deadline_error(error):
+    """
+    Records that the current scrape passed its deadline or was cancelled, so the API can
+    report it.
+
+    Args:
+        error (Exception): The DeadlineExceeded or ScrapeCancelled error.
+    """
+    if has_app_context():
+        g.deadline_error = error
+
+
+def _set_cache_status(status):
+    """
+    Records the cache outcome of the current scrape, so the API can report it.
+
+    Args:
+        status (str): "hit", "miss", "revalidated" or "bypass".
+    """
+    if has_app_context():
+        g.cache_status = status
+
+
+def _set_final_url(url):
+    """
+    Records the URL the current scrape's page was served from after redirects, so links
+    of the page can be resolved against it.
+
+    Args:
+        url (str): The final URL of the page.
+    """
+    if has_app_context():
+        g.final_url = url
+
+
+def _read_page(response, process, process_chunks):
+    """
+    Reads the body of a streamed response and turns it into the scrape result.
+
+    Bodies larger than STREAM_PARSE_THRESHOLD are handed to `process_chunks` chunk by chunk
+    when the method supports incremental processing, so they are never held in memory as a
+    whole. Bodies of unknown length (chunked responses) are buffered up to the threshold
+    first: most of them are small pages, processed like any other. All other bodies are read
+    up to FETCH_MAX_BODY_BYTES.
+
+    Args:
+        response (requests.Response): The response, fetched with stream=True.
+        process (callable): Turns the whole HTML of the page into the scrape result.
+        process_chunks (callable): Turns an iterable of HTML chunks into the scrape result,
+            or None if the method needs the whole page.
+
+    Returns:
+        str: The scrape result.
+
+    Raises:
+        ResponseTooLarge: If the body exceeds its size cap.
+    """
+    # The response was fetched by the http engine, so it is loaded already
+    http_client = get_engine("http")
+    content_length = response.headers.get("Content-Length", "")
+    threshold = app.config["STREAM_PARSE_THRESHOLD"]
+    if process_chunks is not None and not content_length.isdigit():
+        chunks = http_client.iter_text(response, app.config["FETCH_MAX_STREAM_BYTES"])
+        head = []
+        size = 0
+        with stage("download"):
+            for chunk in chunks:
+                head.append(chunk)
+                size += len(chunk)
+                if size > threshold:
+                    break
+            else:
+                return process("".join(head))
+        with stage("stream_parse"):
+            return process_chunks(itertools.chain(head, chunks))
+    if process_chunks is not None and int(content_length) > threshold:
+        with stage("stream_parse"):
+            return process_chunks(
+                http_client.iter_text(response, app.config["FETCH_MAX_STREAM_BYTES"])
+            )
+    with stage("download"):
+        html_content = http_client.read_text(
+            response, app.config["FETCH_MAX_BODY_BYTES"]
+        )
+    return process(html_content)
+
+
+def _scrape_static(url, scraping_method, clean, process, process_chunks=None):
+    """
+    Fetches a page over HTTP through the content cache and processes it.
+
+    A fresh cached result is returned without any request. A stale one is revalidated with
+    a conditional request and reused if the server answers 304 Not Modified.
+    Requests go through the per-host politeness scheduler. The body is streamed, see _read_page().
+    The URL of the page after redirects is recorded in g.final_url (cached entries keep it).
+
+    Args:
+        url (str): The URL of the website to scrape.
+        scraping_method (str): The scraping method, part of the cache key.
+        clean (bool): The clean flag, part of the cache key.
+        process (callable): Turns the HTML of the page into the scrape result.
+        process_chunks (callable): Incremental variant of `process` for huge pages (optional).
+
+    Returns:
+        str: The scrape result, or None if the page could not be retrieved (non 200 status).
+    """
+    cache = get_content_cache()
+    if cache is None:
+        _set_cache_status("bypass")
+        with polite_fetch(url, stream=True) as response:
+            _set_final_url(response.url)
+            if response.status_code != 200:
+                count_error(f"HTTP {response.status_code}")
+                return None
+            return _read_page(response, process, process_chunks)
+
+    key = cache_key(url, scraping_method, clean)
+    with stage("cache"):
+        entry = cache.get(key)
+    if entry is not None and entry.is_fresh():
+        cache.record("hit")
+        _set_cache_status("hit")
+        _set_final_url(entry.final_url or url)
+        return entry.result
+
+    revalidate = entry is not None and entry.can_revalidate()
+    with polite_fetch(
+        url,
+        headers=entry.conditional_headers() if revalidate else None,
+        stream=True,
+    ) as response:
+        if response.status_code == 304 and revalidate:
+            refreshed = refresh_entry(entry, response)
+            if refreshed is None:
+                cache.delete(key)
+            else:
+                cache.put(key, refreshed)
+            cache.record("revalidated")
+            _set_cache_status("revalidated")
+            _set_final_url(entry.final_url or url)
+            return entry.result
+
+        cache.record("miss")
+        _set_cache_status("miss")
+        _set_final_url(response.url)
+        if response.status_code != 200:
+            count_error(f"HTTP {response.status_code}")
+            return None
+
+        scrape_result = _read_page(response, process, process_chunks)
+
+    new_entry = entry_from_response(scrape_result, response)
+    if new_entry is None:
+        cache.delete(key)
+    else:
+        cache.put(key, new_entry)
+    return scrape_result
+
+
 def scrape_with_selenium(url: str, company_name: str, clean):
     """
     company_name (str): The name of the company to search for on the website.
@@ -96,55 +399,45 @@ def scrape_with_selenium(url: str, company_name: str, clean):
     Exception: If an error occurs during the scraping process.
     Environment Variables:
     CHROME_PATH (str): The path to the ChromeDriver executable.
+    The browser is checked out from the shared pool in core.browser_pool.
     Example:
     result = scrape_with_selenium("https://example.com", "Example Company", True)
     """
-    chrome_path = os.getenv("CHROME_PATH")
-
     try:
-        # Set up Chrome options (headless for better performance)
-        chrome_options = Options()
-        chrome_options.add_argument("--lang=en")
-
-        service = Service(executable_path=chrome_path)
-        driver = webdriver.Chrome(service=service, options=chrome_options)
-
-        driver.get(url)
-        time.sleep(2)
-
-        # Handle cookie pop-ups
-        cookie_button = driver.find_element(By.NAME, "reject")
-        cookie_button.click()
-        time.sleep(2)
-
-        search_field_id = "ybar-sbq"
-        element_search_field = driver.find_element(By.ID, search_field_id)
-        element_search_field.clear()
-        element_search_field.send_keys(company_name)
-        time.sleep(2)
-        element_search_field.send_keys(Keys.ENTER)
-        time.sleep(3)
-        page_title = driver.title
-
-        # Get the page source after JavaScript execution
-        page_source = driver.page_source
-        time.sleep(3)
+        driver_pool = get_engine("browser").get_driver_pool()
+        waits = get_engine("waits")
+        # Wait for the host's politeness slot, then check out a pre-warmed headless browser,
+        # which goes back to the pool even on errors
+        with host_slot(url), driver_pool.driver() as driver, stage("browser"):
+            driver.get(url)
+
+            # Wait for DOM conditions instead of fixed sleeps, site flows are declared in core.waits
+            waits.run_interaction_script(
+                driver,
+                waits.get_interaction_script(url),
+                {"company_name": company_name},
+            )
+            page_title = driver.title
 
-        # Close the browser
-        driver.quit()
+            # Get the page source after JavaScript execution
+            page_source = driver.page_source
 
+        scrape_result = f"{BROWSER_TITLE_PREFIX}{page_title}"
+        if clean:
+            return scrape_result + clean_text(page_source)
         # Parse with BeautifulSoup for structured output
-        soup = BeautifulSoup(page_source, "html.parser")
-        scrape_result = f"Scraped Page Title: {page_title}"
-        return scrape_result + (clean_text(page_source) if clean else soup.prettify())
+        return scrape_result + prettify_html(page_source)
 
     except Exception as e:
+        count_error(e)
         return f"An error occurred: {e}"
 
 
 def clean_text(html_content):
     """
     Removes all HTML tags and extracts readable text with formatted output.
+    The document is parsed once (with lxml when available, see core.cleaning), in the parse
+    pool for large documents (see core.parse_pool).
 
     Args:
         html_content (str): The raw HTML content to be cleaned.
@@ -152,38 +445,199 @@ def clean_text(html_content):
     Returns:
         str: The cleaned text in a readable, structured format.
     """
-    soup = BeautifulSoup(html_content, "html.parser")
+    with stage("parse"):
+        title, text = run_parse("text", html_content)
+    with stage("clean"):
+        return format_clean_text(title, text)
 
-    # Remove scripts, styles, and other unwanted tags
-    for tag in soup(
-        ["script", "style", "meta", "noscript", "iframe", "svg", "form", "link"]
-    ):
-        tag.decompose()
 
-    # Extract visible text
-    text = soup.get_text(separator=" ", strip=True)
-    cleaned_text = " ".join(text.split())
+def prettify_html(html_content):
+    """
+    Parses HTML content with BeautifulSoup and returns it prettified, in the parse pool for
+    large documents.
 
-    # Split text into lines
-    lines = cleaned_text.splitlines()
+    Args:
+        html_content (str): The raw HTML content.
 
-    # Initialize formatted output
-    formatted_lines = []
+    Returns:
+        str: The prettified HTML.
+    """
+    with stage("parse"):
+        return run_parse("prettify", html_content)
 
-    # Extract title (if available)
-    title = soup.title.string.strip() if soup.title else "No Title Found"
-    formatted_lines.append(f"### {title}\n")  # Markdown-style title
 
-    # Process each line for bullet formatting
-    for line in lines:
-        line = line.strip()
-        if line:  # Ignore empty lines
-            line = re.sub(
-                r"\s+", " ", line
-            )  # Replace multiple spaces with a single space
-            formatted_lines.append(f"- {line}")  # Bullet points
+def _extract(rules, html_content, url):
+    with stage("extract"):
+        return run_parse("extract", html_content, rules.name, url)
+
+
+def stream_clean_text(chunks):
+    """
+    Same as clean_text() for a document given as an iterable of chunks.
+    The chunks are parsed incrementally, so the document is never held in memory as a whole.
+
+    Args:
+        chunks (iterable): The chunks of the raw HTML content.
+
+    Returns:
+        str: The cleaned text in a readable, structured format.
+    """
+    title, text = run_parse_stream("text", chunks)
+    return format_clean_text(title, text)
 
-    # Convert formatted lines to a readable output
-    readable_output = "\n".join(formatted_lines)
 
-    return readable_output
+def process_static_page(html_content, scraping_method, url, clean=False, rule_set=None):
+    """
+    Turns the HTML of a page fetched over HTTP into the result of a static scraping method,
+    like scrape_with_requests(), scrape_with_bs4() and scrape_with_extract() do. Used by the
+    crawler, which needs the HTML of every page for its links (see core.crawl).
+
+    Args:
+        html_content (str): The raw HTML of the page.
+        scraping_method (str): One of STATIC_SCRAPING_METHODS.
+        url (str): The URL of the page, "extract" resolves links against it.
+        clean (bool): Whether "bs4" cleans the content instead of prettifying it.
+        rule_set (str): The name of the extraction rule set (only used by "extract").
+
+    Returns:
+        str: The scrape result.
+
+    Raises:
+        ValueError: If the scraping method is not a static one.
+    """
+    if scraping_method == "requests":
+        return html_content
+    if scraping_method == "bs4":
+        return clean_text(html_content) if clean else prettify_html(html_content)
+    if scraping_method == "extract":
+        return _extract(get_rule_set(rule_set), html_content, url)
+    raise ValueError(f"Not a static scraping method: {scraping_method}")
+
+
+SCRAPING_METHODS = ("requests", "bs4", "selenium", "extract", "auto")
+
+# The methods that only fetch pages over HTTP, their result is computed from the HTML
+STATIC_SCRAPING_METHODS = ("requests", "bs4", "extract")
+
+# The methods whose result is cleaned text when the clean flag is set, the others ignore it
+CLEANING_METHODS = ("bs4", "selenium", "auto")
+
+# The engine used by every fixed scraping method, "auto" chooses per page
+SCRAPING_ENGINES = {
+    "requests": "http",
+    "bs4": "http",
+    "selenium": "browser",
+    "extract": "http",
+}
+
+
+def run_scraper(
+    url: str,
+    scraping_method: str,
+    clean=False,
+    company_name=None,
+    rule_set=None,
+    timeout=None,
+):
+    """
+    Dispatches a scrape to the function matching the given scraping method, under a deadline.
+
+    Args:
+        url (str): The URL of the website to scrape.
+        scraping_method (str): One of "requests", "bs4", "selenium", "extract" or "auto".
+        clean (bool): Whether the content should be cleaned (ignored by "requests"
+            and "extract").
+        company_name (str): The company to search for (used by "selenium", and "auto"
+            when it uses the browser).
+        rule_set (str): The name of the extraction rule set (only used by "extract").
+        timeout (float): The deadline of the scrape in seconds. Without it, the scrape runs
+            under the current deadline, or SCRAPE_DEFAULT_TIMEOUT seconds if there is none.
+
+    Returns:
+        The value returned by the selected scrape function. Scrapes past their deadline or
+        cancelled return an error message naming the deadline.
+
+    Raises:
+        ValueError: If the scraping method is not supported.
+    """
+    if scraping_method in SCRAPING_ENGINES:
+        _set_scrape_engine(SCRAPING_ENGINES[scraping_method])
+
+    outer = current_deadline()
+    if timeout is None and (outer is None or outer.expires_at is None):
+        timeout = app.config["SCRAPE_DEFAULT_TIMEOUT"]
+
+    # Labels every stage timed until the scrape ends with its method and host
+    begin_scrape(scraping_method, url)
+    started = time.perf_counter()
+    with deadline_scope(timeout) as deadline:
+        scrape_result = _dispatch(url, scraping_method, clean, company_name, rule_set)
+    failed = is_scrape_error(scrape_result)
+    if failed and deadline.error() is not None:
+        # The stage that was aborted may have failed with an unrelated error
+        error = deadline.error()
+        _set_deadline_error(error)
+        scrape_result = f"An error occurred: {error}"
+    end_scrape(failed, time.perf_counter() - started)
+    return scrape_result
+
+
+def _dispatch(url, scraping_method, clean, company_name, rule_set):
+    if scraping_method == "requests":
+        return scrape_with_requests(url)
+    if scraping_method == "bs4":
+        return scrape_with_bs4(url, clean=clean)
+    if scraping_method == "selenium":
+        return scrape_with_selenium(url, company_name, clean=clean)
+    if scraping_method == "extract":
+        return scrape_with_extract(url, rule_set)
+    if scraping_method == "auto":
+        return scrape_with_auto(url, clean=clean, company_name=company_name)
+    raise ValueError(f"Invalid scraping method: {scraping_method}")
+
+
+def is_scrape_error(scrape_result):
+    """
+    Checks whether a scrape function returned one of its error values instead of content.
+
+    Args:
+        scrape_result: The value returned by a scrape function.
+
+    Returns:
+        bool: True if the scrape failed.
+    """
+    # The Selenium error message is written with non-breaking spaces
+    return not isinstance(scrape_result, str) or scrape_result.startswith(
+        ("An error occurred", "An error\xa0occurred")
+    )
+
+
+def is_cleaned(scraping_method, clean):
+    """
+    Returns whether the results of a scraping method are cleaned text.
+
+    Args:
+        scraping_method (str): The scraping method.
+        clean (bool): The clean flag of the scrape, ignored by methods that do not clean.
+
+    Returns:
+        bool: True if the results are cleaned text, False if they are HTML or JSON.
+    """
+    return bool(clean) and scraping_method in CLEANING_METHODS
+
+
+def looks_cleaned(scrape_result):
+    """
+    Guesses whether a result of a cleaning method is cleaned text rather than HTML, for
+    history records stored before they recorded it (see History.cleaned).
+
+    Args:
+        scrape_result (str): The scrape result.
+
+    Returns:
+        bool: True if the result does not look like markup.
+    """
+    if scrape_result.startswith(BROWSER_TITLE_PREFIX):
+        # The title is followed by the prettified page or by its cleaned text
+        return _DOCUMENT_START.search(scrape_result) is None
+    return not scrape_result.lstrip().startswith("<")
@@ -0,0 +1,415 @@
+"""
+This module provides the full-text search over the scraping history.
+
+Searching the history used to mean downloading all of it with /history/export. Instead, every
+history record is indexed in the `history_search` SQLite FTS5 table when it is stored (see
+core/repository.py), in the same transaction, so the index never lags behind the history:
+- The rowid of an index row is the id of its History record. The indexed text is the URL and
+  the visible text of the scraped content: cleaned text as is, the text of HTML results, the
+  field values of extracted results and the pages of crawls, whitespace-collapsed and capped
+  at SEARCH_MAX_INDEX_CHARS characters. Whether a result is cleaned text is stored with its
+  record (History.cleaned), older records are told apart by their content.
+- The owner of the record is indexed as a token of its own column, so a search only walks the
+  posting lists of the user's records instead of filtering every match afterwards.
+- Results are ranked by BM25 (matches in the URL weigh SEARCH_URL_WEIGHT times more) and come
+  with a snippet of the text around the matches. Pages are keyset-paginated like /history:
+  the cursor is the id of the last record of the previous page, whose score is computed again
+  by the database, and the next page starts after that (score, id). Snippets are only made
+  for the records of the page.
+
+Records stored before the index existed are indexed with `python migrate.py`. The index needs
+SQLite with FTS5, with other databases search is unavailable.
+
+Search queries are words (all of them must match), "quoted phrases" and prefix* terms. They
+are rewritten into FTS5 syntax, so operators and punctuation in a query cannot cause errors.
+
+Functions:
+    create_search_index(): Creates the search index if it does not exist.
+    search_available(): Returns whether the database has a search index.
+    index_text(scrape_method, scrape_result, cleaned): Returns the text of a scrape result.
+    index_history_records(records): Adds stored History records to the search index.
+    index_missing_history(batch_size): Indexes the History records missing from the index.
+    search_history(current_user_id, query, limit, cursor): Searches the history of a user.
+Classes:
+    SearchUnavailable: Raised when the database has no search index.
+"""
+
+import html
+import json
+import re
+
+from sqlalchemy import bindparam, text
+
+from config import app, db
+from core.blobs import load_content
+from core.models import History
+from core.parse_pool import run_parse
+from core.scraper import CLEANING_METHODS, is_cleaned, looks_cleaned
+
+SEARCH_TABLE = "history_search"
+
+# Snippet highlight markers, replaced by <mark> tags after the snippet is HTML-escaped
+_MARK_START = "\x02"
+_MARK_END = "\x03"
+
+# Bare words and "quoted phrases" of a search query
+_QUERY_TERM = re.compile(r'"([^"]*)"|(\S+)')
+_WORD = re.compile(r"\w")
+
+# Terms of a query beyond this are ignored, every term is a posting list to intersect
+MAX_QUERY_TERMS = 16
+
+_available: dict = {}
+
+
+class SearchUnavailable(Exception):
+    """Raised when the database has no search index."""
+
+
+def create_search_index():
+    """
+    Creates the search index if it does not exist. Does nothing on databases other than
+    SQLite, or when SQLite was built without FTS5.
+    Must be called inside an application context.
+    """
+    _available.pop(str(db.engine.url), None)
+    if db.engine.dialect.name != "sqlite":
+        return
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(
+                text(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+                    "USING fts5(owner, url, content, "
+                    "tokenize = 'unicode61 remove_diacritics 2')"
+                )
+            )
+    except Exception as e:
+        print(f"History search is unavailable: {e}")
+
+
+def search_available():
+    """
+    Returns whether the database has a search index.
+    Must be called inside an application context.
+
+    Returns:
+        bool: True if the history_search table exists.
+    """
+    key = str(db.engine.url)
+    if key not in _available:
+        _available[key] = db.engine.dialect.name == "sqlite" and (
+            db.session.execute(
+                text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+                {"name": SEARCH_TABLE},
+            ).first()
+            is not None
+        )
+    return _available[key]
+
+
+def _owner_token(user_id):
+    return f"u{user_id}"
+
+
+def _json_strings(value):
+    """Yields the string values of a decoded JSON document."""
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _json_strings(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _json_strings(item)
+    elif value is not None:
+        yield str(value)
+
+
+def _is_text(scrape_method, scrape_result, cleaned):
+    """Returns whether a result is cleaned text, guessed for records that do not say."""
+    if cleaned is None:
+        return scrape_method in CLEANING_METHODS and looks_cleaned(scrape_result)
+    return cleaned
+
+
+def _result_text(scrape_method, scrape_result, cleaned):
+    """
+    Returns the visible text of a scrape result, before whitespace is collapsed.
+
+    Args:
+        scrape_method (str): The scraping method that produced the result.
+        scrape_result (str): The scrape result.
+        cleaned (bool): Whether the result is cleaned text, None if unknown.
+
+    Returns:
+        str: The text.
+    """
+    if scrape_method in ("extract", "crawl"):
+        try:
+            document = json.loads(scrape_result)
+        except ValueError:
+            return scrape_result
+        if scrape_method == "extract":
+            return " ".join(_json_strings(document))
+        # A crawl is indexed by the pages it fetched
+        if not isinstance(document, dict):
+            return ""
+        page_method = document.get("scraping_method")
+        page_cleaned = None
+        if "clean_data" in document:
+            page_cleaned = is_cleaned(page_method, document["clean_data"])
+        return " ".join(
+            _result_text(page_method, page["scrape_result"], page_cleaned)
+            for page in document.get("pages", [])
+            if isinstance(page.get("scrape_result"), str)
+        )
+    if _is_text(scrape_method, scrape_result, cleaned):
+        return scrape_result
+    # The visible text includes the title
+    return run_parse("text", scrape_result)[1]
+
+
+def index_text(scrape_method, scrape_result, cleaned=None):
+    """
+    Returns the text a scrape result is indexed by: the visible text of HTML results, cleaned
+    text as is, the field values of extracted results and the text of the pages of crawls.
+
+    Args:
+        scrape_method (str): The scraping method that produced the result.
+        scrape_result (str): The scrape result.
+        cleaned (bool): Whether the result is cleaned text (see core.scraper.is_cleaned()).
+            None if unknown, for records stored before History.cleaned existed: results of
+            the methods that clean are then guessed from their content.
+
+    Returns:
+        str: The text, whitespace-collapsed and capped at SEARCH_MAX_INDEX_CHARS characters.
+        Empty if the result could not be parsed.
+    """
+    try:
+        content = _result_text(scrape_method, scrape_result, cleaned)
+    except Exception as e:
+        # The record is still stored and found by its URL
+        print(f"Could not extract the text to index: {e}")
+        return ""
+    return " ".join(content.split())[: app.config["SEARCH_MAX_INDEX_CHARS"]]
+
+
+def index_history_records(records):
+    """
+    Adds History records to the search index, in the current transaction.
+    The records must have been flushed, so they have their id.
+
+    Args:
+        records (list): A list of (record, content) tuples, the History records and the text
+            they are indexed by (see index_text(), which is best called before the
+            transaction starts writing: a large page takes a while to parse).
+    """
+    if not records or not search_available():
+        return
+    db.session.execute(
+        text(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, owner, url, content) "
+            "VALUES (:id, :owner, :url, :content)"
+        ),
+        [
+            {
+                "id": record.id,
+                "owner": _owner_token(record.user_id),
+                "url": record.url,
+                "content": content,
+            }
+            for record, content in records
+        ],
+    )
+
+
+def index_missing_history(batch_size=100):
+    """
+    Indexes the History records stored before the search index existed.
+    Every batch is committed on its own, so the indexing can be interrupted and resumed.
+    Must be called inside an application context, after run_migrations().
+
+    Args:
+        batch_size (int): The number of records indexed per transaction.
+
+    Returns:
+        int: The number of indexed records.
+    """
+    if not search_available():
+        return 0
+    indexed = 0
+    last_id = 0
+    while True:
+        # A rowid lookup per record, the index is not scanned as a whole for every batch
+        record_ids = (
+            db.session.execute(
+                text(
+                    f"SELECT id FROM {History.__tablename__} WHERE id > :last_id "
+                    f"AND NOT EXISTS (SELECT 1 FROM {SEARCH_TABLE} "
+                    f"WHERE {SEARCH_TABLE}.rowid = {History.__tablename__}.id) "
+                    "ORDER BY id LIMIT :limit"
+                ),
+                {"last_id": last_id, "limit": batch_size},
+            )
+            .scalars()
+            .all()
+        )
+        records = (
+            History.query.filter(History.id.in_(record_ids)).order_by(History.id).all()
+        )
+        if not records:
+            return indexed
+        index_history_records(
+            [
+                (
+                    record,
+                    index_text(
+                        record.scrape_method, load_content(record), record.cleaned
+                    ),
+                )
+                for record in records
+            ]
+        )
+        db.session.commit()
+        last_id = records[-1].id
+        db.session.expunge_all()
+        indexed += len(records)
+        print(f"Indexed {indexed} history records for search")
+
+
+def build_match_query(current_user_id, query):
+    """
+    Rewrites a search query into an FTS5 query restricted to a user's records.
+    Every word and phrase is quoted, so FTS5 operators and punctuation are matched as text.
+
+    Args:
+        current_user_id (int): The ID of the user.
+        query (str): The search query: words, "quoted phrases" and prefix* terms.
+
+    Returns:
+        str: The FTS5 query, None if the query has no words.
+    """
+    terms = []
+    for phrase, word in _QUERY_TERM.findall(query):
+        prefix = False
+        if word:
+            prefix = word.endswith("*")
+            phrase = word.rstrip("*")
+        if not _WORD.search(phrase):
+            continue
+        term = '"' + phrase.replace('"', "") + '"'
+        terms.append(term + "*" if prefix else term)
+        if len(terms) == MAX_QUERY_TERMS:
+            break
+    if not terms:
+        return None
+    owner = _owner_token(current_user_id)
+    return f'owner : "{owner}" AND {{url content}} : ({" ".join(terms)})'
+
+
+def _format_snippet(snippet):
+    """HTML-escapes a snippet and turns its highlight markers into <mark> tags."""
+    return (
+        html.escape(snippet or "")
+        .replace(_MARK_START, "<mark>")
+        .replace(_MARK_END, "</mark>")
+    )
+
+
+def search_history(current_user_id, query, limit, cursor=None):
+    """
+    Searches the history of a user, best matches first.
+
+    Args:
+        current_user_id (int): The ID of the user.
+        query (str): The search query (see build_match_query()).
+        limit (int): The maximum number of results on the page.
+        cursor (int): The ID of the last record of the previous page, None for the first page.
+
+    Returns:
+        tuple: (hits, next_cursor). The hits are (record, snippet, score) tuples: a row with
+        the id, url, scrape_method and date columns of the record, the text around the
+        matches (HTML-escaped, matches in <mark> tags) and the relevance (higher is better).
+        next_cursor is None on the last page, and the page is empty if the cursor record no
+        longer matches the query.
+
+    Raises:
+        SearchUnavailable: If the database has no search index.
+    """
+    if not search_available():
+        raise SearchUnavailable("History search is not available on this database")
+    match = build_match_query(current_user_id, query)
+    if match is None:
+        return [], None
+
+    # bm25() is lower for better matches, ties are broken by id
+    rank = f"bm25({SEARCH_TABLE}, 0.0, :url_weight, 1.0)"
+    params = {
+        "url_weight": app.config["SEARCH_URL_WEIGHT"],
+        "match": match,
+        # One extra row tells whether there is a next page
+        "limit": limit + 1,
+    }
+    after = ""
+    if cursor is not None:
+        # The cursor's score is computed by the database itself, so it compares exactly
+        cursor_score = db.session.execute(
+            text(
+                f"SELECT {rank} FROM {SEARCH_TABLE} "
+                f"WHERE {SEARCH_TABLE} MATCH :match AND rowid = :cursor"
+            ),
+            dict(params, cursor=cursor),
+        ).scalar()
+        if cursor_score is None:
+            return [], None
+        after = "WHERE score > :score OR (score = :score AND id > :cursor)"
+        params.update(score=cursor_score, cursor=cursor)
+    rows = db.session.execute(
+        text(
+            f"SELECT id, score FROM (SELECT rowid AS id, {rank} AS score "
+            f"FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :match) {after} "
+            "ORDER BY score, id LIMIT :limit"
+        ),
+        params,
+    ).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1][0]
+    if not rows:
+        return [], None
+    record_ids = [row[0] for row in rows]
+
+    # The snippets and metadata of the page's records, the content is not loaded
+    snippets = dict(
+        db.session.execute(
+            text(
+                f"SELECT rowid, snippet({SEARCH_TABLE}, 2, :start, :end, '…', :tokens) "
+                f"FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :match "
+                "AND rowid IN :ids"
+            ).bindparams(bindparam("ids", expanding=True)),
+            {
+                "start": _MARK_START,
+                "end": _MARK_END,
+                "tokens": app.config["SEARCH_SNIPPET_TOKENS"],
+                "match": match,
+                "ids": record_ids,
+            },
+        ).all()
+    )
+    records = {
+        record.id: record
+        for record in db.session.query(
+            History.id, History.url, History.scrape_method, History.date
+        ).filter(
+            History.id.in_(record_ids),
+            History.user_id == current_user_id,
+        )
+    }
+    hits = [
+        (records[record_id], _format_snippet(snippets.get(record_id)), -score)
+        for record_id, score in rows
+        if record_id in records
+    ]
+    return hits, next_cursor
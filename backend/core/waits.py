@@ -0,0 +1,237 @@
+"""
+This module provides condition-based waits and declarative interaction scripts for Selenium.
+
+Instead of sleeping for a fixed time, every step of a browser interaction waits for a DOM
+condition (element present, element clickable, document ready, network idle, ...) and
+continues as soon as it holds. Each step has its own timeout.
+
+Site specific flows are described as interaction scripts: lists of step dictionaries that are
+executed in order by run_interaction_script(). A new site only needs a new script registered in
+INTERACTION_SCRIPTS, no new code.
+
+Supported steps:
+    {"action": "wait", "condition": "document_ready"}
+    {"action": "wait", "condition": "network_idle", "idle_ms": 500}
+    {"action": "wait", "condition": "element_present", "by": "css", "value": "#main"}
+    {"action": "wait", "condition": "element_visible", "by": "css", "value": "#main"}
+    {"action": "click", "by": "name", "value": "reject"}
+    {"action": "type", "by": "id", "value": "search", "text": "{company_name}", "submit": True}
+Every step also accepts:
+    "timeout" (float): Seconds to wait for the step's condition (capped at the time left to the
+        scrape, see core/deadlines.py).
+    "optional" (bool): Continue with the next step if the condition is not met in time.
+Action steps also accept:
+    "if_present" (bool): Skip the step right away if the element is not on the page.
+    "wait_for_navigation" (bool): Wait until the page the action triggers has loaded.
+
+Functions:
+    wait_for(driver, condition, timeout): Waits until a condition holds.
+    get_interaction_script(url): Returns the interaction script registered for a URL.
+    run_interaction_script(driver, steps, variables): Runs an interaction script.
+"""
+
+from urllib.parse import urlsplit
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+from config import app
+from core.deadlines import check_deadline, remaining_timeout
+
+LOCATORS = {
+    "id": By.ID,
+    "name": By.NAME,
+    "css": By.CSS_SELECTOR,
+    "xpath": By.XPATH,
+    "class": By.CLASS_NAME,
+    "tag": By.TAG_NAME,
+}
+
+# Resolves when the page is loaded and no resource finished loading for `idle_ms`
+_NETWORK_IDLE_SCRIPT = """
+if (document.readyState !== "complete") { return false; }
+const entries = performance.getEntriesByType("resource");
+const lastResponse = entries.reduce((last, entry) => Math.max(last, entry.responseEnd), 0);
+return performance.now() - lastResponse >= arguments[0];
+"""
+
+# Waits for the page to load and its resources to settle, used for sites without a script
+DEFAULT_SCRIPT = [
+    {"action": "wait", "condition": "document_ready"},
+    {"action": "wait", "condition": "network_idle", "timeout": 5, "optional": True},
+]
+
+# Rejects the cookie banner (only shown in some regions) and searches for the company
+YAHOO_SCRIPT = [
+    {"action": "wait", "condition": "document_ready"},
+    {
+        "action": "click",
+        "by": "name",
+        "value": "reject",
+        "if_present": True,
+        "wait_for_navigation": True,
+    },
+    {
+        "action": "type",
+        "by": "id",
+        "value": "ybar-sbq",
+        "text": "{company_name}",
+        "submit": True,
+        "wait_for_navigation": True,
+    },
+    {"action": "wait", "condition": "network_idle", "timeout": 5, "optional": True},
+]
+
+# Interaction scripts by host, a host also matches all of its subdomains
+INTERACTION_SCRIPTS = {
+    "yahoo.com": YAHOO_SCRIPT,
+}
+
+
+def document_ready(driver):
+    """Condition: the document has finished loading."""
+    return driver.execute_script("return document.readyState;") == "complete"
+
+
+def network_idle(idle_ms=500):
+    """
+    Condition factory: the document is loaded and no resource finished loading for `idle_ms`.
+    Requests that are still in flight are not visible to the page, so this is a heuristic.
+    """
+
+    def condition(driver):
+        return driver.execute_script(_NETWORK_IDLE_SCRIPT, idle_ms)
+
+    return condition
+
+
+def navigated(element, url_before):
+    """
+    Condition factory: the browser left the page of `element` (the element is detached)
+    or changed its URL (client side navigation).
+    """
+    element_detached = EC.staleness_of(element)
+
+    def condition(driver):
+        return driver.current_url != url_before or element_detached(driver)
+
+    return condition
+
+
+def _locator(step):
+    return (LOCATORS[step.get("by", "css")], step["value"])
+
+
+def _condition_for(step):
+    name = step["condition"]
+    if name == "document_ready":
+        return document_ready
+    if name == "network_idle":
+        return network_idle(step.get("idle_ms", 500))
+    if name == "element_present":
+        return EC.presence_of_element_located(_locator(step))
+    if name == "element_visible":
+        return EC.visibility_of_element_located(_locator(step))
+    if name == "element_clickable":
+        return EC.element_to_be_clickable(_locator(step))
+    raise ValueError(f"Unknown wait condition: {name}")
+
+
+def wait_for(driver, condition, timeout):
+    """
+    Waits until a condition holds.
+
+    Args:
+        driver: The WebDriver to poll.
+        condition (callable): Called with the driver, the wait ends once it returns a truthy value.
+        timeout (float): Maximum number of seconds to wait.
+
+    Returns:
+        The truthy value returned by the condition.
+
+    Raises:
+        TimeoutException: If the condition does not hold within the timeout.
+    """
+    poll_frequency = app.config["SELENIUM_POLL_INTERVAL"]
+    return WebDriverWait(driver, timeout, poll_frequency=poll_frequency).until(
+        condition
+    )
+
+
+def get_interaction_script(url):
+    """
+    Returns the interaction script registered for the host of a URL.
+
+    Args:
+        url (str): The URL that is scraped.
+
+    Returns:
+        list: The steps of the site's script, or DEFAULT_SCRIPT if none is registered.
+    """
+    host = (urlsplit(url).hostname or "").lower()
+    for script_host, steps in INTERACTION_SCRIPTS.items():
+        if host == script_host or host.endswith("." + script_host):
+            return steps
+    return DEFAULT_SCRIPT
+
+
+def _run_step(driver, step, variables, timeout):
+    action = step["action"]
+    if action == "wait":
+        wait_for(driver, _condition_for(step), timeout)
+        return
+
+    if step.get("if_present") and not driver.find_elements(*_locator(step)):
+        return
+
+    url_before = driver.current_url
+    if action == "click":
+        element = wait_for(driver, EC.element_to_be_clickable(_locator(step)), timeout)
+        element.click()
+    elif action == "type":
+        element = wait_for(driver, EC.element_to_be_clickable(_locator(step)), timeout)
+        if step.get("clear", True):
+            element.clear()
+        element.send_keys(step["text"].format(**variables))
+        if step.get("submit"):
+            element.send_keys(Keys.ENTER)
+    else:
+        raise ValueError(f"Unknown interaction step: {action}")
+
+    if step.get("wait_for_navigation"):
+        wait_for(driver, navigated(element, url_before), timeout)
+        wait_for(driver, document_ready, timeout)
+
+
+def run_interaction_script(driver, steps, variables=None):
+    """
+    Runs an interaction script on the page currently loaded in the driver.
+
+    Args:
+        driver: The WebDriver to interact with.
+        steps (list): The step dictionaries to execute in order.
+        variables (dict): Values substituted into the "text" of "type" steps.
+
+    Raises:
+        TimeoutException: If a required step does not complete within its timeout.
+        DeadlineExceeded: If the scrape passes its deadline during the script.
+        ScrapeCancelled: If the scrape is cancelled during the script.
+    """
+    variables = variables or {}
+    for step in steps:
+        timeout = remaining_timeout(
+            step.get("timeout", app.config["SELENIUM_STEP_TIMEOUT"])
+        )
+        try:
+            _run_step(driver, step, variables, timeout)
+        except TimeoutException:
+            # Optional steps are skipped, but not the rest of a scrape past its deadline
+            check_deadline()
+            if step.get("optional"):
+                continue
+            raise TimeoutException(
+                f"Interaction step timed out after {timeout}s: {step}"
+            )
@@ -0,0 +1,34 @@
+"""
+gunicorn settings of the API server.
+
+    gunicorn -c gunicorn.conf.py app:app
+    gunicorn -c gunicorn.conf.py --preload app:app
+
+Without --preload, every worker imports the application and loads the scraping engines
+(Selenium, requests, BeautifulSoup, lxml) on first use, so workers that only serve /login or
+/history stay small. With --preload, the application is imported once in the master and the
+engines are loaded there before the workers are forked (ENGINES_PRELOAD, or all engines when
+it is empty): the workers share their memory copy-on-write and never pay for the imports.
+
+Settings can be overridden on the command line or with the GUNICORN_* environment variables.
+"""
+
+import os
+
+bind = os.getenv("GUNICORN_BIND", "127.0.0.1:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+# Selenium scrapes can take a while
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+
+def when_ready(server):
+    """Loads the scraping engines in the master before the workers are forked."""
+    if not server.cfg.preload_app:
+        return
+    # Imported here, the application is only importable in the master with --preload
+    from config import app
+    from core.engines import preload_engines
+
+    loaded = preload_engines(app.config["ENGINES_PRELOAD"] or "all")
+    server.log.info("Preloaded scraping engines: %s", ", ".join(loaded))
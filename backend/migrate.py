@@ -0,0 +1,73 @@
+"""
+This module upgrades an existing database and reports the space used by scraped content.
+
+It adds missing columns and indexes, moves the content of History rows stored before the blob
+store into compressed, deduplicated blobs (see core/blobs.py), adds the History rows stored
+before the search index to it (see core/search.py) and prints how much space the blob store
+saves. SQLite only returns the freed pages to the file system with --vacuum.
+
+    python migrate.py
+    python migrate.py --report-only
+    python migrate.py --vacuum
+"""
+
+import argparse
+
+from sqlalchemy import text
+
+from config import app, db
+from core.blobs import storage_report
+from core.migrations import migrate_history_content, run_migrations
+from core.search import index_missing_history
+
+
+def _megabytes(size):
+    return f"{size / 2**20:.1f} MB"
+
+
+def print_report(report):
+    """Prints a storage report returned by core.blobs.storage_report()."""
+    print(f"History records:        {report['records']}")
+    print(f"Distinct contents:      {report['blobs']}")
+    print(f"Inline records left:    {report['inline_records']}")
+    print(f"Content size:           {_megabytes(report['logical_bytes'])}")
+    print(f"After deduplication:    {_megabytes(report['deduplicated_bytes'])}")
+    print(f"Stored size:            {_megabytes(report['stored_bytes'])}")
+    print(f"Space saved:            {_megabytes(report['saved_bytes'])}")
+    print(f"Deduplication ratio:    {report['dedup_ratio']:.2f}x")
+    print(f"Compression ratio:      {report['compression_ratio']:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upgrade the database.")
+    parser.add_argument(
+        "--report-only",
+        action="store_true",
+        help="Only upgrade the schema and print the storage report.",
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=100, help="History rows per transaction."
+    )
+    parser.add_argument(
+        "--vacuum",
+        action="store_true",
+        help="Rebuild the SQLite file afterwards to return the freed space.",
+    )
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        run_migrations()
+        if not args.report_only:
+            migrate_history_content(args.batch_size)
+            index_missing_history(args.batch_size)
+            if args.vacuum:
+                with db.engine.connect() as connection:
+                    connection.execution_options(isolation_level="AUTOCOMMIT").execute(
+                        text("VACUUM")
+                    )
+        print_report(storage_report())
+
+
+if __name__ == "__main__":
+    main()
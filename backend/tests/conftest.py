@@ -0,0 +1,74 @@
+"""
+Shared fixtures of the backend tests.
+
+The configuration is read from the environment when config.py is imported, so it is set here,
+before any test module imports the application: a throwaway SQLite database, history records
+stored synchronously, documents parsed inline and no job workers or browsers started.
+
+Run the tests from the backend directory:
+    python -m pytest -q
+"""
+
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+_directory = tempfile.mkdtemp(prefix="backend-tests-")
+os.environ.update(
+    DATABASE_URI=f"sqlite:///{os.path.join(_directory, 'test.db')}",
+    SECRET_KEY="test-secret-key-of-at-least-32-bytes",
+    HISTORY_WRITE_BEHIND="false",
+    PARSE_POOL_WORKERS="0",
+    JOB_WORKERS="0",
+    SELENIUM_POOL_PREWARM="false",
+    CACHE_ENABLED="false",
+)
+
+import jwt  # noqa: E402
+import pytest  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+from config import app, db  # noqa: E402
+from core.migrations import run_migrations  # noqa: E402
+from core.models import User  # noqa: E402
+from core.search import SEARCH_TABLE  # noqa: E402
+
+
+@pytest.fixture
+def database():
+    """Yields inside an application context, with empty tables created for the test."""
+    with app.app_context():
+        db.create_all()
+        run_migrations()
+        yield db
+        db.session.remove()
+        db.drop_all()
+        with db.engine.begin() as connection:
+            connection.execute(text(f"DROP TABLE IF EXISTS {SEARCH_TABLE}"))
+
+
+@pytest.fixture
+def user(database):
+    """A user owning the history records of a test."""
+    user = User(email="user@example.com", username="user", password="-")
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+@pytest.fixture
+def auth():
+    """Returns the Authorization header of a token of a user, expiring in expires_in seconds."""
+
+    def header(user_id, expires_in=60):
+        token = jwt.encode(
+            {
+                "user_id": user_id,
+                "exp": datetime.now(timezone.utc) + timedelta(seconds=expires_in),
+            },
+            app.config["SECRET_KEY"],
+            algorithm="HS256",
+        )
+        return {"Authorization": f"Bearer {token}"}
+
+    return header
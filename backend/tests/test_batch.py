@@ -0,0 +1,105 @@
+import threading
+import time
+import pytest
+
+from app import app as flask_app
+from config import app
+from core import batch
+from core.models import History
+
+
+class FakeScraper:
+    """Stands in for run_scraper, recording how many scrapes of a host run at once."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.running = {}
+        self.peak = {}
+        self.finished = []
+        self.lock = threading.Lock()
+
+    def __call__(self, url, scraping_method, **kwargs):
+        host = url.split("/")[2]
+        with self.lock:
+            self.running[host] = self.running.get(host, 0) + 1
+            self.peak[host] = max(self.peak.get(host, 0), self.running[host])
+        time.sleep(self.seconds.get(host, 0))
+        with self.lock:
+            self.running[host] -= 1
+            self.finished.append(url)
+        if url.endswith("/missing"):
+            return "An error occurred: 404 Not Found"
+        return f"Page {url}"
+
+
+@pytest.fixture
+def scraper(monkeypatch):
+    monkeypatch.setitem(app.config, "BATCH_MAX_WORKERS", 4)
+    monkeypatch.setitem(app.config, "BATCH_PER_HOST_CONCURRENCY", 2)
+    # A pool of its own, sized by the configuration above
+    monkeypatch.setattr(batch, "_executor", None)
+    fake = FakeScraper({"slow.example.com": 0.05})
+    monkeypatch.setattr(batch, "run_scraper", fake)
+    yield fake
+    batch._get_executor().shutdown(wait=True)
+
+
+def items(host, count):
+    return [
+        {"url": f"https://{host}/{index}", "scraping_method": "bs4"}
+        for index in range(count)
+    ]
+
+
+def test_results_keep_the_order_of_the_items(scraper):
+    requested = items("slow.example.com", 3) + [
+        {"url": "https://fast.example.com/missing", "scraping_method": "bs4"},
+        {"url": "https://fast.example.com/1", "scraping_method": "unknown"},
+    ]
+    results = batch.scrape_batch(requested)
+    assert [result["url"] for result in results] == [item["url"] for item in requested]
+    assert [result["status"] for result in results] == [1, 1, 1, 2, 2]
+    assert results[0]["scrape_result"] == "Page https://slow.example.com/0"
+    assert results[4]["error"] == "Invalid scraping method"
+
+
+def test_items_of_a_host_wait_outside_the_pool(scraper):
+    results = batch.scrape_batch(
+        items("slow.example.com", 8) + items("fast.example.com", 2)
+    )
+    assert all(result["status"] == 1 for result in results)
+    assert scraper.peak["slow.example.com"] == 2
+    # The queued items of the slow host did not hold the pool threads the fast host used
+    fast_done = max(
+        scraper.finished.index(f"https://fast.example.com/{index}") for index in (0, 1)
+    )
+    assert fast_done < scraper.finished.index("https://slow.example.com/7")
+    # Every host slot was released
+    assert batch._host_running == {}
+    assert batch._host_pending == {}
+
+
+def test_batch_route_stores_successful_results(scraper, user, auth):
+    response = flask_app.test_client().post(
+        "/scrape/batch",
+        json={"items": items("fast.example.com", 2)},
+        headers=auth(user.id),
+    )
+    assert response.status_code == 200
+    assert History.query.count() == 2
+
+
+@pytest.mark.parametrize(
+    "authorization", ["Bearer not-a-token", "Token abc", "Bearer expired"]
+)
+def test_batch_route_refuses_bad_tokens(scraper, user, auth, authorization):
+    if authorization == "Bearer expired":
+        authorization = auth(user.id, expires_in=-60)["Authorization"]
+    response = flask_app.test_client().post(
+        "/scrape/batch",
+        json={"items": items("fast.example.com", 2)},
+        headers={"Authorization": authorization},
+    )
+    assert response.status_code == 401
+    # Nothing was scraped for a request that is refused
+    assert scraper.finished == []
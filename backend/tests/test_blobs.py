@@ -0,0 +1,75 @@
+import pytest
+
+from config import app, db
+from core import blobs
+from core.blobs import compress, decompress, load_content, storage_report
+from core.migrations import migrate_history_content
+from core.models import ContentBlob, History
+from core.repository import store_user_history_bulk
+
+PAGE = "<html><body>" + "<p>Blue widgets cost 12 dollars.</p>" * 200 + "</body></html>"
+
+
+def test_identical_contents_share_one_blob(user):
+    store_user_history_bulk(
+        [
+            ("https://example.com/a", "requests", PAGE, False),
+            ("https://example.com/a", "requests", PAGE, False),
+            ("https://example.com/b", "requests", PAGE + " ", False),
+        ],
+        user.id,
+    )
+    assert History.query.count() == 3
+    assert ContentBlob.query.count() == 2
+    first, second, third = History.query.order_by(History.id).all()
+    assert first.content_hash == second.content_hash != third.content_hash
+    assert [load_content(record) for record in (first, third)] == [PAGE, PAGE + " "]
+
+
+def test_storage_report_counts_the_savings(user):
+    store_user_history_bulk(
+        [("https://example.com", "requests", PAGE, False)] * 4, user.id
+    )
+    report = storage_report()
+    size = len(PAGE.encode("utf-8"))
+    assert report["records"] == 4
+    assert report["blobs"] == 1
+    assert report["logical_bytes"] == 4 * size
+    assert report["deduplicated_bytes"] == size
+    assert report["dedup_ratio"] == 4.0
+    assert report["stored_bytes"] < size
+    assert report["saved_bytes"] == report["logical_bytes"] - report["stored_bytes"]
+
+
+@pytest.mark.parametrize("codec", ["zlib", "none", "zstd"])
+def test_blobs_of_every_codec_are_read_back(monkeypatch, codec):
+    if codec == "zstd" and blobs.zstandard is None:
+        pytest.skip("zstandard is not installed")
+    monkeypatch.setitem(app.config, "BLOB_COMPRESSION", codec)
+    stored_codec, data = compress(PAGE)
+    assert stored_codec == codec
+    assert decompress(stored_codec, data) == PAGE
+    if codec != "none":
+        assert len(data) < len(PAGE) / 10
+
+
+def test_inline_history_content_is_migrated_to_blobs(user):
+    for index in range(3):
+        db.session.add(
+            History(
+                url=f"https://example.com/{index}",
+                scrape_method="requests",
+                scraped_data=PAGE,
+                user_id=user.id,
+            )
+        )
+    db.session.commit()
+    assert storage_report()["inline_records"] == 3
+
+    assert migrate_history_content(batch_size=2) == 3
+    db.session.expire_all()
+    records = History.query.all()
+    assert all(record.scraped_data == "" for record in records)
+    assert {record.content_hash for record in records} == {blobs.content_hash(PAGE)}
+    assert all(load_content(record) == PAGE for record in records)
+    assert storage_report()["inline_records"] == 0
@@ -0,0 +1,121 @@
+import time
+
+import pytest
+
+from core.browser_pool import DriverPool, DriverPoolTimeout
+from core.deadlines import ScrapeCancelled, deadline_scope
+
+
+class FakeDriver:
+    """The WebDriver methods used by the pool, without a browser."""
+
+    def __init__(self):
+        self.quit_calls = 0
+        self.page_load_timeout = None
+        self.url = None
+        self.fail_reset = False
+
+    def set_page_load_timeout(self, seconds):
+        self.page_load_timeout = seconds
+
+    def execute_script(self, script):
+        return None
+
+    def delete_all_cookies(self):
+        if self.fail_reset:
+            raise RuntimeError("The browser is gone")
+
+    def get(self, url):
+        self.url = url
+
+    def quit(self):
+        self.quit_calls += 1
+
+
+def make_pool(**kwargs):
+    drivers = []
+
+    def factory():
+        drivers.append(FakeDriver())
+        return drivers[-1]
+
+    kwargs.setdefault("checkout_timeout", 0.2)
+    return DriverPool(factory, **kwargs), drivers
+
+
+def test_driver_is_reused_and_reset():
+    pool, drivers = make_pool(size=2)
+    with pool.driver() as first:
+        first.url = "https://example.com"
+    with pool.driver() as second:
+        assert second is first
+        # The driver came back with a blank page
+        assert second.url == "about:blank"
+    assert len(drivers) == 1
+    assert pool.stats["checkouts"] == 2
+    assert pool.stats["created"] == 1
+
+
+def test_driver_returns_to_pool_when_block_raises():
+    pool, drivers = make_pool(size=1)
+    with pytest.raises(ValueError):
+        with pool.driver():
+            raise ValueError("Scrape failed")
+    # The only driver is available again instead of being leaked
+    with pool.driver() as driver:
+        assert driver is drivers[0]
+    assert drivers[0].quit_calls == 0
+
+
+def test_checkout_times_out_when_pool_is_exhausted():
+    pool, _ = make_pool(size=1)
+    with pool.driver():
+        with pytest.raises(DriverPoolTimeout):
+            with pool.driver():
+                pass
+
+
+def test_driver_is_recycled_after_max_uses():
+    pool, drivers = make_pool(size=1, max_uses=2)
+    for _ in range(3):
+        with pool.driver():
+            pass
+    assert len(drivers) == 2
+    assert drivers[0].quit_calls == 1
+    assert drivers[1].quit_calls == 0
+    assert pool.stats["recycled"] == 1
+
+
+def test_driver_failing_reset_is_recycled():
+    pool, drivers = make_pool(size=1)
+    with pool.driver() as driver:
+        driver.fail_reset = True
+    with pool.driver() as driver:
+        assert driver is drivers[1]
+    assert drivers[0].quit_calls == 1
+    assert pool.stats["reset_failures"] == 1
+
+
+def test_driver_of_cancelled_scrape_is_quit():
+    pool, drivers = make_pool(size=1)
+    with pytest.raises(ScrapeCancelled):
+        with deadline_scope(30) as deadline:
+            with pool.driver():
+                deadline.cancel()
+                # The command the scrape was blocked on fails once the driver is quit
+                raise RuntimeError("Connection refused")
+    # The driver is quit in the background
+    for _ in range(100):
+        if drivers[0].quit_calls:
+            break
+        time.sleep(0.01)
+    assert drivers[0].quit_calls == 1
+    with pool.driver() as driver:
+        assert driver is drivers[1]
+
+
+def test_close_quits_idle_drivers():
+    pool, drivers = make_pool(size=2)
+    pool.warm()
+    pool.close()
+    assert [driver.quit_calls for driver in drivers] == [1, 1]
@@ -0,0 +1,100 @@
+import time
+
+import pytest
+from flask import g
+
+from benchmarks.fixture_server import FixtureServer
+from config import app
+from core import cache as cache_module
+from core.cache import CacheEntry, ContentCache, _response_ttl, cache_key
+from core.scraper import run_scraper
+
+
+@pytest.fixture
+def ttl_config(monkeypatch):
+    monkeypatch.setitem(app.config, "CACHE_DEFAULT_TTL", 300)
+    monkeypatch.setitem(app.config, "CACHE_MAX_TTL", 3600)
+
+
+@pytest.mark.parametrize(
+    "headers, ttl",
+    [
+        ({}, 300),
+        ({"Cache-Control": "public, max-age=60"}, 60),
+        ({"Cache-Control": "max-age=60, s-maxage=120"}, 120),
+        ({"Cache-Control": "max-age=999999"}, 3600),
+        ({"Cache-Control": "no-cache"}, 0),
+        ({"Cache-Control": "no-store"}, None),
+        ({"Cache-Control": "private, max-age=60"}, None),
+        ({"Expires": "Thu, 01 Jan 1970 00:00:00 GMT"}, 0),
+    ],
+)
+def test_response_ttl(ttl_config, headers, ttl):
+    assert _response_ttl(headers) == ttl
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ContentCache(memory_bytes=12)
+    cache.put("a", CacheEntry("aaaa"))
+    cache.put("b", CacheEntry("bbbb"))
+    cache.put("c", CacheEntry("cccc"))
+    # Reading "a" makes "b" the least recently used entry
+    assert cache.get("a").result == "aaaa"
+    cache.put("d", CacheEntry("dddd"))
+    assert cache.get("b") is None
+    assert [cache.get(key).result for key in "acd"] == ["aaaa", "cccc", "dddd"]
+    # An entry larger than the whole budget is not kept
+    cache.put("e", CacheEntry("e" * 13))
+    assert cache.get("e") is None
+
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    entry = CacheEntry(
+        "Page", etag='"v1"', expires_at=time.time() + 60, final_url="https://a/"
+    )
+    ContentCache(1024, disk_dir=str(tmp_path), disk_bytes=1024).put("key", entry)
+    cached = ContentCache(1024, disk_dir=str(tmp_path), disk_bytes=1024).get("key")
+    assert cached.result == "Page"
+    assert cached.etag == '"v1"'
+    assert cached.final_url == "https://a/"
+    assert cached.is_fresh()
+    assert cached.conditional_headers() == {"If-None-Match": '"v1"'}
+
+
+def test_disk_tier_is_pruned_to_its_budget(tmp_path):
+    cache = ContentCache(0, disk_dir=str(tmp_path), disk_bytes=300)
+    for index in range(5):
+        cache.put(f"key{index}", CacheEntry("x" * 100))
+    assert sum(path.stat().st_size for path in tmp_path.iterdir()) <= 300
+    assert cache.get("key4") is not None
+
+
+@pytest.fixture
+def content_cache(monkeypatch):
+    monkeypatch.setitem(app.config, "CACHE_ENABLED", True)
+    monkeypatch.setitem(app.config, "POLITENESS_ENABLED", False)
+    cache = ContentCache(2**20)
+    monkeypatch.setattr(cache_module, "_cache", cache)
+    return cache
+
+
+def scrape(url):
+    with app.app_context():
+        result = run_scraper(url, "bs4", clean=True)
+        return result, g.cache_status
+
+
+def test_stale_entry_is_revalidated_with_its_etag(content_cache, monkeypatch):
+    monkeypatch.setitem(app.config, "CACHE_DEFAULT_TTL", 60)
+    with FixtureServer() as server:
+        url = server.url("/synthetic/5000.html")
+        result, status = scrape(url)
+        assert status == "miss"
+        assert scrape(url) == (result, "hit")
+
+        # Once stale, a 304 answer refreshes the entry without downloading the page
+        entry = content_cache.get(cache_key(url, "bs4", True))
+        entry.expires_at = 0
+        assert scrape(url) == (result, "revalidated")
+        assert content_cache.get(cache_key(url, "bs4", True)).is_fresh()
+    assert content_cache.stats == {"hit": 1, "miss": 1, "revalidated": 1}
@@ -0,0 +1,149 @@
+from config import app
+from core import history_writer
+from core.changes import detect_change, hamming_distance, simhash
+from core.history_writer import HistoryWriter, save_user_history
+from core.models import ContentFingerprint, History
+from core.scraper import BROWSER_TITLE_PREFIX, looks_cleaned
+
+URL = "https://example.com/prices"
+PAGE = "\n".join(
+    ["Widget prices", "Blue widgets cost 12 dollars.", "Red widgets cost 15 dollars."]
+    + [f"Widget model {index} ships in {index + 2} days." for index in range(20)]
+    + ["Green widgets are sold out."]
+)
+
+
+def scrape(user_id, content):
+    """Detects the change of a cleaned bs4 result and stores it like /scrape does."""
+    change, fingerprint = detect_change(user_id, URL, "bs4", content, clean=True)
+    if change["change"] != "not_modified":
+        save_user_history(URL, "bs4", content, user_id, fingerprint, cleaned=True)
+    return change, fingerprint
+
+
+def html_page(nonce, price=12):
+    return (
+        f"<html><head><title>Widgets</title><script nonce='{nonce}'>track()</script>"
+        f"</head><body><p>Blue widgets cost {price} dollars.</p></body></html>"
+    )
+
+
+def test_first_scrape_is_new(user):
+    change, fingerprint = scrape(user.id, PAGE)
+    assert change["change"] == "new"
+    assert change["similarity"] is None
+    assert set(fingerprint) == {"text_hash", "simhash"}
+
+
+def test_unchanged_rescrape_is_not_modified(user):
+    scrape(user.id, PAGE)
+    # Whitespace does not count as a change
+    change, fingerprint = scrape(user.id, PAGE.replace(" ", "  "))
+    assert change["change"] == "not_modified"
+    assert change["similarity"] == 1.0
+    assert fingerprint is None
+
+
+def test_modified_rescrape_returns_diff(user):
+    scrape(user.id, PAGE)
+    change, fingerprint = scrape(user.id, PAGE.replace("12 dollars", "10 dollars"))
+    assert change["change"] == "modified"
+    assert "-Blue widgets cost 12 dollars." in change["diff"]
+    assert "+Blue widgets cost 10 dollars." in change["diff"]
+    assert change["added"] == 1 and change["removed"] == 1
+    # Near-identical texts have (almost) the same simhash
+    assert change["similarity"] > 0.8
+
+
+def test_fingerprint_is_stored_with_the_record(user):
+    scrape(user.id, PAGE)
+    modified = PAGE + " New blue widgets arrive soon."
+    _, fingerprint = scrape(user.id, modified)
+    row = ContentFingerprint.query.filter_by(user_id=user.id, url=URL).one()
+    assert row.text_hash == fingerprint["text_hash"]
+    assert scrape(user.id, modified)[0]["change"] == "not_modified"
+
+
+def test_baseline_is_latest_record_even_without_fingerprint(user):
+    scrape(user.id, PAGE)
+    # Stored without change detection, the fingerprint row still describes PAGE
+    changed = PAGE.replace("sold out", "back in stock")
+    save_user_history(URL, "bs4", changed, user.id)
+    assert scrape(user.id, changed)[0]["change"] == "not_modified"
+    assert scrape(user.id, PAGE)[0]["change"] == "modified"
+
+
+def test_other_users_and_methods_have_their_own_baseline(user, database):
+    from core.models import User
+
+    other = User(email="other@example.com", username="other", password="-")
+    database.session.add(other)
+    database.session.commit()
+    scrape(user.id, PAGE)
+    assert scrape(other.id, PAGE)[0]["change"] == "new"
+    change, _ = detect_change(user.id, URL, "requests", PAGE, clean=True)
+    assert change["change"] == "new"
+
+
+def test_simhash_of_similar_texts_is_close():
+    first = simhash(PAGE)
+    assert hamming_distance(first, simhash(PAGE)) == 0
+    close = hamming_distance(first, simhash(PAGE.replace("15", "16")))
+    far = hamming_distance(
+        first, simhash("Completely unrelated text about the weather")
+    )
+    assert close < far
+
+
+def test_requests_results_are_compared_as_html_whatever_the_clean_flag(user):
+    # "requests" ignores clean_data, its results are HTML
+    save_user_history(URL, "requests", html_page("a1"), user.id, cleaned=False)
+    change, _ = detect_change(user.id, URL, "requests", html_page("b2"), clean=True)
+    assert change["change"] == "not_modified"
+    change, _ = detect_change(user.id, URL, "requests", html_page("c3", 10), clean=True)
+    assert change["change"] == "modified"
+
+
+def test_uncleaned_browser_record_without_flag_is_compared_as_html(user):
+    content = BROWSER_TITLE_PREFIX + "Widgets" + html_page("a1")
+    # Stored before History.cleaned existed
+    save_user_history(URL, "selenium", content, user.id)
+    assert History.query.one().cleaned is None
+    rescraped = BROWSER_TITLE_PREFIX + "Widgets" + html_page("b2")
+    change, _ = detect_change(user.id, URL, "selenium", rescraped, clean=False)
+    assert change["change"] == "not_modified"
+
+
+def test_looks_cleaned():
+    assert looks_cleaned("### Widgets\n- Blue widgets cost 12 dollars.")
+    assert not looks_cleaned("  <!DOCTYPE html><html></html>")
+    assert looks_cleaned(BROWSER_TITLE_PREFIX + "Widgets### Widgets\n- Blue widgets")
+    assert not looks_cleaned(
+        BROWSER_TITLE_PREFIX + "Widgets<html>\n <body></body></html>"
+    )
+
+
+def test_buffered_record_is_the_baseline_without_flushing(user, monkeypatch):
+    # A writer whose flusher is not running, its records stay buffered
+    writer = HistoryWriter()
+    monkeypatch.setattr(history_writer, "_writer", writer)
+    monkeypatch.setitem(app.config, "HISTORY_WRITE_BEHIND", True)
+
+    _, fingerprint = scrape(user.id, PAGE)
+    assert writer._queue.qsize() == 1
+    change, _ = detect_change(user.id, URL, "bs4", PAGE, clean=True)
+    assert change["change"] == "not_modified"
+    change, _ = detect_change(user.id, URL, "bs4", PAGE + " Sale!", clean=True)
+    assert change["change"] == "modified"
+    assert change["diff"] is not None
+    # Nothing was stored meanwhile
+    assert writer._queue.qsize() == 1
+    assert History.query.count() == 0
+
+    # Once stored, the record is no longer pending and is read from the database
+    record = writer._queue.get_nowait()
+    writer._write([record])
+    writer._forget([record])
+    assert history_writer.pending_history_record(user.id, URL, "bs4") is None
+    change, _ = detect_change(user.id, URL, "bs4", PAGE, clean=True)
+    assert change["change"] == "not_modified"
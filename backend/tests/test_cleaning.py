@@ -0,0 +1,54 @@
+import pytest
+
+from benchmarks.bench_clean_text import legacy_clean_text
+from benchmarks.pages import synthetic_page
+from core import cleaning
+from core.scraper import clean_text, stream_clean_text
+
+PAGES = {
+    "article": (
+        "<!DOCTYPE html><html><head><title> Widgets &amp; more </title>"
+        "<meta charset='utf-8'><link rel='stylesheet' href='a.css'>"
+        "<style>p { color: red }</style></head><body>"
+        "<h1>Blue\n  widgets</h1><p>Cost <b>12</b>&nbsp;dollars.</p>"
+        "<script>track('visit')</script>"
+        "<form><input name='q'><button>Search</button></form>"
+        "<noscript>Enable JavaScript</noscript><p>Tail &lt;text&gt;</p>"
+        "</body></html>"
+    ),
+    "no title": "<html><body><div>Just<br>text</div></body></html>",
+    "empty title": "<html><head><title></title></head><body>Text</body></html>",
+    "fragment": "<p>First</p>loose text<p>Second</p>",
+    "svg and iframe": (
+        "<body>Before<svg><text>Chart</text></svg>"
+        "<iframe src='x'>Frame</iframe>After</body>"
+    ),
+    "synthetic": synthetic_page(50_000, seed=7),
+}
+
+
+def chunked(html_content, size=7):
+    for start in range(0, len(html_content), size):
+        end = start + size
+        yield html_content[start:end]
+
+
+@pytest.mark.parametrize("name", PAGES)
+def test_clean_text_matches_the_legacy_output(name):
+    expected = legacy_clean_text(PAGES[name])
+    assert clean_text(PAGES[name]) == expected
+    assert stream_clean_text(chunked(PAGES[name])) == expected
+
+
+@pytest.mark.parametrize("name", PAGES)
+def test_standard_library_engine_matches_the_legacy_output(name):
+    title, text = cleaning._extract_with_html_parser(PAGES[name])
+    assert cleaning.format_clean_text(title, text) == legacy_clean_text(PAGES[name])
+
+
+def test_streaming_without_lxml_matches(monkeypatch):
+    monkeypatch.setattr(cleaning, "_lxml", lambda: None)
+    for html_content in PAGES.values():
+        assert stream_clean_text(chunked(html_content)) == legacy_clean_text(
+            html_content
+        )
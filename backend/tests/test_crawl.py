@@ -0,0 +1,133 @@
+import pytest
+from flask import g
+
+from config import app
+from core import crawl as crawl_module
+from core.crawl import Frontier, SeenUrls, crawl, validate_crawl_request
+from core.deadlines import deadline_scope
+from core.links import normalize_url
+
+
+def test_seen_urls_deduplicates_in_set():
+    seen = SeenUrls(bloom_threshold=100, error_rate=0.01)
+    assert seen.add("https://example.com/a")
+    assert not seen.add("https://example.com/a")
+    assert seen.add("https://example.com/b")
+    assert len(seen) == 2
+    assert not seen.uses_bloom
+
+
+def test_seen_urls_keeps_urls_seen_before_switching_to_bloom():
+    seen = SeenUrls(bloom_threshold=50, error_rate=0.001)
+    urls = [f"https://example.com/page/{index}" for index in range(1000)]
+    assert all(seen.add(url) for url in urls[:50])
+    assert seen.uses_bloom
+    new = sum(seen.add(url) for url in urls[50:])
+    # Bloom filters may rarely report a new URL as seen, never the other way around
+    assert new >= 990 - 50
+    assert not any(seen.add(url) for url in urls)
+    assert len(seen) == 50 + new
+
+
+def test_spellings_of_a_url_are_deduplicated():
+    seen = SeenUrls(bloom_threshold=100, error_rate=0.01)
+    assert seen.add(normalize_url("HTTPS://Example.com:443/a/./b/../c?y=2&x=1#top"))
+    assert not seen.add(normalize_url("https://example.com/a/c?x=1&y=2"))
+    assert not seen.add(
+        normalize_url("c?utm_source=feed&x=1&y=2", "https://example.com/a/")
+    )
+
+
+def test_frontier_pops_shallow_pages_first_and_queries_last():
+    frontier = Frontier(max_size=10)
+    frontier.push("https://example.com/deep/page", 2)
+    frontier.push("https://example.com/search?q=x", 1)
+    frontier.push("https://example.com/a/b", 1)
+    frontier.push("https://example.com/a", 1)
+    assert [frontier.pop()[0] for _ in range(len(frontier))] == [
+        "https://example.com/a",
+        "https://example.com/a/b",
+        "https://example.com/search?q=x",
+        "https://example.com/deep/page",
+    ]
+
+
+def test_frontier_keeps_discovery_order_and_drops_beyond_max_size():
+    frontier = Frontier(max_size=2)
+    assert frontier.push("https://example.com/first", 1)
+    assert frontier.push("https://example.com/second", 1)
+    assert not frontier.push("https://example.com/third", 1)
+    assert frontier.pop() == ("https://example.com/first", 1)
+    assert frontier.pop() == ("https://example.com/second", 1)
+
+
+class FakeSite:
+    """Stands in for run_scraper, serving pages of example.com and following redirects."""
+
+    def __init__(self, pages, redirects=None):
+        self.pages = pages
+        self.redirects = redirects or {}
+        self.fetched = []
+        self.on_fetch = None
+
+    def __call__(self, url, scraping_method, **kwargs):
+        self.fetched.append(url)
+        if self.on_fetch is not None:
+            self.on_fetch(url)
+        final_url = self.redirects.get(url, url)
+        g.final_url = final_url
+        links = "".join(f'<a href="{href}">link</a>' for href in self.pages[final_url])
+        return f"<html><body><p>Page {final_url}</p>{links}</body></html>"
+
+
+@pytest.fixture
+def site(monkeypatch):
+    monkeypatch.setitem(app.config, "ROBOTS_ENABLED", False)
+    monkeypatch.setitem(app.config, "CRAWL_CONCURRENCY", 1)
+    fake = FakeSite({})
+    monkeypatch.setattr(crawl_module, "run_scraper", fake)
+    return fake
+
+
+def run_crawl(**data):
+    options, error = validate_crawl_request(dict(data, scraping_method="requests"))
+    assert error is None
+    with app.app_context():
+        return crawl(options)
+
+
+def test_links_are_resolved_against_the_url_after_redirects(site):
+    site.redirects = {"https://example.com/old": "https://example.com/docs/"}
+    site.pages = {
+        "https://example.com/docs/": ["intro", "../about"],
+        "https://example.com/docs/intro": [],
+        "https://example.com/about": [],
+    }
+    result = run_crawl(url="https://example.com/old", max_depth=1)
+    assert {page["url"] for page in result["pages"]} == {
+        "https://example.com/old",
+        "https://example.com/docs/intro",
+        "https://example.com/about",
+    }
+    assert all(page["status"] == 1 for page in result["pages"])
+
+
+def test_cancelled_crawl_keeps_the_pages_done(site):
+    site.pages = {
+        "https://example.com/": ["a", "b"],
+        "https://example.com/a": [],
+        "https://example.com/b": [],
+    }
+    with deadline_scope(30) as deadline:
+
+        def cancel_on_a(url):
+            if url == "https://example.com/a":
+                deadline.cancel()
+
+        site.on_fetch = cancel_on_a
+        result = run_crawl(url="https://example.com/", max_depth=1)
+    assert result["stats"]["cancelled"]
+    assert "https://example.com/b" not in site.fetched
+    # The seed was done before the crawl was cancelled
+    assert result["pages"][0]["url"] == "https://example.com/"
+    assert result["pages"][0]["status"] == 1
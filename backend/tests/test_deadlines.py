@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+
+from config import app
+from core.deadlines import (
+    DeadlineExceeded,
+    ScrapeCancelled,
+    check_deadline,
+    current_deadline,
+    deadline_scope,
+    on_expire,
+    remaining_timeout,
+    validate_timeout,
+)
+
+
+def test_no_deadline_outside_of_a_scope():
+    assert current_deadline() is None
+    assert remaining_timeout(5) == 5
+    check_deadline()
+
+
+def test_nested_deadline_expires_with_its_parent():
+    with deadline_scope(0.5) as outer:
+        with deadline_scope(60) as inner:
+            assert inner.parent is outer
+            assert current_deadline() is inner
+            # The parent's expiry comes first
+            assert inner.expires_at == outer.expires_at
+            assert remaining_timeout(60) <= 0.5
+        with deadline_scope(0.1) as shorter:
+            assert shorter.expires_at < outer.expires_at
+        assert current_deadline() is outer
+        with deadline_scope() as unbounded:
+            assert unbounded.expires_at == outer.expires_at
+    assert current_deadline() is None
+
+
+def test_expired_deadline_raises_and_runs_its_callbacks():
+    fired = threading.Event()
+    with pytest.raises(DeadlineExceeded):
+        with deadline_scope(0.05):
+            with on_expire(fired.set):
+                # The watchdog runs the callback while the stage is blocked
+                assert fired.wait(2)
+            check_deadline()
+    with deadline_scope(0.05) as deadline:
+        time.sleep(0.06)
+        assert deadline.expired
+        assert "0.05s deadline" in str(deadline.error())
+        with pytest.raises(DeadlineExceeded):
+            remaining_timeout(5)
+
+
+def test_cancelling_a_parent_cancels_nested_deadlines():
+    fired = []
+    with deadline_scope(60) as outer:
+        # A thread's deadline has the deadline of the thread that started it as parent
+        with deadline_scope(30, parent=outer) as inner:
+            with on_expire(lambda: fired.append("inner")):
+                outer.cancel()
+                assert fired == ["inner"]
+                assert inner.cancelled
+                with pytest.raises(ScrapeCancelled):
+                    check_deadline()
+
+
+def test_callbacks_do_not_run_after_the_stage_ended():
+    fired = []
+    with deadline_scope(0.05):
+        with on_expire(lambda: fired.append(True)):
+            pass
+        time.sleep(0.1)
+    assert fired == []
+
+
+def test_closed_scope_is_removed_from_its_parent():
+    with deadline_scope(60) as outer:
+        with deadline_scope(30):
+            pass
+        assert outer._callbacks == {}
+
+
+@pytest.mark.parametrize(
+    "value, seconds",
+    [(None, "default"), (5, 5.0), (2.5, 2.5), (0, None), (10**6, None), ("5", None)],
+)
+def test_validate_timeout(monkeypatch, value, seconds):
+    monkeypatch.setitem(app.config, "SCRAPE_MIN_TIMEOUT", 1)
+    monkeypatch.setitem(app.config, "SCRAPE_MAX_TIMEOUT", 120)
+    timeout, error = validate_timeout(value)
+    if seconds is None:
+        assert timeout is None and error
+    else:
+        expected = app.config["SCRAPE_DEFAULT_TIMEOUT"] if value is None else seconds
+        assert (timeout, error) == (expected, None)
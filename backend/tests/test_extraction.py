@@ -0,0 +1,93 @@
+import json
+import os
+
+import pytest
+
+from config import app
+from core.extraction import RuleSet, RuleSetError, extract_fields, get_rule_set
+from core.extraction import list_rule_sets
+
+PAGE = """<!DOCTYPE html>
+<html lang="en"><head>
+<title>Blue   widgets</title>
+<meta name="description" content="All about  widgets">
+<meta property="og:image" content="https://cdn.example.com/w.png">
+<link rel="canonical" href="/widgets">
+</head><body>
+<h1>Widgets</h1><h2>Blue</h2><h2>Red</h2>
+<a href="/blue">Blue</a> <a href="https://other.example.com/red">Red</a> <a>No link</a>
+<img src="img/blue.png">
+</body></html>"""
+
+
+def extract(rule_set, html_content=PAGE, url="https://example.com/shop/"):
+    return json.loads(extract_fields(rule_set, html_content, url))
+
+
+def test_page_meta_rule_set():
+    fields = extract(get_rule_set("page_meta"))
+    assert fields == {
+        "title": "Blue widgets",
+        "description": "All about widgets",
+        "canonical": "https://example.com/widgets",
+        "language": "en",
+        "og_title": None,
+        "og_image": "https://cdn.example.com/w.png",
+        "h1": ["Widgets"],
+    }
+
+
+def test_links_are_resolved_and_elements_without_the_attribute_skipped():
+    fields = extract(get_rule_set("links"))
+    assert fields == {
+        "links": ["https://example.com/blue", "https://other.example.com/red"],
+        "images": ["https://example.com/shop/img/blue.png"],
+    }
+
+
+def test_xpath_rules_may_compute_values():
+    rule_set = RuleSet(
+        "custom",
+        {"headings": {"xpath": "count(//h2)"}, "first_h2": {"xpath": "//h2/text()"}},
+    )
+    assert extract(rule_set) == {"headings": 2.0, "first_h2": "Blue"}
+
+
+def test_empty_document_has_empty_fields():
+    assert extract(get_rule_set("headings"), "") == {"h1": [], "h2": [], "h3": []}
+
+
+@pytest.mark.parametrize(
+    "rules",
+    [
+        {},
+        {"title": {"css": "h1", "xpath": "//h1"}},
+        {"title": {"attr": "href"}},
+        {"title": "h1[["},
+        {"title": {"xpath": "//h1["}},
+    ],
+)
+def test_invalid_rule_sets_are_refused(rules):
+    with pytest.raises(RuleSetError):
+        RuleSet("custom", rules)
+
+
+def test_unknown_rule_set():
+    with pytest.raises(RuleSetError):
+        get_rule_set("does_not_exist")
+
+
+def test_rule_set_files_are_recompiled_when_they_change(tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, "EXTRACTION_RULES_DIR", str(tmp_path))
+    path = tmp_path / "products.json"
+    path.write_text(json.dumps({"name": "h1"}))
+    first = get_rule_set("products")
+    assert get_rule_set("products") is first
+    assert list_rule_sets()["products"] == ["name"]
+
+    path.write_text(json.dumps({"name": "h1", "variants": {"css": "h2", "many": True}}))
+    # The modification time tells the file changed
+    os.utime(path, (1, 1))
+    second = get_rule_set("products")
+    assert second is not first and second.digest != first.digest
+    assert extract(second) == {"name": "Widgets", "variants": ["Blue", "Red"]}
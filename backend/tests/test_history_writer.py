@@ -0,0 +1,67 @@
+import pytest
+
+from core import history_writer
+from core.history_writer import HistoryWriter
+from core.models import History
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(history_writer.time, "sleep", lambda seconds: None)
+
+
+def test_write_stores_batch(user):
+    writer = HistoryWriter(max_attempts=1)
+    writer._write(
+        [
+            ("https://example.com/a", "bs4", "First page", user.id),
+            ("https://example.com/b", "bs4", "Second page", user.id),
+        ]
+    )
+    assert writer.stats["written"] == 2
+    assert writer.stats["batches"] == 1
+    assert History.query.count() == 2
+
+
+def test_write_keeps_good_records_of_failed_batch(user, capsys):
+    writer = HistoryWriter(max_attempts=2)
+    writer._write(
+        [
+            ("https://example.com/a", "bs4", "First page", user.id),
+            # Not a string, storing the batch fails on it
+            ("https://example.com/bad", "bs4", None, user.id),
+            ("https://example.com/c", "bs4", "Third page", user.id),
+        ]
+    )
+    assert writer.stats["written"] == 2
+    assert writer.stats["failed"] == 1
+    urls = {record.url for record in History.query.all()}
+    assert urls == {"https://example.com/a", "https://example.com/c"}
+    assert (
+        "Dropped the history record of https://example.com/bad"
+        in capsys.readouterr().out
+    )
+
+
+@pytest.mark.parametrize(
+    "scrape_result",
+    [None, ({"error": "Page not found"}, 400), "An error occurred: timed out"],
+)
+def test_submit_refuses_scrape_errors(scrape_result):
+    writer = HistoryWriter()
+    with pytest.raises(ValueError):
+        writer.submit(("https://example.com", "bs4", scrape_result, 1))
+    assert writer.stats["queued"] == 0
+
+
+def test_submitted_records_are_stored_by_the_flusher(user):
+    writer = HistoryWriter(flush_interval=0.01)
+    writer.start()
+    try:
+        for index in range(5):
+            writer.submit((f"https://example.com/{index}", "bs4", "Page", user.id))
+        writer.flush()
+    finally:
+        writer.close()
+    assert writer.stats["written"] == 5
+    assert History.query.count() == 5
@@ -0,0 +1,59 @@
+import io
+
+import pytest
+import requests
+
+from benchmarks.fixture_server import FixtureServer
+from config import app
+from core.http_client import ResponseTooLarge, fetch, iter_body, read_text
+
+
+@pytest.fixture(scope="module")
+def server():
+    with FixtureServer() as server:
+        yield server
+
+
+def body_of(server, path, max_bytes):
+    with fetch(server.url(path), stream=True) as response:
+        return b"".join(iter_body(response, max_bytes))
+
+
+def test_declared_length_is_checked_before_reading(server):
+    size = len(body_of(server, "/synthetic/20000.html", 2**20))
+    assert len(body_of(server, "/synthetic/20000.html", size)) == size
+    with fetch(server.url("/synthetic/20000.html"), stream=True) as response:
+        chunks = iter_body(response, size - 1)
+        with pytest.raises(ResponseTooLarge):
+            next(chunks)
+        assert response.raw.tell() == 0
+
+
+def test_body_of_unknown_length_is_cut_at_the_cap(server):
+    size = len(body_of(server, "/chunked/200000.html", 2**20))
+    assert len(body_of(server, "/chunked/200000.html", size)) == size
+    with pytest.raises(ResponseTooLarge):
+        body_of(server, "/chunked/200000.html", size // 2)
+
+
+def response_without_charset(body):
+    response = requests.Response()
+    response.status_code = 200
+    response.headers["Content-Type"] = "application/octet-stream"
+    response.raw = io.BytesIO(body)
+    assert response.encoding is None
+    return response
+
+
+def test_body_without_charset_is_decoded_with_the_detected_encoding(monkeypatch):
+    monkeypatch.setitem(app.config, "FETCH_CHUNK_SIZE", 256)
+    text = "Москва - столица России, крупнейший город страны. " * 40
+    response = response_without_charset(text.encode("koi8_r"))
+    assert read_text(response, 10000) == text
+
+
+def test_ascii_prefix_does_not_hide_later_utf8(monkeypatch):
+    monkeypatch.setitem(app.config, "FETCH_ENCODING_SNIFF_BYTES", 64)
+    text = "<html>" + "a" * 200 + "Crème brûlée</html>"
+    response = response_without_charset(text.encode("utf-8"))
+    assert read_text(response, 10000) == text
@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import app as flask_app
+from config import app, db
+from core.models import User
+from core.jobs import _finish_job, cancel_job, claim_next_job, enqueue_scrape_job
+from core.jobs import get_job, requeue_stale_jobs
+
+
+def test_jobs_are_claimed_oldest_first_and_once(database):
+    second = enqueue_scrape_job("https://example.com/2", "bs4")
+    first = enqueue_scrape_job("https://example.com/1", "bs4")
+    # created_at has a resolution of a second
+    get_job(first).created_at = datetime.now(timezone.utc) - timedelta(minutes=1)
+    db.session.commit()
+
+    job = claim_next_job()
+    assert job.id == first
+    assert job.status == "running"
+    assert job.attempts == 1
+    assert claim_next_job().id == second
+    assert claim_next_job() is None
+
+
+def test_cancel_queued_job(database):
+    job = get_job(enqueue_scrape_job("https://example.com", "bs4"))
+    assert cancel_job(job)
+    assert job.status == "cancelled"
+    # A cancelled job is never claimed
+    assert claim_next_job() is None
+
+
+def test_cancel_running_job_flags_it(database):
+    enqueue_scrape_job("https://example.com", "bs4")
+    job = claim_next_job()
+    assert cancel_job(job)
+    assert job.status == "running"
+    assert job.cancel_requested
+
+
+@pytest.mark.parametrize("status", ["finished", "failed"])
+def test_cancel_ended_job_does_nothing(database, status):
+    enqueue_scrape_job("https://example.com", "bs4")
+    job = claim_next_job()
+    _finish_job(job, status, result="Page" if status == "finished" else None)
+    assert not cancel_job(job)
+    assert job.status == status
+    assert not job.cancel_requested
+
+
+def _abandon(job_id, attempts=1, cancel_requested=False):
+    job = get_job(job_id)
+    job.status = "running"
+    job.attempts = attempts
+    job.cancel_requested = cancel_requested
+    job.started_at = datetime.now(timezone.utc) - timedelta(
+        seconds=app.config["JOB_STALE_SECONDS"] + 60
+    )
+    db.session.commit()
+
+
+def test_requeue_stale_jobs(database):
+    stale = enqueue_scrape_job("https://example.com/stale", "bs4")
+    exhausted = enqueue_scrape_job("https://example.com/exhausted", "bs4")
+    cancelled = enqueue_scrape_job("https://example.com/cancelled", "bs4")
+    _abandon(stale)
+    _abandon(exhausted, attempts=app.config["JOB_MAX_ATTEMPTS"])
+    _abandon(cancelled, cancel_requested=True)
+    enqueue_scrape_job("https://example.com/fresh", "bs4")
+    fresh = claim_next_job()
+
+    assert requeue_stale_jobs() == 1
+    db.session.expire_all()
+    assert get_job(stale).status == "queued"
+    assert get_job(exhausted).status == "failed"
+    assert get_job(cancelled).status == "cancelled"
+    # A job with a recent start is still running
+    assert get_job(fresh.id).status == "running"
+
+
+def test_job_of_a_user_is_only_visible_with_their_token(user, auth):
+    other = User(email="other@example.com", username="other", password="-")
+    db.session.add(other)
+    db.session.commit()
+    client = flask_app.test_client()
+    job_id = enqueue_scrape_job("https://example.com", "bs4", user_id=user.id)
+
+    assert client.get(f"/jobs/{job_id}", headers=auth(user.id)).status_code == 200
+    assert client.get(f"/jobs/{job_id}").status_code == 404
+    assert client.get(f"/jobs/{job_id}", headers=auth(other.id)).status_code == 404
+    assert client.delete(f"/jobs/{job_id}", headers=auth(other.id)).status_code == 404
+    assert get_job(job_id).status == "queued"
+
+
+def test_job_routes_refuse_bad_tokens(user, auth):
+    client = flask_app.test_client()
+    job_id = enqueue_scrape_job("https://example.com", "bs4")
+    expired = auth(user.id, expires_in=-60)
+    assert client.get(f"/jobs/{job_id}", headers=expired).status_code == 401
+    bad = {"Authorization": "Bearer not-a-token"}
+    assert client.delete(f"/jobs/{job_id}", headers=bad).status_code == 401
+    response = client.post(
+        "/scrape",
+        json={"url": "https://example.com", "scraping_method": "bs4", "async": True},
+        headers=bad,
+    )
+    assert response.status_code == 401
+    # Without a token, the job is anyone's
+    assert client.get(f"/jobs/{job_id}").status_code == 200
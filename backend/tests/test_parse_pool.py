@@ -0,0 +1,67 @@
+import pytest
+
+from benchmarks.pages import synthetic_page
+from core.cleaning import extract_text
+from core.deadlines import DeadlineExceeded, deadline_scope
+from core.extraction import RuleSetError
+from core.parse_pool import ParsePool, ParsePoolFull, ParseTimeout
+
+PAGE = synthetic_page(200_000, seed=3)
+# Prettifying this takes seconds, far longer than the timeouts below
+HUGE_PAGE = synthetic_page(4_000_000, seed=5)
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = ParsePool(1, max_queue=0, timeout=30)
+    yield pool
+    pool.close()
+
+
+def chunked(html_content, size=50_000):
+    for start in range(0, len(html_content), size):
+        end = start + size
+        yield html_content[start:end]
+
+
+def test_results_are_those_of_an_inline_parse(pool):
+    assert pool.run("text", PAGE) == extract_text(PAGE)
+    assert pool.run_stream("text", chunked(PAGE)) == extract_text(PAGE)
+
+
+def test_task_errors_are_raised_and_the_worker_kept(pool):
+    restarts = pool.stats["restarts"]
+    with pytest.raises(RuleSetError):
+        pool.run("extract", PAGE, "does_not_exist", None)
+    assert pool.stats["restarts"] == restarts
+    assert pool.run("text", PAGE) == extract_text(PAGE)
+
+
+def test_slow_document_times_out_and_its_worker_is_replaced(pool, monkeypatch):
+    monkeypatch.setattr(pool, "timeout", 0.2)
+    restarts = pool.stats["restarts"]
+    with pytest.raises(ParseTimeout):
+        pool.run("prettify", HUGE_PAGE)
+    assert pool.stats["restarts"] == restarts + 1
+    monkeypatch.setattr(pool, "timeout", 30)
+    assert pool.run("text", PAGE) == extract_text(PAGE)
+
+
+def test_parse_stops_at_the_deadline_of_the_scrape(pool):
+    restarts = pool.stats["restarts"]
+    with pytest.raises(DeadlineExceeded):
+        with deadline_scope(0.2):
+            pool.run("prettify", HUGE_PAGE)
+    assert pool.stats["restarts"] == restarts + 1
+    assert pool.run("text", PAGE) == extract_text(PAGE)
+
+
+def test_documents_beyond_the_queue_limit_are_rejected(pool):
+    # The only slot is taken, as by a document being parsed
+    pool._slots.acquire()
+    try:
+        with pytest.raises(ParsePoolFull):
+            pool.run("text", PAGE)
+    finally:
+        pool._slots.release()
+    assert pool.stats["rejected"] == 1
@@ -0,0 +1,92 @@
+import time
+from urllib.robotparser import RobotFileParser
+
+import pytest
+
+from benchmarks.fixture_server import FixtureServer
+from config import app
+from core import politeness
+from core.deadlines import DeadlineExceeded, deadline_scope
+from core.politeness import HostScheduler, PolitenessTimeout
+
+
+@pytest.fixture(autouse=True)
+def schedulers(monkeypatch):
+    monkeypatch.setattr(politeness, "_schedulers", {})
+
+
+def timed_acquire(scheduler, max_wait=5):
+    started = time.monotonic()
+    scheduler.acquire(max_wait)
+    scheduler.release()
+    return time.monotonic() - started
+
+
+def test_token_bucket_allows_bursts_then_paces_requests():
+    scheduler = HostScheduler(rate=20, burst=2, concurrency=10)
+    assert timed_acquire(scheduler) < 0.02
+    assert timed_acquire(scheduler) < 0.02
+    # The bucket is empty, the next token comes 1/20 s later
+    assert 0.03 < timed_acquire(scheduler) < 0.2
+    assert scheduler.stats["requests"] == 3
+
+
+def test_concurrency_cap_times_out():
+    scheduler = HostScheduler(rate=0, burst=1, concurrency=1)
+    scheduler.acquire(1)
+    with pytest.raises(PolitenessTimeout):
+        scheduler.acquire(0.05)
+    assert scheduler.stats["timeouts"] == 1
+    scheduler.release()
+    assert timed_acquire(scheduler) < 0.02
+
+
+def test_crawl_delay_spaces_request_starts():
+    scheduler = HostScheduler(rate=0, burst=1, concurrency=10, crawl_delay=0.1)
+    assert timed_acquire(scheduler) < 0.02
+    assert timed_acquire(scheduler) >= 0.09
+    # A wait longer than allowed fails at once instead of sleeping
+    started = time.monotonic()
+    with pytest.raises(PolitenessTimeout):
+        scheduler.acquire(0.01)
+    assert time.monotonic() - started < 0.05
+
+
+def robots_txt(*lines):
+    robots = RobotFileParser()
+    robots.parse(lines)
+    return robots
+
+
+def test_crawl_delay_of_robots_txt_is_capped(monkeypatch):
+    monkeypatch.setitem(app.config, "ROBOTS_MAX_CRAWL_DELAY", 5)
+    assert politeness._crawl_delay(robots_txt("User-agent: *", "Crawl-delay: 2")) == 2.0
+    assert politeness._crawl_delay(robots_txt("User-agent: *", "Crawl-delay: 60")) == 5
+    assert politeness._crawl_delay(None) == 0.0
+
+
+def test_robots_txt_is_read_up_to_its_size_cap(monkeypatch):
+    with FixtureServer() as server:
+        url = server.url("/synthetic/1000.html")
+        robots = politeness._read_robots(url)
+        assert robots is not None and robots.can_fetch("*", url)
+        # Too large, ignored like a robots.txt that cannot be fetched
+        monkeypatch.setitem(app.config, "ROBOTS_MAX_BYTES", 10)
+        assert politeness._read_robots(url) is None
+
+
+def test_wait_for_robots_txt_is_bounded_by_the_deadline(monkeypatch):
+    monkeypatch.setitem(app.config, "ROBOTS_ENABLED", False)
+    url = "https://slow-robots.example.com/page"
+    scheduler = politeness._get_scheduler(url)
+    monkeypatch.setitem(app.config, "ROBOTS_ENABLED", True)
+    # Another request is reading robots.txt
+    scheduler.robots_lock.acquire()
+    try:
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            with deadline_scope(0.1):
+                politeness._get_scheduler(url)
+        assert time.monotonic() - started < 1
+    finally:
+        scheduler.robots_lock.release()
@@ -0,0 +1,96 @@
+from core.models import User
+from core.repository import store_user_history_bulk
+from core.scraper import BROWSER_TITLE_PREFIX
+from core.search import index_text, search_history
+
+
+def store(user_id, records):
+    store_user_history_bulk(records, user_id)
+
+
+def walk(user_id, query, limit):
+    """Returns the ids of all the hits of a search, page by page."""
+    ids, cursor, pages = [], None, 0
+    while True:
+        hits, cursor = search_history(user_id, query, limit, cursor)
+        ids += [record.id for record, _, _ in hits]
+        pages += 1
+        if cursor is None:
+            return ids, pages
+
+
+def test_pages_cover_every_hit_once_in_rank_order(user):
+    # Repeated words rank higher, equal pages tie on their score
+    store(
+        user.id,
+        [
+            (f"https://example.com/{index}", "bs4", "widget " * (index % 3 + 1), True)
+            for index in range(7)
+        ],
+    )
+    hits, cursor = search_history(user.id, "widget", 100)
+    assert cursor is None
+    everything = [record.id for record, _, _ in hits]
+    scores = [score for _, _, score in hits]
+    assert len(everything) == 7
+    assert scores == sorted(scores, reverse=True)
+
+    ids, pages = walk(user.id, "widget", 2)
+    assert ids == everything
+    assert pages == 4
+
+
+def test_scores_are_not_rounded(user):
+    store(
+        user.id,
+        [
+            ("https://example.com/a", "bs4", "widget gadget " * 40, True),
+            ("https://example.com/b", "bs4", "widget gadget " * 41, True),
+        ],
+    )
+    hits, _ = search_history(user.id, "widget", 10)
+    first, second = (score for _, _, score in hits)
+    # Rounding to a few digits would make these scores equal
+    assert first != second
+
+
+def test_snippet_marks_matches_and_escapes_html(user):
+    store(user.id, [("https://example.com", "bs4", "Cheap <b> widgets here", True)])
+    (hit,), _ = search_history(user.id, "widgets", 10)
+    assert "<mark>widgets</mark>" in hit[1]
+    assert "&lt;b&gt;" in hit[1]
+
+
+def test_search_only_finds_own_records(user, database):
+    other = User(email="other@example.com", username="other", password="-")
+    database.session.add(other)
+    database.session.commit()
+    store(user.id, [("https://example.com/mine", "bs4", "widget", True)])
+    store(other.id, [("https://example.com/theirs", "bs4", "widget", True)])
+    hits, _ = search_history(user.id, "widget", 10)
+    assert [record.url for record, _, _ in hits] == ["https://example.com/mine"]
+
+
+def test_stale_cursor_gives_an_empty_page(user):
+    store(user.id, [("https://example.com", "bs4", "widget", True)])
+    assert search_history(user.id, "widget", 10, cursor=12345) == ([], None)
+
+
+def test_uncleaned_browser_result_is_indexed_by_its_visible_text():
+    page = (
+        BROWSER_TITLE_PREFIX
+        + "Widgets<html><head><script>trackVisitor()</script></head>"
+        + "<body><p class='price'>Blue widgets</p></body></html>"
+    )
+    for cleaned in (False, None):
+        content = index_text("selenium", page, cleaned)
+        assert "Blue widgets" in content
+        assert "trackVisitor" not in content
+        assert "class" not in content
+
+
+def test_cleaned_text_is_indexed_as_is():
+    content = index_text("bs4", "### Widgets\n- Blue  <widgets>", True)
+    assert content == "### Widgets - Blue <widgets>"
+    # Results of requests are HTML whatever they start with
+    assert index_text("requests", " <p>Hi</p><script>track()</script>", False) == "Hi"
@@ -0,0 +1,50 @@
+"""
+This module runs scrape job workers as a standalone process.
+
+It processes the jobs queued by the API (POST /scrape with "async": true) so scrape workers
+can be scaled independently from the API workers. Start as many processes as needed:
+
+    python worker.py --workers 4
+"""
+
+import argparse
+import time
+
+from config import app, db
+from core.engines import get_engine, preload_engines
+from core.jobs import JobWorkerPool
+from core.migrations import run_migrations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run scrape job workers.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=max(app.config["JOB_WORKERS"], 1),
+        help="Number of worker threads in this process.",
+    )
+    args = parser.parse_args()
+
+    with app.app_context():
+        # Only creates the tables that do not exist yet (e.g. the job queue)
+        db.create_all()
+        run_migrations()
+
+    if app.config["ENGINES_PRELOAD"]:
+        preload_engines(app.config["ENGINES_PRELOAD"])
+    # Only load Selenium at startup when the browsers are pre-warmed
+    if app.config["SELENIUM_POOL_PREWARM"]:
+        get_engine("browser").prewarm_driver_pool()
+    pool = JobWorkerPool(args.workers)
+    pool.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("Stopping scrape job workers...")
+        pool.stop()
+
+
+if __name__ == "__main__":
+    main()
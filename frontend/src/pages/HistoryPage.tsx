@@ -7,17 +7,26 @@ import { downloadFile } from "../api/axios";
 
 
 interface HistoryRecord {
+  id: number;
   url: string;
   scrape_method?: string;  
   scraping_method?: string; 
-  scraped_data: string;
   date: string;
 }
 
+interface HistoryPageResponse {
+  items: HistoryRecord[];
+  next_cursor: string | null;
+}
+
 const HistoryPage: React.FC = () => {
   const [history, setHistory] = useState<HistoryRecord[]>([]);
   const [loading, setLoading] = useState<boolean>(true);
   const [error, setError] = useState<string | null>(null);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState<boolean>(false);
+  // Scraped content is only loaded for the records the user opens
+  const [contents, setContents] = useState<Record<number, string>>({});
   const navigate = useNavigate();
 
   useEffect(() => {
@@ -31,31 +40,37 @@ const HistoryPage: React.FC = () => {
     fetchHistory();
   }, [navigate]);
 
-  const fetchHistory = async () => {
-    try {
-      setLoading(true);
+  const authHeaders = () => {
+    const token = localStorage.getItem("authToken");
 
-      const token = localStorage.getItem("authToken");
-     
+    if (!token) {
+      throw new Error("No authentication token found");
+    }
 
-      if (!token) {
-        throw new Error("No authentication token found");
-      }
+    return {
+      Authorization: `Bearer ${token}`,
+      "Content-Type": "application/json",
+    };
+  };
 
-      
+  const fetchHistoryPage = async (cursor: string | null): Promise<HistoryPageResponse> => {
+    const response = await axios({
+      method: "get",
+      url: `${BASE_URL}/history`,
+      params: cursor ? { cursor } : {},
+      headers: authHeaders(),
+      withCredentials: true,
+    });
+    return response.data;
+  };
 
-      const response = await axios({
-        method: "get",
-        url: `${BASE_URL}/history`,
-        headers: {
-          Authorization: `Bearer ${token}`,
-          "Content-Type": "application/json",
-        },
-        withCredentials: true,
-      });
+  const fetchHistory = async () => {
+    try {
+      setLoading(true);
 
-      
-      setHistory(response.data);
+      const page = await fetchHistoryPage(null);
+      setHistory(page.items);
+      setNextCursor(page.next_cursor);
       setError(null);
     } catch (err) {
       if (err instanceof Error) {
@@ -68,6 +83,77 @@ const HistoryPage: React.FC = () => {
     }
   };
 
+  const loadMore = async () => {
+    if (!nextCursor) return;
+    try {
+      setLoadingMore(true);
+
+      const page = await fetchHistoryPage(nextCursor);
+      setHistory((previous) => [...previous, ...page.items]);
+      setNextCursor(page.next_cursor);
+    } catch (err) {
+      setError(err instanceof Error ? `Failed to load history: ${err.message}` : "Failed to load history");
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  const fetchContent = async (record: HistoryRecord): Promise<string> => {
+    if (contents[record.id] !== undefined) {
+      return contents[record.id];
+    }
+
+    // The raw format sends only the content (compressed), without the JSON envelope
+    const response = await axios({
+      method: "get",
+      url: `${BASE_URL}/history/${record.id}?format=raw`,
+      headers: authHeaders(),
+      withCredentials: true,
+      responseType: "text",
+    });
+    const content: string = response.data;
+    setContents((previous) => ({ ...previous, [record.id]: content }));
+    return content;
+  };
+
+  const showContent = async (record: HistoryRecord) => {
+    try {
+      await fetchContent(record);
+    } catch (err) {
+      console.error("Failed to load content: ", err);
+    }
+  };
+
+  const downloadRecord = async (record: HistoryRecord) => {
+    try {
+      downloadFile(await fetchContent(record), undefined, record.url);
+    } catch (err) {
+      console.error("Failed to download content: ", err);
+    }
+  };
+
+  const exportHistory = async () => {
+    try {
+      const response = await axios({
+        method: "get",
+        url: `${BASE_URL}/history/export`,
+        headers: authHeaders(),
+        withCredentials: true,
+        responseType: "blob",
+      });
+      const urlBlob = window.URL.createObjectURL(response.data);
+      const a = document.createElement("a");
+      a.href = urlBlob;
+      a.download = `history_${new Date().toISOString().slice(0, 10)}.ndjson`;
+      document.body.appendChild(a);
+      a.click();
+      document.body.removeChild(a);
+      window.URL.revokeObjectURL(urlBlob);
+    } catch (err) {
+      console.error("Export error: ", err);
+    }
+  };
+
   // Helper function to get the scraping method, works with multiple field names
   const getScrapingMethod = (record: HistoryRecord): string => {
     return record.scrape_method || record.scraping_method || "Unknown";
@@ -100,7 +186,17 @@ const HistoryPage: React.FC = () => {
       <div className="w-full px-8 py-6 flex-grow">
         <div className="flex justify-between items-center mb-6">
           <h2 className="text-2xl font-bold text-blue-700">Your Scraping History</h2>
-          <Navbar />
+          <div className="flex items-center gap-4">
+            {history.length > 0 && (
+              <button
+                onClick={exportHistory}
+                className="bg-white text-blue-700 border border-blue-600 px-4 py-2 rounded-md hover:bg-blue-50 transition"
+              >
+                Export all (NDJSON)
+              </button>
+            )}
+            <Navbar />
+          </div>
         </div>
         
         <div className="mt-6">
@@ -131,9 +227,10 @@ const HistoryPage: React.FC = () => {
               </button>
             </div>
           ) : (
+            <>
             <div className="grid grid-cols-1 md:grid-cols-2 gap-6">
-              {history.map((record, index) => (
-                <div key={index} className="bg-white p-6 rounded-lg shadow-sm border border-gray-200 hover:shadow-md transition">
+              {history.map((record) => (
+                <div key={record.id} className="bg-white p-6 rounded-lg shadow-sm border border-gray-200 hover:shadow-md transition">
                   <div className="flex justify-between items-center mb-3">
                     <h3 className="font-bold text-blue-700 text-lg truncate max-w-xs">{record.url}</h3>
                     <span className="text-sm bg-blue-100 text-blue-800 px-3 py-1 rounded-full">
@@ -149,16 +246,27 @@ const HistoryPage: React.FC = () => {
 
                   <div className="mb-4">
                     <div className="bg-gray-50 border border-gray-200 rounded-md p-4 text-gray-700 font-mono text-sm overflow-auto h-36">
-                      {record.scraped_data.substring(0, 300)}
-                      {record.scraped_data.length > 300 && (
-                        <span className="text-blue-600">...</span>
+                      {contents[record.id] === undefined ? (
+                        <button
+                          onClick={() => showContent(record)}
+                          className="text-blue-600 hover:underline"
+                        >
+                          Show content
+                        </button>
+                      ) : (
+                        <>
+                          {contents[record.id].substring(0, 300)}
+                          {contents[record.id].length > 300 && (
+                            <span className="text-blue-600">...</span>
+                          )}
+                        </>
                       )}
                     </div>
                   </div>
 
                   <div className="flex justify-end">
                     <button
-                      onClick={() => downloadFile(record.scraped_data, undefined, record.url)}
+                      onClick={() => downloadRecord(record)}
                       className="flex items-center gap-2 bg-blue-600 text-white px-4 py-2 rounded-md hover:bg-blue-700 transition"
                     >
                       <svg xmlns="http://www.w3.org/2000/svg" className="h-5 w-5" fill="none" viewBox="0 0 24 24" stroke="currentColor">
@@ -170,6 +278,18 @@ const HistoryPage: React.FC = () => {
                 </div>
               ))}
             </div>
+            {nextCursor && (
+              <div className="flex justify-center mt-6">
+                <button
+                  onClick={loadMore}
+                  disabled={loadingMore}
+                  className="bg-blue-600 text-white px-6 py-2 rounded-md hover:bg-blue-700 transition disabled:opacity-50"
+                >
+                  {loadingMore ? "Loading..." : "Load more"}
+                </button>
+              </div>
+            )}
+            </>
           )}
         </div>
       </div>
@@ -47,6 +47,7 @@ const [companyName, setCompanyName] = useState<string>("");
         headers["Authorization"] = `Bearer ${token}`;
       }
   
+      // "raw" sends the result itself (compressed, without JSON escaping), errors stay JSON
       const axiosResponse = await axios.post(
         `${BASE_URL}/scrape`,
         {
@@ -54,18 +55,24 @@ const [companyName, setCompanyName] = useState<string>("");
           scraping_method: selectedOption,
           clean_data: cleanData,
           company_name: selectedOption === "selenium" ? companyName : undefined,
+          format: "raw",
         },
         {
           headers,
+          responseType: "text",
         },
       );
-      const response = axiosResponse.data;
-      if (response && response.status === 1) {
+      const contentType = String(axiosResponse.headers["content-type"] || "");
+      if (!contentType.startsWith("application/json")) {
         setIsScrapingDone(true);
-        setScrapedPage(response.scrape_result);
+        setScrapedPage(axiosResponse.data);
         setError(undefined);
       } else {
-        setError(response?.error || "An error occurred during scraping");
+        // Failed scrapes are sent as JSON, with the error message in scrape_result
+        const response = JSON.parse(axiosResponse.data);
+        const message =
+          typeof response?.scrape_result === "string" ? response.scrape_result : undefined;
+        setError(response?.error || message || "An error occurred during scraping");
         setIsScrapingDone(false);
       }
     } catch (err)  {